@@ -1,11 +1,33 @@
 import streamlit as st
-import joblib
 import numpy as np
 import pandas as pd
+import glob
 import os
+import shutil
+import sys
+import tempfile
+import time
 from dotenv import load_dotenv
-from supabase import create_client
-import plotly.express as px
+
+# Sensor storage backends are shared with the ingestion service in hardware/
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(REPO_ROOT, "hardware"))
+sys.path.insert(0, os.path.join(REPO_ROOT, "models"))
+from storage import create_storage
+# Latest sensor readings, fetched incrementally and shared by every viewer
+from recent_readings import RecentReadings
+# Chart series reduced to about one point per pixel, from raw readings or rollups
+from downsampling import downsample_frame, history
+# Feature engineering shared with the ingestion service
+from feature_builders import irrigation_feature_matrix, optimization_feature_matrix
+# Model artifacts, loaded lazily and shared across reruns
+from model_registry import artifact_path, load_model, model_version, warm_up
+# Results of inputs seen before, shared across reruns
+from prediction_cache import shared_cache
+# All three models in one call
+from advisory import advise
+# Whole files of field records, scored in chunks on a background thread
+from batch_scoring import ScoringJob
 
 
 # Set page configuration
@@ -21,9 +43,7 @@ st.set_page_config(
 load_dotenv()
 # Also try loading .env from the project root (one level above models/frontend folders)
 try:
-    current_file = os.path.abspath(__file__)
-    repo_root = os.path.dirname(os.path.dirname(os.path.dirname(current_file)))
-    env_path = os.path.join(repo_root, '.env')
+    env_path = os.path.join(REPO_ROOT, '.env')
     if os.path.exists(env_path):
         load_dotenv(env_path, override=False)
 except Exception:
@@ -32,43 +52,93 @@ except Exception:
 st.title("🌾 AgriTech")
 st.markdown("### Get intelligent crop recommendations and irrigation decisions based on soil and environmental conditions")
 
+# Seconds between automatic refreshes of the live sensor data
+REFRESH_S = float(os.getenv("DASHBOARD_REFRESH_S", "5"))
+
+@st.cache_resource(show_spinner=False)
+def recent_readings(backend, supabase_url, supabase_key):
+    """
+    Latest readings per device, one buffer per server process shared by every viewer:
+    refreshes only fetch new rows, at most once per DASHBOARD_QUERY_TTL_S
+    """
+    return RecentReadings.from_env(create_storage(backend, supabase_url, supabase_key))
+
+# Points per chart series, about the chart width in pixels
+CHART_POINTS = int(os.getenv("DASHBOARD_CHART_POINTS", "1000"))
+# Chart range -> hours of history (None: the latest readings in memory)
+CHART_RANGES = {"Latest readings": None, "Last hour": 1, "Last 24 hours": 24, "Last 7 days": 168, "Last 30 days": 720}
+
+def line_chart(series, title, markers=False):
+    # Imported with the first chart, so pages that never show one do not pay for it
+    import plotly.express as px
+
+    return px.line(series, x="created_at", y="value", color="series", markers=markers, title=title)
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def sensor_charts(df):
+    """Charts of the readings, built once per set of readings (building them costs more than the rest of a rerun)"""
+    # Temperature and humidity over time
+    charts = [line_chart(downsample_frame(df, ["temperature", "humidity"], CHART_POINTS), "Temperature & Humidity Over Time", markers=True)]
+    # Soil moisture and water level over time
+    if "soil_moisture" in df.columns and "water_level" in df.columns:
+        charts.append(line_chart(downsample_frame(df, ["soil_moisture", "water_level"], CHART_POINTS), "Soil Moisture & Water Level Over Time", markers=True))
+    return charts
+
+@st.cache_resource(ttl=60, max_entries=8, show_spinner=False)
+def history_charts(backend, supabase_url, supabase_key, hours):
+    """
+    Charts of the last `hours`, read from the raw table or the rollups depending on the range;
+    the same number of points whatever the range
+    """
+    storage = recent_readings(backend, supabase_url, supabase_key).storage
+    end = pd.Timestamp.now(tz="UTC")
+    series, source = history(storage, end - pd.Timedelta(hours=hours), end, points=CHART_POINTS)
+    return [line_chart(series, f"Temperature & Humidity, last {hours} h (min/max per point, from {source})")]
+
 # --- IoT Live Data Section ---
 with st.expander("Live Sensor Data (IoT)", expanded=False):
-    st.markdown("Click 'Refresh Data' to fetch latest readings from Supabase")
+    st.markdown("Click 'Refresh Data' to fetch latest readings from sensor storage")
     
+    # Storage backend: Supabase (default) or the embedded SQLite database (STORAGE_BACKEND=sqlite)
+    STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "supabase").lower()
     # Supabase credentials (from .env or Streamlit secrets)
     SUPABASE_URL = os.getenv("SUPABASE_URL") or (st.secrets.get("SUPABASE_URL") if hasattr(st, "secrets") else None)
     SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_KEY") or (st.secrets.get("SUPABASE_SERVICE_KEY") if hasattr(st, "secrets") else None)
     
-    if SUPABASE_URL and SUPABASE_KEY:
+    if STORAGE_BACKEND != "supabase" or (SUPABASE_URL and SUPABASE_KEY):
         if st.button("🔄 Refresh Data"):
-            with st.spinner("Fetching sensor data..."):
+            st.session_state["live_data"] = True
+            st.session_state["live_data_forced"] = True
+        if st.session_state.get("live_data"):
+            auto_refresh = st.toggle(f"Auto-refresh every {REFRESH_S:g} s", key="live_auto_refresh")
+
+            @st.fragment(run_every=REFRESH_S if auto_refresh else None)
+            def show_live_readings():
+                # Reruns only this section: new rows are fetched, the rest of the page is left alone
                 try:
-                    supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
-                    response = supabase.table("Sensor readings").select("*").order("created_at", desc=True).limit(100).execute()
-                    data = response.data
-                    if data:
-                        df = pd.DataFrame(data)
+                    readings = recent_readings(STORAGE_BACKEND, SUPABASE_URL, SUPABASE_KEY)
+                    # A click always queries the storage; other reruns share the latest refresh
+                    readings.refresh(force=st.session_state.pop("live_data_forced", False))
+                    df = readings.frame(limit=100)
+                    if not df.empty:
                         st.subheader("Sensor Data Table")
                         st.dataframe(df)
 
                         st.subheader("Sensor Data Visualization")
-                        # Plot temperature and humidity over time
-                        fig = px.line(df.sort_values("created_at"), x="created_at", y=["temperature", "humidity"], markers=True, title="Temperature & Humidity Over Time")
-                        st.plotly_chart(fig, use_container_width=True)
-
-                        # Plot soil moisture and water level over time
-                        if "soil_moisture" in df.columns and "water_level" in df.columns:
-                            fig2 = px.line(df.sort_values("created_at"), x="created_at", y=["soil_moisture", "water_level"], markers=True, title="Soil Moisture & Water Level Over Time")
-                            st.plotly_chart(fig2, use_container_width=True)
+                        hours = CHART_RANGES[st.selectbox("📅 Chart range", list(CHART_RANGES), key="live_chart_range")]
+                        charts = sensor_charts(df) if hours is None else history_charts(STORAGE_BACKEND, SUPABASE_URL, SUPABASE_KEY, hours)
+                        for fig in charts:
+                            st.plotly_chart(fig, use_container_width=True)
                     else:
-                        st.info("No sensor data found in Supabase.")
+                        st.info(f"No sensor data found in {STORAGE_BACKEND} storage.")
                 except Exception as e:
-                    st.error(f"Error fetching data from Supabase: {e}")
+                    st.error(f"Error fetching data from {STORAGE_BACKEND} storage: {e}")
+
+            show_live_readings()
         else:
             st.info("👆 Click 'Refresh Data' to load IoT sensor readings")
     else:
-        st.warning("Supabase credentials not found. Please set SUPABASE_URL and SUPABASE_SERVICE_KEY in your environment.")
+        st.warning("Supabase credentials not found. Please set SUPABASE_URL and SUPABASE_SERVICE_KEY in your environment, or STORAGE_BACKEND=sqlite for local storage.")
 
 # Global status tracker for all models
 MODEL_STATUS = {
@@ -77,175 +147,58 @@ MODEL_STATUS = {
     'optimization_model': False
 }
 
-def load_crop_model():
-    import os
-    import joblib
-    
-    # Get the absolute path to the repository root  
-    current_file = os.path.abspath(__file__)
-    repo_root = os.path.dirname(os.path.dirname(os.path.dirname(current_file)))
-    
-    # Direct path to the crop model
-    model_path = os.path.join(repo_root, "models", "crop recommendation", "crop_model.pkl")
+MODEL_LABELS = {'crop': 'Crop', 'irrigation': 'Irrigation', 'water': 'Optimization'}
+MODEL_STATUS_KEYS = {'crop': 'crop_model', 'irrigation': 'irrigation_model', 'water': 'optimization_model'}
 
-    if os.path.exists(model_path):
-        try:
-            model = joblib.load(model_path)
-            MODEL_STATUS['crop_model'] = True
-            return model
-        except Exception as e:
-            st.error(f"Error loading crop model from {model_path}: {type(e).__name__}: {e}")
-            MODEL_STATUS['crop_model'] = False
-            return None
-    else:
-        st.error(f"❌ Crop model file not found at: {model_path}")
-        MODEL_STATUS['crop_model'] = False
-        return None
+def check_registered_model(name):
+    """True when the artifact of `name` exists; the model itself (and catboost or sklearn) is read on first use"""
+    available = os.path.exists(artifact_path(name))
+    MODEL_STATUS[MODEL_STATUS_KEYS[name]] = available
+    if not available:
+        st.error(f"❌ {MODEL_LABELS[name]} model file not found: Model file not found at: {artifact_path(name)}")
+    return available
 
-def load_irrigation_model():
-    import os
-    import joblib
-    
-    # Get the absolute path to the repository root
-    current_file = os.path.abspath(__file__)
-    repo_root = os.path.dirname(os.path.dirname(os.path.dirname(current_file)))
-    
-    # Direct path to the irrigation model
-    model_path = os.path.join(repo_root, "models", "Smart_Irrigation_Classifier", "catboost_model.pkl")
+def load_registered_model(name):
+    """Shared instance from models/model_registry.py: read once per process, re-read when the artifact changes"""
+    label = MODEL_LABELS[name]
+    try:
+        model = load_model(name)
+        MODEL_STATUS[MODEL_STATUS_KEYS[name]] = True
+        return model
+    except FileNotFoundError as e:
+        st.error(f"❌ {label} model file not found: {e}")
+    except Exception as e:
+        st.error(f"Error loading {label.lower()} model from {artifact_path(name)}: {type(e).__name__}: {e}")
+    MODEL_STATUS[MODEL_STATUS_KEYS[name]] = False
+    return None
 
-    if os.path.exists(model_path):
-        try:
-            model = joblib.load(model_path)
-            MODEL_STATUS['irrigation_model'] = True
-            return model
-        except Exception as e:
-            st.error(f"Error loading irrigation model from {model_path}: {type(e).__name__}: {e}")
-            MODEL_STATUS['irrigation_model'] = False
-            return None
-    else:
-        st.error(f"❌ Irrigation model file not found at: {model_path}")
-        MODEL_STATUS['irrigation_model'] = False
-        return None
+def load_crop_model():
+    return load_registered_model('crop')
+
+def load_irrigation_model():
+    return load_registered_model('irrigation')
 
 def load_optimization_model():
-    import os
-    import joblib
-    
-    # Get the absolute path to the repository root
-    current_file = os.path.abspath(__file__)
-    repo_root = os.path.dirname(os.path.dirname(os.path.dirname(current_file)))
-    
-    # Direct path to the optimization model
-    model_path = os.path.join(repo_root, "models", "irrigation_optimization_model", "catboost_irrigation_model.pkl")
+    return load_registered_model('water')
 
-    if os.path.exists(model_path):
-        try:
-            model = joblib.load(model_path)
-            MODEL_STATUS['optimization_model'] = True
-            return model
-        except Exception as e:
-            st.error(f"Error loading optimization model from {model_path}: {type(e).__name__}: {e}")
-            MODEL_STATUS['optimization_model'] = False
-            return None
-    else:
-        st.error(f"❌ Optimization model file not found at: {model_path}")
-        MODEL_STATUS['optimization_model'] = False
-        return None
-
-# Load all models
-crop_model = load_crop_model()
-irrigation_model = load_irrigation_model()
-optimization_model = load_optimization_model()
-
-# Feature engineering functions
-def create_irrigation_features(soil_moisture, temperature, humidity, ph, n, p, k, rainfall=0):
-    """Create all required features for irrigation model"""
-    import numpy as np
-    
-    # Basic features
-    soil_humidity = humidity * 0.8  # Approximate soil humidity
-    air_temperature = temperature
-    
-    # Derived features
-    relative_soil_saturation = min(soil_moisture / 100.0, 1.0)
-    temp_diff = abs(temperature - 25)  # Difference from optimal temp
-    evapotranspiration = max(0, (temperature - 10) * 0.1 + (100 - humidity) * 0.05)
-    rain_vs_soil = rainfall / max(soil_moisture, 1)
-    ph_encoded = 1 if ph > 7 else 0  # Alkaline vs acidic
-    
-    # NPK ratios
-    np_ratio = n / max(p, 1)
-    nk_ratio = n / max(k, 1)
-    npk_balance = (n + p + k) / 3
-    
-    # Additional derived features
-    crop_encoded = 1  # Default crop type
-    rain_3days = rainfall * 3  # Assume same rainfall for 3 days
-    moisture_temp_ratio = soil_moisture / max(temperature, 1)
-    evapo_ratio = evapotranspiration / max(rainfall, 0.1)
-    rain_effect = min(rainfall / 10, 1.0)
-    moisture_change_rate = 0.1  # Default change rate
-    temp_scaled = temperature / 40  # Scale temperature
-    wind_ratio = 0.5  # Default wind effect
-    
-    return np.array([[
-        soil_moisture, temperature, soil_humidity, relative_soil_saturation,
-        temp_diff, evapotranspiration, rain_vs_soil, rainfall, ph_encoded,
-        n, p, k, np_ratio, nk_ratio, crop_encoded, rain_3days,
-        moisture_temp_ratio, evapo_ratio, rain_effect, moisture_change_rate,
-        temp_scaled, npk_balance, wind_ratio
-    ]])
-
-def create_optimization_features(soil_moisture, temperature, humidity, ph, n, p, k, rainfall=0):
-    """Create all required features for optimization model"""
-    import numpy as np
-    
-    # Basic environmental features
-    soil_humidity = humidity * 0.8
-    air_temperature = temperature
-    wind_speed = 10  # Default wind speed
-    wind_gust = wind_speed * 1.5
-    pressure = 101.325  # Standard atmospheric pressure
-    
-    # Derived features
-    soil_moisture_diff = 0.1  # Default change
-    relative_soil_saturation = min(soil_moisture / 100.0, 1.0)
-    temp_diff = abs(temperature - 25)
-    wind_effect = wind_speed * 0.1
-    evapotranspiration = max(0, (temperature - 10) * 0.1 + (100 - humidity) * 0.05)
-    rain_3days = rainfall * 3
-    rain_vs_soil = rainfall / max(soil_moisture, 1)
-    
-    # NPK features
-    np_ratio = n / max(p, 1)
-    nk_ratio = n / max(k, 1)
-    npk_balance = (n + p + k) / 3
-    
-    # Encoded features
-    ph_encoded = 1 if ph > 7 else 0
-    crop_encoded = 1
-    
-    # Additional ratios
-    moisture_temp_ratio = soil_moisture / max(temperature, 1)
-    evapo_ratio = evapotranspiration / max(rainfall, 0.1)
-    rain_effect = min(rainfall / 10, 1.0)
-    moisture_change_rate = 0.1
-    temp_scaled = temperature / 40
-    wind_ratio = wind_speed / 50
-    
-    return np.array([[
-        soil_moisture, temperature, soil_humidity, air_temperature,
-        wind_speed, humidity, wind_gust, pressure, ph, rainfall,
-        n, p, k, soil_moisture_diff, relative_soil_saturation,
-        temp_diff, wind_effect, evapotranspiration, rain_3days,
-        rain_vs_soil, np_ratio, nk_ratio, ph_encoded, crop_encoded,
-        moisture_temp_ratio, evapo_ratio, rain_effect, moisture_change_rate,
-        temp_scaled, npk_balance, wind_ratio
-    ]])
+CROP_INPUTS = ['N', 'P', 'K', 'temperature', 'humidity', 'ph', 'rainfall']
+FIELD_INPUTS = ['soil_moisture', 'temperature', 'humidity', 'ph', 'n', 'p', 'k', 'rainfall']
+
+def cached_predict(name, predict, values, columns):
+    """Model output for one input row; inputs seen before are answered from the prediction cache"""
+    row = np.array([values], dtype=float)
+    cache = shared_cache(name, columns)
+    if cache is None:
+        return np.asarray(predict(row))[0]
+    return cache.predict(row, predict, version=model_version(name))[0]
+
+# Check that every model can be loaded; each one is read by the first prediction that needs it
+for name in MODEL_LABELS:
+    check_registered_model(name)
 
 # Check overall system status
 def check_system_status():
-    """Returns True only if ALL required models are loaded successfully"""
+    """Returns True only if ALL required models are available"""
     all_loaded = all(MODEL_STATUS.values())
     if not all_loaded:
         failed_models = [model for model, status in MODEL_STATUS.items() if not status]
@@ -253,7 +206,7 @@ def check_system_status():
         st.warning("⚠️ **Fail-Safe Mode**: All predictions will return 0/False due to missing models")
         return False
     else:
-        st.success("✅ **System Status: OPERATIONAL** - All models loaded successfully")
+        st.success("✅ **System Status: OPERATIONAL** - All models available")
         return True
 
 # Check system status
@@ -291,18 +244,20 @@ with col2:
     st.subheader("🌱 Crop Recommendation")
     
     if st.button("🚀 Get Crop Recommendation", type="primary", width="stretch", key="crop_recommendation"):
-        if not system_operational:
+        if system_operational:
+            crop_model = load_crop_model()
+        if not system_operational or not MODEL_STATUS['crop_model']:
             st.error("❌ **FAIL-SAFE ACTIVATED**: Cannot provide recommendations due to system failure")
             st.info("🔄 **Returned Value**: 0 (Safe failure mode)")
         else:
             try:
-                # Create DataFrame with proper column names to avoid warnings
-                feature_names = ['N', 'P', 'K', 'temperature', 'humidity', 'ph', 'rainfall']
-                input_data = pd.DataFrame([[N, P, K, temp, hum, ph, rain]], columns=feature_names)
-                
-                # Make prediction
-                prediction = crop_model.predict(input_data)[0]
-                confidence = crop_model.predict_proba(input_data).max()
+                # One model call (skipped for inputs seen before); DataFrame with proper column names to avoid warnings
+                probabilities = cached_predict(
+                    'crop', lambda X: crop_model.predict_proba(pd.DataFrame(X, columns=CROP_INPUTS)),
+                    [N, P, K, temp, hum, ph, rain], CROP_INPUTS
+                )
+                prediction = crop_model.classes_[probabilities.argmax()]
+                confidence = probabilities.max()
                 
                 # Validation check - if confidence is too low, return 0/failure
                 if confidence < 0.7:  # Less than 70% confidence
@@ -354,24 +309,21 @@ with col2:
     
     # Smart Irrigation Classifier
     if st.button("🔍 Smart Irrigation Check", width="stretch", key="irrigation_check"):
+        if system_operational:
+            irrigation_model = load_irrigation_model()
         if not system_operational or not MODEL_STATUS['irrigation_model']:
             st.error("❌ **FAIL-SAFE ACTIVATED**: Irrigation model unavailable")
             st.info("🔄 **Returned Value**: 0 (Safe failure mode)")
         else:
             try:
-                # Create features for irrigation model
-                irrigation_features = create_irrigation_features(
-                    soil_moisture, temp, hum, ph, N, P, K, rain
+                # Create features for irrigation model and predict (skipped for inputs seen before)
+                probabilities = cached_predict(
+                    'irrigation',
+                    lambda X: irrigation_model.predict_proba(irrigation_feature_matrix(dict(zip(FIELD_INPUTS, X.T)))),
+                    [soil_moisture, temp, hum, ph, N, P, K, rain], FIELD_INPUTS
                 )
-                
-                pred = irrigation_model.predict(irrigation_features)[0]
-                
-                # Get prediction probability if available
-                try:
-                    prob = irrigation_model.predict_proba(irrigation_features).max()
-                    confidence_text = f" (Confidence: {prob:.2%})"
-                except:
-                    confidence_text = ""
+                pred = irrigation_model.classes_[probabilities.argmax()]
+                prob = probabilities.max()
                 
                 # Validation check
                 if prob and prob < 0.8:  # Less than 80% confidence
@@ -394,18 +346,20 @@ with col2:
     
     # Irrigation Optimization
     if st.button("⚡ Irrigation Optimization", width="stretch", key="irrigation_optimization"):
+        if system_operational:
+            optimization_model = load_optimization_model()
         if not system_operational or not MODEL_STATUS['optimization_model']:
             st.error("❌ **FAIL-SAFE ACTIVATED**: Optimization model unavailable") 
             st.info("🔄 **Returned Value**: 0 (Safe failure mode)")
         else:
             try:
-                # Create features for optimization model
-                optimization_features = create_optimization_features(
-                    soil_moisture, temp, hum, ph, N, P, K, rain
+                # Create features for optimization model and predict (skipped for inputs seen before)
+                optimization_pred = cached_predict(
+                    'water',
+                    lambda X: optimization_model.predict(optimization_feature_matrix(dict(zip(FIELD_INPUTS, X.T)))),
+                    [soil_moisture, temp, hum, ph, N, P, K, rain], FIELD_INPUTS
                 )
                 
-                optimization_pred = optimization_model.predict(optimization_features)[0]
-                
                 # Validation check
                 if optimization_pred < 0 or optimization_pred > 100:  # Unrealistic values
                     st.error("❌ **INVALID OPTIMIZATION RESULT**")
@@ -424,6 +378,33 @@ with col2:
             except Exception as e:
                 st.error(f"❌ **OPTIMIZATION FAILED**: {str(e)}")
                 st.info("🔄 **Returned Value**: 0 (Exception fail-safe)")
+    
+    # === FULL ADVISORY SECTION ===
+    st.divider()
+    st.subheader("🧭 Full Advisory")
+    
+    # Crop, irrigation decision and water amount from one call: inputs validated and features built once
+    if st.button("🧭 Get Full Advisory", width="stretch", key="full_advisory"):
+        if system_operational:
+            crop_model, irrigation_model, optimization_model = load_crop_model(), load_irrigation_model(), load_optimization_model()
+        if not system_operational or not all(MODEL_STATUS.values()):
+            st.error("❌ **FAIL-SAFE ACTIVATED**: Cannot provide recommendations due to system failure")
+            st.info("🔄 **Returned Value**: 0 (Safe failure mode)")
+        else:
+            try:
+                advice = advise(
+                    [{'N': N, 'P': P, 'K': K, 'temperature': temp, 'humidity': hum, 'ph': ph, 'rainfall': rain, 'soil_moisture': soil_moisture}],
+                    crop_model, irrigation_model, optimization_model
+                ).iloc[0]
+                st.success(f"🌱 **Recommended Crop: {str(advice['crop']).title()}** (Confidence: {advice['crop_confidence']:.2%})")
+                if advice['irrigation_needed']:
+                    st.success(f"💧 **Irrigation Needed** (Confidence: {advice['irrigation_confidence']:.2%})")
+                    st.info(f"⚡ **Optimal Irrigation: {advice['water_mm']:.2f} units**")
+                else:
+                    st.info(f"🚫 **No Irrigation Needed** (Confidence: {advice['irrigation_confidence']:.2%})")
+            except Exception as e:
+                st.error(f"❌ **ADVISORY FAILED**: {str(e)}")
+                st.info("🔄 **Returned Value**: 0 (Exception fail-safe)")
 
 # Display input summary at the bottom
 st.subheader("📋 Input Summary")
@@ -436,7 +417,115 @@ summary_data = {
 summary_df = pd.DataFrame(summary_data)
 st.dataframe(summary_df, hide_index=True, width="stretch")
 
+# --- Bulk Field Scoring Section ---
+# Rows per chunk and worker processes of a bulk scoring job (0: chunks are scored on the job's thread)
+BULK_CHUNK_ROWS = int(os.getenv("DASHBOARD_SCORING_CHUNK_ROWS", "20000"))
+BULK_WORKERS = int(os.getenv("DASHBOARD_SCORING_WORKERS", "0"))
+# Seconds a job directory is kept after its last write; abandoned sessions never start another job to clean up
+BULK_TTL_S = float(os.getenv("DASHBOARD_SCORING_TTL_S", str(6 * 3600)))
+BULK_MODELS = {
+    "Full advisory (crop, irrigation, water)": "advise",
+    "Crop recommendation": "crop",
+    "Irrigation status": "irrigation",
+    "Water amount": "water",
+}
+
+def sweep_bulk_directories():
+    """Remove the job directories (bulk-scoring-*) of every session that has not written to them for BULK_TTL_S"""
+    cutoff = time.time() - BULK_TTL_S
+    for directory in glob.glob(os.path.join(tempfile.gettempdir(), "bulk-scoring-*")):
+        try:
+            # A running job keeps writing its output, so the newest file tells whether it is still in use
+            last_write = max([os.path.getmtime(directory)] + [os.path.getmtime(e.path) for e in os.scandir(directory)])
+        except OSError:
+            continue  # Removed meanwhile
+        if last_write < cutoff:
+            shutil.rmtree(directory, ignore_errors=True)
+
+def finish_bulk_job(job):
+    """Once a job has stopped: drop the uploaded copy, and the whole directory unless there is a result to download"""
+    if job.state == "done":
+        if os.path.exists(job.source):
+            os.remove(job.source)
+    else:
+        shutil.rmtree(os.path.dirname(job.source), ignore_errors=True)
+
+@st.cache_data(show_spinner=False, max_entries=4, ttl=BULK_TTL_S)
+def scored_file(path, modified_ns):
+    """The finished output, read once instead of on every rerun (the modification time keys the cache)"""
+    with open(path, "rb") as f:
+        return f.read()
+
+def start_bulk_job(uploaded, model):
+    """Copy the upload to a job directory and start scoring it; the script run does not wait for it"""
+    previous = st.session_state.pop("bulk_job", None)
+    if previous is not None:
+        previous.cancel()
+        shutil.rmtree(os.path.dirname(previous.source), ignore_errors=True)
+    sweep_bulk_directories()
+    directory = tempfile.mkdtemp(prefix="bulk-scoring-")
+    extension = ".parquet" if uploaded.name.lower().endswith(".parquet") else ".csv"
+    source = os.path.join(directory, f"fields{extension}")
+    with open(source, "wb") as f:
+        f.write(uploaded.getbuffer())
+    job = ScoringJob(model, source, os.path.join(directory, f"scored{extension}"), BULK_CHUNK_ROWS, BULK_WORKERS)
+    st.session_state["bulk_job"] = job.start()
+    st.session_state["bulk_file_name"] = f"{os.path.splitext(uploaded.name)[0]}_scored{extension}"
+
+with st.expander("📦 Bulk Field Scoring", expanded=False):
+    st.markdown("Upload a CSV or Parquet file of field records (N, P, K, temperature, humidity, ph, rainfall, soil_moisture) "
+                "to score every row; the file is processed in the background and can be downloaded when done")
+    job = st.session_state.get("bulk_job")
+    running = job is not None and not job.finished
+    uploaded = st.file_uploader("Field records", type=["csv", "parquet"], key="bulk_upload")
+    bulk_model = BULK_MODELS[st.selectbox("Predictions", list(BULK_MODELS), key="bulk_model")]
+    if st.button("▶️ Score All Fields", key="bulk_start", disabled=uploaded is None or running):
+        if not system_operational:
+            st.error("❌ **FAIL-SAFE ACTIVATED**: Cannot score fields due to system failure")
+        else:
+            start_bulk_job(uploaded, bulk_model)
+            job, running = st.session_state["bulk_job"], True
+
+    if job is not None:
+        @st.fragment(run_every=1.0 if running else None)
+        def show_bulk_progress():
+            # Polls the job once a second while it runs, without rerunning the rest of the page
+            progress = job.progress()
+            total = f"{progress['total_rows']:,}" if progress['total_rows'] is not None else "?"
+            status = f"{progress['rows']:,} / {total} rows · {progress['rows_per_s']:,.0f} rows/s · {progress['seconds']:.1f} s"
+            if progress["state"] == "running":
+                st.progress(progress["fraction"], text=f"⏳ Scoring: {status}")
+                if st.button("⏹️ Cancel", key="bulk_cancel"):
+                    job.cancel()
+            elif progress["state"] == "done":
+                st.success(f"✅ **Scored {status}**")
+                if os.path.exists(job.destination):
+                    st.download_button("⬇️ Download Results",
+                                       scored_file(job.destination, os.stat(job.destination).st_mtime_ns),
+                                       file_name=st.session_state["bulk_file_name"],
+                                       mime="application/octet-stream", key="bulk_download")
+                else:
+                    st.warning("⌛ The results have expired, please score the file again")
+            elif progress["state"] == "failed":
+                st.error(f"❌ **SCORING FAILED** after {status}: {progress['error']}")
+            else:
+                st.warning(f"⏹️ Scoring cancelled after {status}")
+            if running and job.finished:
+                finish_bulk_job(job)
+                st.rerun()  # Whole page: stops polling and re-enables the start button
+
+        show_bulk_progress()
+
 # Footer
 st.markdown("---")
 st.markdown("**AgriTech - Smart Agriculture Advisor** - Empowering farmers with AI-driven crop and irrigation insights")
-st.markdown("💡 *Tip: Adjust the input parameters to see how they affect the recommendations*")
\ No newline at end of file
+st.markdown("💡 *Tip: Adjust the input parameters to see how they affect the recommendations*")
+
+@st.cache_resource(show_spinner=False)
+def warm_up_models():
+    """Once per server process, after the first page is out: load the models in the background"""
+    return warm_up()
+
+# The first click usually finds the models loaded (DASHBOARD_WARMUP=0: loaded by the first click)
+if system_operational and os.getenv("DASHBOARD_WARMUP", "1") == "1":
+    warm_up_models()
\ No newline at end of file
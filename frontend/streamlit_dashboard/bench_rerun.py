@@ -0,0 +1,154 @@
+"""
+bench_rerun.py
+--------------
+Purpose:
+    - Measure how long the dashboard takes to rerun: Streamlit executes app.py
+      from the top on every widget change and button click
+    - Drives the real app.py headless (streamlit.testing AppTest) with
+      stand-in models shaped like the real ones (the committed artifacts are
+      Git LFS pointers) and an in-memory sensor storage that answers each
+      query after `--query-latency` seconds, like a Supabase round trip
+    - Runs the same session twice: with the caching layer (models held by
+      model_registry, storage client and readings cached by Streamlit,
+      prediction cache), and with every cache dropped before each rerun,
+      which is what the dashboard did before it had one
+    - Reports p50/p95 rerun latency per step
+
+Examples:
+    python bench_rerun.py
+    python bench_rerun.py --reruns 30 --query-latency 0.3
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(REPO_ROOT, "hardware"))
+sys.path.insert(0, os.path.join(REPO_ROOT, "models"))
+
+import model_registry  # noqa: E402
+import prediction_cache  # noqa: E402
+import storage  # noqa: E402
+
+
+class SlowMemoryStorage(storage.MemoryStorage):
+    """MemoryStorage whose queries take `query_latency_s`, like a remote database."""
+
+    def __init__(self, rows, query_latency_s: float):
+        super().__init__()
+        self.rows = rows
+        self.query_latency_s = query_latency_s
+        self.queries = 0
+
+    def query_range(self, *args, **kwargs):
+        time.sleep(self.query_latency_s)
+        self.queries += 1
+        return super().query_range(*args, **kwargs)
+
+
+def stand_in_models(directory: str) -> None:
+    """Train models with the real features and sizes into `directory` and point model_registry at them."""
+    import joblib
+    import numpy as np
+    import pandas as pd
+    from catboost import CatBoostClassifier, CatBoostRegressor
+    from sklearn.ensemble import RandomForestClassifier
+
+    from feature_builders import IRRIGATION_FEATURES, OPTIMIZATION_FEATURES
+
+    crops = pd.read_csv(os.path.join(REPO_ROOT, "data", "crop_data.csv"))
+    features = ["N", "P", "K", "temperature", "humidity", "ph", "rainfall"]
+    rng = np.random.default_rng(0)
+    models = {
+        "crop": RandomForestClassifier(n_estimators=200, random_state=42).fit(crops[features], crops["label"]),
+        "irrigation": CatBoostClassifier(iterations=1000, depth=6, verbose=0, allow_writing_files=False).fit(
+            rng.random((5000, len(IRRIGATION_FEATURES))), rng.integers(0, 2, 5000)),
+        "water": CatBoostRegressor(iterations=1000, depth=6, verbose=0, allow_writing_files=False).fit(
+            rng.random((5000, len(OPTIMIZATION_FEATURES))), rng.random(5000) * 50),
+    }
+    for name, model in models.items():
+        model_registry.MODEL_PATHS[name] = os.path.join(directory, f"{name}.pkl")
+        model_registry.NATIVE_PATHS[name] = os.path.join(directory, f"{name}.native")  # Absent: pickles are read
+        joblib.dump(model, model_registry.MODEL_PATHS[name])
+
+
+def sensor_rows(count: int):
+    now = datetime.now(timezone.utc)
+    return [
+        {"created_at": (now - timedelta(minutes=i)).isoformat(), "device_id": "esp32-1", "temperature": 20 + i % 7,
+         "humidity": 60 + i % 11, "soil_moisture": 0.3 + (i % 5) / 100, "water_level": 40 + i % 3}
+        for i in range(count)
+    ]
+
+
+def drop_caches() -> None:
+    """Forget everything the caching layer keeps between reruns."""
+    import streamlit as st
+
+    model_registry._models.clear()
+    prediction_cache._shared.clear()
+    st.cache_data.clear()
+    st.cache_resource.clear()
+
+
+def session(reruns: int, cached: bool):
+    """Rerun latencies (s) per step of a typical session."""
+    from streamlit.testing.v1 import AppTest
+
+    def timed(action) -> float:
+        if not cached:
+            drop_caches()
+        started = time.perf_counter()
+        action()
+        return time.perf_counter() - started
+
+    drop_caches()
+    app = AppTest.from_file(APP, default_timeout=120)
+    steps = {"first run": [timed(app.run)], "refresh data": [timed(lambda: app.button[0].click().run())]}
+    temperature = app.number_input[3]
+    steps["edit an input"] = [timed(lambda: temperature.set_value(20.0 + i % 10).run()) for i in range(reruns)]
+    crop = app.button(key="crop_recommendation")
+    steps["crop button"] = [timed(lambda: crop.click().run()) for _ in range(reruns)]
+    advisory = app.button(key="full_advisory")
+    steps["full advisory"] = [timed(lambda: advisory.click().run()) for _ in range(reruns)]
+    if app.exception:
+        raise RuntimeError(app.exception[0].value)
+    return steps
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Dashboard rerun latency with and without caching")
+    parser.add_argument("--reruns", type=int, default=20, help="Reruns measured per step")
+    parser.add_argument("--rows", type=int, default=100, help="Sensor readings in the storage")
+    parser.add_argument("--query-latency", type=float, default=0.15, help="Seconds per storage query")
+    args = parser.parse_args()
+
+    store = SlowMemoryStorage(sensor_rows(args.rows), args.query_latency)
+    storage.create_storage = lambda *_: store  # app.py imports it on every rerun
+    os.environ["STORAGE_BACKEND"] = "sqlite"  # Skips the Supabase credentials check; create_storage is replaced
+    with tempfile.TemporaryDirectory() as directory:
+        stand_in_models(directory)
+        results = {}
+        for label, cached in (("no caching", False), ("caching", True)):
+            store.queries = 0
+            results[label] = session(args.reruns, cached)
+            print(f"{label}: {store.queries} storage queries")
+
+    print(f"\n{'step':>14} " + " ".join(f"{label + ' p50/p95 ms':>24}" for label in results))
+    for step in results["caching"]:
+        cells = []
+        for steps in results.values():
+            times = sorted(steps[step])
+            p95 = times[min(len(times) - 1, int(len(times) * 0.95))]
+            cells.append(f"{statistics.median(times) * 1000:>11.0f} / {p95 * 1000:>8.0f}")
+        print(f"{step:>14} " + " ".join(f"{cell:>24}" for cell in cells))
+
+
+if __name__ == "__main__":
+    main()
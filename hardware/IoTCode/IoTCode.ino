@@ -78,6 +78,7 @@ String menuItems[] = {
 };
 int menuIndex = 0;
 int currentServoAngle = 0; // State variable for the servo (0 or 90)
+unsigned long publishSeq = 0; // Incremented on every publish; lets the server drop duplicate deliveries
 
 const int WATER_THRESHOLD = 1800;
 
@@ -220,6 +221,7 @@ void publish_data(float temp, float hum, int water, int rain) {
     doc["rain_status"] = (rain == LOW) ? "DETECTED" : "NO_RAIN";
     doc["water_status"] = (water > WATER_THRESHOLD) ? "FULL" : "NOT_FULL";
     doc["container_status"] = (currentServoAngle == 0) ? "Closed" : "Opened";
+    doc["seq"] = publishSeq++;
 
     char jsonBuffer[200];
     serializeJson(doc, jsonBuffer);
@@ -0,0 +1,222 @@
+"""
+batch_writer.py
+---------------
+Purpose:
+    - Collect decoded sensor readings and write them as one bulk insert
+    - A batch is flushed when it reaches `max_batch_rows` or when its oldest
+      row is older than `max_batch_age_s`, whichever comes first
+    - At most `max_in_flight` batches are written concurrently; once that
+      limit is reached `add()` blocks, pushing back on the caller
+    - An optional `transform` runs on each batch just before it is written
+      (e.g. online irrigation decisions); if it raises, the batch is written
+      unchanged
+
+Run `python batch_writer.py` to benchmark batched vs per-row inserts against
+the in-memory stand-in backend.
+"""
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
+
+from ingest_metrics import BATCH_ROWS, INSERT_FAILURES, INSERT_SECONDS
+
+log = logging.getLogger(__name__)
+
+DEFAULT_BATCH_ROWS = 500
+DEFAULT_BATCH_MAX_AGE_MS = 250
+DEFAULT_MAX_IN_FLIGHT = 4
+
+
+class BatchWriter:
+    """Size/age bounded micro-batcher in front of a storage backend."""
+
+    def __init__(
+        self,
+        storage,
+        max_batch_rows: int = DEFAULT_BATCH_ROWS,
+        max_batch_age_s: float = DEFAULT_BATCH_MAX_AGE_MS / 1000,
+        max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+        transform: Callable[[List[Dict[str, Any]]], None] | None = None,
+    ):
+        if max_batch_rows < 1 or max_in_flight < 1 or max_batch_age_s <= 0:
+            raise ValueError("Batch size, batch age and in-flight limit must be positive")
+        self.storage = storage
+        self.max_batch_rows = max_batch_rows
+        self.max_batch_age_s = max_batch_age_s
+        self.max_in_flight = max_in_flight
+        self.transform = transform
+
+        self._buffer: List[Dict[str, Any]] = []
+        self._oldest_at: float | None = None  # monotonic time of the oldest buffered row
+        self._cond = threading.Condition()
+        self._closed = False
+        self._in_flight = threading.BoundedSemaphore(max_in_flight)
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="batch-writer")
+        self._timer = threading.Thread(target=self._run_timer, name="batch-writer-timer", daemon=True)
+
+        # Statistics (updated from the writer threads)
+        self._stats_lock = threading.Lock()
+        self.rows_written = 0
+        self.batches_written = 0
+        self.rows_failed = 0
+        self.batches_failed = 0
+
+    @classmethod
+    def from_env(cls, storage, transform=None) -> "BatchWriter":
+        """Build a writer configured by INGEST_BATCH_ROWS, INGEST_BATCH_MAX_AGE_MS and INGEST_MAX_IN_FLIGHT."""
+        return cls(
+            storage,
+            max_batch_rows=int(os.getenv("INGEST_BATCH_ROWS", DEFAULT_BATCH_ROWS)),
+            max_batch_age_s=float(os.getenv("INGEST_BATCH_MAX_AGE_MS", DEFAULT_BATCH_MAX_AGE_MS)) / 1000,
+            max_in_flight=int(os.getenv("INGEST_MAX_IN_FLIGHT", DEFAULT_MAX_IN_FLIGHT)),
+            transform=transform,
+        )
+
+    # --- Producer API ---
+
+    def start(self) -> "BatchWriter":
+        self._timer.start()
+        return self
+
+    def add(self, row: Dict[str, Any]) -> None:
+        """Buffer one reading; flushes inline once the batch is full."""
+        self.add_many([row])
+
+    def add_many(self, rows: List[Dict[str, Any]]) -> None:
+        batches = []
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("BatchWriter is closed")
+            for row in rows:
+                if not self._buffer:
+                    self._oldest_at = time.monotonic()
+                    self._cond.notify()
+                self._buffer.append(row)
+                if len(self._buffer) >= self.max_batch_rows:
+                    batches.append(self._take_locked())
+        for batch in batches:
+            self._dispatch(batch)
+
+    def flush(self) -> None:
+        """Hand the current partial batch to a writer thread without waiting for it."""
+        with self._cond:
+            batch = self._take_locked()
+        if batch:
+            self._dispatch(batch)
+
+    def close(self) -> None:
+        """Flush what is buffered and wait for every in-flight batch to finish."""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            batch = self._take_locked()
+            self._cond.notify()
+        if batch:
+            self._dispatch(batch)
+        if self._timer.is_alive():
+            self._timer.join()
+        self._executor.shutdown(wait=True)
+
+    @property
+    def pending_rows(self) -> int:
+        with self._cond:
+            return len(self._buffer)
+
+    # --- Internals ---
+
+    def _take_locked(self) -> List[Dict[str, Any]]:
+        batch, self._buffer = self._buffer, []
+        self._oldest_at = None
+        return batch
+
+    def _dispatch(self, batch: List[Dict[str, Any]]) -> None:
+        # Blocks while max_in_flight batches are already being written.
+        self._in_flight.acquire()
+        self._executor.submit(self._write, batch)
+
+    def _write(self, batch: List[Dict[str, Any]]) -> None:
+        if self.transform is not None:
+            try:
+                self.transform(batch)
+            except Exception as e:
+                log.error("Transform of a %d-row batch failed, writing it unchanged: %s", len(batch), e)
+        backend = (type(self.storage).__name__,)
+        BATCH_ROWS.observe(len(batch), backend)
+        started = time.perf_counter()
+        try:
+            self.storage.insert_many(batch)
+            INSERT_SECONDS.observe(time.perf_counter() - started, backend)
+            with self._stats_lock:
+                self.rows_written += len(batch)
+                self.batches_written += 1
+        except Exception as e:
+            INSERT_FAILURES.inc(labels=backend)
+            with self._stats_lock:
+                self.rows_failed += len(batch)
+                self.batches_failed += 1
+            log.error("Bulk insert of %d rows failed: %s", len(batch), e)
+        finally:
+            self._in_flight.release()
+
+    def _run_timer(self) -> None:
+        """Flush batches whose oldest row has waited longer than max_batch_age_s."""
+        while True:
+            with self._cond:
+                if self._closed:
+                    return
+                if self._oldest_at is None:
+                    self._cond.wait()
+                    continue
+                remaining = self._oldest_at + self.max_batch_age_s - time.monotonic()
+                if remaining > 0:
+                    self._cond.wait(remaining)
+                    continue
+                batch = self._take_locked()
+            self._dispatch(batch)
+
+
+# --- Benchmark against the local stand-in backend ---
+
+def _benchmark(rows: int, latency_ms: float, batch_rows: int, batch_age_ms: float, in_flight: int) -> None:
+    from storage import MemoryStorage
+
+    reading = {"temperature": 24.5, "humidity": 61.0, "rain_status": "NO_RAIN",
+               "water_status": "NOT_FULL", "container_status": "Closed"}
+
+    storage = MemoryStorage(latency_s=latency_ms / 1000, keep_rows=False)
+    per_row = min(rows, 200)
+    start = time.perf_counter()
+    for _ in range(per_row):
+        storage.insert_many([reading])
+    per_row_rate = per_row / (time.perf_counter() - start)
+
+    storage = MemoryStorage(latency_s=latency_ms / 1000, keep_rows=False)
+    writer = BatchWriter(storage, batch_rows, batch_age_ms / 1000, in_flight).start()
+    start = time.perf_counter()
+    for _ in range(rows):
+        writer.add(dict(reading))
+    writer.close()
+    batched_rate = rows / (time.perf_counter() - start)
+
+    print(f"Simulated insert latency: {latency_ms:.1f} ms")
+    print(f"Per-row inserts : {per_row_rate:12,.0f} rows/s")
+    print(f"Batched inserts : {batched_rate:12,.0f} rows/s "
+          f"({storage.insert_calls} requests for {storage.rows_written} rows)")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark BatchWriter against the in-memory backend")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="Simulated insert round trip")
+    parser.add_argument("--batch-rows", type=int, default=DEFAULT_BATCH_ROWS)
+    parser.add_argument("--batch-age-ms", type=float, default=DEFAULT_BATCH_MAX_AGE_MS)
+    parser.add_argument("--in-flight", type=int, default=DEFAULT_MAX_IN_FLIGHT)
+    args = parser.parse_args()
+    _benchmark(args.rows, args.latency_ms, args.batch_rows, args.batch_age_ms, args.in_flight)
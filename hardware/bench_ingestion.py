@@ -0,0 +1,397 @@
+"""
+bench_ingestion.py
+------------------
+Purpose:
+    - Measure how many devices the ingestion service can sustain
+    - Simulates N ESP32 devices publishing the exact JSON produced by
+      `publish_data()` in IoTCode/IoTCode.ino, each to user/<device>/rain_data
+    - Drives the real IngestionService (queue -> workers -> batch writer -> spool)
+      either in-process or through a local MQTT broker, with an in-memory
+      storage stand-in that records when each reading was persisted
+    - Reports sustained messages/s, publish-to-persisted p50/p95/p99 latency,
+      drop counts and peak RSS, and writes them to a JSON file so results can
+      be compared between releases
+    - `--processes N` splits the fleet over N worker processes, each with its
+      own service, the way ingest_supervisor.py shards a real fleet, to check
+      that throughput scales with cores
+    - `--payload binary` sends the same readings in the compact binary layout
+      of reading_schema.py to user/<device>/rain_data/bin instead
+    - `--duplicate-rate` re-sends a fraction of the messages, like QoS 1
+      redeliveries, to check that the duplicate filter drops them
+
+Examples:
+    python bench_ingestion.py --devices 500 --rate 0.2 --duration 30
+    python bench_ingestion.py --devices 2000 --rate 5 --duration 20 --output results.json
+    python bench_ingestion.py --mode broker --broker localhost:1883 --devices 200 --rate 1
+    python bench_ingestion.py --devices 2000 --rate 5 --duration 20 --payload binary
+    python bench_ingestion.py --devices 8000 --rate 5 --duration 20 --processes 4
+"""
+
+import argparse
+import bisect
+import copy
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, List
+
+from batch_writer import BatchWriter
+from ingest_pipeline import IngestPipeline
+from ingest_service import IngestionService, device_id_from_topic
+from reading_schema import ReadingDecoder, encode_binary
+from spool import Spool
+from storage import MemoryStorage
+
+
+BINARY_TOPIC_FILTER = "user/+/rain_data/bin"
+
+
+def firmware_reading(rng: random.Random, seq: int = 0) -> dict:
+    """Same fields and values as publish_data() in IoTCode.ino."""
+    return {
+        "temperature": round(rng.uniform(18.0, 38.0), 1),
+        "humidity": round(rng.uniform(30.0, 95.0), 1),
+        "rain_status": "DETECTED" if rng.random() < 0.1 else "NO_RAIN",
+        "water_status": "FULL" if rng.random() < 0.3 else "NOT_FULL",
+        "container_status": "Opened" if rng.random() < 0.5 else "Closed",
+        "seq": seq,
+    }
+
+
+def firmware_payload(rng: random.Random, seq: int = 0) -> bytes:
+    """A reading with the compact JSON formatting of ArduinoJson's serializeJson()."""
+    return json.dumps(firmware_reading(rng, seq), separators=(",", ":")).encode("utf-8")
+
+
+def binary_payload(rng: random.Random, seq: int = 0) -> bytes:
+    """A reading in binary layout version 2."""
+    return encode_binary(firmware_reading(rng, seq))
+
+
+class RecordingStorage(MemoryStorage):
+    """Stand-in backend that timestamps every row when its bulk insert completes."""
+
+    def __init__(self, latency_s: float = 0.0):
+        super().__init__(latency_s=latency_s, keep_rows=False)
+        self.persisted: List[tuple] = []  # (device_id, created_at, persisted_at)
+
+    def insert_many(self, rows):
+        written = super().insert_many(rows)
+        now = time.time()
+        with self._lock:
+            self.persisted.extend((r["device_id"], r["created_at"], now) for r in rows)
+        return written
+
+
+class Fleet:
+    """Simulated devices publishing at a fixed per-device rate, spread over sender threads."""
+
+    def __init__(
+        self, devices: int, rate: float, duration: float, publish, threads: int, seed: int = 42, binary: bool = False,
+        duplicate_rate: float = 0.0,
+    ):
+        self.devices = devices
+        self.rate = rate
+        self.duration = duration
+        self.publish = publish
+        self.threads = max(1, min(threads, devices))
+        self.seed = seed
+        self.binary = binary
+        self.duplicate_rate = duplicate_rate
+        self.duplicates_sent = 0
+        self.published: Dict[str, List[float]] = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def run(self) -> None:
+        start = time.time() + 0.1
+        workers = [
+            threading.Thread(target=self._run_sender, args=(i, start), daemon=True)
+            for i in range(self.threads)
+        ]
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+
+    def _run_sender(self, index: int, start: float) -> None:
+        rng = random.Random(self.seed + index)
+        device_ids = [str(d) for d in range(index, self.devices, self.threads)]
+        suffix = "/bin" if self.binary else ""
+        topics = [f"user/{d}/rain_data{suffix}" for d in device_ids]
+        make_payload = binary_payload if self.binary else firmware_payload
+        sender_rate = len(device_ids) * self.rate
+        sent: Dict[str, List[float]] = defaultdict(list)
+        seqs = [0] * len(device_ids)
+        duplicates = 0
+        total = int(self.duration * sender_rate)
+        for j in range(total):
+            target = start + j / sender_rate
+            delay = target - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            k = j % len(device_ids)
+            published_at = time.time()
+            payload = make_payload(rng, seqs[k])
+            seqs[k] += 1
+            self.publish(topics[k], payload, published_at)
+            sent[device_ids[k]].append(published_at)
+            if self.duplicate_rate and rng.random() < self.duplicate_rate:
+                self.publish(topics[k], payload, time.time())  # redelivery of the same message
+                duplicates += 1
+        with self._lock:
+            self.duplicates_sent += duplicates
+            for device, times in sent.items():
+                self.published[device].extend(times)
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return float("nan")
+    index = min(len(sorted_values) - 1, max(0, int(round(q / 100 * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+def latencies_ms(published: Dict[str, List[float]], persisted: List[tuple]) -> List[float]:
+    """
+    Match each persisted reading to its publish. The firmware JSON carries no
+    id, so a reading belongs to the latest publish of its device at or before
+    the time it was received (created_at); devices publish seconds apart.
+    """
+    for times in published.values():
+        times.sort()
+    result = []
+    for device, created_at, persisted_at in persisted:
+        times = published.get(device)
+        if not times:
+            continue
+        received = datetime.fromisoformat(created_at).timestamp()
+        i = bisect.bisect_right(times, received + 1e-3) - 1
+        if i >= 0:
+            result.append((persisted_at - times[i]) * 1000)
+    result.sort()
+    return result
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS reports bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_benchmark(args) -> dict:
+    storage = RecordingStorage(latency_s=args.insert_latency_ms / 1000)
+    spool_dir = tempfile.mkdtemp(prefix="bench_spool_")
+    spool = Spool(spool_dir, storage, replay_rows=args.replay_rows)
+    writer = BatchWriter(spool, args.batch_rows, args.batch_age_ms / 1000, args.in_flight)
+    service = IngestionService(
+        storage,
+        spool=spool,
+        writer=writer,
+        pipeline_factory=lambda handler: IngestPipeline(
+            handler, max_queue=args.queue_size, workers=args.workers, policy=args.policy,
+            spill_path=os.path.join(spool_dir, "overflow.bin"),
+        ),
+        log_readings=False,
+        decoder=ReadingDecoder(binary_topics=[BINARY_TOPIC_FILTER]),
+    ).start()
+
+    subscriber = publishers = None
+    if args.mode == "inprocess":
+        publish = service.submit
+    else:
+        subscriber, publishers, publish = connect_broker(args, service)
+
+    fleet = Fleet(
+        args.devices, args.rate, args.duration, publish, args.sender_threads,
+        binary=args.payload == "binary", duplicate_rate=args.duplicate_rate,
+    )
+    started = time.time()
+    fleet.run()
+    publish_done = time.time()
+
+    # Let the pipeline drain: wait until everything published is persisted or progress stops
+    published_total = sum(len(t) for t in fleet.published.values())
+    last_count, last_change = -1, time.time()
+    while time.time() - last_change < args.drain_timeout:
+        count = storage.rows_written
+        if count >= published_total:
+            break
+        if count != last_count:
+            last_count, last_change = count, time.time()
+        time.sleep(0.05)
+
+    if subscriber:
+        subscriber.loop_stop()
+        subscriber.disconnect()
+        for p in publishers:
+            p.loop_stop()
+            p.disconnect()
+    stats = service.stats()
+    service.close()
+    shutil.rmtree(spool_dir, ignore_errors=True)
+
+    persisted = list(storage.persisted)
+    lat = latencies_ms(fleet.published, persisted)
+    last_persist = max((p[2] for p in persisted), default=publish_done)
+    elapsed = max(last_persist, publish_done) - started
+    return {
+        "benchmark": "ingestion",
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        "results": {
+            "published": published_total,
+            "persisted": len(persisted),
+            "offered_msgs_per_s": round(published_total / max(publish_done - started, 1e-9), 1),
+            "sustained_msgs_per_s": round(len(persisted) / max(elapsed, 1e-9), 1),
+            "latency_ms_p50": round(percentile(lat, 50), 2),
+            "latency_ms_p95": round(percentile(lat, 95), 2),
+            "latency_ms_p99": round(percentile(lat, 99), 2),
+            "latency_ms_max": round(lat[-1], 2) if lat else None,
+            "dropped_queue": stats["dropped"],
+            "spilled": stats["spilled"],
+            "failed": stats["failed"],
+            "rejected_payloads": stats["rejected"],
+            "duplicates_sent": fleet.duplicates_sent,
+            "duplicates_dropped": stats["dedup_duplicates"],
+            "lost": published_total - len(persisted),
+            "insert_calls": storage.insert_calls,
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+        },
+    }
+
+
+def _run_shard(args) -> dict:
+    return run_benchmark(args)
+
+
+def run_sharded(args) -> dict:
+    """Run one in-process benchmark per worker process on its share of the fleet and add up the results."""
+    shards = []
+    for i in range(args.processes):
+        shard = copy.copy(args)
+        shard.devices = args.devices // args.processes + (1 if i < args.devices % args.processes else 0)
+        shards.append(shard)
+    with multiprocessing.get_context("spawn").Pool(args.processes) as pool:
+        results = [r["results"] for r in pool.map(_run_shard, shards)]
+
+    combined = {key: sum(r[key] for r in results) for key in (
+        "published", "persisted", "offered_msgs_per_s", "sustained_msgs_per_s", "dropped_queue",
+        "spilled", "failed", "rejected_payloads", "duplicates_sent", "duplicates_dropped", "lost", "insert_calls", "peak_rss_mb",
+    )}
+    # Percentiles cannot be merged exactly; report the worst worker
+    for key in ("latency_ms_p50", "latency_ms_p95", "latency_ms_p99", "latency_ms_max"):
+        combined[key] = max((r[key] for r in results if r[key] is not None), default=None)
+    combined = {key: round(value, 1) if isinstance(value, float) else value for key, value in combined.items()}
+    combined["per_process"] = results
+    return {
+        "benchmark": "ingestion",
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        "results": combined,
+    }
+
+
+def connect_broker(args, service):
+    """Subscriber feeding the service plus a few publisher connections, all on a local broker."""
+    from paho.mqtt import client as mqtt_client
+
+    host, _, port = args.broker.partition(":")
+    port = int(port or 1883)
+
+    def new_client(client_id):
+        return mqtt_client.Client(mqtt_client.CallbackAPIVersion.VERSION2, client_id=client_id)
+
+    subscribed = threading.Event()
+    subscriber = new_client(f"bench-subscriber-{os.getpid()}")
+    subscriber.on_message = lambda client, userdata, msg: service.submit(msg.topic, msg.payload)
+    subscriber.on_subscribe = lambda *a: subscribed.set()
+    subscriber.on_connect = lambda client, *a: client.subscribe(
+        [("user/+/rain_data", args.qos), (BINARY_TOPIC_FILTER, args.qos)]
+    )
+    subscriber.connect(host, port, 60)
+    subscriber.loop_start()
+    if not subscribed.wait(10):
+        raise RuntimeError(f"Could not subscribe on broker {args.broker}")
+
+    publishers = []
+    for i in range(max(1, args.sender_threads)):
+        p = new_client(f"bench-publisher-{os.getpid()}-{i}")
+        p.connect(host, port, 60)
+        p.loop_start()
+        publishers.append(p)
+
+    def publish(topic, payload, published_at):
+        publishers[int(device_id_from_topic(topic)) % len(publishers)].publish(topic, payload, qos=args.qos)
+
+    return subscriber, publishers, publish
+
+
+def main(argv=None) -> dict:
+    parser = argparse.ArgumentParser(description="Simulated ESP32 fleet load test for the ingestion service")
+    parser.add_argument("--mode", choices=("inprocess", "broker"), default="inprocess")
+    parser.add_argument("--broker", default="localhost:1883", help="host:port of a local MQTT broker (broker mode)")
+    parser.add_argument("--qos", type=int, default=0, choices=(0, 1))
+    parser.add_argument("--payload", choices=("json", "binary"), default="json", help="Wire format the devices publish")
+    parser.add_argument("--duplicate-rate", type=float, default=0.0, help="Fraction of messages delivered twice")
+    parser.add_argument("--devices", type=int, default=500)
+    parser.add_argument("--rate", type=float, default=0.2, help="Messages per second per device (firmware: 0.2)")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds of publishing")
+    parser.add_argument("--sender-threads", type=int, default=4)
+    parser.add_argument("--processes", type=int, default=1, help="Worker processes sharing the fleet (inprocess mode)")
+    parser.add_argument("--insert-latency-ms", type=float, default=50.0, help="Simulated storage round trip")
+    parser.add_argument("--queue-size", type=int, default=10_000)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--policy", choices=("block", "drop_oldest", "spill"), default="block")
+    parser.add_argument("--batch-rows", type=int, default=500)
+    parser.add_argument("--batch-age-ms", type=float, default=250)
+    parser.add_argument("--in-flight", type=int, default=4)
+    parser.add_argument("--replay-rows", type=int, default=5000)
+    parser.add_argument("--drain-timeout", type=float, default=10.0, help="Seconds without progress before giving up")
+    parser.add_argument("--output", default="bench_ingestion.json", help="JSON results file")
+    args = parser.parse_args(argv)
+
+    if args.processes > 1 and args.mode != "inprocess":
+        parser.error("--processes needs --mode inprocess; in broker mode run ingest_supervisor.py against the broker")
+    result = run_sharded(args) if args.processes > 1 else run_benchmark(args)
+    with open(args.output, "w") as f:
+        json.dump(result, f, indent=2)
+
+    r = result["results"]
+    print(f"Devices: {args.devices} @ {args.rate}/s ({args.mode}, {args.processes} process(es))")
+    print(f"Published {r['published']:,} | persisted {r['persisted']:,} | lost {r['lost']:,} | dropped {r['dropped_queue']:,}")
+    print(f"Sustained: {r['sustained_msgs_per_s']:,.0f} msg/s (offered {r['offered_msgs_per_s']:,.0f} msg/s)")
+    print(f"Latency ms: p50 {r['latency_ms_p50']} | p95 {r['latency_ms_p95']} | p99 {r['latency_ms_p99']}")
+    print(f"Peak RSS: {r['peak_rss_mb']} MB | insert calls: {r['insert_calls']}")
+    print(f"Results written to {args.output}")
+    return result
+
+
+if __name__ == "__main__":
+    main()
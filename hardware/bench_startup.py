@@ -0,0 +1,243 @@
+"""
+bench_startup.py
+----------------
+Purpose:
+    - Measure the cold start of every entry point: how long a fresh process
+      takes to be ready, and then to answer its first prediction
+        ingestion   `uvicorn data_ingestion:app` (import and lifespan startup, with
+                    SQLite storage and no reachable broker), then POST /predict/advise
+        dashboard   first run of frontend/streamlit_dashboard/app.py, then "Get Full Advisory"
+        scoring     `import batch_scoring`, then score() of a small CSV
+    - Each run is a new interpreter, so nothing is imported or loaded yet;
+      models are stand-ins shaped like the real ones (the committed
+      artifacts are Git LFS pointers), as pickles or in the native formats
+      of model_registry.py
+    - `--delay` waits between ready and the first prediction, like a user
+      reading the page or a client connecting later: the time the background
+      model warm-up has to finish first
+    - `--profile-startup` instead runs each entry point once under
+      `python -X importtime` and prints where its import time goes, summed
+      per top-level package (numpy, pandas, fastapi, catboost...)
+    - Results are written to a JSON file, with the configuration and git
+      revision, so time-to-first-prediction can be compared between releases
+
+Examples:
+    python bench_startup.py
+    python bench_startup.py --entry ingestion dashboard --runs 5 --artifacts native
+    python bench_startup.py --delay 3
+    python bench_startup.py --profile-startup --top 15
+"""
+
+import argparse
+import json
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, List, Tuple
+
+from bench_ingestion import git_revision
+
+HARDWARE_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(HARDWARE_DIR)
+MODELS_DIR = os.path.join(REPO_ROOT, "models")
+APP = os.path.join(REPO_ROOT, "frontend", "streamlit_dashboard", "app.py")
+
+ENTRY_POINTS = ("ingestion", "dashboard", "scoring")
+
+RECORD = {"N": 90, "P": 42, "K": 43, "temperature": 20.9, "humidity": 82.0, "ph": 6.5, "rainfall": 202.9,
+          "soil_moisture": 0.3}
+
+# Every probe prints {"startup_s", "first_prediction_s"}: startup is measured
+# from the first statement to `ready`, the first prediction from `asked` to `answered`
+_PRELUDE = """
+import json, os, sys, time
+started = time.perf_counter()
+sys.path[:0] = [{hardware!r}, {models!r}]
+"""
+
+# Point model_registry at the stand-in artifacts (before anything is loaded)
+_ARTIFACTS = """
+import model_registry
+for name, path in {paths!r}.items():
+    model_registry.MODEL_PATHS[name] = model_registry.NATIVE_PATHS[name] = path
+"""
+
+_PROBES = {
+    "ingestion": """
+import data_ingestion
+imported = time.perf_counter()
+{artifacts}
+from fastapi.testclient import TestClient  # Not part of the service: imported outside both timers
+entered = time.perf_counter()
+with TestClient(data_ingestion.app) as client:  # Runs the lifespan
+    ready = imported + time.perf_counter() - entered
+    time.sleep({delay})
+    asked = time.perf_counter()
+    client.post("/predict/advise", json={{"records": [{record!r}]}}).raise_for_status()
+    answered = time.perf_counter()
+""",
+    "dashboard": """
+from streamlit.testing.v1 import AppTest
+{artifacts}
+app = AppTest.from_file({app!r}, default_timeout=600).run()
+ready = time.perf_counter()
+time.sleep({delay})
+asked = time.perf_counter()
+app.button(key="full_advisory").click().run()
+answered = time.perf_counter()
+if app.exception or not any("Recommended Crop" in str(s.value) for s in app.success):
+    raise RuntimeError(app.exception[0].value if app.exception else "no advisory shown")
+""",
+    "scoring": """
+import batch_scoring
+ready = time.perf_counter()
+{artifacts}
+time.sleep({delay})
+asked = time.perf_counter()
+batch_scoring.score("advise", {source!r}, {destination!r}, workers=0)
+answered = time.perf_counter()
+""",
+}
+
+_REPORT = """
+print(json.dumps({"startup_s": ready - started, "first_prediction_s": answered - asked}))
+"""
+
+
+def stand_in_artifacts(directory: str, native: bool) -> Dict[str, str]:
+    """Models trained with the real features and sizes: pickles, or `.forest` and `.cbm` files."""
+    sys.path.insert(0, MODELS_DIR)
+    import joblib
+    import numpy as np
+    import pandas as pd
+    from catboost import CatBoostClassifier, CatBoostRegressor
+    from sklearn.ensemble import RandomForestClassifier
+
+    from feature_builders import IRRIGATION_FEATURES, OPTIMIZATION_FEATURES
+    from forest_arrays import export_forest
+
+    crops = pd.read_csv(os.path.join(REPO_ROOT, "data", "crop_data.csv"))
+    features = ["N", "P", "K", "temperature", "humidity", "ph", "rainfall"]
+    rng = np.random.default_rng(0)
+    models = {
+        "crop": RandomForestClassifier(n_estimators=200, random_state=42).fit(crops[features], crops["label"]),
+        "irrigation": CatBoostClassifier(iterations=1000, depth=6, verbose=0, allow_writing_files=False).fit(
+            rng.random((5000, len(IRRIGATION_FEATURES))), rng.integers(0, 2, 5000)),
+        "water": CatBoostRegressor(iterations=1000, depth=6, verbose=0, allow_writing_files=False).fit(
+            rng.random((5000, len(OPTIMIZATION_FEATURES))), rng.random(5000) * 50),
+    }
+    paths = {}
+    for name, model in models.items():
+        if not native:
+            paths[name] = os.path.join(directory, f"{name}.pkl")
+            joblib.dump(model, paths[name])
+        elif name == "crop":
+            paths[name] = os.path.join(directory, f"{name}.forest")
+            export_forest(model, paths[name])
+        else:
+            paths[name] = os.path.join(directory, f"{name}.cbm")
+            model.save_model(paths[name])
+    return paths
+
+
+def probe_code(entry: str, paths: Dict[str, str], directory: str, delay: float = 0.0) -> str:
+    body = _PROBES[entry].format(
+        artifacts=_ARTIFACTS.format(paths=paths), record=RECORD, app=APP, delay=delay,
+        source=os.path.join(directory, "fields.csv"), destination=os.path.join(directory, "scored.csv"),
+    )
+    return _PRELUDE.format(hardware=HARDWARE_DIR, models=MODELS_DIR) + body + _REPORT
+
+
+def run_probe(code: str, directory: str, importtime: bool = False) -> Tuple[Dict[str, float], str]:
+    """Run a probe in a fresh interpreter in `directory`; its timings and (with importtime) the -X importtime log."""
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", code]
+    # SQLite storage, spool and database in `directory`, and a closed port as broker: nothing leaves the machine
+    env = {**os.environ, "STORAGE_BACKEND": "sqlite", "INGEST_LOG_LEVEL": "ERROR", "MQTT_BROKER": "127.0.0.1",
+           "MQTT_PORT": "9", "MQTT_TRANSPORT": "tcp", "MQTT_TLS": "0"}
+    done = subprocess.run(command, capture_output=True, text=True, cwd=directory, env=env)
+    if done.returncode:
+        raise RuntimeError(f"Probe failed:\n{done.stderr[-2000:]}")
+    return json.loads(done.stdout.strip().splitlines()[-1]), done.stderr
+
+
+def import_breakdown(log: str) -> Tuple[Dict[str, float], float]:
+    """Seconds of import time per top-level package from a -X importtime log, and the total."""
+    packages: Dict[str, float] = defaultdict(float)
+    for line in log.splitlines():
+        match = re.match(r"import time:\s+(\d+) \|\s+\d+ \|\s*(\S+)", line)
+        if match:
+            packages[match[2].split(".")[0]] += int(match[1]) / 1e6  # Self time, so packages add up to the total
+    return dict(packages), sum(packages.values())
+
+
+def profile_startup(entries: List[str], paths: Dict[str, str], directory: str, top: int) -> Dict[str, dict]:
+    profiles = {}
+    for entry in entries:
+        timings, log = run_probe(probe_code(entry, paths, directory), directory, importtime=True)
+        packages, total = import_breakdown(log)
+        ranked = sorted(packages.items(), key=lambda item: item[1], reverse=True)
+        print(f"\n{entry}: {total:.2f} s of imports until the first prediction "
+              f"(ready {timings['startup_s']:.2f} s, first prediction {timings['first_prediction_s']:.2f} s, "
+              f"both slowed down by -X importtime)")
+        for package, seconds in ranked[:top]:
+            print(f"  {package:<28} {seconds:>6.3f} s {seconds / total:>6.1%}")
+        profiles[entry] = {"import_s": round(total, 3), "packages": {p: round(s, 4) for p, s in ranked[:top]}}
+    return profiles
+
+
+def main(argv=None) -> dict:
+    parser = argparse.ArgumentParser(description="Cold start and time-to-first-prediction of every entry point")
+    parser.add_argument("--entry", nargs="+", choices=ENTRY_POINTS, default=list(ENTRY_POINTS))
+    parser.add_argument("--runs", type=int, default=3, help="Fresh processes per entry point")
+    parser.add_argument("--artifacts", choices=("pickle", "native"), default="pickle",
+                        help="Model formats: the pickles, or the output of `model_registry.py convert`")
+    parser.add_argument("--delay", type=float, default=0.0, help="Seconds between ready and the first prediction")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="Print the import-time breakdown of each entry point instead")
+    parser.add_argument("--top", type=int, default=12, help="Packages listed per entry point with --profile-startup")
+    parser.add_argument("--output", default="bench_startup.json", help="JSON results file")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = stand_in_artifacts(directory, args.artifacts == "native")
+        with open(os.path.join(directory, "fields.csv"), "w") as f:
+            f.write(",".join(RECORD) + "\n" + "\n".join(",".join(map(str, RECORD.values())) for _ in range(100)) + "\n")
+
+        if args.profile_startup:
+            return {"profiles": profile_startup(args.entry, paths, directory, args.top)}
+
+        results = {}
+        print(f"{'entry point':>12} {'ready s':>8} {'first prediction s':>19} {'total s':>8}  (median of {args.runs})")
+        for entry in args.entry:
+            runs = [run_probe(probe_code(entry, paths, directory, args.delay), directory)[0] for _ in range(args.runs)]
+            ready = statistics.median(run["startup_s"] for run in runs)
+            first = statistics.median(run["first_prediction_s"] for run in runs)
+            total = statistics.median(run["startup_s"] + run["first_prediction_s"] for run in runs)
+            results[entry] = {"startup_s": round(ready, 3), "first_prediction_s": round(first, 3),
+                              "time_to_first_prediction_s": round(total, 3)}
+            print(f"{entry:>12} {ready:>8.2f} {first:>19.2f} {total:>8.2f}")
+
+    result = {
+        "benchmark": "startup",
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"Results written to {args.output}")
+    return result
+
+
+if __name__ == "__main__":
+    main()
@@ -1,90 +1,77 @@
-import paho.mqtt
-print("Loaded paho-mqtt version:", paho.mqtt.__version__)
-
-import json
+import logging
 import os
-import ssl 
+import sys
 from contextlib import asynccontextmanager
-from typing import Dict, Any
+from typing import TYPE_CHECKING
 
 # Libraries
 from fastapi import FastAPI
-from paho.mqtt import client as mqtt_client
-from supabase import create_client, Client
+from fastapi.responses import PlainTextResponse
 from dotenv import load_dotenv
 
+from ingest_logging import configure_logging
+from ingest_metrics import REGISTRY, render
+from ingest_service import IngestionService
+from ingest_supervisor import IngestSupervisor
+from mqtt_subscriber import MqttSettings, connect, create_subscriber, unique_client_id
+from prediction_api import router as prediction_router
+from storage import create_storage
+
+# The model registry lives in the models/ folder
+MODELS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "models")
+if MODELS_DIR not in sys.path:
+    sys.path.insert(0, MODELS_DIR)
+
+from model_registry import warm_up  # noqa: E402
+
+# Heavy client libraries (paho, supabase, pandas and the model libraries) are
+# imported at first use, not when uvicorn imports this module
+if TYPE_CHECKING:
+    from paho.mqtt import client as mqtt_client
+
 # --- 1. Load Configuration and Secrets ---
 load_dotenv()
 
-# Supabase Configuration
+# Leveled, rate-limited logging (INGEST_LOG_LEVEL=DEBUG also logs every reading)
+configure_logging()
+log = logging.getLogger("data_ingestion")
+
+# Storage Configuration
+# STORAGE_BACKEND=supabase (default) writes to Supabase using the credentials below,
+# STORAGE_BACKEND=sqlite writes to the embedded database at SQLITE_PATH
 SUPABASE_URL: str = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_KEY: str = os.getenv("SUPABASE_SERVICE_KEY")
 
 # MQTT Configuration (Using environment variables for secure connection)
-# Broker and Port will be read from the .env file
-MQTT_BROKER: str = os.getenv("MQTT_BROKER") 
-MQTT_PORT: int = int(os.getenv("MQTT_PORT")) 
-MQTT_USER: str = os.getenv("MQTT_USER") # Username for private broker
-MQTT_PASSWORD: str = os.getenv("MQTT_PASSWORD") # Password for private broker
-MQTT_TOPIC: str = os.getenv("MQTT_TOPIC")
-MQTT_CLIENT_ID: str = "FastAPI_Ingestion_Service_001" # Unique Client ID for the subscriber
-
-# Database client and MQTT client instances
-supabase: Client | None = None
-mqttc: mqtt_client.Client | None = None
+# MQTT_BROKER, MQTT_PORT, MQTT_USER, MQTT_PASSWORD and MQTT_TOPIC are read from the .env file.
+# MQTT_CLIENT_ID is only a prefix: host, pid and worker number are appended so
+# replicas never kick each other off the broker (see mqtt_subscriber.py).
+MQTT_SETTINGS: MqttSettings = MqttSettings.from_env()
+
+# Worker processes: 1 runs ingestion inside this process; more starts an
+# IngestSupervisor whose workers share the subscription (INGEST_SHARDING)
+INGEST_PROCESSES: int = int(os.getenv("INGEST_PROCESSES", "1"))
+
+# Load the prediction models in the background at startup (PREDICT_WARMUP=0: on the first request)
+PREDICT_WARMUP: bool = os.getenv("PREDICT_WARMUP", "1") == "1"
+
+# Ingestion service (queue -> workers -> batch writer -> spool -> storage) and MQTT client instances
+service: IngestionService | None = None
+supervisor: IngestSupervisor | None = None
+mqttc: "mqtt_client.Client | None" = None
 
 # --- 2. MQTT Callback Functions ---
 
-def on_connect(client, userdata, flags, rc):
-    """Callback function for when the client connects to the MQTT broker."""
-    if rc == 0:
-        print(f"MQTT Connected successfully. Subscribing to topic: {MQTT_TOPIC}")
-        client.subscribe(MQTT_TOPIC)
-    elif rc == 5:
-        # rc=5 means Connection Refused, unauthorized (wrong username/password)
-        print("Failed to connect, return code 5: Authentication failed (check MQTT_USER/PASSWORD)")
-    else:
-        print(f"Failed to connect, return code {rc}")
-
-def on_message(client, userdata, msg):
+def on_message(topic: str, payload: bytes):
     """
     Callback function when a message is received on the subscribed topic.
-    This logic assumes the JSON structure matches the fields defined in the payload dictionary.
+    Runs on paho's network thread, so it only enqueues the raw payload; decoding
+    and storage happen on the ingestion pipeline's worker threads.
     """
-    global supabase
-    if not supabase:
-        print("Error: Supabase client not initialized.")
+    if not service:
+        log.error("Ingestion service not initialized, dropping message on %s", topic)
         return
-
-    try:
-        # 1. Parse the incoming JSON payload from the ESP32
-        data: Dict[str, Any] = json.loads(msg.payload.decode('utf-8'))
-        # NOTE: If data coming from ESP32 is NULL, it will still insert, but Supabase might reject
-        print(f"Received data: {data}")
-
-        # 2. Structure the data for Supabase insertion 
-        # NOTE: Ensure these keys match the columns in your Supabase 'sensor_readings' table
-        payload = {
-            "temperature": data.get("temperature"),
-            "humidity": data.get("humidity"),
-            "water_level_raw": data.get("water_level_raw"),
-            "rain_status": data.get("rain_status"),
-            "servo_angle": data.get("servo_angle"),
-        }
-        
-        # 3. Insert data into the 'sensor_readings' table
-        response = supabase.table('Sensor readings').insert(payload).execute()
-        
-        # Check for insertion errors
-        if response.data:
-            print(f"Successfully inserted record: {response.data[0]['id']}")
-        elif response.error:
-             print(f"Supabase error: {response.error}")
-
-    except json.JSONDecodeError:
-        print(f"Error decoding JSON payload: {msg.payload}")
-    except Exception as e:
-        print(f"An unexpected error occurred during insertion: {e}")
+    service.submit(topic, payload)
 
 
 # --- 3. FastAPI Lifespan (Startup/Shutdown) ---
@@ -94,63 +81,77 @@ async def lifespan(app: FastAPI):
     """
     Handles application startup (DB/MQTT connection) and shutdown (MQTT disconnect) events.
     """
-    global supabase, mqttc
+    global service, supervisor, mqttc
     
     # --- Startup Logic ---
-    print("--- FastAPI Startup ---")
-    
-    # Initialize Supabase Client
-    supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
-    
-    # Initialize MQTT Client
-    # FINAL FIX: Removed CallbackAPIVersion for compatibility with older paho-mqtt versions.
-    
-    mqttc = mqtt_client.Client(
-        mqtt_client.CallbackAPIVersion.VERSION1,
-        client_id=MQTT_CLIENT_ID,
-        transport="websockets",
-        protocol=mqtt_client.MQTTv311
-    )
-
-    mqttc.on_connect = on_connect
-    mqttc.on_message = on_message
-    
-    # 1. Set Username and Password for Private Broker Authentication
-    mqttc.username_pw_set(MQTT_USER, MQTT_PASSWORD)
-    
-    # 2. Configure TLS/SSL for secure WebSocket connection (required by HiveMQ Cloud)
-    mqttc.tls_set(certfile=None, keyfile=None, cert_reqs=ssl.CERT_REQUIRED, tls_version=ssl.PROTOCOL_TLS, ciphers=None)
+    log.info("--- FastAPI Startup ---")
+    if PREDICT_WARMUP:
+        warm_up()
+
+    if INGEST_PROCESSES > 1:
+        # Each worker process runs its own storage, spool and MQTT client;
+        # crashed workers are restarted by the supervisor
+        supervisor = IngestSupervisor(INGEST_PROCESSES).start()
+        yield
+        log.info("--- FastAPI Shutdown ---")
+        supervisor.close()
+        return
     
-    # DIAGNOSTIC PRINT: Check the loaded broker URL 
-    print(f"Attempting to connect to: wss://{MQTT_BROKER}:{MQTT_PORT}/mqtt")
+    # Initialize the storage backend (Supabase or embedded SQLite)
+    storage = create_storage(supabase_url=SUPABASE_URL, supabase_key=SUPABASE_SERVICE_KEY)
+
+    # Every accepted reading is appended to the local spool first; a background
+    # drainer replays it into storage in large bulk inserts, so an outage only
+    # grows the spool instead of losing readings (INGEST_SPOOL_DIR, SPOOL_*).
+    # Readings reach the spool in batches of INGEST_BATCH_ROWS rows or
+    # INGEST_BATCH_MAX_AGE_MS age, through a bounded queue and worker pool
+    # (INGEST_QUEUE_SIZE, INGEST_WORKERS, INGEST_BACKPRESSURE, INGEST_SPILL_DIR).
+    service = IngestionService(storage).start()
     
+    # Initialize MQTT Client (WebSockets + TLS, resubscribes after every reconnect)
+    import paho.mqtt
+    log.info("Loaded paho-mqtt version: %s", paho.mqtt.__version__)
+    mqttc = create_subscriber(MQTT_SETTINGS, unique_client_id(MQTT_SETTINGS.client_id), on_message)
+
     # Connect and start the background thread loop
-    try:
-        # Pass the WebSocket path directly to connect()
-        mqttc.connect(
-            MQTT_BROKER, 
-            MQTT_PORT, 
-            60,
-        )
-        mqttc.loop_start()  # Starts a new thread to handle network traffic
-    except Exception as e:
-        print(f"Could not connect to MQTT broker: {e}")
+    connect(mqttc, MQTT_SETTINGS)
 
     yield
     
     # --- Shutdown Logic ---
-    print("--- FastAPI Shutdown ---")
+    log.info("--- FastAPI Shutdown ---")
     if mqttc:
         mqttc.loop_stop()
         mqttc.disconnect()
+    if service:
+        service.close()  # Drain the queue, flush the writer and replay the spool
 
 # --- 4. FastAPI Application Setup ---
 app = FastAPI(lifespan=lifespan, title="Rain Collector Ingestion Service")
 
+# Batch inference for the crop, irrigation and water models (POST /predict/...)
+app.include_router(prediction_router)
+
 @app.get("/")
 def read_root():
     """Simple status check for the API."""
     return {"status": "ok", "service": "MQTT Ingestion Running"}
 
+@app.get("/ingest/queue")
+def read_queue():
+    """Depth of the ingestion queue, backpressure counters, rows waiting in the batch writer and spool backlog."""
+    if supervisor:
+        return supervisor.stats()  # The same counters per worker process
+    if not service:
+        return {"status": "starting"}
+    return service.stats()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def read_metrics():
+    """Prometheus metrics: message counters, queue depth, batch sizes, insert latency, reconnects, lag and predictions."""
+    # With a supervisor, ingestion runs in the workers; predictions are served by this process
+    families = supervisor.metric_families() + REGISTRY.collect() if supervisor else REGISTRY.collect()
+    return PlainTextResponse(render(families), media_type="text/plain; version=0.0.4")
+
 # --- 5. Run the Service ---
 # To run this, use the command: uvicorn data_ingestion:app --reload
\ No newline at end of file
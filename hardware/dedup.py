@@ -0,0 +1,239 @@
+"""
+dedup.py
+--------
+Purpose:
+    - Drop duplicate readings (QoS retries, broker redeliveries after a
+      reconnect) before they reach the batch writer
+    - Put readings that arrive slightly out of order back in sequence order
+      before they are batched
+    - Keep memory constant: at most `max_devices` devices are tracked (least
+      recently seen are forgotten first) and each holds a fixed amount of state
+
+Per device:
+    - Readings with a `seq` are checked against a sliding window bitmap of the
+      last `window` sequence numbers (the anti-replay window of IPsec), O(1)
+    - A device that reboots restarts its counter at 0: a number far below the
+      window, or one already seen but with a different payload than the
+      reading accepted under it (a redelivery is byte-identical), starts the
+      window again instead of dropping the new readings as duplicates
+    - Readings without one (older firmware) are dropped when the identical
+      payload was seen from the same device within `hash_window_s`, which
+      catches redeliveries but not the next reading of an unchanged sensor
+    - A gap in the sequence holds later readings for up to `reorder_s` seconds,
+      waiting for the missing one
+
+State is per process: with several ingestion workers, each device's readings
+must all reach the same one (device sharding, see ingest_supervisor.py), or
+redeliveries that land on another worker pass and every gap looks permanent.
+"""
+
+import os
+import threading
+import time
+from array import array
+from collections import OrderedDict, deque
+from typing import Any, Dict, List
+
+Row = Dict[str, Any]
+
+DEFAULT_MAX_DEVICES = 100_000
+DEFAULT_WINDOW = 64
+DEFAULT_HASH_WINDOW_MS = 1000
+DEFAULT_REORDER_MS = 500
+DEFAULT_MAX_HELD = 16
+_HASH_RING = 8
+
+
+class _Device:
+    __slots__ = ("highest", "seen", "hashes", "next_seq", "held", "recent")
+
+    def __init__(self):
+        self.highest: int | None = None  # highest seq accepted
+        self.seen = 0  # bit i set: seq (highest - i) was accepted
+        self.hashes: array | None = None  # seq % window -> 32-bit payload hash of the accepted reading
+        self.next_seq: int | None = None  # next seq to release downstream
+        self.held: Dict[int, tuple] = {}  # seq -> (row, release deadline)
+        self.recent: deque = deque(maxlen=_HASH_RING)  # (payload hash, arrival) without seq
+
+
+class Deduplicator:
+    """Per-device duplicate filter and reorder buffer with bounded memory."""
+
+    def __init__(
+        self,
+        max_devices: int = DEFAULT_MAX_DEVICES,
+        window: int = DEFAULT_WINDOW,
+        hash_window_s: float = DEFAULT_HASH_WINDOW_MS / 1000,
+        reorder_s: float = DEFAULT_REORDER_MS / 1000,
+        max_held: int = DEFAULT_MAX_HELD,
+    ):
+        if max_devices < 1 or window < 1 or max_held < 1:
+            raise ValueError("Deduplicator needs max_devices, window and max_held > 0")
+        self.max_devices = max_devices
+        self.window = window
+        self.hash_window_s = hash_window_s
+        self.reorder_s = reorder_s
+        self.max_held = max_held
+        self._mask = (1 << window) - 1
+        self._devices: "OrderedDict[str, _Device]" = OrderedDict()
+        self._holding: set = set()  # devices with held rows
+        self._lock = threading.Lock()
+
+        # Statistics
+        self.accepted = 0
+        self.duplicates = 0
+        self.late = 0
+        self.reordered = 0
+        self.device_restarts = 0
+        self.devices_evicted = 0
+
+    @classmethod
+    def from_env(cls, reorder: bool = True) -> "Deduplicator":
+        """
+        Configured by INGEST_DEDUP_DEVICES, INGEST_DEDUP_WINDOW,
+        INGEST_DEDUP_HASH_WINDOW_MS and INGEST_REORDER_MS (ignored when
+        `reorder` is False).
+        """
+        return cls(
+            max_devices=int(os.getenv("INGEST_DEDUP_DEVICES", DEFAULT_MAX_DEVICES)),
+            window=int(os.getenv("INGEST_DEDUP_WINDOW", DEFAULT_WINDOW)),
+            hash_window_s=float(os.getenv("INGEST_DEDUP_HASH_WINDOW_MS", DEFAULT_HASH_WINDOW_MS)) / 1000,
+            reorder_s=float(os.getenv("INGEST_REORDER_MS", DEFAULT_REORDER_MS)) / 1000 if reorder else 0.0,
+        )
+
+    def offer(self, device_id: str, row: Row, seq: int | None, payload: bytes, now: float | None = None) -> List[Row]:
+        """
+        Admit one reading. Returns the rows to pass on, in order: none for a
+        duplicate or a held reading, several when a gap is filled.
+        """
+        now = time.monotonic() if now is None else now
+        released: List[Row] = []
+        with self._lock:
+            device = self._device_locked(device_id, released)
+            if seq is None:
+                key = hash(payload)
+                if any(k == key and now - t <= self.hash_window_s for k, t in device.recent):
+                    self.duplicates += 1
+                    return released
+                device.recent.append((key, now))
+                self.accepted += 1
+                released.append(row)
+                return released
+            if not self._admit_locked(device, seq, _hash32(payload), released):
+                self.duplicates += 1
+                return released
+            self.accepted += 1
+            self._sequence_locked(device_id, device, seq, row, now, released)
+        return released
+
+    def flush_expired(self, now: float | None = None) -> List[Row]:
+        """Release held readings whose reorder deadline has passed (giving up on the gap before them)."""
+        now = time.monotonic() if now is None else now
+        released: List[Row] = []
+        with self._lock:
+            for device_id in list(self._holding):
+                device = self._devices.get(device_id)
+                while device is not None and device.held and min(d for _, d in device.held.values()) <= now:
+                    device.next_seq = min(device.held)
+                    self._release_locked(device, released)
+                if device is None or not device.held:
+                    self._holding.discard(device_id)
+        return released
+
+    def flush_all(self) -> List[Row]:
+        """Release every held reading, e.g. on shutdown."""
+        released: List[Row] = []
+        with self._lock:
+            for device_id in list(self._holding):
+                self._release_all_locked(self._devices[device_id], released)
+            self._holding.clear()
+        return released
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "dedup_devices": len(self._devices),
+                "dedup_accepted": self.accepted,
+                "dedup_duplicates": self.duplicates,
+                "dedup_late": self.late,
+                "dedup_reordered": self.reordered,
+                "dedup_held_rows": sum(len(self._devices[d].held) for d in self._holding),
+                "dedup_device_restarts": self.device_restarts,
+                "dedup_devices_evicted": self.devices_evicted,
+            }
+
+    # --- Internals ---
+
+    def _device_locked(self, device_id: str, released: List[Row]) -> _Device:
+        device = self._devices.get(device_id)
+        if device is not None:
+            self._devices.move_to_end(device_id)
+            return device
+        if len(self._devices) >= self.max_devices:
+            evicted_id, evicted = self._devices.popitem(last=False)
+            self._release_all_locked(evicted, released)
+            self._holding.discard(evicted_id)
+            self.devices_evicted += 1
+        device = self._devices[device_id] = _Device()
+        return device
+
+    def _admit_locked(self, device: _Device, seq: int, key: int, released: List[Row]) -> bool:
+        """Sliding-window check. False for a duplicate."""
+        if device.hashes is None:
+            device.hashes = array("I", bytes(4 * self.window))
+        slot = seq % self.window
+        if device.highest is None:
+            device.highest, device.seen = seq, 1
+        elif seq > device.highest:
+            device.seen = ((device.seen << (seq - device.highest)) | 1) & self._mask
+            device.highest = seq
+        else:
+            behind = device.highest - seq
+            bit = 1 << behind
+            if behind < self.window and not device.seen & bit:
+                device.seen |= bit  # Late, not seen before
+            elif behind < self.window and device.hashes[slot] == key:
+                return False
+            else:
+                # Far behind the window, or a seen number with a new payload: the counter restarted (device reboot)
+                self.device_restarts += 1
+                self._release_all_locked(device, released)
+                device.highest, device.seen, device.next_seq = seq, 1, None
+        device.hashes[slot] = key
+        return True
+
+    def _sequence_locked(self, device_id: str, device: _Device, seq: int, row: Row, now: float, released: List[Row]) -> None:
+        if self.reorder_s <= 0 or device.next_seq is None or seq == device.next_seq:
+            released.append(row)
+            device.next_seq = seq + 1
+            if device.held:
+                self._release_locked(device, released)
+            return
+        if seq < device.next_seq:
+            # Its successors were already released; pass it on rather than lose it
+            self.late += 1
+            released.append(row)
+            return
+        device.held[seq] = (row, now + self.reorder_s)
+        self._holding.add(device_id)
+        if len(device.held) > self.max_held:
+            device.next_seq = min(device.held)
+            self._release_locked(device, released)
+
+    def _release_locked(self, device: _Device, released: List[Row]) -> None:
+        """Release held rows that continue the sequence from next_seq."""
+        while device.next_seq in device.held:
+            row, _ = device.held.pop(device.next_seq)
+            released.append(row)
+            self.reordered += 1
+            device.next_seq += 1
+
+    def _release_all_locked(self, device: _Device, released: List[Row]) -> None:
+        for seq in sorted(device.held):
+            released.append(device.held[seq][0])
+            self.reordered += 1
+        device.held.clear()
+
+
+def _hash32(payload: bytes) -> int:
+    return hash(payload) & 0xFFFFFFFF
@@ -0,0 +1,231 @@
+"""
+downsampling.py
+---------------
+Purpose:
+    - Reduce sensor time series to about one point per pixel of chart width
+      before they reach Plotly, so a chart of a week or a month sends the
+      browser as many points as a chart of the last 100 readings
+    - `minmax` keeps the lowest and highest reading of every pixel-wide time
+      bucket (spikes and dips stay visible); `lttb` (Largest-Triangle-Three-
+      Buckets) keeps the points that preserve the shape of the line
+    - `history` reads a time window from the finest source that has at most
+      about two rows per pixel and device: the raw table for short windows,
+      the 1-minute or 1-hour rollups (rollups.py) for longer ones, so a
+      month reads about as many rows per device as an hour
+
+Series come back in long form (created_at, series, value), ready for
+`px.line(frame, x="created_at", y="value", color="series")`.
+
+Run `python downsampling.py` to compare chart payloads with and without it.
+"""
+
+import time
+from typing import Dict, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from rollups import HOUR, MINUTE, rollup_tables
+from storage import SensorStorage, to_timestamp
+
+DEFAULT_POINTS = 1000  # About the width of a chart in pixels
+METHODS = ("minmax", "lttb")
+
+# Bucket size of each source, finest first; 0 is the raw table
+SOURCES = (0, MINUTE, HOUR)
+READING_INTERVAL_S = 5  # Seconds between raw readings of a device (publishingInterval of IoTCode.ino)
+ROWS_PER_POINT = 2  # Rows per device a source may have per chart point (min/max keeps two per bucket)
+
+
+def minmax(x: np.ndarray, y: np.ndarray, points: int = DEFAULT_POINTS) -> np.ndarray:
+    """
+    Indices of the lowest and highest y in each of points / 2 equal time buckets,
+    plus the first and last point, in order. x must be sorted.
+    """
+    n = len(x)
+    buckets = max(1, points // 2)
+    if n <= 2 * buckets:
+        return np.arange(n)
+    edges = np.linspace(x[0], x[-1], buckets + 1)
+    bucket = np.clip(np.searchsorted(edges, x, side="right") - 1, 0, buckets - 1)
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])  # Buckets are contiguous runs of sorted x
+    segment = np.repeat(np.arange(len(starts)), np.diff(np.r_[starts, n]))
+    keep = [np.array([0, n - 1])]
+    for reduce in (np.minimum, np.maximum):
+        extreme = reduce.reduceat(y, starts)[segment] == y
+        hits = np.flatnonzero(extreme)
+        keep.append(hits[np.unique(segment[hits], return_index=True)[1]])  # First hit per bucket
+    return np.unique(np.concatenate(keep))
+
+
+def lttb(x: np.ndarray, y: np.ndarray, points: int = DEFAULT_POINTS) -> np.ndarray:
+    """
+    Indices chosen by Largest-Triangle-Three-Buckets: the first and last point and,
+    per bucket of equal point count, the point forming the largest triangle with
+    the point kept before it and the average of the next bucket. x must be sorted.
+    """
+    n = len(x)
+    if points >= n or points < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    edges = (np.arange(points - 1) * (n - 2) / (points - 2)).astype(np.intp) + 1
+    edges[-1] = n - 1
+    out = np.empty(points, dtype=np.intp)
+    out[0], out[-1] = 0, n - 1
+    a = 0
+    for i in range(points - 2):
+        lo, hi = edges[i], edges[i + 1]
+        next_hi = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x, avg_y = x[hi:next_hi].mean(), y[hi:next_hi].mean()
+        # Twice the triangle area (a, candidate, next average); the constant factor does not change the argmax
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(area.argmax())
+        out[i + 1] = a
+    return out
+
+
+def downsample_frame(
+    frame: pd.DataFrame,
+    fields: Sequence[str],
+    points: int = DEFAULT_POINTS,
+    method: str = "minmax",
+) -> pd.DataFrame:
+    """
+    The `fields` of `frame` (created_at, optionally device_id) as long-form series of at
+    most about `points` points each, one series per field (and device, when there are several).
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown method {method!r}, expected one of {', '.join(METHODS)}")
+    select = minmax if method == "minmax" else lttb
+    if frame.empty:
+        return pd.DataFrame({"created_at": pd.Series(dtype="datetime64[ns, UTC]"), "series": [], "value": []})
+    frame = frame.assign(created_at=pd.to_datetime(frame["created_at"], utc=True, format="ISO8601"))
+    devices = frame.groupby("device_id", sort=True, dropna=False) if "device_id" in frame else [(None, frame)]
+    several = "device_id" in frame and frame["device_id"].nunique(dropna=False) > 1
+    parts = []
+    for device, rows in devices:
+        rows = rows.sort_values("created_at", kind="stable")
+        x = rows["created_at"].dt.tz_convert(None).to_numpy(dtype="datetime64[ns]").view(np.int64)
+        for field in fields:
+            if field not in rows:
+                continue
+            y = pd.to_numeric(rows[field], errors="coerce").to_numpy(dtype=np.float64)
+            valid = np.flatnonzero(~np.isnan(y))
+            kept = valid[select(x[valid], y[valid], points)]
+            parts.append(pd.DataFrame({
+                "created_at": rows["created_at"].array[kept],
+                "series": f"{field} ({device})" if several else field,
+                "value": y[kept],
+            }))
+    if not parts:
+        return downsample_frame(frame.iloc[:0], fields, points, method)
+    return pd.concat(parts, ignore_index=True)
+
+
+def pick_source(span_s: float, points: int = DEFAULT_POINTS) -> int:
+    """
+    Bucket size to read a `span_s` window from: the finest source with at most
+    ROWS_PER_POINT * points rows per device, else the coarsest one.
+    """
+    for seconds in SOURCES:
+        if span_s / (seconds or READING_INTERVAL_S) <= ROWS_PER_POINT * max(1, points):
+            return seconds
+    return SOURCES[-1]
+
+
+def history(
+    storage: SensorStorage,
+    start,
+    end,
+    fields: Sequence[str] = ("temperature", "humidity"),
+    points: int = DEFAULT_POINTS,
+    method: str = "minmax",
+    device_id: str | None = None,
+    tables: Dict[int, str] | None = None,
+) -> Tuple[pd.DataFrame, str]:
+    """
+    Downsampled series of `fields` between start and end, and the table they were read from.
+    Rollups only hold temperature and humidity; with min/max the bucket minimum and
+    maximum are both used, so the envelope is the same as from the raw readings.
+    """
+    span = pd.Timestamp(to_timestamp(end)).timestamp() - pd.Timestamp(to_timestamp(start)).timestamp()
+    seconds = pick_source(span, points)
+    if seconds == 0:
+        rows = storage.query_range(start, end, device_id, columns=["created_at", "device_id", *fields])
+        return downsample_frame(pd.DataFrame(rows), fields, points, method), storage.table
+
+    table = (tables or rollup_tables())[seconds]
+    aggregates = [f"{field}_{agg}" for field in fields for agg in ("min", "max", "sum", "count")]
+    rollups = storage.with_table(table)
+    try:
+        rows = pd.DataFrame(rollups.query_range(start, end, device_id, columns=["created_at", "device_id", *aggregates]))
+    finally:
+        rollups.close()
+    if rows.empty:
+        # No rollups for this window (INGEST_ROLLUPS=0, or older than the rollups): read the raw table
+        raw = storage.query_range(start, end, device_id, columns=["created_at", "device_id", *fields])
+        return downsample_frame(pd.DataFrame(raw), fields, points, method), storage.table
+    # Several rows of one bucket (a restart mid-bucket, late readings) merge exactly
+    buckets = rows.groupby(["device_id", "created_at"], as_index=False, dropna=False).agg(
+        {name: {"min": "min", "max": "max"}.get(name.rsplit("_", 1)[1], "sum") for name in aggregates})
+    if method == "minmax":
+        # Each bucket contributes its minimum and its maximum as points
+        lows = buckets[["created_at", "device_id"]].assign(**{f: buckets[f"{f}_min"] for f in fields})
+        highs = buckets[["created_at", "device_id"]].assign(**{f: buckets[f"{f}_max"] for f in fields})
+        points_frame = pd.concat([lows, highs], ignore_index=True)
+    else:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            means = {f: buckets[f"{f}_sum"] / buckets[f"{f}_count"].where(buckets[f"{f}_count"] > 0) for f in fields}
+        points_frame = buckets[["created_at", "device_id"]].assign(**means)
+    return downsample_frame(points_frame, fields, points, method), table
+
+
+# --- Benchmark: chart payload with and without downsampling ---
+
+def _benchmark(interval_s: float, points: int, days: Sequence[float]) -> None:
+    import plotly.express as px
+
+    rng = np.random.default_rng(0)
+    print(f"One reading every {interval_s:g} s, {points} points per series")
+    print(f"{'window':>8} {'source':>7} {'rows read':>10} {'raw points':>11} {'raw JSON MB':>12} "
+          f"{'points':>7} {'JSON MB':>8} {'ms':>6}")
+    for span_days in days:
+        span = span_days * 86400
+        n = int(span / interval_s)
+        t = pd.Timestamp("2025-01-01", tz="UTC") + pd.to_timedelta(np.arange(n) * interval_s, unit="s")
+        daily = np.sin(np.arange(n) * interval_s / 86400 * 2 * np.pi)
+        raw = pd.DataFrame({"created_at": t, "temperature": 22 + 6 * daily + rng.normal(0, 0.5, n),
+                            "humidity": 60 - 15 * daily + rng.normal(0, 2, n)})
+        raw_json = len(px.line(raw, x="created_at", y=["temperature", "humidity"]).to_json())
+
+        seconds = pick_source(span, points)
+        if seconds:
+            # What the rollup table holds for this window
+            bucket = raw["created_at"].dt.floor(f"{seconds}s")
+            source = raw.groupby(bucket).agg(temperature_min=("temperature", "min"), temperature_max=("temperature", "max"),
+                                             humidity_min=("humidity", "min"), humidity_max=("humidity", "max"))
+            rows_read = len(source)
+            source = pd.concat([
+                pd.DataFrame({"created_at": source.index, "temperature": source["temperature_min"], "humidity": source["humidity_min"]}),
+                pd.DataFrame({"created_at": source.index, "temperature": source["temperature_max"], "humidity": source["humidity_max"]}),
+            ], ignore_index=True)
+        else:
+            source, rows_read = raw, n
+        started = time.perf_counter()
+        series = downsample_frame(source, ["temperature", "humidity"], points)
+        elapsed = time.perf_counter() - started
+        chart_json = len(px.line(series, x="created_at", y="value", color="series").to_json())
+        print(f"{span_days:>7g}d {('raw', '1m', '1h')[SOURCES.index(seconds)]:>7} {rows_read:>10,} {2 * n:>11,} "
+              f"{raw_json / 1e6:>12.2f} {len(series):>7,} {chart_json / 1e6:>8.3f} {elapsed * 1000:>6.0f}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark chart payloads with and without downsampling")
+    parser.add_argument("--interval", type=float, default=10.0, help="Seconds between readings")
+    parser.add_argument("--points", type=int, default=DEFAULT_POINTS)
+    parser.add_argument("--days", type=float, nargs="+", default=[0.1, 1, 7, 30])
+    args = parser.parse_args()
+    _benchmark(args.interval, args.points, args.days)
@@ -0,0 +1,71 @@
+"""
+ingest_logging.py
+-----------------
+Purpose:
+    - Leveled logging for the ingestion service instead of print()
+    - A rate-limit filter so a flood of identical errors (a broken device,
+      a storage outage) costs a few lines per interval instead of one per
+      message, which keeps logging safe to leave on in production
+
+Configure with INGEST_LOG_LEVEL (default INFO; DEBUG also logs every reading)
+and INGEST_LOG_BURST / INGEST_LOG_INTERVAL_S (messages allowed per call site
+and interval).
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Dict, Tuple
+
+DEFAULT_BURST = 10
+DEFAULT_INTERVAL_S = 60.0
+
+LOG_FORMAT = "%(asctime)s %(levelname)-7s %(processName)s %(name)s: %(message)s"
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Let through at most `burst` records per call site (logger, level and
+    message template) every `interval_s` seconds. The first record after a
+    window with suppressed records reports how many were dropped.
+    """
+
+    def __init__(self, burst: int = DEFAULT_BURST, interval_s: float = DEFAULT_INTERVAL_S):
+        super().__init__()
+        self.burst = burst
+        self.interval_s = interval_s
+        self._windows: Dict[Tuple[str, int, str], list] = {}  # key -> [window start, passed, suppressed]
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = (record.name, record.levelno, str(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval_s:
+                suppressed = window[2] if window else 0
+                self._windows[key] = [now, 1, 0]
+                if suppressed:
+                    record.msg = f"{record.msg} [{suppressed} similar messages suppressed]"
+                return True
+            if window[1] < self.burst:
+                window[1] += 1
+                return True
+            window[2] += 1
+            return False
+
+
+def configure_logging(level: str | None = None) -> None:
+    """Root handler with the rate limit, configured from INGEST_LOG_LEVEL / INGEST_LOG_BURST / INGEST_LOG_INTERVAL_S."""
+    level = (level or os.getenv("INGEST_LOG_LEVEL", "INFO")).upper()
+    logging.basicConfig(level=level, format=LOG_FORMAT)
+    root = logging.getLogger()
+    root.setLevel(level)
+    rate_limit = RateLimitFilter(
+        burst=int(os.getenv("INGEST_LOG_BURST", DEFAULT_BURST)),
+        interval_s=float(os.getenv("INGEST_LOG_INTERVAL_S", DEFAULT_INTERVAL_S)),
+    )
+    for handler in root.handlers:
+        if not any(isinstance(f, RateLimitFilter) for f in handler.filters):
+            handler.addFilter(rate_limit)
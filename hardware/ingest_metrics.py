@@ -0,0 +1,250 @@
+"""
+ingest_metrics.py
+-----------------
+Purpose:
+    - Counters, gauges and latency histograms for the ingestion service,
+      rendered in the Prometheus text format by GET /metrics
+    - No client library needed: each metric is a few numbers behind a lock,
+      cheap enough for the paths that run once per batch or per connection
+    - Per-message counts the pipeline already keeps (received, processed,
+      dropped, decode errors...) are not counted twice: collectors read
+      them when the endpoint is scraped
+
+Metric families are plain tuples, so worker processes can send theirs to the
+supervisor, which renders them with a `worker` label.
+"""
+
+import bisect
+import math
+import threading
+from typing import Callable, Dict, Iterable, List, NamedTuple, Sequence, Tuple
+
+Labels = Dict[str, str]
+
+# Seconds: 0.5 ms .. 60 s covers an SQLite append up to a Supabase outage retry
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+ROW_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class MetricFamily(NamedTuple):
+    name: str
+    type: str  # counter | gauge | histogram
+    help: str
+    samples: List[Tuple[str, Labels, float]]
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _labels(self, values: Tuple[str, ...]) -> Labels:
+        return dict(zip(self.labelnames, values))
+
+
+class Counter(_Metric):
+    """Monotonically increasing count."""
+
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, labels: Tuple[str, ...] = ()) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def collect(self) -> MetricFamily:
+        with self._lock:
+            samples = [(self.name, self._labels(k), v) for k, v in self._values.items()]
+        return MetricFamily(self.name, self.type, self.help, samples)
+
+
+class Gauge(Counter):
+    """Value that can go up and down."""
+
+    type = "gauge"
+
+    def set(self, value: float, labels: Tuple[str, ...] = ()) -> None:
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(_Metric):
+    """Observations counted into cumulative `le` buckets, plus their sum and count."""
+
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[Tuple[str, ...], list] = {}  # labels -> [bucket counts..., sum, count]
+
+    def observe(self, value: float, labels: Tuple[str, ...] = ()) -> None:
+        self.observe_many((value,), labels)
+
+    def observe_many(self, values: Iterable[float], labels: Tuple[str, ...] = ()) -> None:
+        """Record several observations under one lock acquisition."""
+        buckets, n = self.buckets, len(self.buckets)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [0] * (n + 1) + [0.0, 0]
+            for value in values:
+                state[bisect.bisect_left(buckets, value)] += 1
+                state[n + 1] += value
+                state[n + 2] += 1
+
+    def collect(self) -> MetricFamily:
+        samples = []
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._values.items()]
+        n = len(self.buckets)
+        for key, state in items:
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), state[: n + 1]):
+                cumulative += count
+                samples.append((f"{self.name}_bucket", {**labels, "le": _format_value(bound)}, cumulative))
+            samples.append((f"{self.name}_sum", labels, state[n + 1]))
+            samples.append((f"{self.name}_count", labels, state[n + 2]))
+        return MetricFamily(self.name, self.type, self.help, samples)
+
+
+class Registry:
+    """Metrics plus collector callbacks that produce families at scrape time."""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], Iterable[MetricFamily]]] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], Iterable[MetricFamily]]) -> None:
+        with self._lock:
+            self._collectors.append(collector)
+
+    def remove_collector(self, collector: Callable[[], Iterable[MetricFamily]]) -> None:
+        with self._lock:
+            if collector in self._collectors:
+                self._collectors.remove(collector)
+
+    def collect(self) -> List[MetricFamily]:
+        with self._lock:
+            metrics, collectors = list(self._metrics), list(self._collectors)
+        families = [m.collect() for m in metrics]
+        for collector in collectors:
+            families.extend(collector())
+        return families
+
+    def render(self) -> str:
+        return render(self.collect())
+
+
+def counter_family(name: str, help: str, value: float, labels: Labels | None = None) -> MetricFamily:
+    return MetricFamily(name, "counter", help, [(name, labels or {}, value)])
+
+
+def gauge_family(name: str, help: str, value: float, labels: Labels | None = None) -> MetricFamily:
+    return MetricFamily(name, "gauge", help, [(name, labels or {}, value)])
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def render(families: Iterable[MetricFamily]) -> str:
+    """Prometheus text exposition format (version 0.0.4). Families sharing a name are merged."""
+    merged: Dict[str, MetricFamily] = {}
+    for family in families:
+        if family.name in merged:
+            merged[family.name].samples.extend(family.samples)
+        else:
+            merged[family.name] = MetricFamily(family.name, family.type, family.help, list(family.samples))
+    lines = []
+    for family in merged.values():
+        lines.append(f"# HELP {family.name} {family.help}")
+        lines.append(f"# TYPE {family.name} {family.type}")
+        for name, labels, value in family.samples:
+            label_text = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+            lines.append(f"{name}{{{label_text}}} {_format_value(value)}" if label_text else f"{name} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def with_labels(families: Iterable[MetricFamily], labels: Labels) -> List[MetricFamily]:
+    """Copy of the families with extra labels on every sample (e.g. the worker number)."""
+    return [
+        MetricFamily(f.name, f.type, f.help, [(name, {**labels, **l}, v) for name, l, v in f.samples])
+        for f in families
+    ]
+
+
+# --- Metrics of this process ---
+
+REGISTRY = Registry()
+
+BATCH_ROWS = REGISTRY.register(Histogram(
+    "ingest_batch_rows", "Readings per batch handed to storage.", ("backend",), buckets=ROW_BUCKETS,
+))
+INSERT_SECONDS = REGISTRY.register(Histogram(
+    "ingest_storage_insert_seconds", "Duration of one bulk insert.", ("backend",),
+))
+INSERT_FAILURES = REGISTRY.register(Counter(
+    "ingest_storage_insert_failures_total", "Bulk inserts that raised.", ("backend",),
+))
+PERSIST_LAG = REGISTRY.register(Histogram(
+    "ingest_persist_lag_seconds", "Time from a reading's arrival (created_at) until it is stored in the backend.",
+))
+MQTT_CONNECTS = REGISTRY.register(Counter(
+    "ingest_mqtt_connects_total", "MQTT connection attempts answered by the broker, by result.", ("result",),
+))
+MQTT_DISCONNECTS = REGISTRY.register(Counter(
+    "ingest_mqtt_disconnects_total", "Unexpected MQTT disconnects (each one is followed by a reconnect).",
+))
+MQTT_CONNECTED = REGISTRY.register(Gauge(
+    "ingest_mqtt_connected", "1 while the subscriber is connected to the broker.",
+))
+DECISION_SECONDS = REGISTRY.register(Histogram(
+    "ingest_decision_seconds", "Feature building and inference for one flushed batch, by model.", ("model",),
+))
+DECISION_FAILURES = REGISTRY.register(Counter(
+    "ingest_decision_failures_total", "Batches stored without decisions because inference raised.",
+))
+PREDICT_SECONDS = REGISTRY.register(Histogram(
+    "predict_seconds", "Duration of one model call of the /predict API, by model.", ("model",),
+))
+PREDICT_ROWS = REGISTRY.register(Histogram(
+    "predict_rows", "Records scored per model call of the /predict API, by model.", ("model",), buckets=ROW_BUCKETS,
+))
+BATCHER_QUEUE_SECONDS = REGISTRY.register(Histogram(
+    "predict_batcher_queue_seconds", "Time a request waited for its micro-batch to start, by model.", ("model",),
+))
+BATCHER_BATCH_ROWS = REGISTRY.register(Histogram(
+    "predict_batcher_batch_rows", "Rows per micro-batched model call, by model.", ("model",), buckets=ROW_BUCKETS,
+))
+BATCHER_BATCH_REQUESTS = REGISTRY.register(Histogram(
+    "predict_batcher_batch_requests", "Requests merged into one model call, by model.", ("model",), buckets=ROW_BUCKETS,
+))
+PREDICT_CACHE_LOOKUPS = REGISTRY.register(Counter(
+    "predict_cache_lookups_total", "Records looked up in the prediction cache, by model and result (hit/miss).",
+    ("model", "result"),
+))
@@ -0,0 +1,301 @@
+"""
+ingest_pipeline.py
+------------------
+Purpose:
+    - Decouple the paho network thread from decoding and storage
+    - `submit()` only enqueues the raw MQTT payload into a bounded queue
+    - A pool of worker threads pulls payloads and hands them to the handler,
+      which decodes, validates and persists them
+    - When the queue is full one of three backpressure policies applies:
+        block       -> the paho thread waits for room (TCP pushes back on the broker)
+        drop_oldest -> the oldest queued payload is discarded to make room
+        spill       -> the payload is appended to a spill file on disk and
+                       re-queued once the workers catch up; messages spilled
+                       before a crash or restart are replayed on startup, and
+                       once the file reaches its byte cap drop_oldest applies
+"""
+
+import logging
+import os
+import queue
+import struct
+import threading
+import time
+from typing import Callable, List, Tuple
+
+log = logging.getLogger(__name__)
+
+BLOCK = "block"
+DROP_OLDEST = "drop_oldest"
+SPILL = "spill"
+POLICIES = (BLOCK, DROP_OLDEST, SPILL)
+
+DEFAULT_QUEUE_SIZE = 10_000
+DEFAULT_WORKERS = 2
+DEFAULT_SPILL_MAX_MB = 256
+
+# (topic, raw payload, receive time as a UNIX timestamp)
+Message = Tuple[str, bytes, float]
+Handler = Callable[[str, bytes, float], None]
+
+_SENTINEL = None
+
+
+class SpillFile:
+    """
+    Append-only file of raw messages that did not fit in the queue.
+    Records are length-prefixed so arbitrary payload bytes round-trip.
+    The file is truncated once everything written to it has been read back.
+    Records left by a previous run (crash, restart with a backlog) are read
+    back first; they may have been re-queued once already, so delivery is at
+    least once and the deduplicator drops the repeats. A record cut short by
+    the crash is discarded.
+    """
+
+    _HEADER = struct.Struct("<dHI")  # received_at, topic length, payload length
+
+    def __init__(self, path: str, max_bytes: int = 0):
+        self.path = path
+        self.max_bytes = max_bytes  # 0: unbounded
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._read_offset = 0
+        self.backlog = 0
+        self.size = 0  # Bytes in the file
+        self.recovered = self._recover()
+
+    def _recover(self) -> int:
+        """Count the complete records of a previous run and cut off a torn last one."""
+        with open(self.path, "ab+") as f:
+            end = f.tell()
+            f.seek(0)
+            count = complete = 0
+            while True:
+                header = f.read(self._HEADER.size)
+                if len(header) < self._HEADER.size:
+                    break
+                _, topic_len, payload_len = self._HEADER.unpack(header)
+                if f.tell() + topic_len + payload_len > end:
+                    break
+                f.seek(topic_len + payload_len, os.SEEK_CUR)
+                count, complete = count + 1, f.tell()
+            f.truncate(complete)
+        self.backlog, self.size = count, complete
+        if count:
+            log.warning("Replaying %d messages (%d bytes) spilled by a previous run", count, complete)
+        return count
+
+    def append(self, message: Message) -> bool:
+        """Append one message. False when it would take the file past max_bytes."""
+        topic, payload, received_at = message
+        topic_bytes = topic.encode("utf-8")
+        record = self._HEADER.size + len(topic_bytes) + len(payload)
+        with self._lock:
+            if self.max_bytes and self.size + record > self.max_bytes:
+                return False
+            with open(self.path, "ab") as f:
+                f.write(self._HEADER.pack(received_at, len(topic_bytes), len(payload)))
+                f.write(topic_bytes)
+                f.write(payload)
+            self.backlog += 1
+            self.size += record
+        return True
+
+    def read(self, max_messages: int) -> List[Message]:
+        """Return up to max_messages spilled messages in the order they were written."""
+        messages: List[Message] = []
+        with self._lock:
+            if not self.backlog:
+                return messages
+            with open(self.path, "rb") as f:
+                f.seek(self._read_offset)
+                while len(messages) < max_messages:
+                    header = f.read(self._HEADER.size)
+                    if len(header) < self._HEADER.size:
+                        break
+                    received_at, topic_len, payload_len = self._HEADER.unpack(header)
+                    topic = f.read(topic_len).decode("utf-8")
+                    payload = f.read(payload_len)
+                    messages.append((topic, payload, received_at))
+                self._read_offset = f.tell()
+            self.backlog -= len(messages)
+            if not self.backlog:
+                open(self.path, "wb").close()
+                self._read_offset = self.size = 0
+        return messages
+
+
+class IngestPipeline:
+    """Bounded queue between the MQTT callback and a pool of worker threads."""
+
+    def __init__(
+        self,
+        handler: Handler,
+        max_queue: int = DEFAULT_QUEUE_SIZE,
+        workers: int = DEFAULT_WORKERS,
+        policy: str = BLOCK,
+        spill_path: str | None = None,
+        spill_max_bytes: int = DEFAULT_SPILL_MAX_MB * 2**20,
+    ):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown backpressure policy '{policy}', expected one of {POLICIES}")
+        if max_queue < 1 or workers < 1:
+            raise ValueError("Queue size and worker count must be positive")
+        if policy == SPILL and not spill_path:
+            raise ValueError("The spill policy needs a spill_path")
+
+        self.handler = handler
+        self.policy = policy
+        self.max_queue = max_queue
+        self.queue: "queue.Queue[Message | None]" = queue.Queue(maxsize=max_queue)
+        self.spill = SpillFile(spill_path, spill_max_bytes) if policy == SPILL else None
+
+        self._workers = [
+            threading.Thread(target=self._run_worker, name=f"ingest-worker-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        self._stop = threading.Event()
+        self._spill_feeder = threading.Thread(target=self._run_spill_feeder, name="ingest-spill-feeder", daemon=True)
+
+        # Statistics
+        self._stats_lock = threading.Lock()
+        self.received = 0
+        self.processed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.spill_full = 0
+
+    @classmethod
+    def from_env(cls, handler: Handler, spill_dir: str | None = None) -> "IngestPipeline":
+        """
+        Build a pipeline configured by INGEST_QUEUE_SIZE, INGEST_WORKERS, INGEST_BACKPRESSURE,
+        INGEST_SPILL_DIR and INGEST_SPILL_MAX_MB.
+        """
+        spill_dir = spill_dir or os.getenv("INGEST_SPILL_DIR", "ingest_spill")
+        return cls(
+            handler,
+            max_queue=int(os.getenv("INGEST_QUEUE_SIZE", DEFAULT_QUEUE_SIZE)),
+            workers=int(os.getenv("INGEST_WORKERS", DEFAULT_WORKERS)),
+            policy=os.getenv("INGEST_BACKPRESSURE", BLOCK),
+            spill_path=os.path.join(spill_dir, "overflow.bin"),
+            spill_max_bytes=int(float(os.getenv("INGEST_SPILL_MAX_MB", DEFAULT_SPILL_MAX_MB)) * 2**20),
+        )
+
+    # --- Lifecycle ---
+
+    def start(self) -> "IngestPipeline":
+        for worker in self._workers:
+            worker.start()
+        if self.spill:
+            self._spill_feeder.start()
+        return self
+
+    def close(self, timeout: float = 10.0) -> None:
+        """Stop accepting work, drain what is queued (and spilled) and stop the workers."""
+        self._stop.set()
+        if self.spill and self._spill_feeder.is_alive():
+            self._spill_feeder.join(timeout)
+        for _ in self._workers:
+            self.queue.put(_SENTINEL)
+        for worker in self._workers:
+            worker.join(timeout)
+
+    # --- Producer side (runs on the paho network thread) ---
+
+    def submit(self, topic: str, payload: bytes, received_at: float | None = None) -> bool:
+        """Enqueue one raw message. Returns False if it had to be dropped."""
+        message = (topic, payload, received_at if received_at is not None else time.time())
+        self._count("received")
+
+        if self.policy == BLOCK:
+            self.queue.put(message)
+            return True
+
+        if self.policy == SPILL:
+            # Keep arrival order while a spill backlog exists
+            if self.spill.backlog:
+                self._spill(message)
+                return True
+            try:
+                self.queue.put_nowait(message)
+            except queue.Full:
+                self._spill(message)
+            return True
+
+        self._put_dropping_oldest(message)
+        return True
+
+    @property
+    def depth(self) -> int:
+        return self.queue.qsize()
+
+    def stats(self) -> dict:
+        return {
+            "policy": self.policy,
+            "queue_depth": self.depth,
+            "queue_capacity": self.max_queue,
+            "spill_backlog": self.spill.backlog if self.spill else 0,
+            "spill_bytes": self.spill.size if self.spill else 0,
+            "spill_recovered": self.spill.recovered if self.spill else 0,
+            "workers": len(self._workers),
+            "received": self.received,
+            "processed": self.processed,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "spilled": self.spilled,
+            "spill_full": self.spill_full,
+        }
+
+    # --- Internals ---
+
+    def _count(self, name: str, n: int = 1) -> None:
+        with self._stats_lock:
+            setattr(self, name, getattr(self, name) + n)
+
+    def _spill(self, message: Message) -> None:
+        if self.spill.append(message):
+            self._count("spilled")
+            return
+        # The spill file is at its cap: fall back to drop_oldest
+        self._count("spill_full")
+        self._put_dropping_oldest(message)
+
+    def _put_dropping_oldest(self, message: Message) -> None:
+        while True:
+            try:
+                self.queue.put_nowait(message)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    self.queue.task_done()
+                    self._count("dropped")
+                except queue.Empty:
+                    pass
+
+    def _run_worker(self) -> None:
+        while True:
+            message = self.queue.get()
+            try:
+                if message is _SENTINEL:
+                    return
+                self.handler(*message)
+                self._count("processed")
+            except Exception as e:
+                self._count("failed")
+                log.exception("Ingestion worker failed to handle message on %s: %s", message[0], e)
+            finally:
+                self.queue.task_done()
+
+    def _run_spill_feeder(self) -> None:
+        """Move spilled messages back into the queue whenever it is at most half full."""
+        low_water = max(1, self.max_queue // 2)
+        while True:
+            if self.spill.backlog and self.queue.qsize() < low_water:
+                for message in self.spill.read(self.max_queue - low_water):
+                    self.queue.put(message)
+                continue
+            if self._stop.is_set() and not self.spill.backlog:
+                return
+            time.sleep(0.01)
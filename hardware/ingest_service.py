@@ -0,0 +1,196 @@
+"""
+ingest_service.py
+-----------------
+Purpose:
+    - Wire the ingestion stages together, independent of FastAPI and MQTT:
+        submit() -> IngestPipeline (bounded queue + workers)
+                 -> handle() decodes and validates one message (ReadingDecoder)
+                    and drops duplicates / restores order per device (Deduplicator)
+                 -> BatchWriter (size/age bounded micro-batches, decided per
+                    batch by OnlineDecisions when enabled)
+                    and RollupAggregator (per-minute / per-hour aggregates)
+                 -> Spool (durable write-ahead log, bulk replay)
+                 -> SensorStorage (Supabase / SQLite / in-memory)
+    - Used by the FastAPI app in data_ingestion.py and by the benchmarks
+"""
+
+import logging
+import threading
+from typing import Callable, Iterable, List
+
+from batch_writer import BatchWriter
+from dedup import Deduplicator
+from ingest_metrics import REGISTRY, MetricFamily, counter_family, gauge_family
+from ingest_pipeline import Handler, IngestPipeline
+from online_decisions import OnlineDecisions
+from reading_schema import PayloadError, ReadingDecoder
+from rollups import RollupAggregator
+from spool import Spool
+from storage import SensorStorage, to_timestamp
+
+log = logging.getLogger(__name__)
+
+
+def device_id_from_topic(topic: str) -> str:
+    """Devices publish to user/<device>/rain_data; fall back to the whole topic for other layouts."""
+    parts = topic.split("/")
+    return parts[1] if len(parts) >= 3 else topic
+
+
+class IngestionService:
+    """The full ingestion path from raw MQTT payloads to storage."""
+
+    def __init__(
+        self,
+        storage: SensorStorage,
+        spool: Spool | None = None,
+        writer: BatchWriter | None = None,
+        pipeline_factory: Callable[[Handler], IngestPipeline] = IngestPipeline.from_env,
+        log_readings: bool = True,
+        decoder: ReadingDecoder | None = None,
+        dedup: Deduplicator | None = None,
+        rollups: RollupAggregator | None = None,
+        decisions: OnlineDecisions | None = None,
+    ):
+        self.storage = storage
+        self.spool = spool or Spool.from_env(storage)
+        self.decisions = decisions or OnlineDecisions.from_env()
+        self.writer = writer or BatchWriter.from_env(
+            self.spool, transform=self.decisions.apply if self.decisions is not None else None,
+        )
+        self.decoder = decoder or ReadingDecoder.from_env()
+        self.dedup = dedup or Deduplicator.from_env()
+        self.rollups = rollups or RollupAggregator.from_env(storage)
+        self.pipeline = pipeline_factory(self.handle)
+        self.log_readings = log_readings
+        self._stop = threading.Event()
+        self._reorder_flusher = threading.Thread(target=self._run_reorder_flusher, name="reorder-flusher", daemon=True)
+
+    def start(self) -> "IngestionService":
+        self.spool.start()
+        self.writer.start()
+        if self.rollups is not None:
+            self.rollups.start()
+        self.pipeline.start()
+        if self.dedup.reorder_s > 0:
+            self._reorder_flusher.start()
+        REGISTRY.add_collector(self.metric_families)
+        return self
+
+    def close(self) -> None:
+        REGISTRY.remove_collector(self.metric_families)
+        self.pipeline.close()  # Drain queued messages into the writer
+        self._stop.set()
+        if self._reorder_flusher.is_alive():
+            self._reorder_flusher.join()
+        self._emit(self.dedup.flush_all())  # Readings still waiting for a gap to fill
+        if self.rollups is not None:
+            self.rollups.close()  # Write the open buckets as partial rollups
+        self.writer.close()  # Flush readings still buffered
+        self.spool.close()  # Replay what it can; the rest is picked up on next start
+        self.storage.close()
+
+    def submit(self, topic: str, payload: bytes, received_at: float | None = None) -> bool:
+        """Entry point for the MQTT callback: only enqueues the raw payload."""
+        return self.pipeline.submit(topic, payload, received_at)
+
+    def handle(self, topic: str, raw_payload: bytes, received_at: float) -> None:
+        """Pipeline handler: decode, validate and persist one message."""
+        # 1. Decode the JSON (or binary) payload from the ESP32 against the reading schema
+        try:
+            reading = self.decoder.decode(topic, raw_payload)
+        except PayloadError as e:
+            log.warning("Rejected payload on %s: %s", topic, e)
+            return
+        if self.log_readings and log.isEnabledFor(logging.DEBUG):
+            log.debug("Received data on %s: %s", topic, reading)
+
+        # 2. Structure the data for storage; the schema fields are the table columns
+        payload = {
+            # Readings can sit in the queue and the batch for a while, so stamp
+            # them with the time they arrived rather than the time of insertion
+            "created_at": to_timestamp(received_at),
+            "device_id": device_id_from_topic(topic),
+            **reading,
+        }
+
+        # 3. Drop redeliveries and hold readings that overtook an earlier one
+        rows = self.dedup.offer(payload["device_id"], payload, reading.get("seq"), raw_payload)
+
+        # 4. Queue the reading(s); they are inserted with the next flushed batch
+        if rows:
+            self._emit(rows)
+
+    def _emit(self, rows: List[dict]) -> None:
+        """Pass released readings to the batch writer and the rollups."""
+        self.writer.add_many(rows)
+        if self.rollups is not None:
+            self.rollups.add_many(rows)
+
+    def _run_reorder_flusher(self) -> None:
+        """Release readings held longer than the reorder window, e.g. when the missing one was lost."""
+        while not self._stop.wait(self.dedup.reorder_s / 2):
+            rows = self.dedup.flush_expired()
+            if rows:
+                self._emit(rows)
+
+    def stats(self) -> dict:
+        """Queue depth, backpressure counters, decode errors, rows waiting in the batch writer, spool backlog, rollups and decisions."""
+        return {
+            **self.pipeline.stats(),
+            **self.decoder.stats(),
+            **self.dedup.stats(),
+            "batch_pending_rows": self.writer.pending_rows,
+            **self.spool.stats(),
+            **(self.rollups.stats() if self.rollups is not None else {}),
+            **(self.decisions.stats() if self.decisions is not None else {}),
+        }
+
+    def metric_families(self) -> List[MetricFamily]:
+        """The counters every stage keeps anyway, read when /metrics is scraped."""
+        pipeline, decoder, spool = self.pipeline.stats(), self.decoder.stats(), self.spool.stats()
+        dedup = self.dedup.stats()
+        families = [
+            counter_family("ingest_messages_received_total", "MQTT messages accepted by submit().", pipeline["received"]),
+            counter_family("ingest_messages_processed_total", "Messages handled by the workers.", pipeline["processed"]),
+            counter_family("ingest_messages_failed_total", "Messages whose handler raised.", pipeline["failed"]),
+            counter_family("ingest_messages_dropped_total", "Messages dropped by the drop_oldest policy (or a full spill file).", pipeline["dropped"]),
+            counter_family("ingest_messages_spilled_total", "Messages spilled to disk by the spill policy.", pipeline["spilled"]),
+            counter_family("ingest_spill_full_total", "Messages that found the spill file at INGEST_SPILL_MAX_MB.", pipeline["spill_full"]),
+            gauge_family("ingest_queue_depth", "Messages waiting in the ingestion queue.", pipeline["queue_depth"]),
+            gauge_family("ingest_queue_capacity", "Capacity of the ingestion queue.", pipeline["queue_capacity"]),
+            gauge_family("ingest_spill_backlog", "Spilled messages not yet re-queued.", pipeline["spill_backlog"]),
+            gauge_family("ingest_spill_bytes", "Size of the spill file.", pipeline["spill_bytes"]),
+            counter_family("ingest_payloads_decoded_total", "Payloads decoded into readings.", decoder["decoded"]),
+            counter_family("ingest_payloads_rejected_total", "Payloads that could not be decoded.", decoder["rejected"]),
+            MetricFamily("ingest_field_errors_total", "counter", "Fields that failed validation and were stored as null.", [
+                ("ingest_field_errors_total", {"field": name}, count) for name, count in decoder["field_errors"].items()
+            ]),
+            counter_family("ingest_duplicates_dropped_total", "Redelivered readings dropped before storage.", dedup["dedup_duplicates"]),
+            counter_family("ingest_readings_reordered_total", "Readings held back to restore sequence order.", dedup["dedup_reordered"]),
+            counter_family("ingest_readings_late_total", "Readings that arrived after their successors were released.", dedup["dedup_late"]),
+            gauge_family("ingest_dedup_devices", "Devices tracked by the duplicate filter.", dedup["dedup_devices"]),
+            gauge_family("ingest_batch_pending_rows", "Readings buffered in the batch writer.", self.writer.pending_rows),
+            gauge_family("ingest_spool_pending_rows", "Readings in the spool not yet stored.", spool["spool_pending_rows"]),
+            gauge_family("ingest_spool_bytes", "Size of the spool on disk.", spool["spool_bytes"]),
+            counter_family("ingest_spool_rows_replayed_total", "Readings replayed from the spool into storage.", spool["spool_rows_replayed"]),
+            counter_family("ingest_spool_rows_evicted_total", "Unreplayed readings evicted by the spool size cap.", spool["spool_rows_evicted"]),
+            counter_family("ingest_spool_replay_failures_total", "Failed spool replay attempts.", spool["spool_replay_failures"]),
+        ]
+        if self.rollups is not None:
+            rollups = self.rollups.stats()
+            families += [
+                gauge_family("ingest_rollup_open_buckets", "Rollup buckets still collecting readings.", rollups["rollup_open_buckets"]),
+                gauge_family("ingest_rollup_pending_rows", "Closed rollups waiting to be written.", rollups["rollup_pending_rows"]),
+                counter_family("ingest_rollup_rows_written_total", "Rollup rows written to the rollup tables.", rollups["rollup_rows_written"]),
+                counter_family("ingest_rollup_rows_dropped_total", "Rollup rows dropped by the pending-rows cap.", rollups["rollup_rows_dropped"]),
+                counter_family("ingest_rollup_late_readings_total", "Readings that arrived after their bucket was written.", rollups["rollup_late_readings"]),
+                counter_family("ingest_rollup_write_failures_total", "Failed rollup inserts (retried on the next flush).", rollups["rollup_write_failures"]),
+            ]
+        if self.decisions is not None:
+            decisions = self.decisions.stats()
+            families += [
+                counter_family("ingest_decision_rows_total", "Readings given an irrigation decision.", decisions["decision_rows"]),
+                counter_family("ingest_decision_rows_irrigate_total", "Readings decided as needing irrigation.", decisions["decision_rows_irrigate"]),
+            ]
+        return families
@@ -0,0 +1,288 @@
+"""
+ingest_supervisor.py
+--------------------
+Purpose:
+    - Run the ingestion service as N worker processes so it can use every core
+    - Each worker is a full IngestionService (queue, decoder, batch writer,
+      spool) with its own MQTT client ID and its own spool/spill directories
+    - The fleet is split between workers by hashing the device ID of a
+      wildcard subscription (INGEST_SHARDING=device, the default here) or by
+      an MQTT shared subscription (INGEST_SHARDING=shared)
+    - Duplicate and reorder state (dedup.py) is per process: only device
+      sharding keeps every reading of a device on the same worker, so with a
+      shared subscription the reorder window is turned off
+    - The supervisor restarts crashed workers with exponential backoff and
+      collects their stats and metrics for GET /ingest/queue and GET /metrics
+
+Examples:
+    python ingest_supervisor.py --processes 4
+    INGEST_PROCESSES=4 uvicorn data_ingestion:app     (the API process supervises the workers)
+"""
+
+import argparse
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+from typing import Any, Callable, Dict, List
+
+from dotenv import load_dotenv
+
+from dedup import Deduplicator
+from ingest_logging import configure_logging
+from ingest_metrics import REGISTRY, MetricFamily, counter_family, gauge_family, with_labels
+from ingest_pipeline import IngestPipeline
+from ingest_service import IngestionService
+from mqtt_subscriber import (
+    DEVICE_HASH, NO_SHARDING, SHARED, MqttSettings, connect, create_subscriber, owns_device, unique_client_id,
+)
+from spool import Spool
+from storage import create_storage
+
+log = logging.getLogger(__name__)
+
+DEFAULT_STATS_INTERVAL_S = 1.0
+
+
+def worker_directory(base: str, worker: int, workers: int) -> str:
+    """Per-worker subdirectory so workers never share a spool or spill file."""
+    return base if workers == 1 else os.path.join(base, f"worker-{worker}")
+
+
+def effective_sharding(sharding: str, workers: int) -> str:
+    """
+    Several workers without a sharding mode would each receive every message:
+    split by device by default, so each device's duplicate and reorder state
+    lives in one worker.
+    """
+    return DEVICE_HASH if workers > 1 and sharding == NO_SHARDING else sharding
+
+
+def run_worker(worker: int, workers: int, stats_queue=None, stats_interval_s: float = DEFAULT_STATS_INTERVAL_S) -> None:
+    """Entry point of one worker process: ingest until SIGTERM, then drain and exit."""
+    load_dotenv()
+    configure_logging()
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C goes to the supervisor, which stops us
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+
+    settings = MqttSettings.from_env()
+    settings.sharding = effective_sharding(settings.sharding, workers)
+    storage = create_storage()
+    spool = Spool.from_env(storage, directory=worker_directory(os.getenv("INGEST_SPOOL_DIR", "ingest_spool"), worker, workers))
+    spill_dir = worker_directory(os.getenv("INGEST_SPILL_DIR", "ingest_spill"), worker, workers)
+    # A shared subscription hands each worker an arbitrary subset of a device's
+    # seq numbers: every one would look like a gap and wait out the reorder window
+    dedup = Deduplicator.from_env(reorder=not (settings.sharding == SHARED and workers > 1))
+    service = IngestionService(
+        storage,
+        dedup=dedup,
+        spool=spool,
+        pipeline_factory=lambda handler: IngestPipeline.from_env(handler, spill_dir=spill_dir),
+    ).start()
+
+    if settings.sharding == DEVICE_HASH and workers > 1:
+        def on_message(topic, payload):
+            if owns_device(topic, worker, workers):
+                service.submit(topic, payload)
+    else:
+        on_message = service.submit
+    client = create_subscriber(settings, unique_client_id(settings.client_id, worker), on_message)
+    connect(client, settings)
+
+    try:
+        while not stop.wait(stats_interval_s):
+            if stats_queue is not None:
+                stats_queue.put((worker, os.getpid(), service.stats(), REGISTRY.collect()))
+    finally:
+        client.loop_stop()
+        client.disconnect()
+        service.close()  # Drain the queue, flush the writer and replay the spool
+
+
+class IngestSupervisor:
+    """Starts `processes` worker processes and keeps them running."""
+
+    def __init__(
+        self,
+        processes: int,
+        target: Callable[..., None] = run_worker,
+        max_backoff_s: float = 30.0,
+        stable_after_s: float = 60.0,
+        stop_timeout_s: float = 15.0,
+    ):
+        if processes < 1:
+            raise ValueError("IngestSupervisor needs at least one process")
+        self.processes = processes
+        self.target = target
+        self.max_backoff_s = max_backoff_s
+        self.stable_after_s = stable_after_s
+        self.stop_timeout_s = stop_timeout_s
+
+        # spawn: workers start from a clean interpreter instead of a fork of
+        # a process that already runs paho, uvicorn or writer threads
+        self._context = multiprocessing.get_context("spawn")
+        self._stats_queue = self._context.Queue()
+        self._workers: List[Any] = [None] * processes
+        self._started_at = [0.0] * processes
+        self._failures = [0] * processes
+        self._restart_at: List[float | None] = [None] * processes
+        self._latest: Dict[int, dict] = {}
+        self._families: Dict[int, List[MetricFamily]] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._monitor = threading.Thread(target=self._run_monitor, name="ingest-supervisor", daemon=True)
+        self._collector = threading.Thread(target=self._run_collector, name="ingest-stats", daemon=True)
+
+        # Statistics
+        self.restarts = 0
+
+    @classmethod
+    def from_env(cls) -> "IngestSupervisor":
+        """Build a supervisor for INGEST_PROCESSES workers (default: one per core)."""
+        return cls(int(os.getenv("INGEST_PROCESSES", os.cpu_count() or 1)))
+
+    def start(self) -> "IngestSupervisor":
+        for worker in range(self.processes):
+            self._spawn(worker)
+        self._monitor.start()
+        self._collector.start()
+        return self
+
+    def close(self) -> None:
+        """Ask every worker to drain and exit; kill the ones that do not within stop_timeout_s."""
+        self._stop.set()
+        if self._monitor.is_alive():
+            self._monitor.join()
+        with self._lock:
+            workers = [p for p in self._workers if p is not None]
+        for p in workers:
+            if p.is_alive():
+                p.terminate()  # SIGTERM: the worker closes its service cleanly
+        deadline = time.monotonic() + self.stop_timeout_s
+        for p in workers:
+            p.join(max(0.0, deadline - time.monotonic()))
+            if p.is_alive():
+                log.warning("Worker pid %s did not stop in time, killing it", p.pid)
+                p.kill()
+                p.join()
+        if self._collector.is_alive():
+            self._collector.join()
+
+    def request_stop(self) -> None:
+        """Stop restarting workers and release wait(); safe to call from a signal handler."""
+        self._stop.set()
+
+    def wait(self) -> None:
+        """Block until request_stop() or close() is called."""
+        while not self._stop.wait(1.0):
+            pass
+
+    def stats(self) -> dict:
+        """Per-worker liveness and the latest stats each worker reported."""
+        with self._lock:
+            workers = [
+                {
+                    "worker": i,
+                    "pid": p.pid if p is not None else None,
+                    "alive": p is not None and p.is_alive(),
+                    "recent_failures": self._failures[i],
+                    **self._latest.get(i, {}),
+                }
+                for i, p in enumerate(self._workers)
+            ]
+            restarts = self.restarts
+        return {
+            "processes": self.processes,
+            "alive": sum(w["alive"] for w in workers),
+            "restarts": restarts,
+            "workers": workers,
+        }
+
+    def metric_families(self) -> List[MetricFamily]:
+        """Every worker's latest metrics with a `worker` label, plus the supervisor's own."""
+        with self._lock:
+            reported = list(self._families.items())
+            restarts = self.restarts
+            alive = sum(p is not None and p.is_alive() for p in self._workers)
+        families = [
+            gauge_family("ingest_workers_alive", "Worker processes currently running.", alive),
+            counter_family("ingest_worker_restarts_total", "Crashed worker processes restarted by the supervisor.", restarts),
+        ]
+        for worker, worker_families in sorted(reported):
+            families.extend(with_labels(worker_families, {"worker": str(worker)}))
+        return families
+
+    def _spawn(self, worker: int) -> None:
+        p = self._context.Process(
+            target=self.target,
+            args=(worker, self.processes, self._stats_queue),
+            name=f"ingest-worker-{worker}",
+            daemon=True,
+        )
+        p.start()
+        with self._lock:
+            self._workers[worker] = p
+            self._started_at[worker] = time.monotonic()
+            self._restart_at[worker] = None
+
+    def _run_monitor(self) -> None:
+        while not self._stop.wait(0.2):
+            now = time.monotonic()
+            for worker in range(self.processes):
+                with self._lock:
+                    p, restart_at = self._workers[worker], self._restart_at[worker]
+                if p.is_alive():
+                    continue
+                if restart_at is None:
+                    # A worker that ran for a while is restarted quickly again
+                    if now - self._started_at[worker] >= self.stable_after_s:
+                        self._failures[worker] = 0
+                    delay = min(0.5 * 2 ** self._failures[worker], self.max_backoff_s)
+                    log.error("Worker %d (pid %s) exited with code %s, restarting in %.1fs", worker, p.pid, p.exitcode, delay)
+                    with self._lock:
+                        self._failures[worker] += 1
+                        self._restart_at[worker] = now + delay
+                        self._latest.pop(worker, None)
+                        self._families.pop(worker, None)
+                elif now >= restart_at:
+                    self._spawn(worker)
+                    with self._lock:
+                        self.restarts += 1
+
+    def _run_collector(self) -> None:
+        while not (self._stop.is_set() and not any(p is not None and p.is_alive() for p in self._workers)):
+            try:
+                worker, pid, stats, families = self._stats_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            with self._lock:
+                p = self._workers[worker]
+                if p is not None and p.pid == pid:  # ignore late reports from a replaced worker
+                    self._latest[worker] = stats
+                    self._families[worker] = families
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Run the MQTT ingestion service as several worker processes")
+    parser.add_argument("--processes", type=int, default=None, help="Worker processes (default INGEST_PROCESSES or one per core)")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    configure_logging()
+    supervisor = IngestSupervisor(args.processes) if args.processes else IngestSupervisor.from_env()
+    supervisor.start()
+    sharding = effective_sharding(MqttSettings.from_env().sharding, supervisor.processes)
+    log.info("Started %d ingestion workers (sharding: %s)", supervisor.processes, sharding)
+
+    signal.signal(signal.SIGINT, lambda *_: supervisor.request_stop())
+    signal.signal(signal.SIGTERM, lambda *_: supervisor.request_stop())
+    supervisor.wait()
+    supervisor.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+mqtt_subscriber.py
+------------------
+Purpose:
+    - Build the paho-mqtt subscriber used by the ingestion service, so the
+      single-process FastAPI app and the worker processes of
+      ingest_supervisor.py connect the same way (WebSockets + TLS to HiveMQ Cloud)
+    - Give every subscriber a unique client ID; two clients with the same ID
+      make the broker disconnect the older one
+    - Spread the fleet over several subscribers, either with an MQTT shared
+      subscription ($share/<group>/<topic>, the broker balances messages) or
+      by hashing the device ID of a wildcard subscription
+"""
+
+import logging
+import os
+import socket
+import ssl
+import zlib
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Callable, List
+
+from ingest_metrics import MQTT_CONNECTED, MQTT_CONNECTS, MQTT_DISCONNECTS
+from ingest_service import device_id_from_topic
+
+if TYPE_CHECKING:  # paho is imported when the first subscriber is created
+    from paho.mqtt import client as mqtt_client
+
+log = logging.getLogger(__name__)
+
+NO_SHARDING = "none"
+SHARED = "shared"
+DEVICE_HASH = "device"
+SHARDING_MODES = (NO_SHARDING, SHARED, DEVICE_HASH)
+
+
+@dataclass
+class MqttSettings:
+    """Broker connection settings, read from the same variables as the .env file."""
+
+    broker: str | None = None
+    port: int = 8884
+    user: str | None = None
+    password: str | None = None
+    topic: str = "user/+/rain_data"
+    binary_topics: List[str] = field(default_factory=list)
+    client_id: str = "FastAPI_Ingestion_Service"
+    transport: str = "websockets"
+    tls: bool = True
+    sharding: str = NO_SHARDING
+    share_group: str = "ingestion"
+
+    @classmethod
+    def from_env(cls) -> "MqttSettings":
+        """MQTT_BROKER, MQTT_PORT, MQTT_USER, MQTT_PASSWORD, MQTT_TOPIC, MQTT_CLIENT_ID, MQTT_TRANSPORT, MQTT_TLS,
+        INGEST_BINARY_TOPICS, INGEST_SHARDING and INGEST_SHARE_GROUP."""
+        return cls(
+            broker=os.getenv("MQTT_BROKER"),
+            port=int(os.getenv("MQTT_PORT", 8884)),
+            user=os.getenv("MQTT_USER"),
+            password=os.getenv("MQTT_PASSWORD"),
+            topic=os.getenv("MQTT_TOPIC", cls.topic),
+            binary_topics=[t.strip() for t in os.getenv("INGEST_BINARY_TOPICS", "").split(",") if t.strip()],
+            client_id=os.getenv("MQTT_CLIENT_ID", cls.client_id),
+            transport=os.getenv("MQTT_TRANSPORT", cls.transport),
+            tls=os.getenv("MQTT_TLS", "1") == "1",
+            sharding=os.getenv("INGEST_SHARDING", NO_SHARDING).lower(),
+            share_group=os.getenv("INGEST_SHARE_GROUP", cls.share_group),
+        )
+
+    def topics(self) -> List[str]:
+        """JSON and binary topic filters, wrapped in the shared-subscription group when sharding='shared'."""
+        if self.sharding not in SHARDING_MODES:
+            raise ValueError(f"Unknown INGEST_SHARDING '{self.sharding}', expected one of {SHARDING_MODES}")
+        topics = [self.topic] + [t for t in self.binary_topics if t != self.topic]
+        if self.sharding == SHARED:
+            topics = [f"$share/{self.share_group}/{t}" for t in topics]
+        return topics
+
+
+def unique_client_id(base: str, worker: int | None = None) -> str:
+    """<base>-<host>-<pid>[-w<worker>]: distinct across replicas, hosts and restarts."""
+    client_id = f"{base}-{socket.gethostname()}-{os.getpid()}"
+    return client_id if worker is None else f"{client_id}-w{worker}"
+
+
+def owns_device(topic: str, shard: int, shards: int) -> bool:
+    """Whether the device publishing on `topic` belongs to this shard (stable across processes and runs)."""
+    return zlib.crc32(device_id_from_topic(topic).encode("utf-8")) % shards == shard
+
+
+def create_subscriber(
+    settings: MqttSettings,
+    client_id: str,
+    on_message: Callable[[str, bytes], None],
+) -> "mqtt_client.Client":
+    """Subscriber client that resubscribes on every (re)connect and hands (topic, payload) to on_message."""
+    from paho.mqtt import client as mqtt_client
+
+    topics = settings.topics()
+    client = mqtt_client.Client(
+        mqtt_client.CallbackAPIVersion.VERSION1,
+        client_id=client_id,
+        transport=settings.transport,
+        protocol=mqtt_client.MQTTv311,
+    )
+
+    def on_connect(client, userdata, flags, rc):
+        """Callback function for when the client connects to the MQTT broker."""
+        MQTT_CONNECTS.inc(labels=("ok" if rc == 0 else "refused",))
+        if rc == 0:
+            MQTT_CONNECTED.set(1)
+            log.info("MQTT connected as %s, subscribing to %s", client_id, topics)
+            client.subscribe([(t, 0) for t in topics])
+        elif rc == 5:
+            # rc=5 means Connection Refused, unauthorized (wrong username/password)
+            log.error("MQTT connection refused (rc=5): authentication failed, check MQTT_USER/MQTT_PASSWORD")
+        else:
+            log.error("MQTT connection refused, return code %s", rc)
+
+    def on_disconnect(client, userdata, rc):
+        MQTT_CONNECTED.set(0)
+        if rc != 0:  # 0 is a disconnect() we asked for
+            MQTT_DISCONNECTS.inc()
+            log.warning("MQTT connection lost (rc=%s), paho will reconnect", rc)
+
+    client.on_connect = on_connect
+    client.on_disconnect = on_disconnect
+    client.on_message = lambda client, userdata, msg: on_message(msg.topic, msg.payload)
+
+    # Username and password for private broker authentication
+    if settings.user:
+        client.username_pw_set(settings.user, settings.password)
+    # TLS for the secure WebSocket connection (required by HiveMQ Cloud)
+    if settings.tls:
+        client.tls_set(certfile=None, keyfile=None, cert_reqs=ssl.CERT_REQUIRED, tls_version=ssl.PROTOCOL_TLS, ciphers=None)
+    return client
+
+
+def connect(client: "mqtt_client.Client", settings: MqttSettings) -> bool:
+    """Connect and start paho's network thread; paho keeps reconnecting after a later drop."""
+    scheme = ("wss" if settings.tls else "ws") if settings.transport == "websockets" else ("mqtts" if settings.tls else "mqtt")
+    log.info("Connecting to %s://%s:%s", scheme, settings.broker, settings.port)
+    try:
+        client.connect(settings.broker, settings.port, 60)
+    except Exception as e:
+        log.error("Could not connect to MQTT broker, retrying in the background: %s", e)
+        return False
+    finally:
+        client.loop_start()  # Starts a new thread to handle network traffic (and retries)
+    return True
@@ -0,0 +1,171 @@
+"""
+online_decisions.py
+-------------------
+Purpose:
+    - Make the irrigation decision for every reading while it is ingested,
+      instead of only when someone clicks "Smart Irrigation Check"
+    - Runs on each micro-batch flushed by the batch writer: one feature matrix
+      and one predict_proba call of the Smart Irrigation Classifier per batch,
+      plus one predict call of the optimization regressor for the rows that
+      need water (the regressor is trained on `status == True` rows only)
+    - The results are stored as columns of the reading, so actuators and
+      dashboards read precomputed decisions
+
+Sensors measure temperature, humidity and rain; the soil values the models
+also need (moisture, pH, N/P/K) come from the field profile (`FIELD_*`
+variables), the same defaults the dashboard starts with.
+"""
+
+import logging
+import os
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List
+
+import numpy as np
+
+from ingest_metrics import DECISION_FAILURES, DECISION_SECONDS
+
+# Feature builders and model artifacts live in the models/ folder
+MODELS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "models")
+if MODELS_DIR not in sys.path:
+    sys.path.insert(0, MODELS_DIR)
+
+from advisory import IRRIGATE_LABELS  # noqa: E402
+from feature_builders import irrigation_feature_matrix, optimization_feature_matrix  # noqa: E402
+
+log = logging.getLogger(__name__)
+
+Row = Dict[str, Any]
+
+
+@dataclass
+class FieldProfile:
+    """Soil values of the field the sensors stand in (not measured by the ESP32)."""
+
+    soil_moisture: float = 30.0  # percent, the scale of the training data (about 7 to 54 %)
+    ph: float = 6.7
+    n: float = 80
+    p: float = 48
+    k: float = 40
+    rainfall_mm: float = 0.0  # rainfall used while the rain sensor is dry
+    rain_detected_mm: float = 10.0  # ... and while it detects rain
+
+    @classmethod
+    def from_env(cls) -> "FieldProfile":
+        """FIELD_SOIL_MOISTURE, FIELD_PH, FIELD_N, FIELD_P, FIELD_K, FIELD_RAINFALL_MM and FIELD_RAIN_DETECTED_MM."""
+        return cls(
+            soil_moisture=float(os.getenv("FIELD_SOIL_MOISTURE", cls.soil_moisture)),
+            ph=float(os.getenv("FIELD_PH", cls.ph)),
+            n=float(os.getenv("FIELD_N", cls.n)),
+            p=float(os.getenv("FIELD_P", cls.p)),
+            k=float(os.getenv("FIELD_K", cls.k)),
+            rainfall_mm=float(os.getenv("FIELD_RAINFALL_MM", cls.rainfall_mm)),
+            rain_detected_mm=float(os.getenv("FIELD_RAIN_DETECTED_MM", cls.rain_detected_mm)),
+        )
+
+
+class OnlineDecisions:
+    """Adds irrigation_needed, irrigation_confidence and water_mm to a batch of readings."""
+
+    def __init__(self, classifier, regressor=None, profile: FieldProfile | None = None):
+        self.classifier = classifier
+        self.regressor = regressor
+        self.profile = profile or FieldProfile()
+        self._lock = threading.Lock()
+
+        # Statistics
+        self.batches = 0
+        self.rows_decided = 0
+        self.rows_skipped = 0
+        self.rows_irrigate = 0
+        self.failures = 0
+
+    @classmethod
+    def from_env(cls) -> "OnlineDecisions | None":
+        """
+        Enabled by INGEST_DECISIONS=1; INGEST_DECISION_WATER=1 also predicts the
+        water amount. None (readings are stored without decisions) when disabled
+        or when a model cannot be loaded.
+        """
+        if os.getenv("INGEST_DECISIONS", "0") != "1":
+            return None
+        from model_registry import load_model
+
+        try:
+            classifier = load_model("irrigation")
+            regressor = load_model("water") if os.getenv("INGEST_DECISION_WATER", "0") == "1" else None
+        except Exception as e:
+            log.error("Online irrigation decisions disabled, model could not be loaded: %s", e)
+            return None
+        return cls(classifier, regressor, FieldProfile.from_env())
+
+    def apply(self, rows: List[Row]) -> None:
+        """Decide for every reading with a temperature and humidity, in place. Other rows get null decisions."""
+        decided = [r for r in rows if r.get("temperature") is not None and r.get("humidity") is not None]
+        for row in rows:
+            row["irrigation_needed"] = row["irrigation_confidence"] = row["water_mm"] = None
+        if not decided:
+            with self._lock:
+                self.rows_skipped += len(rows)
+            return
+
+        try:
+            started = time.perf_counter()
+            probabilities = self.classifier.predict_proba(self._features(irrigation_feature_matrix, decided))
+            labels = np.asarray(self.classifier.classes_)[probabilities.argmax(axis=1)]
+            irrigate = np.isin(labels.astype(str), list(IRRIGATE_LABELS))
+            confidence = probabilities.max(axis=1)
+            DECISION_SECONDS.observe(time.perf_counter() - started, ("irrigation",))
+
+            water = None
+            needs_water = [r for r, on in zip(decided, irrigate) if on]
+            if self.regressor is not None and needs_water:
+                started = time.perf_counter()
+                water = self.regressor.predict(self._features(optimization_feature_matrix, needs_water))
+                DECISION_SECONDS.observe(time.perf_counter() - started, ("water",))
+        except Exception:
+            DECISION_FAILURES.inc()
+            with self._lock:
+                self.failures += 1
+            raise
+
+        for row, on, conf in zip(decided, irrigate, confidence):
+            row["irrigation_needed"] = bool(on)
+            row["irrigation_confidence"] = float(conf)
+        if water is not None:
+            for row, amount in zip(needs_water, water):
+                row["water_mm"] = max(float(amount), 0.0)
+        with self._lock:
+            self.batches += 1
+            self.rows_decided += len(decided)
+            self.rows_skipped += len(rows) - len(decided)
+            self.rows_irrigate += len(needs_water)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "decision_batches": self.batches,
+                "decision_rows": self.rows_decided,
+                "decision_rows_skipped": self.rows_skipped,
+                "decision_rows_irrigate": self.rows_irrigate,
+                "decision_failures": self.failures,
+            }
+
+    def _features(self, builder, rows: List[Row]) -> np.ndarray:
+        """Feature matrix of the batch, one row per reading, in the column order the model was trained with."""
+        profile, size = self.profile, len(rows)
+        return builder({
+            "soil_moisture": np.full(size, profile.soil_moisture),
+            "temperature": [row["temperature"] for row in rows],
+            "humidity": [row["humidity"] for row in rows],
+            "ph": np.full(size, profile.ph),
+            "n": np.full(size, profile.n),
+            "p": np.full(size, profile.p),
+            "k": np.full(size, profile.k),
+            "rainfall": np.where(
+                [row.get("rain_status") == "DETECTED" for row in rows], profile.rain_detected_mm, profile.rainfall_mm,
+            ),
+        })
@@ -0,0 +1,288 @@
+"""
+prediction_api.py
+-----------------
+Purpose:
+    - Programmatic inference for the three models, mounted on the ingestion
+      service's FastAPI app:
+        POST /predict/crop        crop recommendation (RandomForest)
+        POST /predict/irrigation  irrigation needed or not (Smart Irrigation Classifier)
+        POST /predict/water       water amount (irrigation optimization regressor)
+        POST /predict/advise      all three at once (models/advisory.py): crop,
+                                  irrigation decision and, where needed, water amount
+    - Every endpoint takes an array of records and scores all of them with one
+      vectorized model call, so a farm-management backend can send thousands
+      of plots per request; requests over PREDICT_MAX_RECORDS are answered 413
+      before their records are validated
+    - The request matrix and the features are built off the event loop (in
+      the thread pool and in the batcher's model thread), so a large request
+      does not stall the others
+    - Concurrent small requests are merged into one model call by an
+      InferenceBatcher per model (PREDICT_BATCH_ROWS, PREDICT_BATCH_WAIT_MS)
+    - Records seen before (inputs equal up to the PREDICT_CACHE_RESOLUTIONS
+      steps) are answered from a PredictionCache per model without feature
+      building or a model call; a reloaded model starts with an empty cache
+    - Models are loaded on the first request (models/model_registry.py); a
+      missing artifact answers 503 instead of failing at startup; pandas and
+      the model libraries are imported then too, not when the service starts
+"""
+
+import os
+import sys
+import time
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+from fastapi import APIRouter, Depends, HTTPException, Request
+from pydantic import BaseModel, Field
+from starlette.concurrency import run_in_threadpool
+
+from inference_batcher import InferenceBatcher
+from ingest_metrics import PREDICT_CACHE_LOOKUPS, PREDICT_ROWS, PREDICT_SECONDS
+
+MODELS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "models")
+if MODELS_DIR not in sys.path:
+    sys.path.insert(0, MODELS_DIR)
+
+from advisory import IRRIGATE_LABELS, advise  # noqa: E402
+from feature_builders import irrigation_feature_matrix, optimization_feature_matrix  # noqa: E402
+from model_registry import load_model  # noqa: E402
+from prediction_cache import PredictionCache, merge  # noqa: E402
+
+# Largest accepted request; bigger exports go through batch scoring
+MAX_RECORDS = int(os.getenv("PREDICT_MAX_RECORDS", "100000"))
+
+# Column order of the crop model (crop recommendation/model_training.py)
+CROP_FEATURES = ["N", "P", "K", "temperature", "humidity", "ph", "rainfall"]
+# Inputs of the irrigation and water feature builders
+FIELD_INPUTS = CROP_FEATURES + ["soil_moisture"]
+
+
+# --- Request and response schemas ---
+
+class CropRecord(BaseModel):
+    N: float = Field(ge=0, description="Nitrogen content in soil")
+    P: float = Field(ge=0, description="Phosphorus content in soil")
+    K: float = Field(ge=0, description="Potassium content in soil")
+    temperature: float = Field(ge=-40, le=85, description="Temperature (°C)")
+    humidity: float = Field(ge=0, le=100, description="Relative humidity (%)")
+    ph: float = Field(ge=0, le=14, description="Soil pH")
+    rainfall: float = Field(ge=0, description="Rainfall (mm)")
+
+
+class FieldRecord(CropRecord):
+    soil_moisture: float = Field(ge=0, description="Volumetric soil moisture content")
+
+
+class CropRequest(BaseModel):
+    records: List[CropRecord] = Field(max_length=MAX_RECORDS)
+
+
+class FieldRequest(BaseModel):
+    records: List[FieldRecord] = Field(max_length=MAX_RECORDS)
+
+
+class CropPrediction(BaseModel):
+    crop: str
+    confidence: float
+
+
+class IrrigationPrediction(BaseModel):
+    irrigation_needed: bool
+    confidence: float
+
+
+class WaterPrediction(BaseModel):
+    water_mm: float
+
+
+class Advice(BaseModel):
+    crop: str
+    crop_confidence: float
+    irrigation_needed: bool
+    irrigation_confidence: float
+    water_mm: float | None = Field(description="Recommended water amount, null when no irrigation is needed")
+
+
+class CropResponse(BaseModel):
+    predictions: List[CropPrediction]
+
+
+class IrrigationResponse(BaseModel):
+    predictions: List[IrrigationPrediction]
+
+
+class WaterResponse(BaseModel):
+    predictions: List[WaterPrediction]
+
+
+class AdviceResponse(BaseModel):
+    predictions: List[Advice]
+
+
+# --- Models (FastAPI dependencies, so tests can override them) ---
+
+def _model(name: str):
+    try:
+        return load_model(name)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=503, detail=f"Model '{name}' unavailable: {e}")
+
+
+def crop_model():
+    return _model("crop")
+
+
+def irrigation_model():
+    return _model("irrigation")
+
+
+def water_model():
+    return _model("water")
+
+
+async def at_most_max_records(request: Request) -> None:
+    """
+    Answer 413 to an oversized request. Runs before the body is validated:
+    the schema's own limit would answer 422 and echo every record back.
+    """
+    try:
+        body = await request.json()  # Already parsed and cached by FastAPI for the body parameter
+    except ValueError:
+        return  # Not JSON: left to the body validation
+    records = body.get("records") if isinstance(body, dict) else None
+    if isinstance(records, list) and len(records) > MAX_RECORDS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_RECORDS} records per request")
+
+
+# --- Helpers ---
+
+def _inputs(records: List[CropRecord], names: List[str]) -> np.ndarray:
+    """(records, names) float matrix of the request."""
+    return np.array([[getattr(r, name) for name in names] for r in records], dtype=np.float64)
+
+
+def _irrigation_features(inputs: np.ndarray) -> np.ndarray:
+    return irrigation_feature_matrix(dict(zip(FIELD_INPUTS, inputs.T)))
+
+
+def _optimization_features(inputs: np.ndarray) -> np.ndarray:
+    return optimization_feature_matrix(dict(zip(FIELD_INPUTS, inputs.T)))
+
+
+# name -> (model, its batcher, its cache or None)
+_serving: Dict[str, Tuple[object, InferenceBatcher, PredictionCache | None]] = {}
+
+
+def _timed(name: str, predict: Callable[[np.ndarray], np.ndarray]) -> Callable[[np.ndarray], np.ndarray]:
+    """Wrap a model call to record its latency and batch size."""
+    def call(X: np.ndarray) -> np.ndarray:
+        started = time.perf_counter()
+        result = predict(X)
+        PREDICT_SECONDS.observe(time.perf_counter() - started, (name,))
+        PREDICT_ROWS.observe(len(X), (name,))
+        return result
+    return call
+
+
+async def _predict(
+    name: str,
+    model,
+    predict: Callable[[np.ndarray], np.ndarray],
+    records: List[CropRecord],
+    columns: List[str],
+    features: Callable[[np.ndarray], np.ndarray] | None = None,
+) -> np.ndarray:
+    """
+    Model output for every record: cached rows from the model's cache, the
+    others scored through its batcher, merged with concurrent requests. The
+    batcher builds the features of each merged batch on its model thread.
+    """
+    served_model, batcher, cache = _serving.get(name, (None, None, None))
+    if served_model is not model:  # First request, or a reloaded (or overridden) model
+        if batcher is not None:
+            batcher.close()  # Requests already queued for the old model are still answered, then its thread ends
+        featurized = predict if features is None else lambda inputs: predict(features(inputs))
+        batcher = InferenceBatcher.from_env(_timed(name, featurized), name)
+        cache = PredictionCache.from_env(columns)
+        _serving[name] = (model, batcher, cache)
+    inputs = await run_in_threadpool(_inputs, records, columns)
+    if cache is None:
+        return await batcher.submit(inputs)
+
+    keys, found = cache.get_many(inputs)
+    missing = [i for i, row in enumerate(found) if row is None]
+    PREDICT_CACHE_LOOKUPS.inc(len(found) - len(missing), (name, "hit"))
+    PREDICT_CACHE_LOOKUPS.inc(len(missing), (name, "miss"))
+    computed = None
+    if missing:
+        computed = await batcher.submit(inputs[missing])
+        cache.put_many([keys[i] for i in missing], computed)
+    return merge(found, missing, computed)
+
+
+# --- Endpoints ---
+
+router = APIRouter(prefix="/predict", tags=["predictions"], dependencies=[Depends(at_most_max_records)])
+
+
+@router.post("/crop", response_model=CropResponse)
+async def predict_crop(request: CropRequest, model=Depends(crop_model)):
+    """Recommended crop and its probability for every record."""
+    import pandas as pd
+
+    if not request.records:
+        return {"predictions": []}
+    probabilities = await _predict(
+        "crop", model, lambda X: model.predict_proba(pd.DataFrame(X, columns=CROP_FEATURES)),
+        request.records, CROP_FEATURES,
+    )
+    crops = np.asarray(model.classes_)[probabilities.argmax(axis=1)]
+    return {"predictions": [
+        {"crop": str(crop), "confidence": float(conf)} for crop, conf in zip(crops, probabilities.max(axis=1))
+    ]}
+
+
+@router.post("/irrigation", response_model=IrrigationResponse)
+async def predict_irrigation(request: FieldRequest, model=Depends(irrigation_model)):
+    """Whether each field needs irrigation, with the probability of that decision."""
+    if not request.records:
+        return {"predictions": []}
+    probabilities = await _predict(
+        "irrigation", model, model.predict_proba, request.records, FIELD_INPUTS, _irrigation_features,
+    )
+    labels = np.asarray(model.classes_)[probabilities.argmax(axis=1)].astype(str)
+    return {"predictions": [
+        {"irrigation_needed": label in IRRIGATE_LABELS, "confidence": float(conf)}
+        for label, conf in zip(labels, probabilities.max(axis=1))
+    ]}
+
+
+@router.post("/water", response_model=WaterResponse)
+async def predict_water(request: FieldRequest, model=Depends(water_model)):
+    """Recommended water amount (mm) for every field."""
+    if not request.records:
+        return {"predictions": []}
+    water = await _predict(
+        "water", model, model.predict, request.records, FIELD_INPUTS, _optimization_features,
+    )
+    return {"predictions": [{"water_mm": float(amount)} for amount in water]}
+
+
+@router.post("/advise", response_model=AdviceResponse)
+def predict_advice(
+    request: FieldRequest,
+    crop=Depends(crop_model),
+    irrigation=Depends(irrigation_model),
+    water=Depends(water_model),
+):
+    """Crop, irrigation decision and water amount for every field, with features built once for all three models."""
+    import pandas as pd
+
+    if not request.records:
+        return {"predictions": []}
+    started = time.perf_counter()
+    advice = advise(pd.DataFrame(_inputs(request.records, FIELD_INPUTS), columns=FIELD_INPUTS), crop, irrigation, water)
+    PREDICT_SECONDS.observe(time.perf_counter() - started, ("advise",))
+    PREDICT_ROWS.observe(len(advice), ("advise",))
+    advice["water_mm"] = advice["water_mm"].astype(object).where(advice["water_mm"].notna(), None)
+    return {"predictions": advice.to_dict("records")}
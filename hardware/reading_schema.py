@@ -0,0 +1,281 @@
+"""
+reading_schema.py
+-----------------
+Purpose:
+    - Declare the fields of one sensor reading, as published by publish_data()
+      in IoTCode/IoTCode.ino, in a single place
+    - Compile the declaration into a decoder that turns raw MQTT payloads into
+      typed rows (or columnar batches) and counts validation errors per field
+    - Support a compact fixed-layout binary payload next to the firmware JSON,
+      chosen per topic, for fleets where parse CPU and broker bandwidth matter
+
+Binary layout, version 1 (little endian, 6 bytes instead of ~110 bytes of JSON):
+    uint8   version             1
+    int16   temperature x 100   -32768 when the DHT read failed
+    uint16  humidity x 100      65535 when the DHT read failed
+    uint8   flags               bit 0 rain detected, bit 1 water full, bit 2 container opened
+Version 2 (10 bytes) appends
+    uint32  seq                 per-device message counter, used to drop duplicates
+"""
+
+import json
+import math
+import os
+import struct
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Sequence, Tuple
+
+# Same threshold as WATER_THRESHOLD in IoTCode.ino, used for legacy raw readings
+WATER_THRESHOLD = 1800
+
+JSON = "json"
+BINARY = "binary"
+
+
+class PayloadError(ValueError):
+    """The payload could not be decoded into a reading at all."""
+
+
+@dataclass(frozen=True)
+class Field:
+    """
+    One column of a reading.
+    `kind` is "float" (range checked, NaN/null means the sensor had no value),
+    "int" (range checked) or "enum" (must be one of `choices`). `legacy` lists older payload keys
+    and how to convert their values, for devices still on old firmware.
+    """
+
+    name: str
+    kind: str
+    minimum: float | None = None
+    maximum: float | None = None
+    choices: Tuple[str, ...] = ()
+    legacy: Tuple[Tuple[str, Callable[[Any], Any]], ...] = ()
+
+
+SENSOR_READING_SCHEMA: Tuple[Field, ...] = (
+    Field("temperature", "float", minimum=-40.0, maximum=85.0),
+    Field("humidity", "float", minimum=0.0, maximum=100.0),
+    Field("rain_status", "enum", choices=("DETECTED", "NO_RAIN")),
+    Field(
+        "water_status", "enum", choices=("FULL", "NOT_FULL"),
+        legacy=(("water_level_raw", lambda raw: "FULL" if raw > WATER_THRESHOLD else "NOT_FULL"),),
+    ),
+    Field(
+        "container_status", "enum", choices=("Opened", "Closed"),
+        legacy=(("servo_angle", lambda angle: "Closed" if angle == 0 else "Opened"),),
+    ),
+    # Incremented by the firmware on every publish (restarts at 0 on reboot)
+    Field("seq", "int", minimum=0, maximum=2**32 - 1),
+)
+
+_BINARY_V1 = struct.Struct("<BhHB")
+_BINARY_V2 = struct.Struct("<BhHBI")
+_TEMPERATURE_MISSING = -32768
+_HUMIDITY_MISSING = 0xFFFF
+_RAIN, _WATER_FULL, _CONTAINER_OPEN = 1, 2, 4
+
+_MAX_CACHED_TOPICS = 65536
+
+
+def _compile_field(field: Field) -> Callable[[Any], Any]:
+    """Validator for one field: returns the typed value or raises ValueError."""
+    if field.kind == "float":
+        low = -math.inf if field.minimum is None else field.minimum
+        high = math.inf if field.maximum is None else field.maximum
+
+        def check_float(value):
+            if value is None:
+                return None
+            if value.__class__ is bool or not isinstance(value, (int, float)):
+                raise ValueError(f"{field.name} must be a number, got {value!r}")
+            value = float(value)
+            if math.isnan(value):
+                return None
+            if not low <= value <= high:
+                raise ValueError(f"{field.name}={value} outside [{low}, {high}]")
+            return value
+
+        return check_float
+    if field.kind == "int":
+        low = -math.inf if field.minimum is None else field.minimum
+        high = math.inf if field.maximum is None else field.maximum
+
+        def check_int(value):
+            if value is None:
+                return None
+            if value.__class__ is bool or not isinstance(value, int):
+                raise ValueError(f"{field.name} must be an integer, got {value!r}")
+            if not low <= value <= high:
+                raise ValueError(f"{field.name}={value} outside [{low}, {high}]")
+            return value
+
+        return check_int
+    if field.kind == "enum":
+        choices = frozenset(field.choices)
+
+        def check_enum(value):
+            if value is None or value in choices:
+                return value
+            raise ValueError(f"{field.name} must be one of {sorted(choices)}, got {value!r}")
+
+        return check_enum
+    raise ValueError(f"Unknown field kind '{field.kind}' for {field.name}")
+
+
+def topic_matches(topic_filter: str, topic: str) -> bool:
+    """MQTT topic filter matching with the + and # wildcards."""
+    filter_parts, topic_parts = topic_filter.split("/"), topic.split("/")
+    for i, part in enumerate(filter_parts):
+        if part == "#":
+            return True
+        if i >= len(topic_parts) or (part != "+" and part != topic_parts[i]):
+            return False
+    return len(filter_parts) == len(topic_parts)
+
+
+def encode_binary(reading: Dict[str, Any]) -> bytes:
+    """Pack a reading into the binary layout (version 2 when it has a seq, else version 1)."""
+    temperature, humidity = reading.get("temperature"), reading.get("humidity")
+    flags = (
+        (_RAIN if reading.get("rain_status") == "DETECTED" else 0)
+        | (_WATER_FULL if reading.get("water_status") == "FULL" else 0)
+        | (_CONTAINER_OPEN if reading.get("container_status") == "Opened" else 0)
+    )
+    values = (
+        _TEMPERATURE_MISSING if temperature is None or math.isnan(temperature) else round(temperature * 100),
+        _HUMIDITY_MISSING if humidity is None or math.isnan(humidity) else round(humidity * 100),
+        flags,
+    )
+    if reading.get("seq") is None:
+        return _BINARY_V1.pack(1, *values)
+    return _BINARY_V2.pack(2, *values, reading["seq"])
+
+
+class ReadingDecoder:
+    """
+    Decoder compiled from a schema.
+    Payloads on topics matching one of `binary_topics` are decoded with the
+    binary layout, everything else as JSON. A field that fails validation is
+    stored as null and counted in `field_errors`; only a payload that cannot
+    be decoded at all is rejected (PayloadError).
+    """
+
+    def __init__(self, schema: Sequence[Field] = SENSOR_READING_SCHEMA, binary_topics: Iterable[str] = ()):
+        self.schema = tuple(schema)
+        self.names = tuple(f.name for f in self.schema)
+        self.binary_topics = tuple(binary_topics)
+        self._fields = tuple((f.name, _compile_field(f), f.legacy) for f in self.schema)
+        self._checks = {name: check for name, check, _ in self._fields}
+        self._formats: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+        # Statistics
+        self.decoded = 0
+        self.rejected = 0
+        self.field_errors: Dict[str, int] = {name: 0 for name in self.names}
+
+    @classmethod
+    def from_env(cls) -> "ReadingDecoder":
+        """Build a decoder whose binary topics come from INGEST_BINARY_TOPICS (comma separated MQTT filters)."""
+        topics = [t.strip() for t in os.getenv("INGEST_BINARY_TOPICS", "").split(",") if t.strip()]
+        return cls(binary_topics=topics)
+
+    def format_for(self, topic: str) -> str:
+        """Wire format negotiated for a topic, cached per topic (one per device)."""
+        fmt = self._formats.get(topic)
+        if fmt is None:
+            fmt = BINARY if any(topic_matches(f, topic) for f in self.binary_topics) else JSON
+            if len(self._formats) >= _MAX_CACHED_TOPICS:
+                self._formats.clear()
+            self._formats[topic] = fmt
+        return fmt
+
+    def decode(self, topic: str, payload: bytes) -> Dict[str, Any]:
+        """One payload -> {field: typed value}, with every schema field present."""
+        try:
+            if self.format_for(topic) == BINARY:
+                reading = self._decode_binary(payload)
+            else:
+                reading = self._decode_json(payload)
+        except PayloadError:
+            with self._lock:
+                self.rejected += 1
+            raise
+        with self._lock:
+            self.decoded += 1
+        return reading
+
+    def decode_columns(self, messages: Iterable[Tuple[str, bytes]]) -> Dict[str, List[Any]]:
+        """Decode (topic, payload) pairs into one list per field, skipping rejected payloads."""
+        columns: Dict[str, List[Any]] = {name: [] for name in self.names}
+        appends = [(name, columns[name].append) for name in self.names]
+        for topic, payload in messages:
+            try:
+                reading = self.decode(topic, payload)
+            except PayloadError:
+                continue
+            for name, append in appends:
+                append(reading[name])
+        return columns
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "decoded": self.decoded,
+                "rejected": self.rejected,
+                "field_errors": dict(self.field_errors),
+            }
+
+    def _field_error(self, name: str) -> None:
+        with self._lock:
+            self.field_errors[name] += 1
+
+    def _decode_json(self, payload: bytes) -> Dict[str, Any]:
+        try:
+            data = json.loads(payload)
+        except (UnicodeDecodeError, ValueError) as e:
+            raise PayloadError(f"Invalid JSON payload: {payload[:64]!r}") from e
+        if not isinstance(data, dict):
+            raise PayloadError(f"Payload is not a JSON object: {payload[:64]!r}")
+
+        reading = {}
+        for name, check, legacy in self._fields:
+            value = data.get(name)
+            try:
+                if value is None and legacy:
+                    for key, convert in legacy:
+                        if data.get(key) is not None:
+                            value = convert(data[key])
+                            break
+                reading[name] = check(value)
+            except (TypeError, ValueError):
+                reading[name] = None
+                self._field_error(name)
+        return reading
+
+    def _decode_binary(self, payload: bytes) -> Dict[str, Any]:
+        if payload[:1] == b"\x01" and len(payload) == _BINARY_V1.size:
+            _, temperature, humidity, flags = _BINARY_V1.unpack(payload)
+            seq = None
+        elif payload[:1] == b"\x02" and len(payload) == _BINARY_V2.size:
+            _, temperature, humidity, flags, seq = _BINARY_V2.unpack(payload)
+        else:
+            raise PayloadError(f"Unsupported binary payload (version/length): {payload[:16]!r}")
+        reading = {
+            "temperature": None if temperature == _TEMPERATURE_MISSING else temperature / 100,
+            "humidity": None if humidity == _HUMIDITY_MISSING else humidity / 100,
+            "rain_status": "DETECTED" if flags & _RAIN else "NO_RAIN",
+            "water_status": "FULL" if flags & _WATER_FULL else "NOT_FULL",
+            "container_status": "Opened" if flags & _CONTAINER_OPEN else "Closed",
+            "seq": seq,
+        }
+        # The layout cannot express a wrong type, only an out-of-range number
+        for name in ("temperature", "humidity"):
+            try:
+                reading[name] = self._checks[name](reading[name])
+            except ValueError:
+                reading[name] = None
+                self._field_error(name)
+        return reading
@@ -0,0 +1,274 @@
+"""
+recent_readings.py
+------------------
+Purpose:
+    - Keep the latest readings of every device in memory for the dashboard:
+      a ring buffer per device, so memory stays bounded however long it runs
+    - Refresh incrementally: the first refresh loads the latest readings,
+      later ones only ask the storage for rows from `lookback_s` before the
+      newest one seen and only for the columns the dashboard shows, instead
+      of the latest 100 full rows. The lookback catches rows committed after
+      newer ones (other ingestion processes, batches in flight, spool replay);
+      rows already buffered are recognised by their id and skipped
+    - One buffer per server process is shared by every viewer; refreshes
+      closer together than `max_age_s` are answered from memory, so any
+      number of viewers auto-refreshing every few seconds cost at most one
+      small query per `max_age_s`
+
+Run `python recent_readings.py` to compare with re-downloading the latest rows.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Any, Callable, Deque, Dict, List, Sequence
+
+from reading_schema import SENSOR_READING_SCHEMA
+from storage import Row, SensorStorage, to_timestamp
+
+# Columns the dashboard shows: row identity, time, device and the sensor fields
+READING_COLUMNS = ("id", "created_at", "device_id") + tuple(
+    field.name for field in SENSOR_READING_SCHEMA if field.name != "seq"
+)
+
+DEFAULT_PER_DEVICE = 500
+DEFAULT_INITIAL_ROWS = 1000
+DEFAULT_PAGE_ROWS = 1000
+DEFAULT_MAX_AGE_S = 2.0
+DEFAULT_LOOKBACK_S = 60.0  # Well above the batch writer's 250 ms and a spool replay after a short outage
+
+
+class RecentReadings:
+    """Bounded, incrementally refreshed buffer of the latest readings per device."""
+
+    def __init__(
+        self,
+        storage: SensorStorage,
+        columns: Sequence[str] = READING_COLUMNS,
+        per_device: int = DEFAULT_PER_DEVICE,
+        max_age_s: float = DEFAULT_MAX_AGE_S,
+        initial_rows: int = DEFAULT_INITIAL_ROWS,
+        page_rows: int = DEFAULT_PAGE_ROWS,
+        lookback_s: float = DEFAULT_LOOKBACK_S,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if per_device < 1 or initial_rows < 1 or page_rows < 1:
+            raise ValueError("per_device, initial_rows and page_rows must be positive")
+        self.storage = storage
+        self.columns = list(columns)
+        self.per_device = per_device
+        self.max_age_s = max_age_s
+        self.initial_rows = initial_rows
+        self.page_rows = page_rows
+        self.lookback = timedelta(seconds=lookback_s)
+        self._clock = clock
+        self._devices: Dict[Any, Deque[Row]] = {}
+        self._newest: str | None = None  # Newest created_at buffered (normalised)
+        self._seen: Dict[Any, str] = {}  # Identity -> created_at of the rows inside the lookback window
+        self._refreshed_at: float | None = None
+        self._frame = None
+        self._lock = threading.Lock()
+
+        # Statistics
+        self.version = 0  # Incremented whenever new rows arrive
+        self.queries = 0
+        self.rows_fetched = 0
+        self.refreshes_skipped = 0
+
+    @classmethod
+    def from_env(cls, storage: SensorStorage) -> "RecentReadings":
+        """
+        Buffer sized by DASHBOARD_BUFFER_ROWS (per device), refreshed at most every
+        DASHBOARD_QUERY_TTL_S and looking back DASHBOARD_LOOKBACK_S for late rows.
+        """
+        return cls(
+            storage,
+            per_device=int(os.getenv("DASHBOARD_BUFFER_ROWS", DEFAULT_PER_DEVICE)),
+            max_age_s=float(os.getenv("DASHBOARD_QUERY_TTL_S", DEFAULT_MAX_AGE_S)),
+            lookback_s=float(os.getenv("DASHBOARD_LOOKBACK_S", DEFAULT_LOOKBACK_S)),
+        )
+
+    def refresh(self, force: bool = False) -> int:
+        """
+        Fetch the readings that arrived since the last refresh; returns how many.
+        Skipped (0) when the last refresh is younger than max_age_s, unless forced.
+        """
+        with self._lock:
+            now = self._clock()
+            if not force and self._refreshed_at is not None and now - self._refreshed_at < self.max_age_s:
+                self.refreshes_skipped += 1
+                return 0
+            if self._newest is None:
+                # Latest rows first so the limit keeps the newest, then oldest to newest
+                added = self._add(self._query(limit=self.initial_rows, descending=True)[::-1])
+            else:
+                added = 0
+                start = self._cutoff()
+                while True:
+                    page = self._query(start=start, limit=self.page_rows)
+                    added += self._add(page)
+                    if len(page) < self.page_rows:
+                        break
+                    # Next page from the last timestamp of this one (its rows are skipped by id)
+                    last = to_timestamp(page[-1]["created_at"])
+                    if last == start:  # A full page of one timestamp cannot advance
+                        break
+                    start = last
+            self._forget_old()
+            self._refreshed_at = now
+            if added:
+                self.version += 1
+                self._frame = None
+            return added
+
+    def rows(self, limit: int | None = None) -> List[Row]:
+        """Buffered readings of every device, newest first."""
+        with self._lock:
+            rows = [row for readings in self._devices.values() for row in readings]
+        rows.sort(key=lambda row: to_timestamp(row["created_at"]), reverse=True)
+        return rows[:limit] if limit is not None else rows
+
+    def frame(self, limit: int | None = None):
+        """rows(limit) as a DataFrame, rebuilt only when new rows arrived."""
+        import pandas as pd
+
+        frame, version = self._frame, self.version
+        if frame is None or frame[0] != (version, limit):
+            frame = ((version, limit), pd.DataFrame(self.rows(limit)))
+            self._frame = frame
+        return frame[1]
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "buffer_devices": len(self._devices),
+                "buffer_rows": sum(len(readings) for readings in self._devices.values()),
+                "buffer_queries": self.queries,
+                "buffer_rows_fetched": self.rows_fetched,
+                "buffer_refreshes_skipped": self.refreshes_skipped,
+            }
+
+    # --- Internals (called under the lock) ---
+
+    def _query(self, **kwargs) -> List[Row]:
+        rows = self.storage.query_range(columns=self.columns, **kwargs)
+        self.queries += 1
+        self.rows_fetched += len(rows)
+        return rows
+
+    def _cutoff(self) -> str:
+        """Oldest created_at a refresh asks for: the lookback before the newest row buffered."""
+        return to_timestamp(datetime.fromisoformat(self._newest) - self.lookback)
+
+    def _forget_old(self) -> None:
+        """Drop the identities of rows older than the lookback window; no refresh asks for them again."""
+        if self._newest is not None:
+            cutoff = self._cutoff()
+            self._seen = {identity: at for identity, at in self._seen.items() if at >= cutoff}
+
+    def _add(self, rows: List[Row]) -> int:
+        """Append rows that are not buffered yet; returns how many."""
+        added = 0
+        cutoff = self._cutoff() if self._newest is not None else None
+        for row in rows:
+            created_at = to_timestamp(row["created_at"])
+            identity = row.get("id")
+            if identity is None:  # Tables without an id column: the row itself
+                identity = tuple(sorted(row.items(), key=lambda item: item[0]))
+            if identity in self._seen or (cutoff is not None and created_at < cutoff):
+                continue
+            self._seen[identity] = created_at
+            if self._newest is None or created_at > self._newest:
+                self._newest = created_at
+            device = row.get("device_id")
+            if device not in self._devices:
+                self._devices[device] = deque(maxlen=self.per_device)
+            self._devices[device].append(row)
+            added += 1
+        return added
+
+
+# --- Benchmark: viewers re-downloading the latest rows vs one shared incremental buffer ---
+
+class _CountingStorage(SensorStorage):
+    """Wraps a storage and counts queries, rows and the JSON bytes a REST response would carry."""
+
+    def __init__(self, storage: SensorStorage):
+        self.storage = storage
+        self.table = storage.table
+        self.queries = 0
+        self.rows = 0
+        self.bytes = 0
+
+    def insert_many(self, rows: List[Row]) -> int:
+        return self.storage.insert_many(rows)
+
+    def query_range(self, *args, **kwargs):
+        import json
+
+        rows = self.storage.query_range(*args, **kwargs)
+        self.queries += 1
+        self.rows += len(rows)
+        self.bytes += len(json.dumps(rows, default=str))
+        return rows
+
+    def with_table(self, table: str) -> "_CountingStorage":
+        return _CountingStorage(self.storage.with_table(table))
+
+    def close(self) -> None:
+        self.storage.close()
+
+
+def _benchmark(viewers: int, devices: int, interval_s: float, duration_s: float) -> None:
+    from datetime import datetime, timedelta, timezone
+
+    from storage import MemoryStorage
+
+    started = datetime.now(timezone.utc)
+    wide = {f"extra_{i}": 0.0 for i in range(8)}  # Columns the dashboard does not show
+
+    def reading(t: float, device: int) -> Row:
+        return {"id": int(t * 1000) * devices + device, "created_at": started + timedelta(seconds=t),
+                "device_id": f"esp32-{device}", "temperature": 22.5, "humidity": 61.0, "rain_status": "NO_RAIN",
+                "water_status": "FULL", "container_status": "Closed", **wide}
+
+    results = {}
+    for label in ("latest 100 rows per viewer", "shared incremental buffer"):
+        memory = MemoryStorage()
+        memory.insert_many([reading(-i, d) for i in range(1, 200) for d in range(devices)])
+        counting = _CountingStorage(memory)
+        clock = [0.0]
+        buffer = RecentReadings(counting, max_age_s=interval_s, clock=lambda: clock[0])
+        # Every device publishes once per second; every viewer refreshes every interval_s
+        for step in range(int(duration_s)):
+            clock[0] = float(step)
+            memory.insert_many([reading(step, d) for d in range(devices)])
+            if step % interval_s:
+                continue
+            for _ in range(viewers):
+                if label.startswith("latest"):
+                    counting.query_range(limit=100, descending=True)
+                else:
+                    buffer.refresh()
+                    buffer.frame(100)
+        results[label] = (counting.queries, counting.rows, counting.bytes)
+
+    print(f"{viewers} viewers refreshing every {interval_s:g} s, {devices} devices publishing every second, "
+          f"{duration_s:g} s")
+    print(f"{'':>28} {'queries':>8} {'rows':>9} {'MB':>8}")
+    for label, (queries, rows, size) in results.items():
+        print(f"{label:>28} {queries:>8,} {rows:>9,} {size / 1e6:>8.2f}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark incremental readings against full refreshes")
+    parser.add_argument("--viewers", type=int, default=20)
+    parser.add_argument("--devices", type=int, default=10)
+    parser.add_argument("--interval", type=int, default=5, help="Seconds between refreshes of each viewer")
+    parser.add_argument("--duration", type=float, default=300, help="Simulated seconds")
+    args = parser.parse_args()
+    _benchmark(args.viewers, args.devices, args.interval, args.duration)
@@ -0,0 +1,252 @@
+"""
+rollups.py
+----------
+Purpose:
+    - Aggregate readings per device into 1-minute and 1-hour buckets as they
+      stream through the ingestion service
+    - Per bucket: count, min/max/sum/mean of temperature and humidity, the
+      fraction of readings with rain detected and the last water status
+    - A background flusher writes every closed bucket to its rollup table
+      (`sensor_rollups_1m`, `sensor_rollups_1h`), so history views read one
+      row per device and bucket instead of every raw reading
+
+A bucket closes `allowed_lateness_s` after its end. Rows carry sums and counts
+as well as means, so several rows for the same device and bucket (a restart
+mid-hour, or worker processes sharing a subscription) can be merged exactly:
+add counts and sums, take the min of minimums and the max of maximums.
+`created_at` is the bucket start, so `query_range` works on rollup tables too.
+"""
+
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Tuple
+
+from storage import SensorStorage, to_timestamp
+
+log = logging.getLogger(__name__)
+
+Row = Dict[str, Any]
+
+MINUTE = 60
+HOUR = 3600
+DEFAULT_TABLES = {MINUTE: "sensor_rollups_1m", HOUR: "sensor_rollups_1h"}
+DEFAULT_LATENESS_S = 2.0
+DEFAULT_FLUSH_INTERVAL_S = 5.0
+DEFAULT_MAX_PENDING_ROWS = 100_000
+
+
+def rollup_tables() -> Dict[int, str]:
+    """Rollup table per bucket size, named by ROLLUP_TABLE_1M / ROLLUP_TABLE_1H."""
+    return {
+        MINUTE: os.getenv("ROLLUP_TABLE_1M", DEFAULT_TABLES[MINUTE]),
+        HOUR: os.getenv("ROLLUP_TABLE_1H", DEFAULT_TABLES[HOUR]),
+    }
+
+
+class _Bucket:
+    """Running aggregates of one device over one interval."""
+
+    __slots__ = (
+        "count", "t_count", "t_min", "t_max", "t_sum", "h_count", "h_min", "h_max", "h_sum",
+        "rain_count", "rain_detected", "water_status", "last_at",
+    )
+
+    def __init__(self):
+        self.count = self.t_count = self.h_count = self.rain_count = self.rain_detected = 0
+        self.t_min = self.h_min = float("inf")
+        self.t_max = self.h_max = float("-inf")
+        self.t_sum = self.h_sum = 0.0
+        self.water_status = None
+        self.last_at = 0.0
+
+    def add(self, row: Row, ts: float) -> None:
+        self.count += 1
+        t = row.get("temperature")
+        if t is not None:
+            self.t_count += 1
+            self.t_sum += t
+            if t < self.t_min:
+                self.t_min = t
+            if t > self.t_max:
+                self.t_max = t
+        h = row.get("humidity")
+        if h is not None:
+            self.h_count += 1
+            self.h_sum += h
+            if h < self.h_min:
+                self.h_min = h
+            if h > self.h_max:
+                self.h_max = h
+        rain = row.get("rain_status")
+        if rain is not None:
+            self.rain_count += 1
+            self.rain_detected += rain == "DETECTED"
+        water = row.get("water_status")
+        if water is not None and ts >= self.last_at:
+            self.water_status = water
+        self.last_at = max(self.last_at, ts)
+
+    def to_row(self, device_id: str, start: float, seconds: int) -> Row:
+        return {
+            "created_at": to_timestamp(start),
+            "device_id": device_id,
+            "bucket_seconds": seconds,
+            "readings": self.count,
+            "temperature_count": self.t_count,
+            "temperature_min": self.t_min if self.t_count else None,
+            "temperature_max": self.t_max if self.t_count else None,
+            "temperature_sum": self.t_sum,
+            "temperature_mean": self.t_sum / self.t_count if self.t_count else None,
+            "humidity_count": self.h_count,
+            "humidity_min": self.h_min if self.h_count else None,
+            "humidity_max": self.h_max if self.h_count else None,
+            "humidity_sum": self.h_sum,
+            "humidity_mean": self.h_sum / self.h_count if self.h_count else None,
+            "rain_readings": self.rain_count,
+            "rain_fraction": self.rain_detected / self.rain_count if self.rain_count else None,
+            "water_status": self.water_status,
+            "last_reading_at": to_timestamp(self.last_at),
+        }
+
+
+class RollupAggregator:
+    """Incremental per-device rollups, flushed to one table per bucket size."""
+
+    def __init__(
+        self,
+        sinks: Dict[int, SensorStorage],
+        allowed_lateness_s: float = DEFAULT_LATENESS_S,
+        flush_interval_s: float = DEFAULT_FLUSH_INTERVAL_S,
+        max_pending_rows: int = DEFAULT_MAX_PENDING_ROWS,
+    ):
+        if not sinks or any(seconds <= 0 for seconds in sinks):
+            raise ValueError("RollupAggregator needs at least one positive bucket size")
+        self.sinks = dict(sorted(sinks.items()))
+        self.allowed_lateness_s = allowed_lateness_s
+        self.flush_interval_s = flush_interval_s
+        self.max_pending_rows = max_pending_rows
+
+        self._open: Dict[int, Dict[Tuple[str, float], _Bucket]] = {seconds: {} for seconds in self.sinks}
+        self._pending: Dict[int, List[Row]] = {seconds: [] for seconds in self.sinks}  # closed, not yet written
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._flusher = threading.Thread(target=self._run_flusher, name="rollup-flusher", daemon=True)
+
+        # Statistics
+        self.late_readings = 0
+        self.rows_written = 0
+        self.rows_dropped = 0
+        self.write_failures = 0
+
+    @classmethod
+    def from_env(cls, storage: SensorStorage) -> "RollupAggregator | None":
+        """
+        Rollup tables next to the raw table, named by ROLLUP_TABLE_1M / ROLLUP_TABLE_1H,
+        with ROLLUP_LATENESS_S. None when INGEST_ROLLUPS=0.
+        """
+        if os.getenv("INGEST_ROLLUPS", "1") != "1":
+            return None
+        return cls(
+            {seconds: storage.with_table(table) for seconds, table in rollup_tables().items()},
+            allowed_lateness_s=float(os.getenv("ROLLUP_LATENESS_S", DEFAULT_LATENESS_S)),
+        )
+
+    # --- Lifecycle ---
+
+    def start(self) -> "RollupAggregator":
+        self._flusher.start()
+        return self
+
+    def close(self) -> None:
+        """Write every bucket, including the ones still open (they merge with later rows for the same bucket)."""
+        self._stop.set()
+        if self._flusher.is_alive():
+            self._flusher.join()
+        self.close_buckets(float("inf"))
+        self.write_pending()
+        for sink in self.sinks.values():
+            sink.close()
+
+    # --- Aggregation ---
+
+    def add_many(self, rows: List[Row], now: float | None = None) -> None:
+        """
+        Fold readings into their buckets. A reading for a bucket that was already
+        written (e.g. replayed from the spill file) opens a new partial bucket,
+        written on the next tick as an extra row to merge with the first.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            for row in rows:
+                try:
+                    ts = datetime.fromisoformat(row["created_at"]).timestamp()
+                except (KeyError, TypeError, ValueError):
+                    continue
+                device_id = row.get("device_id")
+                for seconds, buckets in self._open.items():
+                    start = ts - ts % seconds
+                    bucket = buckets.get((device_id, start))
+                    if bucket is None:
+                        if start + seconds + self.allowed_lateness_s <= now:
+                            self.late_readings += 1
+                        bucket = buckets[(device_id, start)] = _Bucket()
+                    bucket.add(row, ts)
+
+    def close_buckets(self, now: float | None = None) -> int:
+        """Move buckets that ended more than allowed_lateness_s ago to the write queue."""
+        now = time.time() if now is None else now
+        closed = 0
+        with self._lock:
+            for seconds, buckets in self._open.items():
+                done = [key for key in buckets if key[1] + seconds + self.allowed_lateness_s <= now]
+                pending = self._pending[seconds]
+                for device_id, start in sorted(done, key=lambda key: key[1]):
+                    pending.append(buckets.pop((device_id, start)).to_row(device_id, start, seconds))
+                closed += len(done)
+                overflow = len(pending) - self.max_pending_rows
+                if overflow > 0:
+                    del pending[:overflow]
+                    self.rows_dropped += overflow
+                    log.error("Rollup backlog over %d rows: dropped %d oldest rollups", self.max_pending_rows, overflow)
+        return closed
+
+    def write_pending(self) -> int:
+        """Insert closed buckets, one bulk insert per table; failed rows stay queued for the next try."""
+        written = 0
+        with self._write_lock:
+            for seconds, sink in self.sinks.items():
+                with self._lock:
+                    rows, self._pending[seconds] = self._pending[seconds], []
+                if not rows:
+                    continue
+                try:
+                    sink.insert_many(rows)
+                    written += len(rows)
+                except Exception as e:
+                    with self._lock:
+                        self._pending[seconds][:0] = rows
+                        self.write_failures += 1
+                    log.warning("Writing %d rollups to %s failed, will retry: %s", len(rows), sink.table, e)
+        with self._lock:
+            self.rows_written += written
+        return written
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "rollup_open_buckets": sum(len(b) for b in self._open.values()),
+                "rollup_pending_rows": sum(len(p) for p in self._pending.values()),
+                "rollup_rows_written": self.rows_written,
+                "rollup_rows_dropped": self.rows_dropped,
+                "rollup_late_readings": self.late_readings,
+                "rollup_write_failures": self.write_failures,
+            }
+
+    def _run_flusher(self) -> None:
+        while not self._stop.wait(self.flush_interval_s):
+            self.close_buckets()
+            self.write_pending()
@@ -0,0 +1,318 @@
+"""
+spool.py
+--------
+Purpose:
+    - Durable, append-only write-ahead spool for accepted sensor readings
+    - Every batch is appended to the active segment file first, so a slow or
+      unreachable Supabase never loses readings and never stalls the writer
+    - A background drainer replays the spool in large bulk inserts and
+      records a checkpoint (segment, byte offset) after each one
+    - Segments rotate at `segment_bytes`; once the spool exceeds `max_bytes`
+      the oldest segments are evicted so it cannot fill the disk
+
+Layout of the spool directory:
+    000000000001.log, 000000000002.log, ...   JSON lines, one reading per line
+    checkpoint.json                           first byte not yet replayed
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Tuple
+
+from ingest_metrics import BATCH_ROWS, INSERT_FAILURES, INSERT_SECONDS, PERSIST_LAG
+
+log = logging.getLogger(__name__)
+
+DEFAULT_SEGMENT_MB = 16
+DEFAULT_MAX_MB = 1024
+DEFAULT_REPLAY_ROWS = 5000
+
+_SEGMENT_SUFFIX = ".log"
+_CHECKPOINT = "checkpoint.json"
+
+
+def _observe_lag(rows: List[Dict[str, Any]]) -> None:
+    """Arrival-to-storage lag of every replayed reading (created_at is the arrival time)."""
+    now = time.time()
+    lags = []
+    for row in rows:
+        try:
+            lags.append(now - datetime.fromisoformat(row["created_at"]).timestamp())
+        except (KeyError, TypeError, ValueError):
+            continue
+    PERSIST_LAG.observe_many(lags)
+
+
+class Spool:
+    """Segmented write-ahead log in front of a storage backend."""
+
+    def __init__(
+        self,
+        directory: str,
+        storage,
+        segment_bytes: int = DEFAULT_SEGMENT_MB * 1024 * 1024,
+        max_bytes: int = DEFAULT_MAX_MB * 1024 * 1024,
+        replay_rows: int = DEFAULT_REPLAY_ROWS,
+        fsync: bool = False,
+        max_backoff_s: float = 30.0,
+    ):
+        if segment_bytes < 1 or max_bytes < segment_bytes or replay_rows < 1:
+            raise ValueError("Spool needs segment_bytes > 0, max_bytes >= segment_bytes and replay_rows > 0")
+        self.directory = directory
+        self.storage = storage
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.replay_rows = replay_rows
+        self.fsync = fsync
+        self.max_backoff_s = max_backoff_s
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._drainer = threading.Thread(target=self._run_drainer, name="spool-drainer", daemon=True)
+
+        # Statistics
+        self.rows_appended = 0
+        self.rows_replayed = 0
+        self.rows_evicted = 0
+        self.rows_corrupt = 0
+        self.replay_batches = 0
+        self.replay_failures = 0
+        self.last_error: str | None = None
+
+        os.makedirs(directory, exist_ok=True)
+        self._segments: List[int] = sorted(
+            int(name[: -len(_SEGMENT_SUFFIX)])
+            for name in os.listdir(directory)
+            if name.endswith(_SEGMENT_SUFFIX) and name[: -len(_SEGMENT_SUFFIX)].isdigit()
+        )
+        self._checkpoint: Tuple[int, int] = self._load_checkpoint()
+        self.pending_rows = self._count_pending()
+
+        # Never append to a segment left behind by a previous run: its tail may be torn.
+        self._active = (self._segments[-1] + 1) if self._segments else 1
+        self._segments.append(self._active)
+        self._active_file = open(self._segment_path(self._active), "ab")
+        self._active_size = 0
+        if self._checkpoint[0] < self._segments[0]:
+            self._checkpoint = (self._segments[0], 0)
+
+    @classmethod
+    def from_env(cls, storage, directory: str | None = None) -> "Spool":
+        """Build a spool configured by INGEST_SPOOL_DIR, SPOOL_SEGMENT_MB, SPOOL_MAX_MB, SPOOL_REPLAY_ROWS and SPOOL_FSYNC."""
+        return cls(
+            directory or os.getenv("INGEST_SPOOL_DIR", "ingest_spool"),
+            storage,
+            segment_bytes=int(float(os.getenv("SPOOL_SEGMENT_MB", DEFAULT_SEGMENT_MB)) * 1024 * 1024),
+            max_bytes=int(float(os.getenv("SPOOL_MAX_MB", DEFAULT_MAX_MB)) * 1024 * 1024),
+            replay_rows=int(os.getenv("SPOOL_REPLAY_ROWS", DEFAULT_REPLAY_ROWS)),
+            fsync=os.getenv("SPOOL_FSYNC", "0") == "1",
+        )
+
+    # --- Lifecycle ---
+
+    def start(self) -> "Spool":
+        self._drainer.start()
+        return self
+
+    def close(self, drain_timeout: float = 5.0) -> None:
+        """Give the drainer up to drain_timeout seconds to catch up, then stop it."""
+        deadline = time.monotonic() + drain_timeout
+        while self.pending_rows and self._drainer.is_alive() and time.monotonic() < deadline:
+            self._wakeup.set()
+            time.sleep(0.05)
+        self._stop.set()
+        self._wakeup.set()
+        if self._drainer.is_alive():
+            self._drainer.join()
+        with self._lock:
+            self._active_file.close()
+
+    # --- Write side (storage interface used by the BatchWriter) ---
+
+    def insert_many(self, rows: List[Dict[str, Any]]) -> int:
+        """Append rows to the active segment. Replay to the real backend happens later."""
+        if not rows:
+            return 0
+        data = "".join(json.dumps(row, separators=(",", ":"), default=str) + "\n" for row in rows).encode("utf-8")
+        with self._lock:
+            if self._active_size and self._active_size + len(data) > self.segment_bytes:
+                self._rotate_locked()
+            self._active_file.write(data)
+            self._active_file.flush()
+            if self.fsync:
+                os.fsync(self._active_file.fileno())
+            self._active_size += len(data)
+            self.rows_appended += len(rows)
+            self.pending_rows += len(rows)
+            self._enforce_cap_locked()
+        self._wakeup.set()
+        return len(rows)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "spool_segments": len(self._segments),
+                "spool_bytes": self._total_bytes_locked(),
+                "spool_pending_rows": self.pending_rows,
+                "spool_rows_replayed": self.rows_replayed,
+                "spool_rows_evicted": self.rows_evicted,
+                "spool_replay_failures": self.replay_failures,
+                "spool_last_error": self.last_error,
+            }
+
+    # --- Replay side ---
+
+    def replay_once(self) -> int:
+        """Replay up to replay_rows readings in one bulk insert. Returns rows replayed."""
+        rows, end = self._read_from_checkpoint()
+        if not rows:
+            if end != self._checkpoint:
+                self._advance(end, 0)  # only skipped corrupt lines
+            return 0
+        backend = (type(self.storage).__name__,)
+        BATCH_ROWS.observe(len(rows), backend)
+        started = time.perf_counter()
+        try:
+            self.storage.insert_many(rows)
+        except Exception:
+            INSERT_FAILURES.inc(labels=backend)
+            raise
+        INSERT_SECONDS.observe(time.perf_counter() - started, backend)
+        self._advance(end, len(rows))
+        _observe_lag(rows)
+        return len(rows)
+
+    def _run_drainer(self) -> None:
+        backoff = 0.5
+        while not self._stop.is_set():
+            self._wakeup.clear()
+            try:
+                replayed = self.replay_once()
+                backoff = 0.5
+                if replayed:
+                    continue
+            except Exception as e:
+                self.replay_failures += 1
+                self.last_error = f"{type(e).__name__}: {e}"
+                log.warning("Spool replay failed, retrying in %.1fs: %s", backoff, self.last_error)
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, self.max_backoff_s)
+                continue
+            self._wakeup.wait(1.0)
+
+    def _read_from_checkpoint(self) -> Tuple[List[Dict[str, Any]], Tuple[int, int]]:
+        """Read up to replay_rows complete lines starting at the checkpoint, across segments."""
+        with self._lock:
+            segment, offset = self._checkpoint
+            segments = [s for s in self._segments if s >= segment]
+            active, active_size = self._active, self._active_size
+
+        rows: List[Dict[str, Any]] = []
+        for seg in segments:
+            start = offset if seg == segment else 0
+            limit = active_size if seg == active else None
+            position = start
+            try:
+                f = open(self._segment_path(seg), "rb")
+            except FileNotFoundError:
+                continue  # evicted by the size cap since the checkpoint was read
+            with f:
+                f.seek(start)
+                while len(rows) < self.replay_rows and (limit is None or position < limit):
+                    line = f.readline()
+                    if not line.endswith(b"\n"):
+                        break  # torn tail of a crashed run, or nothing more yet
+                    position += len(line)
+                    try:
+                        rows.append(json.loads(line))
+                    except ValueError:
+                        self.rows_corrupt += 1
+            if len(rows) >= self.replay_rows or seg == active:
+                return rows, (seg, position)
+        return rows, (segment, offset)
+
+    def _advance(self, checkpoint: Tuple[int, int], replayed: int) -> None:
+        with self._lock:
+            if checkpoint < self._checkpoint:
+                return  # segments were evicted while the batch was in flight
+            self._checkpoint = checkpoint
+            self.rows_replayed += replayed
+            self.replay_batches += 1 if replayed else 0
+            self.pending_rows = max(0, self.pending_rows - replayed)
+            self._save_checkpoint_locked()
+            # Sealed segments entirely before the checkpoint are no longer needed
+            while self._segments[0] < checkpoint[0]:
+                self._delete_segment_locked(self._segments.pop(0))
+
+    # --- Segment management ---
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"{segment:012d}{_SEGMENT_SUFFIX}")
+
+    def _rotate_locked(self) -> None:
+        self._active_file.close()
+        self._active += 1
+        self._segments.append(self._active)
+        self._active_file = open(self._segment_path(self._active), "ab")
+        self._active_size = 0
+
+    def _total_bytes_locked(self) -> int:
+        sealed = sum(os.path.getsize(self._segment_path(s)) for s in self._segments[:-1])
+        return sealed + self._active_size
+
+    def _enforce_cap_locked(self) -> None:
+        """Evict the oldest sealed segments while the spool is over max_bytes."""
+        while len(self._segments) > 1 and self._total_bytes_locked() > self.max_bytes:
+            oldest = self._segments.pop(0)
+            start = self._checkpoint[1] if self._checkpoint[0] == oldest else 0
+            if self._checkpoint[0] <= oldest:
+                evicted = self._count_lines(oldest, start)
+                self.rows_evicted += evicted
+                self.pending_rows = max(0, self.pending_rows - evicted)
+                self._checkpoint = (self._segments[0], 0)
+                self._save_checkpoint_locked()
+                log.error("Spool over %d bytes: evicted %d unreplayed readings", self.max_bytes, evicted)
+            self._delete_segment_locked(oldest)
+
+    def _delete_segment_locked(self, segment: int) -> None:
+        try:
+            os.remove(self._segment_path(segment))
+        except FileNotFoundError:
+            pass
+
+    def _count_lines(self, segment: int, start: int = 0) -> int:
+        try:
+            with open(self._segment_path(segment), "rb") as f:
+                f.seek(start)
+                return sum(chunk.count(b"\n") for chunk in iter(lambda: f.read(1 << 20), b""))
+        except FileNotFoundError:
+            return 0
+
+    def _count_pending(self) -> int:
+        segment, offset = self._checkpoint
+        return sum(self._count_lines(s, offset if s == segment else 0) for s in self._segments if s >= segment)
+
+    # --- Checkpoint ---
+
+    def _load_checkpoint(self) -> Tuple[int, int]:
+        try:
+            with open(os.path.join(self.directory, _CHECKPOINT)) as f:
+                data = json.load(f)
+            return int(data["segment"]), int(data["offset"])
+        except (FileNotFoundError, ValueError, KeyError):
+            return (self._segments[0], 0) if self._segments else (1, 0)
+
+    def _save_checkpoint_locked(self) -> None:
+        path = os.path.join(self.directory, _CHECKPOINT)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"segment": self._checkpoint[0], "offset": self._checkpoint[1]}, f)
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
@@ -0,0 +1,300 @@
+"""
+storage.py
+----------
+Purpose:
+    - Storage backends for sensor readings, shared by the ingestion service
+      and the Streamlit dashboard
+    - Every backend implements the `SensorStorage` interface:
+        insert_many(rows)   -> bulk insert
+        query_range(...)    -> readings in a created_at window, optionally for one device
+        with_table(table)   -> the same backend pointed at another table
+    - `SupabaseStorage` talks to the hosted PostgreSQL table over REST
+    - `SQLiteStorage` is an embedded engine (WAL mode, indexed on created_at
+      and device) for edge deployments and offline load tests
+    - `MemoryStorage` is an in-process stand-in used for benchmarks and tests
+
+Pick a backend with STORAGE_BACKEND=supabase|sqlite (see `create_storage`).
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
+
+# Name of the table holding raw sensor readings
+SENSOR_TABLE: str = os.getenv("SUPABASE_TABLE", "Sensor readings")
+# Rows per Supabase request: PostgREST's default max-rows, larger responses are cut off without an error
+SUPABASE_PAGE_ROWS = int(os.getenv("SUPABASE_PAGE_ROWS", "1000"))
+
+Row = Dict[str, Any]
+
+
+def to_timestamp(value: Any) -> str:
+    """
+    Normalise a datetime, UNIX timestamp or ISO string to a fixed-width UTC ISO string.
+    Fixed width keeps lexical order equal to time order, which the embedded
+    backend relies on for its created_at index.
+    """
+    if isinstance(value, (int, float)):
+        value = datetime.fromtimestamp(value, timezone.utc)
+    elif isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).isoformat(timespec="microseconds")
+
+
+class SensorStorage(ABC):
+    """Interface every storage backend implements."""
+
+    table: str = SENSOR_TABLE
+
+    @abstractmethod
+    def insert_many(self, rows: List[Row]) -> int:
+        """Insert all rows in one bulk operation and return the row count."""
+
+    @abstractmethod
+    def query_range(
+        self,
+        start: Any = None,
+        end: Any = None,
+        device_id: str | None = None,
+        columns: Sequence[str] | None = None,
+        limit: int | None = None,
+        descending: bool = False,
+    ) -> List[Row]:
+        """Readings with start <= created_at < end, ordered by created_at."""
+
+    @abstractmethod
+    def with_table(self, table: str) -> "SensorStorage":
+        """Same backend and connection settings, pointed at another table (e.g. a rollup table)."""
+
+    def close(self) -> None:
+        pass
+
+
+class SupabaseStorage(SensorStorage):
+    """
+    Writes readings to a Supabase (PostgREST) table, one HTTP request per batch.
+    Queries are read in pages of `page_rows`, since the server returns at most
+    that many rows per request.
+    """
+
+    def __init__(self, client, table: str = SENSOR_TABLE, page_rows: int = SUPABASE_PAGE_ROWS):
+        self.client = client
+        self.table = table
+        self.page_rows = page_rows
+
+    def insert_many(self, rows: List[Row]) -> int:
+        if not rows:
+            return 0
+        # 'minimal' skips echoing the inserted rows back over the wire and
+        # default_to_null=False lets columns such as created_at keep their defaults.
+        self.client.table(self.table).insert(
+            rows, returning="minimal", default_to_null=False
+        ).execute()
+        return len(rows)
+
+    def query_range(self, start=None, end=None, device_id=None, columns=None, limit=None, descending=False):
+        rows: List[Row] = []
+        while limit is None or len(rows) < limit:
+            size = self.page_rows if limit is None else min(self.page_rows, limit - len(rows))
+            query = self.client.table(self.table).select(",".join(columns) if columns else "*")
+            if start is not None:
+                query = query.gte("created_at", to_timestamp(start))
+            if end is not None:
+                query = query.lt("created_at", to_timestamp(end))
+            if device_id is not None:
+                query = query.eq("device_id", device_id)
+            # device_id breaks created_at ties, so pages neither overlap nor skip rows
+            query = query.order("created_at", desc=descending).order("device_id", desc=descending)
+            page = query.range(len(rows), len(rows) + size - 1).execute().data or []
+            rows.extend(page)
+            if len(page) < size:
+                break
+        return rows
+
+    def with_table(self, table: str) -> "SupabaseStorage":
+        return SupabaseStorage(self.client, table, self.page_rows)
+
+
+class SQLiteStorage(SensorStorage):
+    """
+    Embedded backend in a single SQLite file.
+    WAL mode lets the dashboard read while the ingestion service writes, and
+    the (device_id, created_at) and created_at indexes serve time-range queries.
+    Columns are added on first sight, so new payload fields need no migration.
+    """
+
+    def __init__(self, path: str, table: str = "sensor_readings"):
+        self.path = path
+        self.table = table
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                f'CREATE TABLE IF NOT EXISTS "{table}" ('
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "created_at TEXT NOT NULL, "
+                "device_id TEXT)"
+            )
+            self._conn.execute(f'CREATE INDEX IF NOT EXISTS "{table}_created_at" ON "{table}" (created_at)')
+            self._conn.execute(
+                f'CREATE INDEX IF NOT EXISTS "{table}_device_created_at" ON "{table}" (device_id, created_at)'
+            )
+        self._columns = self._read_columns()
+
+    def _read_columns(self) -> List[str]:
+        return [r["name"] for r in self._conn.execute(f'PRAGMA table_info("{self.table}")')]
+
+    def _ensure_columns(self, names: Iterable[str]) -> None:
+        for name in names:
+            if name not in self._columns:
+                if not name.replace("_", "").isalnum():
+                    raise ValueError(f"Invalid column name: {name!r}")
+                self._conn.execute(f'ALTER TABLE "{self.table}" ADD COLUMN "{name}"')
+                self._columns.append(name)
+
+    def insert_many(self, rows: List[Row]) -> int:
+        if not rows:
+            return 0
+        now = to_timestamp(time.time())
+        columns = sorted({key for row in rows for key in row if key != "id"} | {"created_at"})
+        values = [
+            tuple(
+                to_timestamp(row["created_at"]) if c == "created_at" and row.get("created_at") is not None
+                else now if c == "created_at"
+                else row.get(c)
+                for c in columns
+            )
+            for row in rows
+        ]
+        placeholders = ", ".join("?" for _ in columns)
+        column_list = ", ".join(f'"{c}"' for c in columns)
+        with self._lock, self._conn:
+            self._ensure_columns(columns)
+            self._conn.executemany(
+                f'INSERT INTO "{self.table}" ({column_list}) VALUES ({placeholders})', values
+            )
+        return len(rows)
+
+    def query_range(self, start=None, end=None, device_id=None, columns=None, limit=None, descending=False):
+        conditions, params = [], []
+        if device_id is not None:
+            conditions.append("device_id = ?")
+            params.append(device_id)
+        if start is not None:
+            conditions.append("created_at >= ?")
+            params.append(to_timestamp(start))
+        if end is not None:
+            conditions.append("created_at < ?")
+            params.append(to_timestamp(end))
+        with self._lock:
+            selected = [c for c in columns if c in self._columns] if columns else None
+            column_sql = ", ".join(f'"{c}"' for c in selected) if selected else "*"
+            sql = f'SELECT {column_sql} FROM "{self.table}"'
+            if conditions:
+                sql += " WHERE " + " AND ".join(conditions)
+            sql += f" ORDER BY created_at {'DESC' if descending else 'ASC'}"
+            if limit is not None:
+                sql += " LIMIT ?"
+                params.append(int(limit))
+            return [dict(r) for r in self._conn.execute(sql, params)]
+
+    def with_table(self, table: str) -> "SQLiteStorage":
+        return SQLiteStorage(self.path, table)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class MemoryStorage(SensorStorage):
+    """
+    In-process stand-in for Supabase.
+    `latency_s` simulates the round trip of one insert request so throughput
+    can be benchmarked without the network.
+    """
+
+    def __init__(self, latency_s: float = 0.0, keep_rows: bool = True):
+        self.latency_s = latency_s
+        self.keep_rows = keep_rows
+        self.rows: List[Row] = []
+        self.insert_calls = 0
+        self.rows_written = 0
+        self._lock = threading.Lock()
+
+    def insert_many(self, rows: List[Row]) -> int:
+        if not rows:
+            return 0
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        with self._lock:
+            self.insert_calls += 1
+            self.rows_written += len(rows)
+            if self.keep_rows:
+                self.rows.extend(rows)
+        return len(rows)
+
+    def query_range(self, start=None, end=None, device_id=None, columns=None, limit=None, descending=False):
+        start = to_timestamp(start) if start is not None else None
+        end = to_timestamp(end) if end is not None else None
+        with self._lock:
+            rows = [
+                r for r in self.rows
+                if (device_id is None or r.get("device_id") == device_id)
+                and (start is None or to_timestamp(r["created_at"]) >= start)
+                and (end is None or to_timestamp(r["created_at"]) < end)
+            ]
+        rows.sort(key=lambda r: to_timestamp(r["created_at"]), reverse=descending)
+        if limit is not None:
+            rows = rows[:limit]
+        if columns:
+            rows = [{c: r.get(c) for c in columns} for r in rows]
+        return rows
+
+    def with_table(self, table: str) -> "MemoryStorage":
+        storage = MemoryStorage(self.latency_s, self.keep_rows)
+        storage.table = table
+        return storage
+
+
+_clients: Dict[Tuple[str, str], Any] = {}
+_clients_lock = threading.Lock()
+
+
+def supabase_client(url: str, key: str):
+    """
+    One Supabase client per (url, key) for the whole process: its HTTP session
+    keeps connections alive, so later requests skip the TCP and TLS handshakes.
+    """
+    with _clients_lock:
+        if (url, key) not in _clients:
+            from supabase import create_client
+
+            _clients[(url, key)] = create_client(url, key)
+        return _clients[(url, key)]
+
+
+def create_storage(backend: str | None = None, supabase_url: str | None = None, supabase_key: str | None = None) -> SensorStorage:
+    """
+    Build the configured backend.
+        STORAGE_BACKEND=supabase (default) uses SUPABASE_URL / SUPABASE_SERVICE_KEY
+        STORAGE_BACKEND=sqlite uses the file at SQLITE_PATH (default sensor_readings.db)
+    """
+    backend = (backend or os.getenv("STORAGE_BACKEND", "supabase")).lower()
+    if backend == "sqlite":
+        return SQLiteStorage(os.getenv("SQLITE_PATH", "sensor_readings.db"))
+    if backend == "supabase":
+        url = supabase_url or os.getenv("SUPABASE_URL")
+        key = supabase_key or os.getenv("SUPABASE_SERVICE_KEY")
+        if not url or not key:
+            raise ValueError("Supabase storage needs SUPABASE_URL and SUPABASE_SERVICE_KEY")
+        return SupabaseStorage(supabase_client(url, key))
+    raise ValueError(f"Unknown STORAGE_BACKEND '{backend}', expected 'supabase' or 'sqlite'")
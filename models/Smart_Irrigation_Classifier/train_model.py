@@ -7,6 +7,14 @@ from sklearn.metrics import accuracy_score, classification_report
 from catboost import CatBoostClassifier
 import optuna
 import joblib
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from feature_registry import compile_plan  # noqa: E402
+
+# CatBoost's training logs go next to this script, wherever it is run from
+TRAIN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "catboost_info")
 
 # ===============================
 # 📂 LOAD YOUR DATA
@@ -56,7 +64,9 @@ except Exception as e:
 # ===============================
 # 🧠 SPLIT DATA INTO X AND y
 # ===============================
-X = merged_df[important_features]
+# Features computed by the shared registry, in the order the model is trained with
+# fallbacks=False: missing observations stay NaN for the mean imputation below
+X = compile_plan(important_features).frame(merged_df, fallbacks=False)
 y = merged_df['status']
 
 # Fill missing values with column means
@@ -81,7 +91,8 @@ cat = CatBoostClassifier(
     bagging_temperature=0.8,
     border_count=128,
     verbose=False,
-    random_seed=42
+    random_seed=42,
+    train_dir=TRAIN_DIR
 )
 
 cat.fit(X_train, y_train)
@@ -106,7 +117,8 @@ def objective(trial):
         'bagging_temperature': trial.suggest_float('bagging_temperature', 0.5, 1.0),
         'border_count': trial.suggest_int('border_count', 32, 256),
         'verbose': False,
-        'random_seed': 42
+        'random_seed': 42,
+        'train_dir': TRAIN_DIR
     }
 
     model = CatBoostClassifier(**params)
@@ -127,6 +139,7 @@ print(f"🎯 Best Accuracy: {study.best_value:.4f}")
 best_params = study.best_params
 best_params['verbose'] = False
 best_params['random_seed'] = 42
+best_params['train_dir'] = TRAIN_DIR
 
 print("\n🔹 Training final CatBoost model with best parameters...")
 best_cat = CatBoostClassifier(**best_params)
@@ -164,6 +177,10 @@ with open("model_accuracy.txt", "w") as f:
 
 # Save trained model
 joblib.dump(best_cat, "catboost_model.pkl")
+# Native CatBoost format: what models/model_registry.py loads. Written aside and
+# renamed, so a running service never reads a half-written file
+best_cat.save_model("catboost_model.cbm.tmp")
+os.replace("catboost_model.cbm.tmp", "catboost_model.cbm")
 
 print("\n✅ Model and reports saved successfully!")
 print("📁 Files created: model_report.csv, model_accuracy.txt, catboost_model.pkl")
@@ -0,0 +1,180 @@
+"""
+advisory.py
+-----------
+Purpose:
+    - The full recommendation for a batch of fields in one call, instead of
+      three separate buttons that each rebuild features from the same inputs:
+        1. recommended crop (crop recommendation forest)
+        2. irrigation needed or not (Smart Irrigation Classifier)
+        3. water amount (irrigation optimization regressor), only for the
+           fields that need irrigation: the regressor is trained on
+           `status == True` rows only (irrigation_optimization_model/train.py)
+    - Inputs are validated once, and the union of the irrigation and
+      optimization features is computed once by one feature plan; both
+      models read their columns from it
+
+Run `python advisory.py` to benchmark against the three separate calls.
+"""
+
+import time
+from typing import TYPE_CHECKING, Any, Dict, Sequence, Tuple
+
+import numpy as np
+
+from feature_builders import IRRIGATION_FEATURES, OPTIMIZATION_FEATURES
+from feature_registry import compile_plan, matrix
+
+if TYPE_CHECKING:  # pandas is imported on the first call: the ingestion service imports this module at startup
+    import pandas as pd
+
+# Column order of the crop model (crop recommendation/model_training.py)
+CROP_FEATURES = ["N", "P", "K", "temperature", "humidity", "ph", "rainfall"]
+
+# Accepted range per input; lower-case n/p/k are accepted for N/P/K
+INPUT_LIMITS = {
+    "N": (0, None), "P": (0, None), "K": (0, None),
+    "temperature": (-40, 85), "humidity": (0, 100), "ph": (0, 14), "rainfall": (0, None),
+    "soil_moisture": (0, None),
+}
+ALIASES = {"N": "n", "P": "p", "K": "k"}
+
+# Class labels the irrigation classifier may use for "irrigate"
+IRRIGATE_LABELS = {"1", "True", "true", "irrigate", "ON"}
+
+# Every feature of both irrigation models, each computed once
+FIELD_FEATURES = list(dict.fromkeys(IRRIGATION_FEATURES + OPTIMIZATION_FEATURES))
+_field_plan = compile_plan(FIELD_FEATURES)
+
+
+def validate(data: Any, names: Sequence[str] = tuple(INPUT_LIMITS)) -> Dict[str, np.ndarray]:
+    """
+    The inputs `names` (INPUT_LIMITS keys, all by default) as float arrays.
+    Accepts a DataFrame, a dict of columns or a list of records; raises
+    ValueError naming every missing column and every column with values out of range.
+    """
+    if isinstance(data, list):
+        import pandas as pd
+
+        data = pd.DataFrame.from_records(data)
+    columns, problems = {}, []
+    for name in names:
+        low, high = INPUT_LIMITS[name]
+        column = name if name in data else ALIASES.get(name)
+        if column not in data:
+            problems.append(f"missing column {name!r}")
+            continue
+        values = np.asarray(data[column], dtype=np.float64)
+        bad = ~np.isfinite(values)
+        if low is not None:
+            bad |= values < low
+        if high is not None:
+            bad |= values > high
+        if bad.any():
+            problems.append(f"{name}: {int(bad.sum())} value(s) outside [{low}, {'∞' if high is None else high}]")
+        columns[name] = values
+    if problems:
+        raise ValueError("Invalid advisory inputs: " + "; ".join(problems))
+    return columns
+
+
+def advise(data: Any, crop_model=None, irrigation_model=None, water_model=None) -> "pd.DataFrame":
+    """
+    One row per input row: crop, crop_confidence, irrigation_needed,
+    irrigation_confidence and water_mm (NaN where no irrigation is needed).
+    Models default to the shared instances of model_registry.
+    """
+    import pandas as pd
+
+    if crop_model is None or irrigation_model is None or water_model is None:
+        from model_registry import load_model
+
+        crop_model = crop_model or load_model("crop")
+        irrigation_model = irrigation_model or load_model("irrigation")
+        water_model = water_model or load_model("water")
+
+    inputs = validate(data)
+    size = len(inputs["N"])
+    result = pd.DataFrame({
+        "crop": pd.Series(dtype=object), "crop_confidence": pd.Series(dtype=float),
+        "irrigation_needed": pd.Series(dtype=bool), "irrigation_confidence": pd.Series(dtype=float),
+        "water_mm": pd.Series(dtype=float),
+    }, index=range(size))
+    if not size:
+        return result
+
+    result["crop"], result["crop_confidence"] = crop_choice(crop_model, inputs)
+
+    features = _field_plan.values(inputs)
+    irrigate, confidence = irrigation_decision(irrigation_model, matrix(features, IRRIGATION_FEATURES))
+    result["irrigation_needed"] = irrigate
+    result["irrigation_confidence"] = confidence
+
+    water = np.full(size, np.nan)
+    on = np.flatnonzero(irrigate)
+    if len(on):
+        water[on] = np.maximum(water_model.predict(matrix(features, OPTIMIZATION_FEATURES, on)), 0.0)
+    result["water_mm"] = water
+    return result
+
+
+def crop_choice(crop_model, inputs: Dict[str, np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    """Most likely crop and its probability per row, from validated inputs."""
+    import pandas as pd
+
+    crops = crop_model.predict_proba(pd.DataFrame({name: inputs[name] for name in CROP_FEATURES}))
+    return np.asarray(crop_model.classes_)[crops.argmax(axis=1)], crops.max(axis=1)
+
+
+def irrigation_decision(irrigation_model, X: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Irrigate or not and the classifier's probability of that answer per row of irrigation features."""
+    proba = irrigation_model.predict_proba(X)
+    labels = np.asarray(irrigation_model.classes_)[proba.argmax(axis=1)]
+    return np.isin(labels.astype(str), list(IRRIGATE_LABELS)), proba.max(axis=1)
+
+
+# --- Benchmark: advise() vs the three separate feature builds and model calls ---
+
+def _benchmark(rows: int, on_share: float, repeats: int) -> None:
+    import pandas as pd
+    from catboost import CatBoostClassifier, CatBoostRegressor
+    from sklearn.ensemble import RandomForestClassifier
+
+    from feature_builders import irrigation_feature_matrix, optimization_feature_matrix
+    from model_registry import MODELS_DIR
+
+    crops = pd.read_csv(f"{MODELS_DIR}/../data/crop_data.csv")
+    rng = np.random.default_rng(0)
+    data = crops[CROP_FEATURES].sample(rows, replace=True, random_state=0).reset_index(drop=True)
+    data["soil_moisture"] = rng.uniform(0, 1, rows)
+
+    crop = RandomForestClassifier(n_estimators=200, random_state=42).fit(crops[CROP_FEATURES], crops["label"])
+    # Stand-in classifier that says "irrigate" for about `on_share` of the rows
+    X = irrigation_feature_matrix(data)
+    status = X[:, IRRIGATION_FEATURES.index("temperature")] > np.quantile(data["temperature"], 1 - on_share)
+    irrigation = CatBoostClassifier(iterations=300, depth=6, verbose=0, allow_writing_files=False).fit(X, status)
+    water = CatBoostRegressor(iterations=300, depth=6, verbose=0, allow_writing_files=False).fit(
+        optimization_feature_matrix(data), rng.uniform(0, 50, rows))
+
+    def separately():
+        crop.predict_proba(data[CROP_FEATURES])
+        irrigation.predict_proba(irrigation_feature_matrix(data))
+        water.predict(optimization_feature_matrix(data))
+
+    for label, run in (("Three separate calls", separately), ("advise()", lambda: advise(data, crop, irrigation, water))):
+        started = time.perf_counter()
+        for _ in range(repeats):
+            run()
+        print(f"{label:21}: {rows * repeats / (time.perf_counter() - started):10,.0f} rows/s")
+    share = advise(data, crop, irrigation, water)["irrigation_needed"].mean()
+    print(f"Regressor ran on {share:.0%} of the rows")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark advise() against separate model calls")
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--on-share", type=float, default=0.3, help="Share of rows the classifier marks for irrigation")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+    _benchmark(args.rows, args.on_share, args.repeats)
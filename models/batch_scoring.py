@@ -0,0 +1,475 @@
+"""
+batch_scoring.py
+----------------
+Purpose:
+    - Score historical exports (CSV or Parquet, any size) with one of the
+      three models or the full advisory pipeline, without loading the file:
+      the input is read in chunks, each chunk is validated, featurized and
+      scored by a pool of worker processes, and the results are appended to
+      the output (CSV or Parquet) in input order as soon as they are ready
+    - Memory stays bounded by the chunk size: at most 2 chunks per worker are
+      in flight, so peak memory is about chunk_rows x (2 x workers + 2) rows
+      whatever the size of the file
+    - Each worker loads the models once (model_registry); the crop model is
+      read from its pickle when there is one, since sklearn's compiled
+      traversal beats the flat forest from a few hundred rows per call
+    - ScoringJob runs a score on a background thread and reports its
+      progress and throughput, for the dashboard's bulk scoring mode
+    - All or nothing: an invalid row stops the run with a ValueError naming
+      the rows of its chunk, and a failed or cancelled run removes its
+      partial output, so a finished output file always covers every row
+
+Output rows are the input rows with the prediction columns appended:
+    crop         crop, crop_confidence
+    irrigation   irrigation_needed, irrigation_confidence
+    water        water_mm
+    advise       all five (water_mm empty where no irrigation is needed)
+
+Usage:
+    python batch_scoring.py score advise history.parquet scored.csv --workers 4
+    python batch_scoring.py benchmark --rows 1000000
+"""
+
+import os
+import resource
+import sys
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Iterator, Optional
+
+import numpy as np
+import pandas as pd
+
+from advisory import CROP_FEATURES, advise, crop_choice, irrigation_decision, validate
+from feature_builders import irrigation_feature_matrix, optimization_feature_matrix
+
+DEFAULT_CHUNK_ROWS = 50_000
+MODELS = ("crop", "irrigation", "water", "advise")
+
+# Inputs each model is computed from (advisory.INPUT_LIMITS names); missing
+# observed features of the historical data (rainfall, wind...) fall back to
+# their feature_registry expression
+REQUIRED_INPUTS = {
+    "crop": CROP_FEATURES,
+    "irrigation": ["soil_moisture", "temperature", "humidity", "ph", "N", "P", "K"],
+    "water": ["soil_moisture", "temperature", "humidity", "ph", "N", "P", "K"],
+}
+
+
+def scoring_paths(model: str) -> Dict[str, str]:
+    """Artifact of every model `model` needs: the registry's, except the crop pickle when present."""
+    from model_registry import MODEL_PATHS, artifact_path
+
+    names = ["crop", "irrigation", "water"] if model == "advise" else [model]
+    paths = {name: artifact_path(name) for name in names}
+    if "crop" in paths and os.path.exists(MODEL_PATHS["crop"]):
+        paths["crop"] = MODEL_PATHS["crop"]
+    return paths
+
+
+# --- Chunked input and output ---
+
+def _pyarrow():
+    """pyarrow and pyarrow.parquet, needed for Parquet files only."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError("Parquet files need pyarrow (pip install pyarrow); CSV files work without it") from e
+    return pa, pq
+
+
+def read_chunks(path: str, chunk_rows: int = DEFAULT_CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """The rows of a CSV or Parquet file, `chunk_rows` at a time, indexed by row number in the file."""
+    if path.endswith(".parquet"):
+        _, pq = _pyarrow()
+        start = 0
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows):
+            chunk = batch.to_pandas()
+            chunk.index = pd.RangeIndex(start, start + len(chunk))
+            start += len(chunk)
+            yield chunk
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_rows)
+
+
+def count_rows(path: str) -> int:
+    """Rows of a CSV (lines after the header, read in blocks) or Parquet file (from its footer)."""
+    if path.endswith(".parquet"):
+        _, pq = _pyarrow()
+        return pq.ParquetFile(path).metadata.num_rows
+    lines, last = 0, b"\n"
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            lines += block.count(b"\n")
+            last = block[-1:]
+    return max(0, lines + (last != b"\n") - 1)
+
+
+class ChunkWriter:
+    """
+    Appends DataFrames to a CSV or Parquet file; the first one fixes the columns
+    (and Parquet schema). Integer columns are written to Parquet as float64, so
+    a later chunk that has a gap in the same column (read as float) still fits.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.rows = 0
+        self._parquet = path.endswith(".parquet")
+        self._file = None if self._parquet else open(path, "w", newline="")
+        self._writer = None
+
+    def write(self, frame: pd.DataFrame) -> None:
+        if self._parquet:
+            pa, pq = _pyarrow()
+            integers = frame.select_dtypes("integer").columns
+            if len(integers):
+                frame = frame.astype({column: np.float64 for column in integers})
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(self.path, table.schema)
+            self._writer.write_table(table.cast(self._writer.schema))
+        else:
+            frame.to_csv(self._file, header=self.rows == 0, index=False)
+        self.rows += len(frame)
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+        if self._file is not None:
+            self._file.close()
+
+    def __enter__(self) -> "ChunkWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+# --- Scoring one chunk (in a worker process, or inline) ---
+
+_models: Dict[str, object] = {}
+
+
+def _load(paths: Dict[str, str]) -> None:
+    """Pool initializer: load every model of the run once per process."""
+    from model_registry import load_model
+
+    _models.update({name: load_model(name, path) for name, path in paths.items()})
+
+
+def predict_chunk(model: str, chunk: pd.DataFrame, models: Optional[Dict[str, object]] = None) -> pd.DataFrame:
+    """The prediction columns of `model` for one chunk, on the chunk's index."""
+    models = _models if models is None else models
+    try:
+        if model == "advise":
+            result = advise(chunk, models["crop"], models["irrigation"], models["water"])
+            result.index = chunk.index
+            return result
+        inputs = validate(chunk, REQUIRED_INPUTS[model])
+    except ValueError as error:
+        raise ValueError(f"Rows {chunk.index[0]}..{chunk.index[-1]}: {error}") from None
+
+    if model == "crop":
+        crop, confidence = crop_choice(models["crop"], inputs)
+        return pd.DataFrame({"crop": crop, "crop_confidence": confidence}, index=chunk.index)
+    if model == "irrigation":
+        needed, confidence = irrigation_decision(models["irrigation"], irrigation_feature_matrix(chunk))
+        return pd.DataFrame({"irrigation_needed": needed, "irrigation_confidence": confidence}, index=chunk.index)
+    return pd.DataFrame({"water_mm": models["water"].predict(optimization_feature_matrix(chunk))}, index=chunk.index)
+
+
+# --- The score command ---
+
+def score(
+    model: str,
+    source: str,
+    destination: str,
+    chunk_rows: int = DEFAULT_CHUNK_ROWS,
+    workers: Optional[int] = None,
+    paths: Optional[Dict[str, str]] = None,
+    progress: Optional[Callable[[int], None]] = None,
+) -> Dict[str, float]:
+    """
+    Score every row of `source` into `destination`, in order. `workers` processes
+    (default: one per CPU; 0 scores in this process). `paths` overrides the
+    artifacts of scoring_paths(model). `progress` is called with the rows written
+    so far after every chunk. Returns rows, chunks, seconds and rows/s.
+    Raises ValueError on the first chunk with invalid rows; `destination` is then
+    removed, like after any other failure or a cancel from `progress`.
+    """
+    if model not in MODELS:
+        raise ValueError(f"Unknown model {model!r}, expected one of {', '.join(MODELS)}")
+    if chunk_rows < 1:
+        raise ValueError("chunk_rows must be positive")
+    paths = {**scoring_paths(model), **(paths or {})}
+    workers = (os.cpu_count() or 1) if workers is None else workers
+    started = time.perf_counter()
+    chunks = 0
+
+    try:
+        with ChunkWriter(destination) as writer:
+            def write(chunk: pd.DataFrame, predictions: pd.DataFrame) -> None:
+                # Prediction columns replace input columns of the same name (e.g. a re-scored export)
+                writer.write(pd.concat([chunk.drop(columns=predictions.columns, errors="ignore"), predictions], axis=1))
+                if progress is not None:
+                    progress(writer.rows)
+
+            if workers == 0:
+                _load(paths)
+                for chunk in read_chunks(source, chunk_rows):
+                    write(chunk, predict_chunk(model, chunk))
+                    chunks += 1
+            else:
+                from concurrent.futures import ProcessPoolExecutor
+
+                with ProcessPoolExecutor(workers, initializer=_load, initargs=(paths,)) as pool:
+                    pending = deque()  # (chunk, future) in input order
+                    for chunk in read_chunks(source, chunk_rows):
+                        pending.append((chunk, pool.submit(predict_chunk, model, chunk)))
+                        # Bounded read-ahead: wait for the oldest chunk before reading more
+                        while len(pending) >= 2 * workers:
+                            write(*_result(pending.popleft()))
+                            chunks += 1
+                    while pending:
+                        write(*_result(pending.popleft()))
+                        chunks += 1
+    except BaseException:
+        if os.path.exists(destination):
+            os.remove(destination)  # All or nothing: no partial output that looks finished
+        raise
+
+    seconds = time.perf_counter() - started
+    return {
+        "rows": writer.rows,
+        "chunks": chunks,
+        "seconds": seconds,
+        "rows_per_s": writer.rows / seconds if seconds else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def _result(item):
+    chunk, future = item
+    return chunk, future.result()
+
+
+def peak_rss_mb() -> float:
+    """Peak resident memory of this process or of its largest (finished) worker."""
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return peak / 1024  # KiB on Linux
+
+
+# --- Background scoring (the dashboard's bulk mode) ---
+
+class ScoringCancelled(Exception):
+    """Raised inside a ScoringJob's thread when it is cancelled."""
+
+
+class ScoringJob:
+    """
+    score() on a background thread, for callers that must not block (a Streamlit
+    script run): start() returns at once and progress() can be polled meanwhile.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        source: str,
+        destination: str,
+        chunk_rows: int = DEFAULT_CHUNK_ROWS,
+        workers: Optional[int] = 0,
+        paths: Optional[Dict[str, str]] = None,
+    ):
+        self.model = model
+        self.source = source
+        self.destination = destination
+        self.chunk_rows = chunk_rows
+        self.workers = workers
+        self.paths = paths
+        self.state = "pending"  # pending, running, done, failed or cancelled
+        self.error: str | None = None
+        self.total_rows: int | None = None
+        self.rows = 0
+        self.result: Dict[str, float] = {}
+        self._started: float | None = None
+        self._finished: float | None = None
+        self._cancel = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+    def start(self) -> "ScoringJob":
+        self._thread = threading.Thread(target=self._run, name="bulk-scoring", daemon=True)
+        self._started = time.perf_counter()
+        self.state = "running"
+        self._thread.start()
+        return self
+
+    def cancel(self) -> None:
+        """Stop after the chunk being scored; the partial output is removed."""
+        self._cancel.set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until the job has finished (or `timeout` s passed); True when finished."""
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self.finished
+
+    @property
+    def finished(self) -> bool:
+        return self.state in ("done", "failed", "cancelled")
+
+    def progress(self) -> Dict[str, Any]:
+        """State, rows scored out of total_rows (None until counted), fraction, seconds and rows/s."""
+        with self._lock:
+            end = self._finished if self._finished is not None else time.perf_counter()
+            seconds = end - self._started if self._started is not None else 0.0
+            total = self.total_rows
+            return {
+                "state": self.state,
+                "rows": self.rows,
+                "total_rows": total,
+                "fraction": min(1.0, self.rows / total) if total else float(self.state == "done"),
+                "seconds": seconds,
+                "rows_per_s": self.rows / seconds if seconds else 0.0,
+                "error": self.error,
+            }
+
+    def _progress(self, rows: int) -> None:
+        with self._lock:
+            self.rows = rows
+        if self._cancel.is_set():
+            raise ScoringCancelled
+
+    def _run(self) -> None:
+        try:
+            total = count_rows(self.source)
+            with self._lock:
+                self.total_rows = total
+            result = score(self.model, self.source, self.destination, self.chunk_rows, self.workers,
+                           self.paths, progress=self._progress)
+            state, error = "done", None
+        except ScoringCancelled:
+            result, state, error = {}, "cancelled", None
+        except Exception as exc:  # Reported through progress(); the thread has no caller to raise to
+            result, state, error = {}, "failed", str(exc) or type(exc).__name__
+        with self._lock:
+            self.result, self.error = result, error
+            self._finished = time.perf_counter()
+            self.state = state
+
+
+# --- Benchmark: whole-file read/predict/write vs streaming, with stand-in models ---
+
+_WHOLE_FILE = """
+import json, sys, time
+sys.path.insert(0, {models_dir!r})
+import pandas as pd
+import batch_scoring
+from model_registry import load_model
+
+started = time.perf_counter()
+models = {{name: load_model(name, path) for name, path in {paths!r}.items()}}
+data = pd.read_csv({source!r})
+result = pd.concat([data, batch_scoring.predict_chunk({model!r}, data, models)], axis=1)
+result.to_csv({destination!r}, index=False)
+seconds = time.perf_counter() - started
+print(json.dumps({{"rows_per_s": len(data) / seconds, "peak_rss_mb": batch_scoring.peak_rss_mb()}}))
+"""
+
+_STREAMING = """
+import json, sys
+sys.path.insert(0, {models_dir!r})
+import batch_scoring
+
+print(json.dumps(batch_scoring.score({model!r}, {source!r}, {destination!r}, {chunk_rows}, {workers}, {paths!r})))
+"""
+
+
+def _stand_in_artifacts(directory: str) -> Dict[str, str]:
+    """Models shaped like the real ones (the committed artifacts are Git LFS pointers)."""
+    import joblib
+    from catboost import CatBoostClassifier, CatBoostRegressor
+    from sklearn.ensemble import RandomForestClassifier
+
+    from model_registry import MODELS_DIR
+
+    crops = pd.read_csv(os.path.join(os.path.dirname(MODELS_DIR), "data", "crop_data.csv"))
+    data = crops[CROP_FEATURES].assign(soil_moisture=np.random.default_rng(0).uniform(0, 1, len(crops)))
+    paths = {name: os.path.join(directory, file) for name, file in
+             (("crop", "crop.pkl"), ("irrigation", "irrigation.cbm"), ("water", "water.cbm"))}
+    joblib.dump(RandomForestClassifier(n_estimators=200, random_state=42).fit(crops[CROP_FEATURES], crops["label"]),
+                paths["crop"])
+    CatBoostClassifier(iterations=1000, depth=6, verbose=0, allow_writing_files=False).fit(
+        irrigation_feature_matrix(data), np.where(data["temperature"] > 27, "ON", "OFF")).save_model(paths["irrigation"])
+    CatBoostRegressor(iterations=1000, depth=6, verbose=0, allow_writing_files=False).fit(
+        optimization_feature_matrix(data), data["rainfall"] / 10).save_model(paths["water"])
+    return paths
+
+
+def _benchmark(rows: int, model: str, chunk_rows: int, workers) -> None:
+    import json
+    import subprocess
+    import tempfile
+
+    from model_registry import MODELS_DIR
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = {name: path for name, path in _stand_in_artifacts(directory).items()
+                 if model == "advise" or name == model}
+        crops = pd.read_csv(os.path.join(os.path.dirname(MODELS_DIR), "data", "crop_data.csv"))
+        source = os.path.join(directory, "history.csv")
+        rng = np.random.default_rng(1)
+        with ChunkWriter(source) as writer:
+            for start in range(0, rows, chunk_rows):
+                size = min(chunk_rows, rows - start)
+                chunk = crops[CROP_FEATURES].sample(size, replace=True, random_state=start).reset_index(drop=True)
+                writer.write(chunk.assign(soil_moisture=rng.uniform(0, 1, size)))
+        print(f"{rows:,} rows, {os.path.getsize(source) / 1e6:.0f} MB CSV, model {model}, {os.cpu_count()} CPU(s)")
+        print(f"{'run':>24} {'rows/s':>10} {'peak RSS MB':>12}")
+        runs = [("whole file", _WHOLE_FILE, {})] + [
+            (f"score, {n} worker(s)" if n else "score, inline", _STREAMING, {"chunk_rows": chunk_rows, "workers": n})
+            for n in workers
+        ]
+        for label, probe, options in runs:
+            code = probe.format(models_dir=MODELS_DIR, model=model, source=source, paths=paths,
+                                destination=os.path.join(directory, "scored.csv"), **options)
+            output = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(f"{label:>24} {result['rows_per_s']:>10,.0f} {result['peak_rss_mb']:>12,.0f}")
+
+
+def _main() -> None:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Score large CSV/Parquet files in chunks")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run = commands.add_parser("score", help="Score a file")
+    run.add_argument("model", choices=MODELS)
+    run.add_argument("input", help="CSV or .parquet file")
+    run.add_argument("output", help="CSV or .parquet file (overwritten)")
+    run.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS)
+    run.add_argument("--workers", type=int, default=None, help="Worker processes (default: one per CPU, 0: inline)")
+    for name in ("crop", "irrigation", "water"):
+        run.add_argument(f"--{name}-model", help=f"Artifact of the {name} model (default: model_registry's)")
+    bench = commands.add_parser("benchmark", help="Whole-file vs streaming scoring of a synthetic export")
+    bench.add_argument("--rows", type=int, default=1_000_000)
+    bench.add_argument("--model", choices=MODELS, default="advise")
+    bench.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS)
+    bench.add_argument("--workers", type=int, nargs="+", default=[0, os.cpu_count() or 1])
+    args = parser.parse_args()
+
+    if args.command == "benchmark":
+        _benchmark(args.rows, args.model, args.chunk_rows, args.workers)
+        return
+    paths = {name: getattr(args, f"{name}_model") for name in ("crop", "irrigation", "water")
+             if getattr(args, f"{name}_model")}
+    stats = score(args.model, args.input, args.output, args.chunk_rows, args.workers, paths)
+    print(f"Scored {stats['rows']:,} rows in {stats['chunks']} chunk(s), {stats['seconds']:.1f} s: "
+          f"{stats['rows_per_s']:,.0f} rows/s, peak RSS {stats['peak_rss_mb']:,.0f} MB", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    _main()
@@ -3,6 +3,11 @@ from sklearn.model_selection import train_test_split
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.metrics import accuracy_score
 import joblib
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from forest_arrays import export_forest  # noqa: E402
 
 # Load dataset from correct path
 df = pd.read_csv("../../data/crop_data.csv")
@@ -30,4 +35,7 @@ print(f"Model Accuracy: {accuracy:.4f} ({accuracy*100:.2f}%)")
 # Save model
 joblib.dump(model, "crop_model.pkl")
 print("Model saved as crop_model.pkl")
+# Flat, memory-mappable arrays: what models/model_registry.py loads
+export_forest(model, "crop_model.forest")
+print("Model exported as crop_model.forest")
 print("Training completed successfully!")
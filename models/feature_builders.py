@@ -0,0 +1,108 @@
+"""
+feature_builders.py
+-------------------
+Purpose:
+    - Build the feature rows of the Smart Irrigation Classifier (23 columns)
+      and of the irrigation optimization regressor (31 columns) from soil and
+      weather values
+    - Shared by the dashboard, the prediction API and the ingestion service;
+      every feature is defined once in feature_registry.py, the same
+      definitions the training data is prepared with
+    - `irrigation_feature_matrix` / `optimization_feature_matrix` build the
+      columns for a whole batch through one compiled plan into one
+      preallocated matrix
+    - `create_irrigation_features` / `create_optimization_features` build the
+      row of one reading; a single row takes the plan's scalar path, as fast
+      as the hand-written per-row builders it replaced
+
+Run `python feature_builders.py` to benchmark one call per row vs one call per batch.
+"""
+
+import time
+
+import numpy as np
+
+from feature_registry import compile_plan
+
+# Column order expected by Smart_Irrigation_Classifier/catboost_model.pkl (train_model.py)
+IRRIGATION_FEATURES = [
+    'soil_moisture', 'temperature', 'soil_humidity', 'Relative_Soil_Saturation',
+    'temp_diff', 'Evapotranspiration', 'rain_vs_soil', 'rainfall', 'ph_encoded',
+    'n', 'p', 'k', 'np_ratio', 'nk_ratio', 'crop_encoded', 'rain_3days',
+    'moisture_temp_ratio', 'evapo_ratio', 'rain_effect', 'moisture_change_rate',
+    'temp_scaled', 'npk_balance', 'wind_ratio'
+]
+
+# Column order expected by irrigation_optimization_model/catboost_irrigation_model.pkl (train.py)
+OPTIMIZATION_FEATURES = [
+    'soil_moisture', 'temperature', 'soil_humidity', 'air_temperature_(c)',
+    'wind_speed_(km/h)', 'humidity', 'wind_gust_(km/h)', 'pressure_(kpa)',
+    'ph', 'rainfall', 'n', 'p', 'k', 'soil_moisture_diff',
+    'Relative_Soil_Saturation', 'temp_diff', 'wind_effect',
+    'Evapotranspiration', 'rain_3days', 'rain_vs_soil',
+    'np_ratio', 'nk_ratio', 'ph_encoded', 'crop_encoded',
+    'moisture_temp_ratio', 'evapo_ratio', 'rain_effect',
+    'moisture_change_rate', 'temp_scaled', 'npk_balance', 'wind_ratio'
+]
+
+# Compiled once: dependency order and shared intermediates are resolved here, not per call
+irrigation_feature_matrix = compile_plan(IRRIGATION_FEATURES)
+optimization_feature_matrix = compile_plan(OPTIMIZATION_FEATURES)
+
+
+def _record(soil_moisture, temperature, humidity, ph, n, p, k, rainfall):
+    return {"soil_moisture": [soil_moisture], "temperature": [temperature], "humidity": [humidity], "ph": [ph],
+            "n": [n], "p": [p], "k": [k], "rainfall": [rainfall]}
+
+
+def create_irrigation_features(soil_moisture, temperature, humidity, ph, n, p, k, rainfall=0):
+    """Create all required features for irrigation model"""
+    return irrigation_feature_matrix(_record(soil_moisture, temperature, humidity, ph, n, p, k, rainfall))
+
+
+def create_optimization_features(soil_moisture, temperature, humidity, ph, n, p, k, rainfall=0):
+    """Create all required features for optimization model"""
+    return optimization_feature_matrix(_record(soil_moisture, temperature, humidity, ph, n, p, k, rainfall))
+
+
+# --- Benchmark: one scalar call per row vs one vectorized call per batch ---
+
+def _benchmark(sizes, scalar_cap: int) -> None:
+    import pandas as pd
+
+    rng = np.random.default_rng(42)
+    print(f"{'rows':>9} {'builder':>13} {'scalar rows/s':>15} {'vectorized rows/s':>18} {'speedup':>8}")
+    for rows in sizes:
+        data = pd.DataFrame({
+            "soil_moisture": rng.uniform(0, 1, rows), "temperature": rng.uniform(0, 50, rows),
+            "humidity": rng.uniform(0, 100, rows), "ph": rng.uniform(4, 9, rows),
+            "N": rng.integers(0, 200, rows), "P": rng.integers(0, 200, rows), "K": rng.integers(0, 200, rows),
+            "rainfall": rng.uniform(0, 300, rows),
+        })
+        for name, scalar, vectorized in (
+            ("irrigation", create_irrigation_features, irrigation_feature_matrix),
+            ("optimization", create_optimization_features, optimization_feature_matrix),
+        ):
+            # The scalar path is timed on at most scalar_cap rows; its rate does not depend on the batch size
+            sample = data.head(scalar_cap)
+            columns = [sample[c].tolist() for c in ("soil_moisture", "temperature", "humidity", "ph", "N", "P", "K", "rainfall")]
+            started = time.perf_counter()
+            np.vstack([scalar(*values) for values in zip(*columns)])
+            scalar_rate = len(sample) / (time.perf_counter() - started)
+
+            repeats = max(1, 10_000 // rows)
+            started = time.perf_counter()
+            for _ in range(repeats):
+                vectorized(data)
+            vectorized_rate = rows * repeats / (time.perf_counter() - started)
+            print(f"{rows:>9,} {name:>13} {scalar_rate:>15,.0f} {vectorized_rate:>18,.0f} {vectorized_rate / scalar_rate:>7.1f}x")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark scalar vs vectorized feature building")
+    parser.add_argument("--rows", type=int, nargs="+", default=[1, 1_000, 1_000_000])
+    parser.add_argument("--scalar-cap", type=int, default=100_000, help="Most rows built with the scalar functions")
+    args = parser.parse_args()
+    _benchmark(args.rows, args.scalar_cap)
@@ -0,0 +1,256 @@
+"""
+feature_registry.py
+-------------------
+Purpose:
+    - The one definition of every model feature: its name, the columns it is
+      computed from, a vectorized expression and its dtype
+    - Used by preprocessing (4_feature_engineering.py), the training scripts,
+      the dashboard, the prediction API and the ingestion service, so a
+      feature means the same thing when a model is trained and when it is served
+    - `compile_plan(columns)` resolves the features a model needs, in the
+      column order it was trained with, into a plan that computes each
+      feature once per batch (shared intermediates such as Evapotranspiration
+      are reused) and writes them into one preallocated matrix
+    - A single row (the dashboard, one API record, one reading) takes a
+      scalar path through the same expressions on NumPy scalars, which skips
+      the fixed cost of dozens of one-element array operations
+
+Every column the training data provides is marked `observed`: it is taken
+from the data when present (weather stations, time series, the crop target
+encoding and the engineered columns of the final training sets), so a
+training frame is passed through unchanged. The expression is the fallback
+used when only the basic soil and weather values are known, e.g. in the
+dashboard. Derived features use the formulas the training data was built
+with: 4_feature_engineering.py for the first set, and formulas checked
+against the rows of data/Final_irregation_optimization_data_m2.csv for the
+columns added after it; measured columns and the crop encoding have no
+formula and fall back to rough serving defaults. Training frames are built
+with `fallbacks=False`, which leaves the gaps of observed columns as NaN for
+the training script's own imputation instead of filling them with those defaults.
+"""
+
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+# Inputs every feature is ultimately computed from; N/P/K may also be given in upper case
+BASE_INPUTS = ("soil_moisture", "temperature", "humidity", "ph", "n", "p", "k")
+ALIASES = {"n": ("n", "N"), "p": ("p", "P"), "k": ("k", "K")}
+
+
+@dataclass(frozen=True)
+class Feature:
+    name: str
+    inputs: Tuple[str, ...]
+    expression: Callable[..., np.ndarray]  # One array (or NumPy scalar, for one row) per input, in `inputs` order
+    dtype: str = "float64"
+    observed: bool = False  # Taken from the data when present; `expression` fills the gaps
+    description: str = ""
+
+
+def _constant(value: float) -> Callable[[np.ndarray], np.ndarray]:
+    scalar = np.float64(value)
+    return lambda reference: np.full(len(reference), value) if isinstance(reference, np.ndarray) else scalar
+
+
+def _ph_encoded(ph: np.ndarray) -> np.ndarray:
+    # 0 = acidic (< 6.5), 1 = neutral (6.5 .. 7.5), 2 = alkaline (> 7.5)
+    if not isinstance(ph, np.ndarray):
+        return np.float64(0 if ph < 6.5 else (1 if ph <= 7.5 else 2))
+    return np.where(ph < 6.5, 0, np.where(ph <= 7.5, 1, 2))
+
+
+FEATURES: Dict[str, Feature] = {f.name: f for f in [
+    # Measured upstream; no formula, so serving falls back to rough defaults
+    Feature("rainfall", ("temperature",), _constant(0.0), observed=True, description="Rainfall (mm)"),
+    Feature("soil_humidity", ("humidity",), lambda humidity: humidity * 0.8, observed=True,
+            description="Soil humidity, approximated as 80% of air humidity"),
+    Feature("air_temperature_(c)", ("temperature",), lambda temperature: temperature, observed=True,
+            description="Air temperature, approximated by the soil surface temperature"),
+    Feature("wind_speed_(km/h)", ("temperature",), _constant(10.0), observed=True, description="Average wind speed"),
+    Feature("wind_gust_(km/h)", ("wind_speed_(km/h)",), lambda wind: wind * 1.5, observed=True,
+            description="Maximum wind gust"),
+    Feature("pressure_(kpa)", ("temperature",), _constant(101.325), observed=True, description="Atmospheric pressure"),
+    Feature("rain_3days", ("rainfall",), lambda rainfall: rainfall * 3, observed=True,
+            description="Rainfall over the past 3 days, assumed constant"),
+    Feature("soil_moisture_diff", ("soil_moisture",), _constant(0.1), observed=True,
+            description="Change of soil moisture since the previous measurement"),
+    Feature("crop_encoded", ("soil_moisture",), _constant(0.5365), observed=True,
+            description="Target encoding of the crop (share of irrigated rows), the training mean when unknown"),
+
+    # Derived features (4_feature_engineering.py)
+    Feature("Relative_Soil_Saturation", ("soil_moisture", "soil_humidity"), lambda sm, sh: sm / sh, observed=True,
+            description="Soil moisture relative to soil humidity"),
+    Feature("temp_diff", ("air_temperature_(c)", "temperature"), lambda air, t: air - t, observed=True,
+            description="Air minus soil temperature"),
+    Feature("wind_effect", ("wind_speed_(km/h)", "wind_gust_(km/h)"), lambda wind, gust: wind * gust, observed=True,
+            description="Combined drying effect of wind and gusts"),
+    Feature("Evapotranspiration", ("humidity", "temperature"), lambda h, t: h * t, observed=True,
+            description="Water demand proxy: humidity x temperature"),
+    Feature("rain_vs_soil", ("rainfall", "soil_moisture"), lambda rain, sm: rain - sm, observed=True,
+            description="Rainfall minus soil moisture"),
+    Feature("np_ratio", ("n", "p"), lambda n, p: n / (p + 1e-5), observed=True,
+            description="Nitrogen to phosphorus ratio"),
+    Feature("nk_ratio", ("n", "k"), lambda n, k: n / (k + 1e-5), observed=True,
+            description="Nitrogen to potassium ratio"),
+    Feature("ph_encoded", ("ph",), _ph_encoded, "int64", observed=True,
+            description="pH class: 0 acidic, 1 neutral, 2 alkaline"),
+
+    # Derived features of the final training sets
+    Feature("moisture_temp_ratio", ("soil_moisture", "temperature"), lambda sm, t: sm / (t + 1), observed=True,
+            description="Soil moisture per degree"),
+    Feature("evapo_ratio", ("Evapotranspiration", "Relative_Soil_Saturation"), lambda et, rss: et / (rss + 1),
+            observed=True, description="Evapotranspiration relative to soil saturation"),
+    Feature("rain_effect", ("rainfall", "rain_vs_soil"), lambda rain, rvs: rain * rvs, observed=True,
+            description="Rainfall weighted by its surplus over soil moisture"),
+    Feature("moisture_change_rate", ("soil_moisture_diff", "soil_moisture"), lambda diff, sm: diff / (sm + 1),
+            observed=True, description="Change of soil moisture relative to its level"),
+    Feature("temp_scaled", ("temp_diff", "temperature"), lambda diff, t: diff / (t + 1), observed=True,
+            description="Air minus soil temperature relative to the soil temperature"),
+    Feature("npk_balance", ("n", "p", "k"), lambda n, p, k: (n + p + k) / 3, observed=True,
+            description="Mean of N, P and K"),
+    Feature("wind_ratio", ("wind_speed_(km/h)", "wind_gust_(km/h)"), lambda wind, gust: wind / (gust + 1),
+            observed=True, description="Average wind speed relative to gusts"),
+]}
+
+
+class FeaturePlan:
+    """Compiled computation of a fixed list of output columns."""
+
+    def __init__(self, columns: Sequence[str]):
+        self.columns = tuple(columns)
+        self.steps: List[Feature] = []  # Every feature needed, each once, dependencies first
+        self.inputs: set = set()  # Base inputs the plan reads
+        seen: set = set()
+        for name in self.columns:
+            self._resolve(name, seen, ())
+
+    def _resolve(self, name: str, seen: set, path: Tuple[str, ...]) -> None:
+        if name in seen:
+            return
+        if name in path:
+            raise ValueError(f"Feature cycle: {' -> '.join(path + (name,))}")
+        if name in BASE_INPUTS:
+            self.inputs.add(name)
+        elif name in FEATURES:
+            for dependency in FEATURES[name].inputs:
+                self._resolve(dependency, seen, path + (name,))
+            self.steps.append(FEATURES[name])
+        else:
+            raise KeyError(f"Unknown feature {name!r}")
+        seen.add(name)
+
+    def values(self, data: Any, fallbacks: bool = True) -> Dict[str, np.ndarray]:
+        """
+        Every input and intermediate feature of the plan, computed once. With
+        `fallbacks=False`, NaNs in observed columns are kept instead of filled.
+        """
+        if _length(data) == 1:
+            return {name: np.array([value]) for name, value in self.scalars(data, fallbacks).items()}
+        values = {name: _input(data, name) for name in sorted(self.inputs)}
+        with np.errstate(divide="ignore", invalid="ignore"):  # Same inf/NaN as the pandas preprocessing
+            for feature in self.steps:
+                values[feature.name] = self._compute(feature, data, values, fallbacks)
+        return values
+
+    def scalars(self, data: Any, fallbacks: bool = True) -> Dict[str, np.float64]:
+        """`values` of a one-row input, as NumPy scalars: same expressions, same inf/NaN."""
+        values = {name: _scalar_input(data, name) for name in self.inputs}
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for feature in self.steps:
+                observed = _scalar_input(data, feature.name) if feature.observed and _has(data, feature.name) else None
+                if observed is not None and (not fallbacks or not np.isnan(observed)):
+                    values[feature.name] = observed
+                else:
+                    values[feature.name] = np.float64(feature.expression(*(values[i] for i in feature.inputs)))
+        return values
+
+    @staticmethod
+    def _compute(feature: Feature, data: Any, values: Dict[str, np.ndarray], fallbacks: bool) -> np.ndarray:
+        if feature.observed and _has(data, feature.name):
+            observed = np.asarray(data[feature.name], dtype=np.float64)
+            missing = np.isnan(observed)
+            if not fallbacks or not missing.any():
+                return observed
+            return np.where(missing, feature.expression(*(values[i] for i in feature.inputs)), observed)
+        return np.asarray(feature.expression(*(values[i] for i in feature.inputs)), dtype=np.float64)
+
+    def __call__(self, data: Any) -> np.ndarray:
+        """(rows, len(columns)) float64 matrix in column order."""
+        if _length(data) == 1:
+            values = self.scalars(data)
+            return np.array([[values[name] for name in self.columns]], dtype=np.float64)
+        return matrix(self.values(data), self.columns)
+
+    def frame(self, data: Any, fallbacks: bool = True):
+        """
+        The same columns as a DataFrame, each with its declared dtype (float64
+        for a column left with NaNs). Training scripts pass `fallbacks=False`
+        so missing observations stay missing.
+        """
+        import pandas as pd
+
+        values = self.values(data, fallbacks)
+        return pd.DataFrame({
+            name: values[name].astype(_dtype(name, values[name])) for name in self.columns
+        }, index=data.index if isinstance(data, pd.DataFrame) else None)
+
+
+@lru_cache(maxsize=None)
+def _compile(columns: Tuple[str, ...]) -> FeaturePlan:
+    return FeaturePlan(columns)
+
+
+def compile_plan(columns: Sequence[str]) -> FeaturePlan:
+    """The (cached) plan computing `columns`, in that order."""
+    return _compile(tuple(columns))
+
+
+def _dtype(name: str, values: np.ndarray) -> str:
+    dtype = FEATURES[name].dtype if name in FEATURES else "float64"
+    return "float64" if dtype != "float64" and np.isnan(values).any() else dtype
+
+
+def matrix(values: Dict[str, np.ndarray], columns: Sequence[str], rows: np.ndarray | None = None) -> np.ndarray:
+    """
+    (rows, len(columns)) float64 matrix of already computed `values` (FeaturePlan.values),
+    optionally of a subset of rows only, e.g. several models' columns from one plan.
+    """
+    size = len(next(iter(values.values()))) if rows is None else len(rows)
+    out = np.empty((size, len(columns)))
+    for i, name in enumerate(columns):
+        out[:, i] = values[name] if rows is None else values[name][rows]
+    return out
+
+
+# --- Input access for DataFrames, structured arrays and dicts of arrays ---
+
+def _has(data: Any, name: str) -> bool:
+    fields = data.dtype.names if isinstance(data, np.ndarray) else data
+    return name in fields
+
+
+def _length(data: Any) -> int:
+    if isinstance(data, dict):
+        return len(next(iter(data.values())))
+    return len(data)
+
+
+def _input(data: Any, name: str) -> np.ndarray:
+    for column in ALIASES.get(name, (name,)):
+        if _has(data, column):
+            return np.asarray(data[column], dtype=np.float64)
+    raise KeyError(f"Missing input column {name!r}")
+
+
+def _scalar_input(data: Any, name: str) -> np.float64:
+    """The value of a one-row input, without building a one-element array for lists and arrays."""
+    for column in ALIASES.get(name, (name,)):
+        if _has(data, column):
+            values = data[column]
+            if not isinstance(values, (list, tuple, np.ndarray)):
+                values = np.asarray(values, dtype=np.float64)  # e.g. a pandas Series
+            return np.float64(values[0])
+    raise KeyError(f"Missing input column {name!r}")
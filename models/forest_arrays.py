@@ -0,0 +1,229 @@
+"""
+forest_arrays.py
+----------------
+Purpose:
+    - Store a fitted scikit-learn RandomForestClassifier as flat node arrays
+      (all trees concatenated) in a directory of .npy files plus meta.json,
+      instead of a pickle of 200 Python tree objects
+    - Loading memory-maps the arrays: no unpickling, and pages are only read
+      from disk when a prediction touches them
+    - `FlatForest` walks all trees for a batch at once, one NumPy step per
+      tree level, instead of sklearn's per-tree dispatch; `predict` and
+      `predict_proba` are identical to the sklearn forest it was exported from.
+      That removes the fixed cost of a call (~11 ms for 200 trees in sklearn,
+      well under 1 ms here), which dominates single-row and small requests;
+      sklearn's compiled traversal stays faster from a few hundred rows
+    - An export is written to a temporary sibling directory and renamed into
+      place, so processes that have the previous arrays memory-mapped keep
+      reading the old files instead of files rewritten under them
+    - Thresholds and leaf class distributions are stored as float32 (half of
+      sklearn's float64) where that is exact: sklearn compares float32 inputs,
+      so each threshold is rounded down to the largest float32 not above it,
+      and leaf distributions stay float64 if any of them is not a float32
+
+Layout of a `<name>.forest/` directory:
+    meta.json        classes, n_features, feature names, number of trees, depth
+    roots.npy        index of each tree's root node
+    feature.npy      split feature per node
+    threshold.npy    split threshold per node (go left when x <= threshold)
+    children.npy     (left, right) child per node (leaves point to themselves)
+    leaf.npy         row of each leaf in value.npy (-1 for split nodes)
+    value.npy        class distribution per leaf (n_leaves, n_classes)
+
+Run `python forest_arrays.py` to benchmark against sklearn.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import time
+from typing import Any
+
+import numpy as np
+
+FORMAT_VERSION = 2
+ARRAYS = ("roots", "feature", "threshold", "children", "leaf", "value")
+
+# (row, tree) pairs walked together: large enough to amortize the per-step overhead,
+# small enough that a chunk's node and leaf gathers stay in cache
+CHUNK_ELEMENTS = 1 << 16
+
+
+def _float32_at_most(threshold: np.ndarray) -> np.ndarray:
+    """Largest float32 <= each threshold: for float32 x, x <= t  <=>  x <= result."""
+    rounded = threshold.astype(np.float32)
+    above = rounded.astype(np.float64) > threshold
+    rounded[above] = np.nextafter(rounded[above], np.float32(-np.inf))
+    return rounded
+
+
+def export_forest(forest, path: str) -> str:
+    """Write a fitted RandomForestClassifier to the `path` directory; returns the path."""
+    trees = [estimator.tree_ for estimator in forest.estimators_]
+    offsets = np.cumsum([0] + [tree.node_count for tree in trees])
+    nodes = np.arange(offsets[-1])
+    is_leaf = np.concatenate([tree.children_left < 0 for tree in trees])
+
+    # Children are renumbered to positions in the concatenated arrays; leaves loop onto
+    # themselves, so every row can take the same number of steps whatever its depth
+    left = np.concatenate([t.children_left + o for t, o in zip(trees, offsets)])
+    right = np.concatenate([t.children_right + o for t, o in zip(trees, offsets)])
+    left[is_leaf] = right[is_leaf] = nodes[is_leaf]
+    feature = np.concatenate([tree.feature for tree in trees])
+    feature[is_leaf] = 0
+    threshold = np.concatenate([tree.threshold for tree in trees])
+    threshold[is_leaf] = np.inf
+
+    # sklearn stores each node's class distribution as fractions (1 output); only leaves are read
+    value = np.concatenate([tree.value[:, 0, :] for tree in trees])[is_leaf]
+    if np.array_equal(value.astype(np.float32).astype(np.float64), value):
+        value = value.astype(np.float32)
+    leaf = np.full(len(nodes), -1)
+    leaf[is_leaf] = np.arange(is_leaf.sum())
+
+    arrays = {
+        "roots": offsets[:-1].astype(np.int32),
+        "feature": feature.astype(np.int32),
+        "threshold": _float32_at_most(threshold),
+        "children": np.column_stack([left, right]).astype(np.int32),
+        "leaf": leaf.astype(np.int32),
+        "value": value,
+    }
+    meta = {
+        "format": FORMAT_VERSION,
+        "classes": forest.classes_.tolist(),
+        "n_features": int(forest.n_features_in_),
+        "feature_names": [str(n) for n in getattr(forest, "feature_names_in_", [])],
+        "n_trees": len(trees),
+        "max_depth": max(tree.max_depth for tree in trees),
+    }
+    staging = tempfile.mkdtemp(prefix=f".{os.path.basename(path)}.", dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        os.chmod(staging, 0o755)
+        for name, array in arrays.items():
+            np.save(os.path.join(staging, f"{name}.npy"), np.ascontiguousarray(array))
+        with open(os.path.join(staging, "meta.json"), "w") as f:
+            json.dump(meta, f, indent=2)
+        _replace_directory(staging, path)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    return path
+
+
+def _replace_directory(staging: str, path: str) -> None:
+    """
+    Move the complete `staging` directory to `path`. A directory cannot be
+    renamed over a non-empty one, so the old export is first renamed aside and
+    then deleted: its files are unlinked, never rewritten, and memory maps of
+    them stay valid.
+    """
+    if not os.path.isdir(path):
+        os.replace(staging, path)
+        return
+    old = f"{staging}.old"
+    os.replace(path, old)
+    os.replace(staging, path)
+    shutil.rmtree(old, ignore_errors=True)
+
+
+class FlatForest:
+    """Read-only forest over the arrays of an exported `.forest` directory."""
+
+    def __init__(self, meta: dict, arrays: dict):
+        if meta.get("format") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported forest format {meta.get('format')!r}, re-export the model")
+        self.classes_ = np.asarray(meta["classes"])
+        self.n_features_in_ = meta["n_features"]
+        if meta["feature_names"]:
+            self.feature_names_in_ = np.asarray(meta["feature_names"], dtype=object)
+        self.n_estimators = meta["n_trees"]
+        self.max_depth = meta["max_depth"]
+        for name in ARRAYS:
+            setattr(self, name, arrays[name])
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "FlatForest":
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r" if mmap else None) for name in ARRAYS}
+        return cls(meta, arrays)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, name).nbytes for name in ARRAYS)
+
+    def predict_proba(self, X: Any) -> np.ndarray:
+        # sklearn evaluates trees on float32 inputs; compare the same values
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            raise ValueError(f"Expected {self.n_features_in_} features, got shape {X.shape}")
+        proba = np.empty((len(X), len(self.classes_)))
+        chunk = max(1, CHUNK_ELEMENTS // self.n_estimators)
+        for start in range(0, len(X), chunk):
+            proba[start:start + chunk] = self._proba(X[start:start + chunk])
+        return proba
+
+    def predict(self, X: Any) -> np.ndarray:
+        return self.classes_.take(self.predict_proba(X).argmax(axis=1))
+
+    def _proba(self, X: np.ndarray) -> np.ndarray:
+        # (trees, rows) matrix of current nodes, all trees advanced one level per step;
+        # rows that reached a leaf stay on it
+        node = np.repeat(np.asarray(self.roots, dtype=np.intp)[:, None], len(X), axis=1)
+        values = np.ascontiguousarray(X).ravel()
+        row_start = np.arange(len(X)) * X.shape[1]
+        children = self.children.reshape(-1)
+        for _ in range(self.max_depth):
+            go_right = values[row_start + self.feature[node]] > self.threshold[node]
+            node = children[2 * node + go_right]
+        # Reducing over the tree axis adds tree by tree, in sklearn's order: identical sums
+        proba = np.add.reduce(self.value[self.leaf[node]], axis=0, dtype=np.float64)
+        proba /= self.n_estimators
+        return proba
+
+
+def load_forest(path: str, mmap: bool = True) -> FlatForest:
+    return FlatForest.load(path, mmap)
+
+
+# --- Benchmark: sklearn vs FlatForest on the crop model ---
+
+def _benchmark(sizes, repeats: int) -> None:
+    import tempfile
+
+    import pandas as pd
+    from sklearn.ensemble import RandomForestClassifier
+
+    features = ["N", "P", "K", "temperature", "humidity", "ph", "rainfall"]
+    data = pd.read_csv(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "crop_data.csv"))
+    forest = RandomForestClassifier(n_estimators=200, random_state=42).fit(data[features].values, data["label"])
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as directory:
+        flat = load_forest(export_forest(forest, os.path.join(directory, "crop.forest")), mmap=False)
+        sklearn_bytes = sum(e.tree_.__getstate__()["nodes"].nbytes + e.tree_.value.nbytes for e in forest.estimators_)
+        print(f"Node storage: sklearn {sklearn_bytes / 1e6:.2f} MB, flat {flat.nbytes / 1e6:.2f} MB")
+        print(f"{'rows':>8} {'sklearn rows/s':>15} {'flat rows/s':>12} {'speedup':>8} {'identical':>10}")
+        for rows in sizes:
+            X = data[features].sample(rows, replace=True, random_state=rows).values + rng.normal(0, 2, (rows, len(features)))
+            times = {}
+            for name, model in (("sklearn", forest), ("flat", flat)):
+                n = max(1, repeats // rows)
+                started = time.perf_counter()
+                for _ in range(n):
+                    model.predict_proba(X)
+                times[name] = (time.perf_counter() - started) / n
+            identical = np.array_equal(flat.predict_proba(X), forest.predict_proba(X))
+            print(f"{rows:>8,} {rows / times['sklearn']:>15,.0f} {rows / times['flat']:>12,.0f} "
+                  f"{times['sklearn'] / times['flat']:>7.1f}x {str(identical):>10}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark the flat-array forest against sklearn")
+    parser.add_argument("--rows", type=int, nargs="+", default=[1, 10, 100, 1_000, 10_000, 100_000])
+    parser.add_argument("--repeats", type=int, default=200, help="Rows scored per size (at least one call)")
+    args = parser.parse_args()
+    _benchmark(args.rows, args.repeats)
@@ -14,6 +14,11 @@ import seaborn as sns
 # 📂 LOAD DATA
 # ===============================
 import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from feature_registry import compile_plan  # noqa: E402
+
 # Get the absolute path to the data file
 project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 data_path = os.path.join(project_root, 'data', 'Final_irregation_optimization_data_m2.csv')
@@ -36,7 +41,9 @@ features = [
 
 target = 'recommended_water_mm'
 
-X = merged_df[merged_df['status'] == True][features]
+# Features computed by the shared registry, in the order the model is trained with;
+# missing observations stay NaN (CatBoost handles them) instead of taking serving defaults
+X = compile_plan(features).frame(merged_df[merged_df['status'] == True], fallbacks=False)
 y = merged_df[merged_df['status'] == True][target]
 
 # ===============================
@@ -53,7 +60,7 @@ plt.tight_layout()
 plt.show()
 
 # 2. Feature Correlation Heatmap
-corr = merged_df[features].corr()
+corr = compile_plan(features).frame(merged_df, fallbacks=False).corr()
 plt.figure(figsize=(12,10))
 sns.heatmap(corr, annot=True, cmap='coolwarm', fmt='.2f')
 plt.title('Feature Correlation Heatmap')
@@ -77,7 +84,9 @@ model = CatBoostRegressor(
     loss_function='RMSE',
     eval_metric='R2',
     random_seed=42,
-    verbose=200
+    verbose=200,
+    # Training logs next to this script, wherever it is run from
+    train_dir=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'catboost_info')
 )
 
 model.fit(X_train, y_train, eval_set=(X_test, y_test), use_best_model=True)
@@ -86,7 +95,11 @@ model.fit(X_train, y_train, eval_set=(X_test, y_test), use_best_model=True)
 # 💾 SAVE MODEL
 # ===============================
 joblib.dump(model, 'catboost_irrigation_model.pkl')
-print("✅ Model saved successfully as 'catboost_irrigation_model.pkl'")
+# Native CatBoost format: what models/model_registry.py loads. Written aside and
+# renamed, so a running service never reads a half-written file
+model.save_model('catboost_irrigation_model.cbm.tmp')
+os.replace('catboost_irrigation_model.cbm.tmp', 'catboost_irrigation_model.cbm')
+print("✅ Model saved successfully as 'catboost_irrigation_model.pkl' and 'catboost_irrigation_model.cbm'")
 
 # ===============================
 # 📊 EVALUATION
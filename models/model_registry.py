@@ -0,0 +1,311 @@
+"""
+model_registry.py
+-----------------
+Purpose:
+    - One place that knows where the trained model artifacts live
+    - Load each artifact lazily on first use and hand the same instance to
+      every caller in the process (dashboard, ingestion service, API)
+    - Prefer the native artifacts: CatBoost's own `.cbm` format and the flat,
+      memory-mapped `.forest` arrays of the RandomForest (forest_arrays.py);
+      the pickles are the fallback
+    - Notice retrained artifacts: every lookup compares the file's inode,
+      mtime and size with the loaded copy, and reloads when the content hash
+      changed. Exports never rewrite an artifact in place (they write a
+      temporary file or directory and rename it), and a load that sees the
+      artifact change while it reads starts over, so the hash always belongs
+      to the files the model was read from
+    - Each model has its own lock: loading one does not block callers of another
+    - `warm_up` loads the models on a background thread once a process is
+      ready, so neither its startup nor (usually) its first prediction waits
+      for catboost, sklearn and the artifacts
+
+`python model_registry.py convert` writes the native artifacts next to the
+pickles; `python model_registry.py benchmark` reports cold-start load time
+and resident memory per model and format.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Tuple
+
+MODELS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+MODEL_PATHS = {
+    "crop": os.path.join(MODELS_DIR, "crop recommendation", "crop_model.pkl"),
+    "irrigation": os.path.join(MODELS_DIR, "Smart_Irrigation_Classifier", "catboost_model.pkl"),
+    "water": os.path.join(MODELS_DIR, "irrigation_optimization_model", "catboost_irrigation_model.pkl"),
+}
+
+# Native artifacts, used instead of the pickles when present
+NATIVE_PATHS = {
+    "crop": os.path.join(MODELS_DIR, "crop recommendation", "crop_model.forest"),
+    "irrigation": os.path.join(MODELS_DIR, "Smart_Irrigation_Classifier", "catboost_model.cbm"),
+    "water": os.path.join(MODELS_DIR, "irrigation_optimization_model", "catboost_irrigation_model.cbm"),
+}
+
+# CatBoost class to read each `.cbm` into
+CATBOOST_KINDS = {"irrigation": "CatBoostClassifier", "water": "CatBoostRegressor"}
+
+
+@dataclass
+class _Loaded:
+    model: Any
+    stat: Tuple  # (inode, mtime_ns, size) of every file of the artifact
+    digest: str
+
+
+_models: Dict[str, _Loaded] = {}
+_locks: Dict[str, threading.Lock] = {}  # One per artifact path
+_lock = threading.Lock()  # Guards _locks
+
+# Reads of an artifact that is being replaced are retried this many times
+_READ_ATTEMPTS = 5
+
+
+def artifact_path(name: str) -> str:
+    """Path of the artifact `load_model(name)` reads: the native one if it exists, else the pickle."""
+    native = NATIVE_PATHS.get(name)
+    return native if native and os.path.exists(native) else MODEL_PATHS[name]
+
+
+def load_model(name: str, path: str | None = None):
+    """
+    The model called `name`, loaded on first use. Raises FileNotFoundError when
+    the artifact is missing. Later calls cost one stat(); the artifact is only
+    re-read when its hash changed.
+    """
+    path = path or artifact_path(name)
+    with _path_lock(path):
+        for attempt in range(_READ_ATTEMPTS):
+            # A loaded artifact that vanished is most likely between the renames of a replacement
+            if not os.path.exists(path) and (path not in _models or attempt == _READ_ATTEMPTS - 1):
+                raise FileNotFoundError(f"Model file not found at: {path}")
+            loaded = _load_locked(name, path, _models.get(path))
+            if loaded is not None:
+                _models[path] = loaded
+                return loaded.model
+            time.sleep(0.01 * (attempt + 1))  # Being replaced: let the export finish
+        raise RuntimeError(f"Model artifact {path} kept changing while it was read")
+
+
+def model_version(name: str, path: str | None = None) -> str:
+    """Content hash of the artifact `load_model(name)` returns (loads it if needed)."""
+    path = path or artifact_path(name)
+    load_model(name, path)
+    with _path_lock(path):
+        return _models[path].digest
+
+
+def warm_up(names=None) -> threading.Thread:
+    """
+    Load the models `names` (all by default) on a background thread. A prediction
+    arriving meanwhile waits for the load in progress instead of starting another;
+    missing or unreadable artifacts are left for that prediction to report.
+    """
+    def load_all() -> None:
+        for name in names or MODEL_PATHS:
+            try:
+                load_model(name)
+            except Exception:
+                pass
+
+    thread = threading.Thread(target=load_all, name="model-warm-up", daemon=True)
+    thread.start()
+    return thread
+
+
+def export_native(name: str, model=None) -> str:
+    """Write the native artifact of `name` (from the pickle unless a model is given); returns its path."""
+    model = model if model is not None else load_model(name, MODEL_PATHS[name])
+    path = NATIVE_PATHS[name]
+    if path.endswith(".forest"):
+        from forest_arrays import export_forest
+
+        export_forest(model, path)  # Staged in a sibling directory and renamed into place
+    else:
+        staging = f"{path}.{os.getpid()}.tmp"
+        try:
+            model.save_model(staging)
+            os.replace(staging, path)
+        finally:
+            if os.path.exists(staging):
+                os.remove(staging)
+    return path
+
+
+# --- Internals ---
+
+def _path_lock(path: str) -> threading.Lock:
+    with _lock:
+        return _locks.setdefault(path, threading.Lock())
+
+
+def _load_locked(name: str, path: str, loaded: _Loaded | None) -> _Loaded | None:
+    """
+    The current version of the artifact (`loaded` itself when its content is
+    unchanged), or None when the artifact was replaced while it was read.
+    """
+    try:
+        stat = _stat(path)
+        if loaded is not None and loaded.stat == stat:
+            return loaded
+        digest = _digest(path)
+        if loaded is not None and loaded.digest == digest:
+            current = loaded
+        else:
+            current = _Loaded(_read(name, path), stat, digest)
+        if _stat(path) != stat:
+            return None  # The hash or the model may be of a different version
+    except FileNotFoundError:
+        return None  # Between the two renames of a directory replacement
+    current.stat = stat  # Touched or copied, same content
+    return current
+
+
+def _files(path: str):
+    if os.path.isdir(path):
+        return [os.path.join(path, f) for f in sorted(os.listdir(path))]
+    return [path]
+
+
+def _stat(path: str) -> Tuple:
+    return tuple((s.st_ino, s.st_mtime_ns, s.st_size) for s in map(os.stat, _files(path)))
+
+
+def _digest(path: str) -> str:
+    digest = hashlib.sha256()
+    for file in _files(path):
+        with open(file, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def _read(name: str, path: str):
+    if path.endswith(".forest"):
+        from forest_arrays import load_forest
+
+        return load_forest(path)
+    if path.endswith(".cbm"):
+        import catboost
+
+        return getattr(catboost, CATBOOST_KINDS.get(name, "CatBoost"))().load_model(path)
+    import joblib
+
+    return joblib.load(path)
+
+
+# --- Benchmark: cold-start load time and resident memory, each load in a fresh interpreter ---
+
+_PROBE = """
+import json, os, sys, time
+sys.path.insert(0, {models_dir!r})
+import numpy, sklearn.ensemble, catboost, joblib  # Libraries are not counted as model memory
+import forest_arrays, model_registry
+
+def rss():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+before = rss()
+started = time.perf_counter()
+model = model_registry.load_model({name!r}, {path!r})
+loaded = time.perf_counter() - started
+after_load = rss()
+started = time.perf_counter()
+model.predict(numpy.zeros((1, {width})))
+first = time.perf_counter() - started
+print(json.dumps({{"load_s": loaded, "first_predict_s": first, "rss_load": after_load - before, "rss_predict": rss() - before}}))
+"""
+
+
+def _probe(name: str, path: str) -> dict:
+    import json
+    import subprocess
+    import sys
+
+    from feature_builders import IRRIGATION_FEATURES, OPTIMIZATION_FEATURES
+
+    width = {"crop": 7, "irrigation": len(IRRIGATION_FEATURES), "water": len(OPTIMIZATION_FEATURES)}[name]
+    code = _PROBE.format(models_dir=MODELS_DIR, name=name, path=path, width=width)
+    output = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def _size(path: str) -> int:
+    return sum(os.path.getsize(f) for f in _files(path))
+
+
+def _synthetic_artifacts(directory: str) -> Dict[str, Dict[str, str]]:
+    """Train stand-ins shaped like the real models (same features, forest size, depth) into `directory`."""
+    import joblib
+    import numpy as np
+    import pandas as pd
+    from catboost import CatBoostClassifier, CatBoostRegressor
+    from sklearn.ensemble import RandomForestClassifier
+
+    from feature_builders import IRRIGATION_FEATURES, OPTIMIZATION_FEATURES
+
+    crops = pd.read_csv(os.path.join(os.path.dirname(MODELS_DIR), "data", "crop_data.csv"))
+    rng = np.random.default_rng(42)
+    models = {
+        "crop": RandomForestClassifier(n_estimators=200, random_state=42).fit(
+            crops[["N", "P", "K", "temperature", "humidity", "ph", "rainfall"]], crops["label"]),
+        "irrigation": CatBoostClassifier(iterations=1000, depth=6, verbose=0, allow_writing_files=False).fit(
+            rng.random((5000, len(IRRIGATION_FEATURES))), rng.integers(0, 2, 5000)),
+        "water": CatBoostRegressor(iterations=1000, depth=6, verbose=0, allow_writing_files=False).fit(
+            rng.random((5000, len(OPTIMIZATION_FEATURES))), rng.random(5000) * 50),
+    }
+    artifacts = {}
+    for name, model in models.items():
+        pickle = os.path.join(directory, f"{name}.pkl")
+        joblib.dump(model, pickle)
+        if name == "crop":
+            from forest_arrays import export_forest
+
+            native = export_forest(model, os.path.join(directory, f"{name}.forest"))
+        else:
+            native = os.path.join(directory, f"{name}.cbm")
+            model.save_model(native)
+        artifacts[name] = {"pickle": pickle, "native": native}
+    return artifacts
+
+
+def _benchmark(synthetic: bool) -> None:
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as directory:
+        if synthetic:
+            artifacts = _synthetic_artifacts(directory)
+        else:
+            artifacts = {
+                name: {fmt: path for fmt, path in (("pickle", MODEL_PATHS[name]), ("native", NATIVE_PATHS[name]))
+                       if os.path.exists(path)}
+                for name in MODEL_PATHS
+            }
+        print(f"{'model':>10} {'format':>7} {'size MB':>8} {'load ms':>8} {'1st predict ms':>15} "
+              f"{'RSS load MB':>12} {'RSS predict MB':>15}")
+        for name, paths in artifacts.items():
+            for fmt, path in paths.items():
+                r = _probe(name, path)
+                print(f"{name:>10} {fmt:>7} {_size(path) / 1e6:>8.2f} {r['load_s'] * 1000:>8.1f} "
+                      f"{r['first_predict_s'] * 1000:>15.1f} {r['rss_load'] / 1e6:>12.2f} {r['rss_predict'] / 1e6:>15.2f}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Model artifact tools")
+    parser.add_argument("command", choices=["convert", "benchmark"])
+    parser.add_argument("--synthetic", action="store_true",
+                        help="Benchmark stand-in models trained on the spot instead of the artifacts in models/")
+    args = parser.parse_args()
+    if args.command == "convert":
+        for model_name in MODEL_PATHS:
+            if os.path.exists(MODEL_PATHS[model_name]):
+                print(f"{model_name}: {export_native(model_name)}")
+    else:
+        _benchmark(args.synthetic)
@@ -0,0 +1,195 @@
+"""
+prediction_cache.py
+-------------------
+Purpose:
+    - Answer repeated prediction queries without running the model: the
+      dashboard defaults (80/48/40, 23 °C, 82 %...) and sensors whose readings
+      barely change between publishes ask for the same result over and over
+    - The key is the input vector quantized to a resolution per column
+      (0.1 °C, 0.5 % humidity, ...), so values within one step share an entry;
+      0 means exact
+    - Bounded: least recently used entries are evicted beyond `max_entries`,
+      and entries expire after `ttl_s`
+    - Bound to a model version: when the version passed in changes (a
+      retrained artifact, see model_registry.model_version) every entry is
+      dropped
+
+Hits, misses, evictions, expirations and invalidations are counted in `stats()`.
+`shared_cache(name, columns)` keeps one cache per model for the whole process
+(it outlives Streamlit reruns).
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+DEFAULT_ENTRIES = 10_000
+DEFAULT_TTL_S = 600.0
+
+# Quantization step per input column: about the precision of the sensors and
+# of the dashboard inputs; differences below it do not change a recommendation
+DEFAULT_RESOLUTIONS = {
+    "N": 1.0, "P": 1.0, "K": 1.0, "n": 1.0, "p": 1.0, "k": 1.0,
+    "temperature": 0.1, "humidity": 0.5, "ph": 0.01, "rainfall": 0.1, "soil_moisture": 0.001,
+}
+
+
+class PredictionCache:
+    """Bounded LRU + TTL cache of model outputs, one row per quantized input row."""
+
+    def __init__(
+        self,
+        resolutions: Sequence[float],
+        max_entries: int = DEFAULT_ENTRIES,
+        ttl_s: float = DEFAULT_TTL_S,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if max_entries < 1 or ttl_s <= 0:
+            raise ValueError("max_entries and ttl_s must be positive")
+        self.resolutions = np.asarray(resolutions, dtype=np.float64)
+        self._steps = np.where(self.resolutions > 0, self.resolutions, 1.0)
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._clock = clock
+        self._entries: "OrderedDict[bytes, Tuple[float, np.ndarray]]" = OrderedDict()  # key -> (expiry, output row)
+        self._version: Any = None
+        self._lock = threading.Lock()
+
+        # Statistics
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @classmethod
+    def from_env(cls, columns: Sequence[str]) -> "PredictionCache | None":
+        """
+        Cache for inputs with these columns. PREDICT_CACHE_ENTRIES (0 disables
+        caching, None is returned), PREDICT_CACHE_TTL_S and
+        PREDICT_CACHE_RESOLUTIONS ("temperature=0.5,humidity=1" overrides the defaults).
+        """
+        entries = int(os.getenv("PREDICT_CACHE_ENTRIES", DEFAULT_ENTRIES))
+        if entries <= 0:
+            return None
+        resolutions = dict(DEFAULT_RESOLUTIONS)
+        for item in filter(None, os.getenv("PREDICT_CACHE_RESOLUTIONS", "").split(",")):
+            name, _, value = item.partition("=")
+            resolutions[name.strip()] = float(value)
+        return cls(
+            [resolutions.get(column, 0.0) for column in columns],
+            max_entries=entries,
+            ttl_s=float(os.getenv("PREDICT_CACHE_TTL_S", DEFAULT_TTL_S)),
+        )
+
+    def keys(self, X: np.ndarray) -> List[bytes]:
+        """One key per row: the row quantized to the column resolutions."""
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim != 2 or X.shape[1] != len(self.resolutions):
+            raise ValueError(f"Expected {len(self.resolutions)} columns, got shape {X.shape}")
+        quantized = np.where(self.resolutions > 0, np.round(X / self._steps), X) + 0.0  # + 0.0 folds -0.0 into 0.0
+        return [row.tobytes() for row in quantized]
+
+    def get_many(self, X: np.ndarray, version: Any = None) -> Tuple[List[bytes], List[Optional[np.ndarray]]]:
+        """Keys of the rows of X and the cached output row of each (None on a miss)."""
+        keys = self.keys(X)
+        now = self._clock()
+        found: List[Optional[np.ndarray]] = []
+        with self._lock:
+            self._check_version(version)
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] <= now:
+                    del self._entries[key]
+                    self.expirations += 1
+                    entry = None
+                if entry is None:
+                    found.append(None)
+                else:
+                    self._entries.move_to_end(key)
+                    found.append(entry[1])
+            hits = sum(row is not None for row in found)
+            self.hits += hits
+            self.misses += len(keys) - hits
+        return keys, found
+
+    def put_many(self, keys: Sequence[bytes], outputs: np.ndarray, version: Any = None) -> None:
+        """Store one output row per key, evicting the least recently used entries beyond max_entries."""
+        expiry = self._clock() + self.ttl_s
+        with self._lock:
+            if version is not None and version != self._version:
+                return  # Computed by a model version that was replaced meanwhile
+            for key, output in zip(keys, outputs):
+                self._entries[key] = (expiry, np.array(output))  # A copy, not a view pinning the whole batch
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def predict(self, X: np.ndarray, predict: Callable[[np.ndarray], np.ndarray], version: Any = None) -> np.ndarray:
+        """predict(X) with cached rows filled in; the model only sees the rows that missed, in one call."""
+        keys, found = self.get_many(X, version)
+        missing = [i for i, row in enumerate(found) if row is None]
+        computed = None
+        if missing:
+            computed = np.asarray(predict(np.asarray(X)[missing]))
+            self.put_many([keys[i] for i in missing], computed, version)
+        return merge(found, missing, computed)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "cache_entries": len(self._entries),
+                "cache_hits": self.hits,
+                "cache_misses": self.misses,
+                "cache_hit_rate": self.hits / lookups if lookups else 0.0,
+                "cache_evictions": self.evictions,
+                "cache_expirations": self.expirations,
+                "cache_invalidations": self.invalidations,
+            }
+
+    def _check_version(self, version: Any) -> None:
+        """Drop everything when the model version changed. Called under the lock."""
+        if version is None or version == self._version:
+            return
+        if self._version is not None:
+            self.invalidations += 1
+        self._entries.clear()
+        self._version = version
+
+
+_shared: Dict[str, "PredictionCache | None"] = {}
+_shared_lock = threading.Lock()
+
+
+def shared_cache(name: str, columns: Sequence[str]) -> "PredictionCache | None":
+    """The process-wide cache of model `name` (configured from the environment on first use)."""
+    with _shared_lock:
+        if name not in _shared:
+            _shared[name] = PredictionCache.from_env(columns)
+        return _shared[name]
+
+
+def merge(found: List[Optional[np.ndarray]], missing: List[int], computed: Optional[np.ndarray]) -> np.ndarray:
+    """Cached rows and freshly computed rows (for the `missing` positions) as one array, in row order."""
+    if computed is not None and len(missing) == len(found):
+        return computed
+    if not found:
+        return np.empty(0)
+    first = computed[0] if computed is not None else next(row for row in found if row is not None)
+    out = np.empty((len(found),) + np.shape(first), dtype=(computed if computed is not None else first).dtype)
+    for i, row in enumerate(found):
+        if row is not None:
+            out[i] = row
+    if computed is not None:
+        out[missing] = computed
+    return out
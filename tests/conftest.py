@@ -0,0 +1,10 @@
+import os
+import sys
+
+# The ingestion service and the model helpers are plain script folders, not
+# packages, so make their modules importable the same way the services do.
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for folder in ("hardware", "models"):
+    path = os.path.join(REPO_ROOT, folder)
+    if path not in sys.path:
+        sys.path.insert(0, path)
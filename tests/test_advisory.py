@@ -0,0 +1,92 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+from catboost import CatBoostClassifier, CatBoostRegressor
+from sklearn.ensemble import RandomForestClassifier
+
+from advisory import CROP_FEATURES, advise, validate
+from feature_builders import irrigation_feature_matrix, optimization_feature_matrix
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "crop_data.csv")
+
+
+class Recording:
+    """Wraps a model and records the rows it is asked to score."""
+
+    def __init__(self, model):
+        self.model, self.rows = model, []
+        self.classes_ = getattr(model, "classes_", None)
+
+    def predict_proba(self, X):
+        self.rows.append(len(X))
+        return self.model.predict_proba(X)
+
+    def predict(self, X):
+        self.rows.append(len(X))
+        return self.model.predict(X)
+
+
+@pytest.fixture(scope="module")
+def fields():
+    crops = pd.read_csv(DATA)
+    data = crops[CROP_FEATURES].sample(300, random_state=0).reset_index(drop=True)
+    data["soil_moisture"] = np.random.default_rng(0).uniform(0, 1, 300)
+    return crops, data
+
+
+@pytest.fixture
+def models(fields):
+    crops, data = fields
+    crop = RandomForestClassifier(n_estimators=10, random_state=0).fit(crops[CROP_FEATURES], crops["label"])
+    hot = np.where(data["temperature"] > 28, "ON", "OFF")
+    irrigation = CatBoostClassifier(iterations=30, depth=3, verbose=False, allow_writing_files=False).fit(
+        irrigation_feature_matrix(data), hot)
+    water = CatBoostRegressor(iterations=30, depth=3, verbose=False, allow_writing_files=False).fit(
+        optimization_feature_matrix(data), data["temperature"])
+    return Recording(crop), Recording(irrigation), Recording(water)
+
+
+def test_one_result_per_row_matching_the_separate_models(fields, models):
+    _, data = fields
+    crop, irrigation, water = models
+    advice = advise(data, crop, irrigation, water)
+    assert len(advice) == len(data)
+    assert list(advice["crop"]) == list(crop.model.predict(data[CROP_FEATURES]))
+    on = irrigation.model.predict(irrigation_feature_matrix(data)) == "ON"
+    assert advice["irrigation_needed"].tolist() == on.tolist()
+    expected = np.maximum(water.model.predict(optimization_feature_matrix(data)), 0)
+    assert np.allclose(advice.loc[on, "water_mm"], expected[on])
+    assert advice.loc[~on, "water_mm"].isna().all()
+
+
+def test_each_model_called_once_and_regressor_only_on_irrigated_rows(fields, models):
+    _, data = fields
+    crop, irrigation, water = models
+    advice = advise(data, crop, irrigation, water)
+    irrigated = int(advice["irrigation_needed"].sum())
+    assert 0 < irrigated < len(data)
+    assert crop.rows == [len(data)] and irrigation.rows == [len(data)] and water.rows == [irrigated]
+
+
+def test_no_irrigation_no_regressor_call(fields, models):
+    _, data = fields
+    crop, irrigation, water = models
+    cold = data.assign(temperature=5.0)
+    advice = advise(cold, crop, irrigation, water)
+    assert not advice["irrigation_needed"].any() and water.rows == []
+
+
+def test_records_and_lower_case_npk(models):
+    record = {"n": 80, "p": 48, "k": 40, "temperature": 35.0, "humidity": 82, "ph": 6.7, "rainfall": 240, "soil_moisture": 0.35}
+    advice = advise([record], *models)
+    assert len(advice) == 1 and bool(advice.loc[0, "irrigation_needed"])
+
+
+def test_inputs_validated_once_with_every_problem(fields):
+    _, data = fields
+    with pytest.raises(ValueError) as error:
+        validate(data.drop(columns="soil_moisture").assign(humidity=120.0, ph=np.nan))
+    message = str(error.value)
+    assert "soil_moisture" in message and "humidity: 300 value(s)" in message and "ph: 300" in message
@@ -0,0 +1,128 @@
+import os
+import sys
+
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+from catboost import CatBoostClassifier, CatBoostRegressor
+from sklearn.ensemble import RandomForestClassifier
+
+from advisory import CROP_FEATURES, advise
+from batch_scoring import ScoringJob, count_rows, read_chunks, score
+from feature_builders import irrigation_feature_matrix, optimization_feature_matrix
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "crop_data.csv")
+
+
+@pytest.fixture(scope="module")
+def history():
+    crops = pd.read_csv(DATA)
+    data = crops[CROP_FEATURES].sample(500, random_state=0).reset_index(drop=True)
+    return data.assign(soil_moisture=np.random.default_rng(0).uniform(0, 1, 500), field_id=np.arange(500))
+
+
+@pytest.fixture(scope="module")
+def artifacts(history, tmp_path_factory):
+    directory = tmp_path_factory.mktemp("models")
+    crops = pd.read_csv(DATA)
+    paths = {"crop": str(directory / "crop.pkl"), "irrigation": str(directory / "irrigation.cbm"),
+             "water": str(directory / "water.cbm")}
+    joblib.dump(RandomForestClassifier(n_estimators=10, random_state=0).fit(crops[CROP_FEATURES], crops["label"]),
+                paths["crop"])
+    CatBoostClassifier(iterations=30, depth=3, verbose=False, allow_writing_files=False).fit(
+        irrigation_feature_matrix(history), np.where(history["temperature"] > 27, "ON", "OFF")).save_model(paths["irrigation"])
+    CatBoostRegressor(iterations=30, depth=3, verbose=False, allow_writing_files=False).fit(
+        optimization_feature_matrix(history), history["rainfall"] / 10).save_model(paths["water"])
+    return paths
+
+
+def _models(paths):
+    from model_registry import load_model
+
+    return {name: load_model(name, path) for name, path in paths.items()}
+
+
+@pytest.mark.parametrize("workers", [0, 2])
+def test_streamed_advice_matches_whole_file_in_order(history, artifacts, tmp_path, workers):
+    source, destination = tmp_path / "history.csv", tmp_path / "scored.csv"
+    history.to_csv(source, index=False)
+    stats = score("advise", str(source), str(destination), chunk_rows=64, workers=workers, paths=artifacts)
+    assert stats["rows"] == 500 and stats["chunks"] == 8 and stats["rows_per_s"] > 0
+
+    scored = pd.read_csv(destination)
+    expected = advise(history, *_models(artifacts).values())
+    assert scored["field_id"].tolist() == list(range(500))
+    assert scored["crop"].tolist() == expected["crop"].tolist()
+    assert scored["irrigation_needed"].tolist() == expected["irrigation_needed"].tolist()
+    assert np.allclose(scored["water_mm"], expected["water_mm"], equal_nan=True)
+
+
+def test_single_model_parquet_in_and_out(history, artifacts, tmp_path):
+    source, destination = tmp_path / "history.parquet", tmp_path / "scored.parquet"
+    history.rename(columns={"N": "n"}).to_parquet(source, index=False)
+    assert [len(chunk) for chunk in read_chunks(str(source), 200)] == [200, 200, 100]
+
+    score("water", str(source), str(destination), chunk_rows=200, workers=0, paths=artifacts)
+    scored = pd.read_parquet(destination)
+    water = _models(artifacts)["water"]
+    assert list(scored.columns) == list(history.rename(columns={"N": "n"}).columns) + ["water_mm"]
+    assert np.allclose(scored["water_mm"], water.predict(optimization_feature_matrix(history)))
+
+
+def test_parquet_integer_columns_that_turn_float_in_a_later_chunk(history, artifacts, tmp_path):
+    source, destination = tmp_path / "history.csv", tmp_path / "scored.parquet"
+    # An integer column in the first chunk, float (a fraction and a gap) in the second
+    plot = [str(i) for i in range(500)]
+    plot[250], plot[260] = "2.5", ""
+    history.assign(plot=plot).to_csv(source, index=False)
+    score("crop", str(source), str(destination), chunk_rows=200, workers=0, paths=artifacts)
+    scored = pd.read_parquet(destination)
+    assert len(scored) == 500 and scored["plot"].dtype == np.float64
+    assert scored["plot"][250] == 2.5 and scored["plot"].isna().sum() == 1
+    assert scored["field_id"].tolist() == list(range(500))
+
+
+def test_invalid_rows_reported_with_their_position(history, artifacts, tmp_path):
+    source, destination = tmp_path / "history.csv", tmp_path / "scored.csv"
+    history.assign(humidity=np.where(history.index == 321, 150.0, history["humidity"])).to_csv(source, index=False)
+    with pytest.raises(ValueError, match=r"Rows 300\.\.399: .*humidity: 1 value"):
+        score("crop", str(source), str(destination), chunk_rows=100, workers=0, paths=artifacts)
+    assert not destination.exists()  # All or nothing: the first three chunks are not left behind
+
+
+def test_background_job_reports_progress_and_result(history, artifacts, tmp_path):
+    source, destination = tmp_path / "history.parquet", tmp_path / "scored.parquet"
+    history.to_parquet(source, index=False)
+    job = ScoringJob("advise", str(source), str(destination), chunk_rows=100, paths=artifacts)
+    assert job.progress()["state"] == "pending"
+    assert job.start().wait(timeout=60)
+
+    progress = job.progress()
+    assert progress["state"] == "done" and progress["error"] is None
+    assert progress["rows"] == progress["total_rows"] == 500 and progress["fraction"] == 1.0
+    assert progress["rows_per_s"] > 0 and job.result["chunks"] == 5
+    assert pd.read_parquet(destination)["field_id"].tolist() == list(range(500))
+
+
+def test_background_job_cancel_and_failure(history, artifacts, tmp_path):
+    source = tmp_path / "history.csv"
+    history.to_csv(source, index=False)
+    assert count_rows(str(source)) == 500
+
+    job = ScoringJob("crop", str(source), str(tmp_path / "scored.csv"), chunk_rows=100, paths=artifacts)
+    job.cancel()  # Before the first chunk: stops once it is written
+    assert job.start().wait(timeout=60)
+    assert job.progress()["state"] == "cancelled" and job.progress()["rows"] == 100
+
+    history.drop(columns="ph").to_csv(source, index=False)
+    job = ScoringJob("crop", str(source), str(tmp_path / "scored.csv"), chunk_rows=100, paths=artifacts).start()
+    assert job.wait(timeout=60)
+    assert job.progress()["state"] == "failed" and "ph" in job.progress()["error"]
+
+
+def test_parquet_without_pyarrow_names_the_missing_package(tmp_path, monkeypatch):
+    monkeypatch.setitem(sys.modules, "pyarrow", None)  # As if it were not installed
+    monkeypatch.setitem(sys.modules, "pyarrow.parquet", None)
+    with pytest.raises(ImportError, match="pip install pyarrow"):
+        count_rows(str(tmp_path / "fields.parquet"))
@@ -0,0 +1,88 @@
+import threading
+import time
+
+import pytest
+
+from batch_writer import BatchWriter
+from storage import MemoryStorage
+
+
+def reading(i):
+    return {"temperature": 20.0 + i, "humidity": 50.0, "rain_status": "NO_RAIN"}
+
+
+def test_full_batches_are_written_as_one_insert():
+    storage = MemoryStorage()
+    writer = BatchWriter(storage, max_batch_rows=100, max_batch_age_s=60).start()
+    for i in range(250):
+        writer.add(reading(i))
+    writer.close()
+
+    assert storage.rows_written == 250
+    assert storage.insert_calls == 3  # 100 + 100 + the remainder flushed on close
+    assert writer.rows_written == 250 and writer.rows_failed == 0
+
+
+def test_partial_batch_is_flushed_after_max_age():
+    storage = MemoryStorage()
+    writer = BatchWriter(storage, max_batch_rows=1000, max_batch_age_s=0.05).start()
+    writer.add(reading(0))
+    writer.add(reading(1))
+
+    deadline = time.monotonic() + 2
+    while storage.rows_written < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert storage.rows_written == 2
+    assert storage.insert_calls == 1
+    writer.close()
+
+
+def test_in_flight_limit_blocks_producer():
+    release = threading.Event()
+    started = []
+
+    class SlowStorage(MemoryStorage):
+        def insert_many(self, rows):
+            started.append(len(rows))
+            release.wait(5)
+            return super().insert_many(rows)
+
+    storage = SlowStorage()
+    writer = BatchWriter(storage, max_batch_rows=1, max_batch_age_s=60, max_in_flight=2).start()
+    writer.add(reading(0))
+    writer.add(reading(1))
+
+    producer = threading.Thread(target=writer.add, args=(reading(2),))
+    producer.start()
+    producer.join(0.2)
+    assert producer.is_alive()  # third batch waits for a free in-flight slot
+
+    release.set()
+    producer.join(5)
+    writer.close()
+    assert storage.rows_written == 3
+
+
+def test_failed_insert_is_counted_and_writer_keeps_going():
+    class FlakyStorage(MemoryStorage):
+        calls = 0
+
+        def insert_many(self, rows):
+            FlakyStorage.calls += 1
+            if FlakyStorage.calls == 1:
+                raise ConnectionError("network down")
+            return super().insert_many(rows)
+
+    storage = FlakyStorage()
+    writer = BatchWriter(storage, max_batch_rows=2, max_batch_age_s=60, max_in_flight=1).start()
+    for i in range(4):
+        writer.add(reading(i))
+    writer.close()
+
+    assert writer.rows_failed == 2 and writer.batches_failed == 1
+    assert storage.rows_written == 2
+
+
+def test_invalid_limits_are_rejected():
+    with pytest.raises(ValueError):
+        BatchWriter(MemoryStorage(), max_batch_rows=0)
@@ -0,0 +1,65 @@
+import json
+
+from bench_ingestion import firmware_payload, latencies_ms, main
+
+
+def test_firmware_payload_matches_publish_data_fields():
+    import random
+
+    doc = json.loads(firmware_payload(random.Random(1)))
+    assert list(doc) == ["temperature", "humidity", "rain_status", "water_status", "container_status", "seq"]
+    assert doc["rain_status"] in ("DETECTED", "NO_RAIN")
+    assert doc["water_status"] in ("FULL", "NOT_FULL")
+    assert doc["container_status"] in ("Opened", "Closed")
+
+
+def test_latency_is_matched_to_the_latest_publish_before_receipt():
+    published = {"7": [100.0, 105.0, 110.0]}
+    persisted = [("7", "1970-01-01T00:01:45.002000+00:00", 105.3)]  # received at 105.002
+    assert [round(v) for v in latencies_ms(published, persisted)] == [300]
+
+
+def test_inprocess_run_writes_machine_readable_results(tmp_path):
+    output = tmp_path / "results.json"
+    main([
+        "--devices", "50", "--rate", "20", "--duration", "0.5", "--insert-latency-ms", "1",
+        "--batch-age-ms", "20", "--output", str(output),
+    ])
+    result = json.loads(output.read_text())
+    r = result["results"]
+    assert r["published"] > 0 and r["persisted"] == r["published"] and r["lost"] == 0
+    assert r["latency_ms_p50"] <= r["latency_ms_p95"] <= r["latency_ms_p99"]
+    assert r["sustained_msgs_per_s"] > 0 and r["peak_rss_mb"] > 0
+    assert result["config"]["devices"] == 50
+
+
+def test_binary_payload_run_loses_nothing(tmp_path):
+    output = tmp_path / "results.json"
+    main([
+        "--devices", "20", "--rate", "20", "--duration", "0.3", "--insert-latency-ms", "1",
+        "--batch-age-ms", "20", "--payload", "binary", "--output", str(output),
+    ])
+    r = json.loads(output.read_text())["results"]
+    assert r["published"] > 0 and r["persisted"] == r["published"] and r["rejected_payloads"] == 0
+
+
+def test_redelivered_messages_are_dropped_before_storage(tmp_path):
+    output = tmp_path / "results.json"
+    main([
+        "--devices", "20", "--rate", "20", "--duration", "0.3", "--insert-latency-ms", "1",
+        "--batch-age-ms", "20", "--duplicate-rate", "0.5", "--output", str(output),
+    ])
+    r = json.loads(output.read_text())["results"]
+    assert r["duplicates_sent"] > 0 and r["duplicates_dropped"] == r["duplicates_sent"]
+    assert r["persisted"] == r["published"]
+
+
+def test_sharded_run_adds_up_worker_processes(tmp_path):
+    output = tmp_path / "results.json"
+    main([
+        "--devices", "21", "--rate", "20", "--duration", "0.3", "--insert-latency-ms", "1",
+        "--batch-age-ms", "20", "--processes", "2", "--output", str(output),
+    ])
+    r = json.loads(output.read_text())["results"]
+    assert len(r["per_process"]) == 2
+    assert r["published"] == sum(p["published"] for p in r["per_process"]) and r["lost"] == 0
@@ -0,0 +1,28 @@
+import os
+import subprocess
+import sys
+
+from bench_startup import HARDWARE_DIR, MODELS_DIR, import_breakdown
+
+
+def test_import_breakdown_sums_self_time_per_package():
+    log = "\n".join([
+        "import time: self [us] | cumulative | imported package",
+        "import time:       100 |        100 |     numpy.core",
+        "import time:       400 |        500 |   numpy",
+        "import time:      2000 |       2500 | pandas",
+        "some other stderr line",
+    ])
+    packages, total = import_breakdown(log)
+    assert packages == {"numpy": 0.0005, "pandas": 0.002}
+    assert total == 0.0025
+
+
+def test_service_starts_without_the_heavy_libraries():
+    code = (
+        f"import sys; sys.path[:0] = [{HARDWARE_DIR!r}, {MODELS_DIR!r}]; import data_ingestion; "
+        "print(sorted({m.split('.')[0] for m in sys.modules} & {'pandas', 'paho', 'supabase', 'catboost', 'sklearn', 'joblib'}))"
+    )
+    env = {**os.environ, "STORAGE_BACKEND": "sqlite", "INGEST_LOG_LEVEL": "ERROR"}
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True, env=env).stdout
+    assert output.strip().splitlines()[-1] == "[]"
@@ -0,0 +1,85 @@
+from dedup import Deduplicator
+
+
+def offer(dedup, seq, now=0.0, device="7", payload=b""):
+    return [r["seq"] for r in dedup.offer(device, {"seq": seq}, seq, payload, now=now)]
+
+
+def test_redelivered_sequence_numbers_are_dropped():
+    dedup = Deduplicator(reorder_s=0)
+    assert [offer(dedup, s) for s in (1, 2, 2, 3, 1)] == [[1], [2], [], [3], []]
+    assert dedup.stats()["dedup_duplicates"] == 2
+
+
+def test_late_readings_inside_the_window_are_accepted_once():
+    dedup = Deduplicator(window=8, reorder_s=0)
+    assert offer(dedup, 10) == [10]
+    assert offer(dedup, 8) == [8]  # arrived late, not seen before
+    assert offer(dedup, 8) == []
+
+
+def test_counter_restart_after_reboot_is_not_mistaken_for_duplicates():
+    dedup = Deduplicator(window=8, reorder_s=0)
+    for s in range(100, 110):
+        offer(dedup, s)
+    assert offer(dedup, 0) == [0] and offer(dedup, 1) == [1]
+    assert dedup.stats()["dedup_device_restarts"] == 1
+
+
+def test_early_reboot_is_told_apart_from_redeliveries_by_payload():
+    dedup = Deduplicator(reorder_s=0)
+    for s in range(20):
+        offer(dedup, s, payload=b"boot 1 reading %d" % s)
+    # Rebooted before the counter passed the window: same numbers, new readings
+    assert [offer(dedup, s, payload=b"boot 2 reading %d" % s) for s in range(10)] == [[s] for s in range(10)]
+    assert offer(dedup, 4, payload=b"boot 2 reading 4") == []  # A redelivery is still dropped
+    stats = dedup.stats()
+    assert stats["dedup_device_restarts"] == 1 and stats["dedup_duplicates"] == 1
+
+
+def test_gap_holds_later_readings_until_it_is_filled():
+    dedup = Deduplicator(reorder_s=1.0)
+    assert offer(dedup, 1) == [1]
+    assert offer(dedup, 3) == []
+    assert offer(dedup, 4) == []
+    assert offer(dedup, 2) == [2, 3, 4]
+    assert dedup.stats()["dedup_reordered"] == 2
+
+
+def test_held_readings_are_released_when_the_gap_times_out():
+    dedup = Deduplicator(reorder_s=1.0)
+    offer(dedup, 1, now=0.0)
+    offer(dedup, 3, now=0.1)
+    assert dedup.flush_expired(now=0.5) == []
+    assert [r["seq"] for r in dedup.flush_expired(now=1.2)] == [3]
+    assert offer(dedup, 2, now=1.3) == [2]  # too late to reorder, still stored
+    assert dedup.stats()["dedup_late"] == 1
+
+
+def test_without_reordering_a_shared_subscription_share_passes_straight_through(monkeypatch):
+    monkeypatch.setenv("INGEST_REORDER_MS", "500")
+    dedup = Deduplicator.from_env(reorder=False)
+    # One of four workers behind a shared subscription sees every fourth number
+    assert [offer(dedup, s) for s in range(0, 40, 4)] == [[s] for s in range(0, 40, 4)]
+    assert dedup.stats()["dedup_held_rows"] == 0
+
+
+def test_payloads_without_seq_are_deduplicated_by_content_for_a_short_time():
+    dedup = Deduplicator(hash_window_s=1.0)
+    row = {"temperature": 20.0}
+    assert dedup.offer("7", row, None, b'{"temperature":20}', now=0.0) == [row]
+    assert dedup.offer("7", row, None, b'{"temperature":20}', now=0.5) == []
+    assert dedup.offer("8", row, None, b'{"temperature":20}', now=0.5) == [row]  # other device
+    assert dedup.offer("7", row, None, b'{"temperature":20}', now=5.0) == [row]  # next reading, same values
+
+
+def test_memory_is_bounded_by_the_device_lru():
+    dedup = Deduplicator(max_devices=100, reorder_s=1.0)
+    for device in range(10_000):
+        offer(dedup, 1, device=str(device))
+        offer(dedup, 3, device=str(device))  # held
+    stats = dedup.stats()
+    assert stats["dedup_devices"] == 100
+    assert stats["dedup_held_rows"] == 100
+    assert stats["dedup_devices_evicted"] == 9_900
+    assert len(dedup.flush_all()) == 100
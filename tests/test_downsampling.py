@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from downsampling import downsample_frame, history, lttb, minmax, pick_source
+from rollups import HOUR, MINUTE, RollupAggregator
+from storage import SQLiteStorage, to_timestamp
+
+T0 = 1_700_000_040.0  # A minute boundary
+
+
+def test_minmax_keeps_every_spike_within_the_point_budget():
+    x = np.arange(100_000)
+    y = np.sin(x / 500.0)
+    y[[123, 45_678, 99_000]] = [50.0, -50.0, 40.0]
+    kept = minmax(x, y, 200)
+    assert len(kept) <= 202 and np.all(np.diff(kept) > 0)
+    assert {0, 123, 45_678, 99_000, 99_999} <= set(kept.tolist())
+    assert minmax(x[:150], y[:150], 200).tolist() == list(range(150))
+
+
+def test_lttb_keeps_the_ends_and_the_shape():
+    x = np.arange(10_000, dtype=float)
+    y = np.where(x < 5_000, 0.0, 1.0)
+    y[7_500] = 9.0
+    kept = lttb(x, y, 100)
+    assert len(kept) == 100 and kept[0] == 0 and kept[-1] == 9_999 and np.all(np.diff(kept) > 0)
+    assert 7_500 in kept.tolist()
+
+
+def test_frame_is_long_form_per_field_and_device():
+    times = pd.date_range("2025-01-01", periods=5_000, freq="10s", tz="UTC").astype(str)
+    frame = pd.DataFrame({"created_at": np.tile(times, 2), "device_id": ["7"] * 5_000 + ["8"] * 5_000,
+                          "temperature": np.random.default_rng(0).normal(20, 2, 10_000), "humidity": 60.0})
+    series = downsample_frame(frame, ["temperature", "humidity"], points=100)
+    assert list(series.columns) == ["created_at", "series", "value"]
+    counts = series["series"].value_counts()
+    assert set(counts.index) == {"temperature (7)", "temperature (8)", "humidity (7)", "humidity (8)"}
+    assert counts.max() <= 102
+    assert series.loc[series["series"] == "temperature (7)", "value"].max() == frame["temperature"][:5_000].max()
+    with pytest.raises(ValueError):
+        downsample_frame(frame, ["temperature"], method="average")
+
+
+def test_source_follows_the_window_length():
+    # At most about two rows per point and device: a reading every 5 s, a minute or an hour
+    assert pick_source(3600, 1000) == 0  # 720 readings
+    assert pick_source(86400, 1000) == MINUTE  # 1,440 minutes
+    assert pick_source(7 * 86400, 1000) == HOUR  # 168 hours, not 10,080 minutes
+    assert pick_source(30 * 86400, 1000) == HOUR
+    assert pick_source(90 * 86400, 1000) == HOUR
+
+
+@pytest.fixture
+def storage(tmp_path):
+    storage = SQLiteStorage(str(tmp_path / "readings.db"))
+    readings = [{"created_at": to_timestamp(T0 + i * 10), "device_id": "7", "temperature": 20.0 + (i % 60) / 10,
+                 "humidity": 50.0} for i in range(3 * 8640)]  # 3 days, every 10 s
+    readings[1000]["temperature"] = 45.0
+    storage.insert_many(readings)
+    rollups = RollupAggregator({MINUTE: storage.with_table("sensor_rollups_1m"), HOUR: storage.with_table("sensor_rollups_1h")})
+    rollups.add_many(readings)
+    rollups.close()
+    yield storage
+    storage.close()
+
+
+def test_history_reads_rollups_for_long_windows_with_the_same_envelope(storage):
+    start, end = T0, T0 + 3 * 86400
+    series, source = history(storage, start, end, points=200)
+    assert source == "sensor_rollups_1h"
+    temperature = series.loc[series["series"] == "temperature", "value"]
+    assert len(temperature) <= 202 and temperature.max() == 45.0 and temperature.min() == 20.0
+
+    means, _ = history(storage, start, end, points=200, method="lttb")
+    assert means.loc[means["series"] == "humidity", "value"].eq(50.0).all()
+
+    day, source = history(storage, T0, T0 + 86400, points=1000)
+    assert source == "sensor_rollups_1m" and day.loc[day["series"] == "temperature", "value"].max() == 45.0
+
+    recent, source = history(storage, T0, T0 + 600, points=200)
+    assert source == "sensor_readings" and (recent["series"] == "temperature").sum() == 60
+
+
+def test_history_falls_back_to_raw_readings_without_rollups(tmp_path):
+    storage = SQLiteStorage(str(tmp_path / "readings.db"))
+    storage.insert_many([{"created_at": to_timestamp(T0 + i * 60), "device_id": "7", "temperature": 20.0}
+                         for i in range(5_000)])
+    series, source = history(storage, T0, T0 + 5_000 * 60, points=100)
+    assert source == "sensor_readings" and 0 < len(series) <= 2 * 102
+    storage.close()
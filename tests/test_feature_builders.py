@@ -0,0 +1,155 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from feature_builders import (
+    IRRIGATION_FEATURES, OPTIMIZATION_FEATURES, create_irrigation_features, create_optimization_features,
+    irrigation_feature_matrix, optimization_feature_matrix,
+)
+
+BUILDERS = [
+    (create_irrigation_features, irrigation_feature_matrix, len(IRRIGATION_FEATURES)),
+    (create_optimization_features, optimization_feature_matrix, len(OPTIMIZATION_FEATURES)),
+]
+
+
+def divide(a, b):
+    """a / b, with NumPy's inf/NaN for a zero divisor, like the plan."""
+    if b == 0:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return float(np.float64(a) / np.float64(b))
+    return a / b
+
+
+def reference_row(soil_moisture, temperature, humidity, ph, n, p, k, rainfall, columns):
+    """Every feature of one reading written out by hand, from the basic inputs and the serving defaults."""
+    rainfall = float(rainfall)
+    soil_humidity = humidity * 0.8
+    air_temperature = temperature
+    wind_speed = 10.0
+    wind_gust = wind_speed * 1.5
+    soil_moisture_diff = 0.1
+
+    relative_soil_saturation = divide(soil_moisture, soil_humidity)
+    temp_diff = air_temperature - temperature
+    evapotranspiration = humidity * temperature
+    rain_vs_soil = rainfall - soil_moisture
+    values = {
+        "soil_moisture": soil_moisture, "temperature": temperature, "humidity": humidity, "ph": ph,
+        "n": n, "p": p, "k": k, "rainfall": rainfall,
+        "soil_humidity": soil_humidity, "air_temperature_(c)": air_temperature,
+        "wind_speed_(km/h)": wind_speed, "wind_gust_(km/h)": wind_gust,
+        "pressure_(kpa)": 101.325, "rain_3days": rainfall * 3,
+        "soil_moisture_diff": soil_moisture_diff, "crop_encoded": 0.5365,
+        "Relative_Soil_Saturation": relative_soil_saturation,
+        "temp_diff": temp_diff,
+        "wind_effect": wind_speed * wind_gust,
+        "Evapotranspiration": evapotranspiration,
+        "rain_vs_soil": rain_vs_soil,
+        "np_ratio": n / (p + 1e-5),
+        "nk_ratio": n / (k + 1e-5),
+        "ph_encoded": 0 if ph < 6.5 else (1 if ph <= 7.5 else 2),
+        "moisture_temp_ratio": divide(soil_moisture, temperature + 1),
+        "evapo_ratio": divide(evapotranspiration, relative_soil_saturation + 1),
+        "rain_effect": rainfall * rain_vs_soil,
+        "moisture_change_rate": divide(soil_moisture_diff, soil_moisture + 1),
+        "temp_scaled": divide(temp_diff, temperature + 1),
+        "npk_balance": (n + p + k) / 3,
+        "wind_ratio": wind_speed / (wind_gust + 1),
+    }
+    return np.array([[values[name] for name in columns]], dtype=np.float64)
+
+
+def fields(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    data = pd.DataFrame({
+        "soil_moisture": rng.uniform(0, 150, rows), "temperature": rng.uniform(-5, 50, rows),
+        "humidity": rng.uniform(0, 100, rows), "ph": rng.choice([6.5, 7.0, 7.5], rows),
+        "N": rng.integers(0, 200, rows), "P": rng.integers(0, 3, rows), "K": rng.integers(0, 200, rows),
+        "rainfall": rng.choice([0.0, 0.05, 12.0, 240.0], rows),
+    })
+    return data
+
+
+@pytest.mark.parametrize("scalar, vectorized, width", BUILDERS)
+def test_batches_and_single_rows_equal_the_hand_written_formulas_exactly(scalar, vectorized, width):
+    data = fields(500)
+    matrix = vectorized(data)
+    expected = np.vstack([
+        reference_row(r.soil_moisture, r.temperature, r.humidity, r.ph, r.N, r.P, r.K, r.rainfall, vectorized.columns)
+        for r in data.itertuples()
+    ])
+    assert matrix.shape == (500, width) and matrix.dtype == np.float64
+    assert np.array_equal(matrix, expected)
+    # One row at a time takes the plan's scalar path
+    singles = np.vstack([
+        scalar(r.soil_moisture, r.temperature, r.humidity, r.ph, r.N, r.P, r.K, r.rainfall) for r in data.itertuples()
+    ])
+    assert singles.dtype == np.float64 and np.array_equal(singles, expected)
+    assert np.array_equal(vectorized(data.head(1)), expected[:1])
+
+
+@pytest.mark.parametrize("scalar, vectorized, width", BUILDERS)
+def test_one_row_of_dashboard_values(scalar, vectorized, width):
+    record = {"soil_moisture": [0.35], "temperature": [23.0], "humidity": [82.0], "ph": [6.7],
+              "n": [80], "p": [48], "k": [40], "rainfall": [240.0]}
+    assert np.array_equal(vectorized(record), scalar(0.35, 23.0, 82.0, 6.7, 80, 48, 40, 240.0))
+
+
+# soil_moisture 30, temperature 20, humidity 50, ph 7, N 80, P 40, K 20, rainfall 5, worked out by hand
+# from the formulas of the training data and the serving defaults (no wind, pressure or crop measured)
+EXPECTED = {
+    "soil_moisture": 30.0, "temperature": 20.0, "humidity": 50.0, "ph": 7.0, "rainfall": 5.0,
+    "n": 80.0, "p": 40.0, "k": 20.0,
+    "soil_humidity": 40.0,  # 80% of air humidity
+    "air_temperature_(c)": 20.0, "wind_speed_(km/h)": 10.0, "wind_gust_(km/h)": 15.0, "pressure_(kpa)": 101.325,
+    "soil_moisture_diff": 0.1, "crop_encoded": 0.5365, "rain_3days": 15.0,
+    "Relative_Soil_Saturation": 0.75,  # 30 / 40
+    "temp_diff": 0.0,  # 20 - 20
+    "wind_effect": 150.0,  # 10 * 15
+    "Evapotranspiration": 1000.0,  # 50 * 20
+    "rain_vs_soil": -25.0,  # 5 - 30
+    "np_ratio": 1.9999995,  # 80 / 40.00001
+    "nk_ratio": 3.99999800000,  # 80 / 20.00001
+    "ph_encoded": 1.0,  # 6.5 <= 7 <= 7.5
+    "moisture_temp_ratio": 1.4285714285714286,  # 30 / 21
+    "evapo_ratio": 571.4285714285714,  # 1000 / 1.75
+    "rain_effect": -125.0,  # 5 * -25
+    "moisture_change_rate": 0.0032258064516129032,  # 0.1 / 31
+    "temp_scaled": 0.0,  # 0 / 21
+    "npk_balance": 46.666666666666664,  # 140 / 3
+    "wind_ratio": 0.625,  # 10 / 16
+}
+
+
+@pytest.mark.parametrize("scalar, vectorized, width", BUILDERS)
+def test_pinned_values_of_one_reading(scalar, vectorized, width):
+    columns = IRRIGATION_FEATURES if width == len(IRRIGATION_FEATURES) else OPTIMIZATION_FEATURES
+    expected = np.array([[EXPECTED[name] for name in columns]])
+    record = {"soil_moisture": [30.0], "temperature": [20.0], "humidity": [50.0], "ph": [7.0],
+              "n": [80], "p": [40], "k": [20], "rainfall": [5.0]}
+    np.testing.assert_allclose(scalar(30.0, 20.0, 50.0, 7.0, 80, 40, 20, 5.0), expected, rtol=1e-12)
+    np.testing.assert_allclose(vectorized(record), expected, rtol=1e-12)
+
+
+@pytest.mark.parametrize("ph, encoded", [(6.49, 0), (6.5, 1), (7.5, 1), (7.51, 2)])
+def test_ph_classes_at_the_boundaries(ph, encoded):
+    column = IRRIGATION_FEATURES.index("ph_encoded")
+    assert create_irrigation_features(30.0, 20.0, 50.0, ph, 80, 40, 20)[0, column] == encoded
+    assert irrigation_feature_matrix({"soil_moisture": [30.0], "temperature": [20.0], "humidity": [50.0], "ph": [ph],
+                                      "n": [80], "p": [40], "k": [20]})[0, column] == encoded
+
+
+def test_structured_arrays_and_default_rainfall():
+    data = fields(10).drop(columns="rainfall")
+    structured = data.to_records(index=False)
+    assert np.array_equal(irrigation_feature_matrix(structured), irrigation_feature_matrix(data))
+    assert np.array_equal(
+        irrigation_feature_matrix(data)[3],
+        create_irrigation_features(*data.iloc[3][["soil_moisture", "temperature", "humidity", "ph", "N", "P", "K"]])[0],
+    )
+
+
+def test_missing_inputs_are_reported():
+    with pytest.raises(KeyError, match="soil_moisture"):
+        irrigation_feature_matrix(fields(3).drop(columns="soil_moisture"))
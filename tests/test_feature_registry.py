@@ -0,0 +1,150 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from feature_builders import IRRIGATION_FEATURES, OPTIMIZATION_FEATURES, create_irrigation_features
+from feature_registry import FEATURES, compile_plan
+
+
+def weather_station_rows(rows=200, seed=0):
+    """Rows shaped like the merged training data (measured wind, soil humidity, 3-day rain, crop)."""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "soil_moisture": rng.uniform(1, 80, rows), "temperature": rng.uniform(-5, 45, rows),
+        "soil_humidity": rng.uniform(5, 90, rows), "air_temperature_(c)": rng.uniform(-5, 45, rows),
+        "wind_speed_(km/h)": rng.uniform(0, 40, rows), "humidity": rng.uniform(10, 100, rows),
+        "wind_gust_(km/h)": rng.uniform(0, 80, rows), "pressure_(kpa)": rng.uniform(95, 105, rows),
+        "ph": rng.choice([5.0, 6.5, 7.0, 7.5, 8.2], rows), "rainfall": rng.uniform(0, 300, rows),
+        "n": rng.integers(0, 200, rows), "p": rng.integers(0, 200, rows), "k": rng.integers(0, 200, rows),
+        "rain_3days": rng.uniform(0, 900, rows), "crop_encoded": rng.integers(0, 20, rows),
+        "soil_moisture_diff": rng.normal(0, 1, rows), "moisture_change_rate": rng.normal(0, 1, rows),
+    })
+
+
+def test_preprocessing_formulas():
+    # The expressions of Data_Pre-processing/Status_Classifer_model/4_feature_engineering.py
+    df = weather_station_rows()
+    features = compile_plan(list(df.columns) + [
+        "Relative_Soil_Saturation", "temp_diff", "wind_effect", "Evapotranspiration",
+        "rain_vs_soil", "np_ratio", "nk_ratio", "ph_encoded",
+    ]).frame(df)
+    pd.testing.assert_series_equal(features["Relative_Soil_Saturation"], df["soil_moisture"] / df["soil_humidity"], check_names=False)
+    pd.testing.assert_series_equal(features["temp_diff"], df["air_temperature_(c)"] - df["temperature"], check_names=False)
+    pd.testing.assert_series_equal(features["wind_effect"], df["wind_speed_(km/h)"] * df["wind_gust_(km/h)"], check_names=False)
+    pd.testing.assert_series_equal(features["Evapotranspiration"], df["humidity"] * df["temperature"], check_names=False)
+    pd.testing.assert_series_equal(features["rain_vs_soil"], df["rainfall"] - df["soil_moisture"], check_names=False)
+    pd.testing.assert_series_equal(features["np_ratio"], df["n"] / (df["p"] + 1e-5), check_names=False)
+    pd.testing.assert_series_equal(features["nk_ratio"], df["n"] / (df["k"] + 1e-5), check_names=False)
+    expected_ph = df["ph"].apply(lambda v: 0 if v < 6.5 else (1 if v <= 7.5 else 2))
+    pd.testing.assert_series_equal(features["ph_encoded"], expected_ph, check_names=False)
+    assert features["ph_encoded"].dtype == np.int64
+
+
+# The first rows of data/Final_irregation_optimization_data_m2.csv (notebooks/exploratory_analysis.ipynb);
+# rainfall and N/P/K come from the matching rows of data/crop_data.csv
+DATASET_ROWS = pd.DataFrame({
+    "soil_moisture": [54.0, 12.0, 34.0, 7.0, 50.0], "temperature": [22.0, 20.0, 26.0, 44.0, 38.0],
+    "soil_humidity": [70.0, 40.0, 35.0, 44.0, 23.0], "air_temperature_(c)": [19.52, 19.49, 19.47, 19.54, 19.61],
+    "wind_speed_(km/h)": [2.13, 2.01, 1.90, 2.28, 2.66], "humidity": [55.04, 55.17, 55.30, 54.20, 53.09],
+    "wind_gust_(km/h)": [6.30, 10.46, 14.63, 16.08, 17.52], "pressure_(kpa)": [101.50, 101.50, 101.51, 101.51, 101.51],
+    "ph": [6.502985, 7.038096, 7.840207, 6.980401, 7.628473],
+    "rainfall": [202.9355362, 226.6555374, 263.9642476, 242.8640342, 262.7173405],
+    "n": [90, 85, 60, 74, 78], "p": [42, 58, 55, 35, 42], "k": [43, 41, 44, 40, 42],
+    "soil_moisture_diff": [0.0, 0.0, 22.0, -27.0, 43.0], "ph_encoded": [1, 1, 2, 1, 2],
+    "crop_encoded": [0.569876, 0.472449, 0.472449, 0.472449, 0.472449],
+    "moisture_temp_ratio": [2.347826, 0.571429, 1.259259, 0.155556, 1.282051],
+    "evapo_ratio": [683.561290, 848.769231, 729.318841, 2057.474510, 635.625479],
+    "rain_effect": [30224.312898, 48652.866185, 60702.339593, 57282.890868, 55884.533974],
+    "moisture_change_rate": [0.0, 0.0, 0.628571, -3.375, 0.843137],
+    "temp_scaled": [-0.107826, -0.024286, -0.241852, -0.543556, -0.471538],
+    "npk_balance": [58.333333, 61.333333, 53.0, 49.666667, 54.0],
+    "wind_ratio": [0.291781, 0.175393, 0.121561, 0.133489, 0.143629],
+})
+ENGINEERED = ["ph_encoded", "moisture_temp_ratio", "evapo_ratio", "rain_effect", "moisture_change_rate",
+              "temp_scaled", "npk_balance", "wind_ratio"]
+
+
+def declared_dtypes(df):
+    return df.astype({name: FEATURES[name].dtype if name in FEATURES else np.float64 for name in df.columns})
+
+
+@pytest.mark.parametrize("columns", [IRRIGATION_FEATURES, OPTIMIZATION_FEATURES])
+def test_dataset_rows_come_back_unchanged(columns):
+    df = DATASET_ROWS.assign(rain_3days=[0.0, 202.9, 429.6, 693.6, 733.5])
+    df = df.assign(**compile_plan(["Relative_Soil_Saturation", "temp_diff", "wind_effect", "Evapotranspiration",
+                                   "rain_vs_soil", "np_ratio", "nk_ratio"]).frame(df))
+    pd.testing.assert_frame_equal(compile_plan(columns).frame(df), declared_dtypes(df[columns]))
+
+
+def test_engineered_formulas_reproduce_the_dataset():
+    # Without the engineered columns, the fallbacks compute the same values as the dataset has
+    features = compile_plan(ENGINEERED).frame(DATASET_ROWS.drop(columns=ENGINEERED))
+    pd.testing.assert_frame_equal(features, declared_dtypes(DATASET_ROWS[ENGINEERED]), atol=1e-5, rtol=1e-6)
+
+
+def test_training_frames_keep_missing_observations():
+    df = weather_station_rows(4).assign(ph_encoded=[0.0, np.nan, 1.0, 2.0])
+    df.loc[1, ["rainfall", "wind_speed_(km/h)", "crop_encoded", "soil_moisture_diff"]] = np.nan
+    plan = compile_plan(OPTIMIZATION_FEATURES)
+    training = plan.frame(df, fallbacks=False)
+    for name in ("rainfall", "wind_speed_(km/h)", "crop_encoded", "soil_moisture_diff", "ph_encoded"):
+        assert np.isnan(training.loc[1, name]) and not training[name].drop(1).isna().any()
+    assert training["ph_encoded"].dtype == np.float64  # int64 cannot hold the gap
+    pd.testing.assert_frame_equal(training.drop(1), plan.frame(df).drop(1), check_dtype=False)
+    serving = plan.frame(df)
+    assert serving.loc[1, "rainfall"] == 0.0 and serving.loc[1, "crop_encoded"] == 0.5365
+
+
+def test_measured_columns_are_used_and_gaps_filled():
+    df = weather_station_rows(4)
+    df.loc[1, "wind_speed_(km/h)"] = np.nan
+    X = compile_plan(OPTIMIZATION_FEATURES)(df)
+    wind = X[:, OPTIMIZATION_FEATURES.index("wind_speed_(km/h)")]
+    assert wind[0] == df.loc[0, "wind_speed_(km/h)"] and wind[1] == 10.0
+    assert np.array_equal(X[:, OPTIMIZATION_FEATURES.index("rain_3days")], df["rain_3days"])
+
+
+@pytest.mark.parametrize("columns", [IRRIGATION_FEATURES, OPTIMIZATION_FEATURES])
+def test_one_row_takes_the_scalar_path_with_the_same_result(columns):
+    df = weather_station_rows(3)
+    df.loc[:, "wind_speed_(km/h)"] = [np.nan, 4.0, 0.0]
+    df.loc[:, "soil_humidity"] = [0.0, 30.0, 0.0]  # Division by zero: inf like the batch
+    plan = compile_plan(columns)
+    batch = plan(df)
+    for i in range(3):
+        np.testing.assert_array_equal(plan(df.iloc[[i]]), batch[i:i + 1])
+        np.testing.assert_array_equal(plan(df.iloc[[i]].to_dict("list")), batch[i:i + 1])
+    pd.testing.assert_frame_equal(plan.frame(df.iloc[[0]], fallbacks=False), plan.frame(df, fallbacks=False).iloc[[0]])
+
+
+def test_serving_approximations_when_only_basic_inputs_are_known():
+    row = create_irrigation_features(30.0, 20.0, 50.0, 7.0, 80, 40, 20, rainfall=5.0)[0]
+    value = dict(zip(IRRIGATION_FEATURES, row))
+    assert value["soil_humidity"] == 40.0
+    assert value["Relative_Soil_Saturation"] == 30.0 / 40.0
+    assert value["temp_diff"] == 0.0
+    assert value["Evapotranspiration"] == 1000.0
+    assert value["rain_vs_soil"] == -25.0
+    assert value["evapo_ratio"] == 1000.0 / 1.75
+    assert value["rain_3days"] == 15.0
+    assert value["ph_encoded"] == 1
+    assert value["crop_encoded"] == 0.5365
+    assert value["wind_ratio"] == 10.0 / 16.0
+
+
+def test_plans_are_compiled_once_and_compute_each_feature_once():
+    plan = compile_plan(OPTIMIZATION_FEATURES)
+    assert compile_plan(list(OPTIMIZATION_FEATURES)) is plan
+    names = [feature.name for feature in plan.steps]
+    assert len(names) == len(set(names))
+    # Dependencies come first
+    assert names.index("Evapotranspiration") < names.index("evapo_ratio")
+    assert names.index("wind_speed_(km/h)") < names.index("wind_gust_(km/h)") < names.index("wind_effect")
+    assert plan.inputs == {"soil_moisture", "temperature", "humidity", "ph", "n", "p", "k"}
+
+
+def test_every_model_column_is_registered():
+    for name in set(IRRIGATION_FEATURES + OPTIMIZATION_FEATURES):
+        assert name in FEATURES or name in {"soil_moisture", "temperature", "humidity", "ph", "n", "p", "k"}
+    with pytest.raises(KeyError, match="leaf_wetness"):
+        compile_plan(["leaf_wetness"])
@@ -0,0 +1,85 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+
+import forest_arrays
+from forest_arrays import export_forest, load_forest
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "crop_data.csv")
+CROP_FEATURES = ["N", "P", "K", "temperature", "humidity", "ph", "rainfall"]
+
+
+@pytest.fixture(scope="module")
+def crops():
+    return pd.read_csv(DATA)
+
+
+@pytest.fixture(scope="module")
+def forest(crops):
+    return RandomForestClassifier(n_estimators=30, random_state=0).fit(crops[CROP_FEATURES], crops["label"])
+
+
+def noisy_rows(crops, rows, seed=1):
+    rng = np.random.default_rng(seed)
+    return crops[CROP_FEATURES].sample(rows, replace=True, random_state=seed) + rng.normal(0, 5, (rows, 7))
+
+
+@pytest.mark.parametrize("rows", [1, 7, 1000])
+def test_identical_to_sklearn(forest, crops, tmp_path, rows):
+    flat = load_forest(export_forest(forest, str(tmp_path / "crop.forest")))
+    X = noisy_rows(crops, rows)
+    assert np.array_equal(flat.predict_proba(X), forest.predict_proba(X))
+    assert np.array_equal(flat.predict(X), forest.predict(X))
+
+
+def test_chunks_and_memory_mapping(forest, crops, tmp_path, monkeypatch):
+    monkeypatch.setattr(forest_arrays, "CHUNK_ELEMENTS", 100)  # 3 rows per chunk
+    flat = load_forest(export_forest(forest, str(tmp_path / "crop.forest")))
+    assert isinstance(flat.threshold, np.memmap)
+    X = noisy_rows(crops, 10)
+    assert np.array_equal(flat.predict_proba(X), forest.predict_proba(X))
+
+
+def test_reexport_leaves_memory_mapped_copies_intact(forest, crops, tmp_path):
+    path = str(tmp_path / "crop.forest")
+    old = load_forest(export_forest(forest, path))
+    X = noisy_rows(crops, 50)
+    expected = old.predict_proba(X)
+    retrained = RandomForestClassifier(n_estimators=5, random_state=1).fit(crops[CROP_FEATURES], crops["label"])
+    export_forest(retrained, path)
+    assert np.array_equal(old.predict_proba(X), expected)  # Still reads the files it mapped
+    assert load_forest(path).n_estimators == 5
+    assert os.listdir(tmp_path) == ["crop.forest"]  # No staging directory left behind
+
+
+def test_float32_storage_keeps_split_decisions(tmp_path):
+    # Thresholds sit between float32 neighbours; rounding them to nearest would flip some rows
+    rng = np.random.default_rng(3)
+    X = rng.normal(0, 1, (4000, 3)).astype(np.float32)
+    y = (X[:, 0] + 0.5 * X[:, 1] > 0).astype(int)
+    forest = RandomForestClassifier(n_estimators=10, min_samples_leaf=3, random_state=0).fit(X, y)
+    flat = load_forest(export_forest(forest, str(tmp_path / "f.forest")), mmap=False)
+    assert flat.threshold.dtype == np.float32
+    assert np.array_equal(flat.predict_proba(X), forest.predict_proba(X))
+    sklearn_thresholds = np.concatenate([e.tree_.threshold[e.tree_.children_left >= 0] for e in forest.estimators_])
+    assert np.array_equal(np.sort(flat.threshold[flat.leaf < 0].astype(np.float64)),
+                          np.sort(forest_arrays._float32_at_most(sklearn_thresholds).astype(np.float64)))
+
+
+def test_half_the_node_memory_of_sklearn(forest, tmp_path):
+    flat = load_forest(export_forest(forest, str(tmp_path / "crop.forest")), mmap=False)
+    sklearn_bytes = sum(e.tree_.__getstate__()["nodes"].nbytes + e.tree_.value.nbytes for e in forest.estimators_)
+    assert flat.nbytes < sklearn_bytes / 2
+
+
+def test_rejects_wrong_width_and_old_format(forest, tmp_path):
+    path = export_forest(forest, str(tmp_path / "crop.forest"))
+    with pytest.raises(ValueError, match="7 features"):
+        load_forest(path).predict(np.zeros((1, 3)))
+    meta = (tmp_path / "crop.forest" / "meta.json")
+    meta.write_text(meta.read_text().replace('"format": 2', '"format": 1'))
+    with pytest.raises(ValueError, match="re-export"):
+        load_forest(path)
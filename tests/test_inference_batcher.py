@@ -0,0 +1,93 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from inference_batcher import InferenceBatcher
+
+
+class Model:
+    """Doubles its input and records the size of every call."""
+
+    def __init__(self):
+        self.calls = []
+
+    def predict(self, X):
+        self.calls.append(len(X))
+        return X[:, 0] * 2
+
+
+def run_clients(batcher, inputs):
+    async def main():
+        return await asyncio.gather(*(batcher.submit(X) for X in inputs))
+    return asyncio.run(main())
+
+
+def test_concurrent_requests_share_one_model_call():
+    model = Model()
+    batcher = InferenceBatcher(model.predict, max_batch_rows=100, max_wait_s=0.05)
+    inputs = [np.full((n, 3), i, dtype=float) for i, n in enumerate((1, 2, 1, 3))]
+    results = run_clients(batcher, inputs)
+
+    assert model.calls == [7]
+    assert [r.tolist() for r in results] == [[0], [2, 2], [4], [6, 6, 6]]
+    assert batcher.stats()["mean_batch_rows"] == 7
+    batcher.close()
+
+
+def test_batches_never_exceed_max_rows_and_keep_arrival_order():
+    model = Model()
+    batcher = InferenceBatcher(model.predict, max_batch_rows=4, max_wait_s=0.05)
+    results = run_clients(batcher, [np.full((1, 1), i, dtype=float) for i in range(10)])
+
+    assert model.calls == [4, 4, 2]
+    assert [r[0] for r in results] == [i * 2 for i in range(10)]
+    batcher.close()
+
+
+def test_full_batches_skip_the_queue():
+    model = Model()
+    batcher = InferenceBatcher(model.predict, max_batch_rows=4, max_wait_s=10)
+    result = run_clients(batcher, [np.ones((5, 1))])[0]
+    assert model.calls == [5] and result.tolist() == [2.0] * 5
+    batcher.close()
+
+
+def test_model_errors_reach_every_caller_of_the_batch():
+    def broken(X):
+        raise RuntimeError("model crashed")
+
+    batcher = InferenceBatcher(broken, max_wait_s=0.01)
+
+    async def main():
+        return await asyncio.gather(*(batcher.submit(np.ones((1, 1))) for _ in range(3)), return_exceptions=True)
+
+    assert all(isinstance(r, RuntimeError) for r in asyncio.run(main()))
+    batcher.close()
+
+
+def test_a_new_event_loop_gets_a_working_batcher():
+    model = Model()
+    batcher = InferenceBatcher(model.predict, max_wait_s=0.001)
+    for _ in range(2):
+        assert run_clients(batcher, [np.ones((1, 1))])[0].tolist() == [2.0]
+    batcher.close()
+
+
+def test_close_answers_queued_requests_then_releases_the_thread():
+    model = Model()
+    batcher = InferenceBatcher(model.predict, max_batch_rows=100, max_wait_s=0.05)
+
+    async def main():
+        pending = [asyncio.ensure_future(batcher.submit(np.full((1, 1), i, dtype=float))) for i in range(3)]
+        await asyncio.sleep(0)  # Queued, the batch is still forming
+        batcher.close()
+        return await asyncio.gather(*pending)
+
+    assert [r.tolist() for r in asyncio.run(main())] == [[0.0], [2.0], [4.0]]
+    assert model.calls == [3] and batcher._task.done() and batcher._executor._shutdown
+
+
+def test_configuration_is_validated():
+    with pytest.raises(ValueError):
+        InferenceBatcher(Model().predict, max_batch_rows=0)
@@ -0,0 +1,68 @@
+import logging
+
+from batch_writer import BatchWriter
+from ingest_logging import RateLimitFilter
+from ingest_metrics import Counter, Histogram, MetricFamily, Registry, render, with_labels
+from ingest_pipeline import IngestPipeline
+from ingest_service import IngestionService
+from spool import Spool
+from storage import MemoryStorage
+
+
+def test_counters_and_histograms_render_in_prometheus_text_format():
+    registry = Registry()
+    sent = registry.register(Counter("sent_total", "Messages sent.", ("device",)))
+    latency = registry.register(Histogram("latency_seconds", "Latency.", buckets=(0.1, 1.0)))
+    sent.inc(labels=("7",))
+    sent.inc(2, labels=("7",))
+    latency.observe_many([0.05, 0.5, 5.0])
+
+    text = registry.render()
+    assert "# TYPE sent_total counter" in text
+    assert 'sent_total{device="7"} 3' in text
+    assert 'latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{le="1"} 2' in text
+    assert 'latency_seconds_bucket{le="+Inf"} 3' in text
+    assert "latency_seconds_count 3" in text
+    assert "latency_seconds_sum 5.55" in text
+
+
+def test_worker_families_are_merged_under_one_header():
+    family = MetricFamily("queue_depth", "gauge", "Depth.", [("queue_depth", {}, 4)])
+    text = render(with_labels([family], {"worker": "0"}) + with_labels([family], {"worker": "1"}))
+    assert text.count("# TYPE queue_depth gauge") == 1
+    assert 'queue_depth{worker="0"} 4' in text and 'queue_depth{worker="1"} 4' in text
+
+
+def test_service_exposes_pipeline_decoder_and_storage_metrics(tmp_path):
+    storage = MemoryStorage()
+    spool = Spool(str(tmp_path / "spool"), storage)
+    service = IngestionService(
+        storage, spool=spool, writer=BatchWriter(spool, max_batch_rows=10, max_batch_age_s=0.02),
+        pipeline_factory=lambda handler: IngestPipeline(handler, workers=1), log_readings=False,
+    ).start()
+    service.submit("user/7/rain_data", b'{"temperature":24.5,"humidity":140}')
+    service.submit("user/7/rain_data", b"garbage")
+    service.pipeline.queue.join()
+    text = render(service.metric_families())
+    service.close()
+
+    assert "ingest_messages_received_total 2" in text
+    assert "ingest_payloads_rejected_total 1" in text
+    assert 'ingest_field_errors_total{field="humidity"} 1' in text
+    assert "ingest_queue_depth 0" in text
+
+
+def test_rate_limit_filter_suppresses_floods_and_reports_them():
+    rate_limit = RateLimitFilter(burst=2, interval_s=60)
+
+    def record(msg="Rejected payload on %s"):
+        return logging.LogRecord("ingest", logging.WARNING, __file__, 1, msg, ("user/7",), None)
+
+    assert [rate_limit.filter(record()) for _ in range(5)] == [True, True, False, False, False]
+    assert rate_limit.filter(record("Another call site %s"))
+
+    rate_limit.interval_s = 0
+    first_of_next_window = record()
+    assert rate_limit.filter(first_of_next_window)
+    assert "[3 similar messages suppressed]" in first_of_next_window.getMessage()
@@ -0,0 +1,145 @@
+import threading
+import time
+
+import pytest
+
+from ingest_pipeline import BLOCK, DROP_OLDEST, SPILL, IngestPipeline, SpillFile
+
+
+class GatedHandler:
+    """Handler that holds every worker until `gate` is set."""
+
+    def __init__(self):
+        self.gate = threading.Event()
+        self.seen = []
+        self._lock = threading.Lock()
+
+    def __call__(self, topic, payload, received_at):
+        self.gate.wait(5)
+        with self._lock:
+            self.seen.append(payload)
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.005)
+    return condition()
+
+
+def test_workers_process_every_message():
+    handler = GatedHandler()
+    handler.gate.set()
+    pipeline = IngestPipeline(handler, max_queue=10, workers=3).start()
+    for i in range(50):
+        pipeline.submit("user/1/rain_data", str(i).encode())
+    pipeline.close()
+
+    assert sorted(int(p) for p in handler.seen) == list(range(50))
+    assert pipeline.processed == 50 and pipeline.dropped == 0
+
+
+def test_drop_oldest_keeps_newest_messages():
+    handler = GatedHandler()
+    pipeline = IngestPipeline(handler, max_queue=3, workers=1, policy=DROP_OLDEST).start()
+    pipeline.submit("t", b"0")
+    assert wait_for(lambda: pipeline.depth == 0)  # the worker holds message 0
+    for i in range(1, 7):
+        assert pipeline.submit("t", str(i).encode())
+    assert pipeline.dropped == 3
+
+    handler.gate.set()
+    pipeline.close()
+    assert handler.seen == [b"0", b"4", b"5", b"6"]
+
+
+def test_block_policy_waits_for_room():
+    handler = GatedHandler()
+    pipeline = IngestPipeline(handler, max_queue=1, workers=1, policy=BLOCK).start()
+    pipeline.submit("t", b"0")
+    assert wait_for(lambda: pipeline.depth == 0)
+    pipeline.submit("t", b"1")
+
+    producer = threading.Thread(target=pipeline.submit, args=("t", b"2"))
+    producer.start()
+    producer.join(0.1)
+    assert producer.is_alive()
+
+    handler.gate.set()
+    producer.join(5)
+    pipeline.close()
+    assert handler.seen == [b"0", b"1", b"2"]
+
+
+def test_spill_policy_loses_nothing(tmp_path):
+    handler = GatedHandler()
+    pipeline = IngestPipeline(handler, max_queue=4, workers=1, policy=SPILL,
+                              spill_path=str(tmp_path / "overflow.bin")).start()
+    for i in range(40):
+        pipeline.submit("user/1/rain_data", str(i).encode())
+    assert pipeline.spilled > 0
+
+    handler.gate.set()
+    pipeline.close()
+    assert sorted(int(p) for p in handler.seen) == list(range(40))
+    assert pipeline.spill.backlog == 0
+
+
+def test_spill_file_round_trips_binary_payloads(tmp_path):
+    spill = SpillFile(str(tmp_path / "spill.bin"))
+    spill.append(("user/1/rain_data", b"\x00\xffraw", 1.5))
+    spill.append(("user/2/rain_data", b"{}", 2.5))
+
+    assert spill.read(1) == [("user/1/rain_data", b"\x00\xffraw", 1.5)]
+    assert spill.read(10) == [("user/2/rain_data", b"{}", 2.5)]
+    assert spill.backlog == 0 and (tmp_path / "spill.bin").stat().st_size == 0
+
+
+def test_messages_spilled_before_a_restart_are_replayed(tmp_path):
+    path = str(tmp_path / "overflow.bin")
+    spill = SpillFile(path)
+    for i in range(5):
+        spill.append(("user/1/rain_data", str(i).encode(), float(i)))
+    with open(path, "ab") as f:
+        f.write(b"\x00" * 7)  # A record torn by the crash
+
+    handler = GatedHandler()
+    handler.gate.set()
+    pipeline = IngestPipeline(handler, max_queue=4, workers=1, policy=SPILL, spill_path=path).start()
+    assert pipeline.stats()["spill_recovered"] == 5
+    assert wait_for(lambda: len(handler.seen) == 5)
+    pipeline.close()
+    assert handler.seen == [str(i).encode() for i in range(5)]
+    assert pipeline.spill.backlog == 0 and (tmp_path / "overflow.bin").stat().st_size == 0
+
+
+def test_full_spill_file_falls_back_to_drop_oldest(tmp_path):
+    handler = GatedHandler()
+    record = SpillFile._HEADER.size + len("user/1/rain_data") + 2
+    pipeline = IngestPipeline(handler, max_queue=4, workers=1, policy=SPILL,
+                              spill_path=str(tmp_path / "overflow.bin"), spill_max_bytes=10 * record).start()
+    for i in range(40):
+        pipeline.submit("user/1/rain_data", b"%02d" % i)
+    stats = pipeline.stats()
+    assert stats["spilled"] == 10 and stats["spill_bytes"] == 10 * record
+    assert stats["spill_full"] > 0 and stats["dropped"] > 0
+
+    handler.gate.set()
+    pipeline.close()
+    assert len(handler.seen) == 40 - stats["dropped"]
+    assert b"39" in handler.seen  # The newest readings still get through
+
+
+def test_failing_handler_is_counted():
+    def handler(topic, payload, received_at):
+        raise ValueError("bad reading")
+
+    pipeline = IngestPipeline(handler, workers=1).start()
+    pipeline.submit("t", b"{}")
+    pipeline.close()
+    assert pipeline.failed == 1
+
+
+def test_unknown_policy_is_rejected():
+    with pytest.raises(ValueError):
+        IngestPipeline(lambda *a: None, policy="ignore")
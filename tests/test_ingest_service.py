@@ -0,0 +1,74 @@
+from batch_writer import BatchWriter
+from ingest_pipeline import IngestPipeline
+from ingest_service import IngestionService, device_id_from_topic
+from spool import Spool
+from storage import MemoryStorage
+
+
+def build_service(tmp_path, storage):
+    spool = Spool(str(tmp_path / "spool"), storage)
+    writer = BatchWriter(spool, max_batch_rows=100, max_batch_age_s=0.02)
+    return IngestionService(
+        storage, spool=spool, writer=writer,
+        pipeline_factory=lambda handler: IngestPipeline(handler, workers=1),
+        log_readings=False,
+    ).start()
+
+
+def test_device_id_comes_from_the_topic():
+    assert device_id_from_topic("user/7/rain_data") == "7"
+    assert device_id_from_topic("rain_data") == "rain_data"
+
+
+def test_messages_flow_from_submit_to_storage(tmp_path):
+    storage = MemoryStorage()
+    service = build_service(tmp_path, storage)
+    service.submit("user/7/rain_data", b'{"temperature":24.5,"humidity":61}', received_at=0.0)
+    service.submit("user/8/rain_data", b"not json")
+    service.close()
+
+    assert len(storage.rows) == 1
+    row = storage.rows[0]
+    assert row["device_id"] == "7" and row["temperature"] == 24.5
+    assert row["created_at"] == "1970-01-01T00:00:00.000000+00:00"
+
+
+def test_firmware_status_fields_reach_storage(tmp_path):
+    storage = MemoryStorage()
+    service = build_service(tmp_path, storage)
+    service.submit("user/7/rain_data", b'{"temperature":24.5,"humidity":61,"rain_status":"NO_RAIN",'
+                                       b'"water_status":"NOT_FULL","container_status":"Opened"}')
+    service.close()
+
+    row = storage.rows[0]
+    assert row["water_status"] == "NOT_FULL" and row["container_status"] == "Opened"
+    assert "water_level_raw" not in row and "servo_angle" not in row
+
+
+def test_stats_combine_every_stage(tmp_path):
+    service = build_service(tmp_path, MemoryStorage())
+    stats = service.stats()
+    service.close()
+    assert {"queue_depth", "decoded", "field_errors", "batch_pending_rows", "spool_pending_rows"} <= set(stats)
+
+
+def test_duplicates_are_dropped_before_storage(tmp_path):
+    storage = MemoryStorage()
+    service = build_service(tmp_path, storage)
+    for seq in (0, 1, 1, 2, 0):
+        service.submit("user/7/rain_data", b'{"temperature":20,"seq":%d}' % seq)
+    service.close()
+
+    assert sorted(row["seq"] for row in storage.rows) == [0, 1, 2]
+
+
+def test_readings_are_rolled_up_alongside_storage(tmp_path):
+    storage = MemoryStorage()
+    service = build_service(tmp_path, storage)
+    for seq, temperature in enumerate((20, 22, 24)):
+        service.submit("user/7/rain_data", b'{"temperature":%d,"seq":%d}' % (temperature, seq), received_at=60.0 + seq)
+    minute_sink = service.rollups.sinks[60]
+    service.close()
+
+    assert len(storage.rows) == 3
+    assert [(r["readings"], r["temperature_mean"]) for r in minute_sink.rows] == [(3, 22.0)]
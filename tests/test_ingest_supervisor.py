@@ -0,0 +1,70 @@
+import os
+import time
+from collections import Counter
+
+from ingest_supervisor import IngestSupervisor, effective_sharding, worker_directory
+from mqtt_subscriber import MqttSettings, owns_device, unique_client_id
+
+
+def crashing_worker(worker, workers, stats_queue):
+    stats_queue.put((worker, os.getpid(), {"received": worker}, []))
+    time.sleep(0.2)
+    os._exit(3)
+
+
+def idle_worker(worker, workers, stats_queue):
+    while True:
+        stats_queue.put((worker, os.getpid(), {"received": worker}, []))
+        time.sleep(0.05)
+
+
+def wait_for(condition, timeout=20.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def test_shared_subscription_topics():
+    settings = MqttSettings(topic="user/+/rain_data", binary_topics=["user/+/rain_data/bin"], sharding="shared")
+    assert settings.topics() == ["$share/ingestion/user/+/rain_data", "$share/ingestion/user/+/rain_data/bin"]
+    assert MqttSettings(topic="user/7/rain_data").topics() == ["user/7/rain_data"]
+    assert effective_sharding("none", 4) == "device" and effective_sharding("shared", 4) == "shared"
+    assert effective_sharding("none", 1) == "none"
+
+
+def test_device_hash_gives_every_device_to_exactly_one_worker():
+    owners = Counter()
+    for device in range(1000):
+        topic = f"user/{device}/rain_data"
+        owned = [w for w in range(4) if owns_device(topic, w, 4)]
+        assert len(owned) == 1
+        owners[owned[0]] += 1
+    assert min(owners.values()) > 200  # roughly even
+
+
+def test_client_ids_and_directories_are_per_worker():
+    assert unique_client_id("svc", 0) != unique_client_id("svc", 1)
+    assert worker_directory("spool", 0, 1) == "spool"
+    assert worker_directory("spool", 2, 4) == os.path.join("spool", "worker-2")
+
+
+def test_crashed_workers_are_restarted():
+    supervisor = IngestSupervisor(2, target=crashing_worker, max_backoff_s=0.2).start()
+    try:
+        assert wait_for(lambda: supervisor.stats()["restarts"] >= 2)
+    finally:
+        supervisor.close()
+
+
+def test_stats_are_collected_and_workers_stop_on_close():
+    supervisor = IngestSupervisor(2, target=idle_worker, stop_timeout_s=2).start()
+    try:
+        assert wait_for(lambda: all("received" in w for w in supervisor.stats()["workers"]))
+        stats = supervisor.stats()
+        assert stats["alive"] == 2 and [w["received"] for w in stats["workers"]] == [0, 1]
+    finally:
+        supervisor.close()
+    assert supervisor.stats()["alive"] == 0
@@ -0,0 +1,124 @@
+import os
+import threading
+
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+from catboost import CatBoostRegressor
+from sklearn.ensemble import RandomForestClassifier
+
+import model_registry
+from model_registry import artifact_path, export_native, load_model, model_version
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "crop_data.csv")
+CROP_FEATURES = ["N", "P", "K", "temperature", "humidity", "ph", "rainfall"]
+
+
+@pytest.fixture(scope="module")
+def forest():
+    data = pd.read_csv(DATA)
+    return RandomForestClassifier(n_estimators=20, random_state=0).fit(data[CROP_FEATURES], data["label"])
+
+
+@pytest.fixture
+def artifacts(tmp_path, monkeypatch):
+    monkeypatch.setattr(model_registry, "_models", {})
+    paths = {name: str(tmp_path / f"{name}.pkl") for name in ("crop", "irrigation", "water")}
+    natives = {"crop": str(tmp_path / "crop.forest"), "irrigation": str(tmp_path / "irrigation.cbm"),
+               "water": str(tmp_path / "water.cbm")}
+    monkeypatch.setattr(model_registry, "MODEL_PATHS", paths)
+    monkeypatch.setattr(model_registry, "NATIVE_PATHS", natives)
+    return paths, natives
+
+
+def test_one_shared_instance_loaded_lazily(artifacts, forest):
+    paths, _ = artifacts
+    joblib.dump(forest, paths["crop"])
+    assert model_registry._models == {}
+    first = load_model("crop")
+    assert load_model("crop") is first
+    assert model_version("crop") == model_registry._digest(paths["crop"])
+
+
+def test_reload_only_when_content_changes(artifacts, forest):
+    paths, _ = artifacts
+    joblib.dump(forest, paths["crop"])
+    first = load_model("crop")
+    # Same bytes, new mtime: kept
+    stat = os.stat(paths["crop"])
+    os.utime(paths["crop"], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert load_model("crop") is first
+    # Retrained: reloaded
+    joblib.dump(RandomForestClassifier(n_estimators=2, random_state=1).fit(np.eye(7), list("abcdefg")), paths["crop"])
+    assert load_model("crop") is not first
+    assert load_model("crop").n_estimators == 2
+
+
+def test_native_artifacts_are_preferred(artifacts, forest):
+    paths, natives = artifacts
+    joblib.dump(forest, paths["crop"])
+    assert artifact_path("crop") == paths["crop"]
+    export_native("crop")
+    assert artifact_path("crop") == natives["crop"]
+    flat = load_model("crop")
+    assert type(flat).__name__ == "FlatForest"
+    assert list(flat.classes_) == list(forest.classes_)
+
+    regressor = CatBoostRegressor(iterations=20, verbose=0, allow_writing_files=False).fit(np.random.rand(50, 3), np.random.rand(50))
+    export_native("water", regressor)
+    loaded = load_model("water")
+    assert isinstance(loaded, CatBoostRegressor)
+    X = np.random.rand(5, 3)
+    assert np.array_equal(loaded.predict(X), regressor.predict(X))
+
+
+def test_missing_artifact(artifacts):
+    with pytest.raises(FileNotFoundError, match="irrigation.pkl"):
+        load_model("irrigation")
+
+
+def test_warm_up_loads_in_the_background_and_skips_missing(artifacts, forest):
+    paths, _ = artifacts
+    joblib.dump(forest, paths["crop"])  # irrigation and water are missing
+    model_registry.warm_up().join(timeout=60)
+    assert list(model_registry._models) == [paths["crop"]]
+    assert load_model("crop") is model_registry._models[paths["crop"]].model
+
+
+def test_artifact_replaced_during_a_load_is_read_again(artifacts, forest, monkeypatch):
+    paths, _ = artifacts
+    joblib.dump(forest, paths["crop"])
+    retrained = RandomForestClassifier(n_estimators=2, random_state=1).fit(np.eye(7), list("abcdefg"))
+    read = model_registry._read
+
+    def read_while_retraining(name, path):
+        model = read(name, path)
+        if model.n_estimators != 2:
+            joblib.dump(retrained, path + ".new")
+            os.replace(path + ".new", path)
+        return model
+
+    monkeypatch.setattr(model_registry, "_read", read_while_retraining)
+    assert load_model("crop").n_estimators == 2
+    assert model_version("crop") == model_registry._digest(paths["crop"])
+
+
+def test_loading_one_model_does_not_block_another(artifacts, forest, monkeypatch):
+    paths, _ = artifacts
+    joblib.dump(forest, paths["crop"])
+    joblib.dump(forest, paths["irrigation"])
+    release = threading.Event()
+    read = model_registry._read
+
+    def slow_irrigation(name, path):
+        if name == "irrigation":
+            release.wait(timeout=10)
+        return read(name, path)
+
+    monkeypatch.setattr(model_registry, "_read", slow_irrigation)
+    warming = model_registry.warm_up(["irrigation"])
+    assert load_model("crop") is not None and warming.is_alive()
+    release.set()
+    warming.join(timeout=10)
+    assert paths["irrigation"] in model_registry._models
@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+from catboost import CatBoostClassifier, CatBoostRegressor
+
+from batch_writer import BatchWriter
+from feature_builders import IRRIGATION_FEATURES, OPTIMIZATION_FEATURES, create_irrigation_features
+from online_decisions import FieldProfile, OnlineDecisions
+from storage import MemoryStorage
+
+
+@pytest.fixture(scope="module")
+def models():
+    # Tiny stand-ins for the LFS artifacts: irrigate when it is hot
+    rng = np.random.default_rng(0)
+    temperature = rng.uniform(0, 45, 400)
+    X = np.vstack([create_irrigation_features(FieldProfile.soil_moisture, t, 60.0, 6.7, 80, 48, 40) for t in temperature])
+    classifier = CatBoostClassifier(iterations=30, depth=3, verbose=False, random_seed=0, allow_writing_files=False).fit(X, temperature > 25)
+    X_water = rng.uniform(0, 50, (400, len(OPTIMIZATION_FEATURES)))
+    regressor = CatBoostRegressor(iterations=30, depth=3, verbose=False, random_seed=0, allow_writing_files=False).fit(X_water, X_water[:, 1])
+    return classifier, regressor
+
+
+def reading(temperature, humidity=60.0, **fields):
+    return {"device_id": "7", "temperature": temperature, "humidity": humidity, **fields}
+
+
+def test_feature_lists_match_the_builders():
+    assert create_irrigation_features(0.35, 23, 82, 6.7, 80, 48, 40).shape == (1, len(IRRIGATION_FEATURES))
+
+
+def test_batch_is_decided_with_one_call_per_model(models):
+    classifier, regressor = models
+    decisions = OnlineDecisions(classifier, regressor)
+    rows = [reading(40.0), reading(5.0), reading(None), reading(38.0)]
+    decisions.apply(rows)
+
+    assert [r["irrigation_needed"] for r in rows] == [True, False, None, True]
+    assert all(0.5 <= r["irrigation_confidence"] <= 1 for r in rows if r["irrigation_needed"] is not None)
+    # The water amount is only predicted where irrigation is needed
+    assert [r["water_mm"] is not None for r in rows] == [True, False, False, True]
+    assert decisions.stats() == {
+        "decision_batches": 1, "decision_rows": 3, "decision_rows_skipped": 1,
+        "decision_rows_irrigate": 2, "decision_failures": 0,
+    }
+
+
+def test_field_profile_comes_from_the_environment(monkeypatch):
+    monkeypatch.setenv("FIELD_PH", "7.5")
+    monkeypatch.setenv("FIELD_N", "20")
+    profile = FieldProfile.from_env()
+    assert profile.ph == 7.5 and profile.n == 20 and profile.k == 40
+    assert 7 <= profile.soil_moisture <= 54  # Percent, as the models were trained
+
+
+def test_decisions_are_off_by_default(monkeypatch):
+    monkeypatch.delenv("INGEST_DECISIONS", raising=False)
+    assert OnlineDecisions.from_env() is None
+
+
+def test_flushed_batches_are_stored_with_their_decisions(models):
+    storage = MemoryStorage()
+    writer = BatchWriter(storage, max_batch_rows=2, transform=OnlineDecisions(models[0]).apply)
+    writer.add_many([reading(40.0), reading(5.0), reading(41.0)])
+    writer.close()
+    assert sorted(r["irrigation_needed"] for r in storage.rows) == [False, True, True]
+
+
+def test_failed_inference_still_stores_the_readings():
+    class Broken:
+        def predict_proba(self, X):
+            raise RuntimeError("model crashed")
+
+    storage = MemoryStorage()
+    decisions = OnlineDecisions(Broken())
+    writer = BatchWriter(storage, transform=decisions.apply)
+    writer.add(reading(30.0))
+    writer.close()
+    assert len(storage.rows) == 1 and storage.rows[0]["irrigation_needed"] is None
+    assert decisions.stats()["decision_failures"] == 1
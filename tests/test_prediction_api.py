@@ -0,0 +1,156 @@
+import asyncio
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+from catboost import CatBoostClassifier, CatBoostRegressor
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sklearn.ensemble import RandomForestClassifier
+
+import model_registry
+import prediction_api
+from feature_builders import create_irrigation_features, create_optimization_features
+from prediction_api import CROP_FEATURES, crop_model, irrigation_model, router, water_model
+
+FIELD = {"N": 80, "P": 48, "K": 40, "temperature": 23.0, "humidity": 82.0, "ph": 6.7, "rainfall": 240.0, "soil_moisture": 0.35}
+
+
+class Counting:
+    """Wraps a model and counts its calls."""
+
+    def __init__(self, model):
+        self.model, self.calls = model, 0
+        self.classes_ = getattr(model, "classes_", None)
+
+    def predict_proba(self, X):
+        self.calls += 1
+        return self.model.predict_proba(X)
+
+    def predict(self, X):
+        self.calls += 1
+        return self.model.predict(X)
+
+
+@pytest.fixture(scope="module")
+def models():
+    crops = pd.read_csv(os.path.join(os.path.dirname(model_registry.MODELS_DIR), "data", "crop_data.csv"))
+    crop = RandomForestClassifier(n_estimators=10, random_state=0).fit(crops[CROP_FEATURES], crops["label"])
+    temperature = np.random.default_rng(0).uniform(0, 45, 300)
+    X = np.vstack([create_irrigation_features(0.35, t, 60, 6.7, 80, 48, 40) for t in temperature])
+    irrigation = CatBoostClassifier(iterations=20, depth=3, verbose=False, allow_writing_files=False).fit(X, temperature > 25)
+    X = np.vstack([create_optimization_features(0.35, t, 60, 6.7, 80, 48, 40) for t in temperature])
+    water = CatBoostRegressor(iterations=20, depth=3, verbose=False, allow_writing_files=False).fit(X, temperature)
+    return {"crop": Counting(crop), "irrigation": Counting(irrigation), "water": Counting(water)}
+
+
+@pytest.fixture
+def client(models):
+    app = FastAPI()
+    app.include_router(router)
+    app.dependency_overrides = {
+        crop_model: lambda: models["crop"],
+        irrigation_model: lambda: models["irrigation"],
+        water_model: lambda: models["water"],
+    }
+    return TestClient(app)
+
+
+def test_crop_batch_is_scored_with_one_model_call(client, models):
+    calls = models["crop"].calls
+    response = client.post("/predict/crop", json={"records": [FIELD] * 50})
+    assert response.status_code == 200
+    predictions = response.json()["predictions"]
+    assert len(predictions) == 50 and models["crop"].calls == calls + 1
+    assert predictions[0]["crop"] in set(models["crop"].classes_) and 0 < predictions[0]["confidence"] <= 1
+
+
+def test_irrigation_and_water_follow_the_inputs(client):
+    hot, cold = {**FIELD, "temperature": 40.0}, {**FIELD, "temperature": 5.0}
+    irrigation = client.post("/predict/irrigation", json={"records": [hot, cold]}).json()["predictions"]
+    assert [p["irrigation_needed"] for p in irrigation] == [True, False]
+    water = client.post("/predict/water", json={"records": [hot, cold]}).json()["predictions"]
+    assert water[0]["water_mm"] > water[1]["water_mm"]
+
+
+def test_invalid_records_are_rejected(client):
+    assert client.post("/predict/crop", json={"records": [{**FIELD, "humidity": 140}]}).status_code == 422
+    assert client.post("/predict/irrigation", json={"records": [{"N": 1}]}).status_code == 422
+    assert client.post("/predict/water", json={"records": []}).json() == {"predictions": []}
+
+
+def test_oversized_requests_are_refused(client, monkeypatch):
+    monkeypatch.setattr(prediction_api, "MAX_RECORDS", 2)
+    response = client.post("/predict/crop", json={"records": [FIELD] * 3})
+    assert response.status_code == 413 and response.json() == {"detail": "At most 2 records per request"}
+    assert client.post("/predict/water", json={"records": [{"N": -1}] * 3}).status_code == 413  # Before parsing
+
+
+def test_request_matrix_and_features_are_built_off_the_event_loop(client, monkeypatch):
+    on_loop = []
+
+    def recording(function):
+        def call(*args):
+            try:
+                asyncio.get_running_loop()
+                on_loop.append(function.__name__)
+            except RuntimeError:  # A worker thread
+                pass
+            return function(*args)
+        return call
+
+    monkeypatch.setattr(prediction_api, "_serving", {})
+    monkeypatch.setattr(prediction_api, "_inputs", recording(prediction_api._inputs))
+    monkeypatch.setattr(prediction_api, "_irrigation_features", recording(prediction_api._irrigation_features))
+    assert client.post("/predict/irrigation", json={"records": [{**FIELD, "temperature": 3.3}]}).status_code == 200
+    assert on_loop == []
+
+
+def test_a_reloaded_model_closes_the_batcher_of_the_old_one(client, models, monkeypatch):
+    monkeypatch.setattr(prediction_api, "_serving", {})
+    client.post("/predict/water", json={"records": [FIELD]})
+    old = prediction_api._serving["water"][1]
+    client.app.dependency_overrides[water_model] = lambda: Counting(models["water"].model)  # A new artifact
+    client.post("/predict/water", json={"records": [FIELD]})
+    assert prediction_api._serving["water"][1] is not old and old._executor._shutdown
+
+
+def test_missing_model_answers_503(monkeypatch):
+    monkeypatch.setitem(model_registry.MODEL_PATHS, "water", "/nonexistent/model.pkl")
+    app = FastAPI()
+    app.include_router(router)
+    assert TestClient(app).post("/predict/water", json={"records": [FIELD]}).status_code == 503
+
+
+def test_repeated_records_are_answered_from_the_cache(client, models):
+    near = {**FIELD, "temperature": 31.02, "humidity": 44.9}
+    first = client.post("/predict/irrigation", json={"records": [near]}).json()
+    calls = models["irrigation"].calls
+    # Within the quantization steps (0.1 °C, 0.5 % humidity): no model call
+    again = client.post("/predict/irrigation", json={"records": [{**near, "temperature": 31.04, "humidity": 45.1}]}).json()
+    assert again == first and models["irrigation"].calls == calls
+    # One new record among cached ones: only that record is scored
+    mixed = client.post("/predict/irrigation", json={"records": [near, {**near, "temperature": 12.0}, near]}).json()
+    assert models["irrigation"].calls == calls + 1
+    assert mixed["predictions"][0] == mixed["predictions"][2] == first["predictions"][0]
+    assert prediction_api._serving["irrigation"][2].stats()["cache_hits"] >= 3
+
+
+def test_cache_can_be_disabled(client, models, monkeypatch):
+    monkeypatch.setenv("PREDICT_CACHE_ENTRIES", "0")
+    monkeypatch.setattr(prediction_api, "_serving", {})
+    calls = models["water"].calls
+    for _ in range(2):
+        client.post("/predict/water", json={"records": [FIELD]})
+    assert models["water"].calls == calls + 2
+
+
+def test_advise_returns_all_three_answers(client, models):
+    hot, cold = {**FIELD, "temperature": 40.0}, {**FIELD, "temperature": 5.0}
+    calls = models["water"].calls
+    advice = client.post("/predict/advise", json={"records": [hot, cold]}).json()["predictions"]
+    assert [a["irrigation_needed"] for a in advice] == [True, False]
+    assert advice[0]["water_mm"] >= 0 and advice[1]["water_mm"] is None
+    assert advice[0]["crop"] in set(models["crop"].classes_)
+    assert models["water"].calls == calls + 1
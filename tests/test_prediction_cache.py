@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+
+from prediction_cache import PredictionCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class Model:
+    """Row sums, counting calls and scored rows."""
+
+    def __init__(self):
+        self.calls = self.rows = 0
+
+    def __call__(self, X):
+        self.calls += 1
+        self.rows += len(X)
+        return X.sum(axis=1, keepdims=True)
+
+
+def test_quantized_keys():
+    cache = PredictionCache([0.1, 1.0, 0])
+    keys = cache.keys(np.array([[23.04, 80.4, 0.35], [22.96, 79.6, 0.35], [23.2, 80.0, 0.35], [23.0, 80.0, 0.350001]]))
+    assert keys[0] == keys[1]
+    assert keys[0] != keys[2]  # Next temperature step
+    assert keys[0] != keys[3]  # Resolution 0: exact
+    assert cache.keys(np.array([[-0.01, 0, 0]])) == cache.keys(np.array([[0.01, 0, 0]]))
+    with pytest.raises(ValueError, match="3 columns"):
+        cache.keys(np.zeros((1, 2)))
+
+
+def test_only_missing_rows_reach_the_model_in_order():
+    cache, model = PredictionCache([1, 1]), Model()
+    first = cache.predict(np.array([[1.0, 2.0], [3.0, 4.0]]), model)
+    result = cache.predict(np.array([[3.0, 4.0], [5.0, 6.0], [1.2, 2.2]]), model)
+    assert first.ravel().tolist() == [3.0, 7.0]
+    assert result.ravel().tolist() == [7.0, 11.0, 3.0]  # Third row: cached result of its quantization cell
+    assert model.calls == 2 and model.rows == 3
+    assert cache.predict(np.array([[1.0, 2.0]]), model).ravel().tolist() == [3.0] and model.calls == 2
+    stats = cache.stats()
+    assert stats["cache_hits"] == 3 and stats["cache_misses"] == 3 and stats["cache_entries"] == 3
+
+
+def test_lru_eviction():
+    cache, model = PredictionCache([1], max_entries=2), Model()
+    for value in (1.0, 2.0, 1.0, 3.0):  # 1 is used again, so 2 is the least recently used when 3 arrives
+        cache.predict(np.array([[value]]), model)
+    _, found = cache.get_many(np.array([[1.0], [2.0], [3.0]]))
+    assert [row is not None for row in found] == [True, False, True]
+    assert cache.stats()["cache_evictions"] == 1
+
+
+def test_entries_expire():
+    clock, model = Clock(), Model()
+    cache = PredictionCache([1], ttl_s=10, clock=clock)
+    cache.predict(np.array([[1.0]]), model)
+    clock.now = 9.9
+    cache.predict(np.array([[1.0]]), model)
+    assert model.calls == 1
+    clock.now = 10.0
+    cache.predict(np.array([[1.0]]), model)
+    assert model.calls == 2 and cache.stats()["cache_expirations"] == 1
+
+
+def test_new_model_version_invalidates():
+    cache, model = PredictionCache([1]), Model()
+    cache.predict(np.array([[1.0]]), model, version="a")
+    cache.predict(np.array([[1.0]]), model, version="a")
+    assert model.calls == 1
+    cache.predict(np.array([[1.0]]), model, version="b")
+    assert model.calls == 2 and cache.stats()["cache_invalidations"] == 1
+    # A result computed with the replaced version is not stored
+    keys, _ = cache.get_many(np.array([[5.0]]), version="b")
+    cache.put_many(keys, np.array([[0.0]]), version="a")
+    assert cache.get_many(np.array([[5.0]]), version="b")[1] == [None]
+
+
+def test_from_env(monkeypatch):
+    monkeypatch.setenv("PREDICT_CACHE_RESOLUTIONS", "temperature=0.5, leaf_wetness=2")
+    monkeypatch.setenv("PREDICT_CACHE_TTL_S", "30")
+    cache = PredictionCache.from_env(["N", "temperature", "leaf_wetness", "unknown"])
+    assert cache.resolutions.tolist() == [1.0, 0.5, 2.0, 0.0] and cache.ttl_s == 30
+    monkeypatch.setenv("PREDICT_CACHE_ENTRIES", "0")
+    assert PredictionCache.from_env(["N"]) is None
@@ -0,0 +1,100 @@
+import json
+
+import pytest
+
+from reading_schema import PayloadError, ReadingDecoder, encode_binary, topic_matches
+
+FIRMWARE_JSON = b'{"temperature":24.5,"humidity":61,"rain_status":"DETECTED","water_status":"FULL","container_status":"Closed"}'
+
+
+def test_firmware_fields_are_decoded_into_typed_columns():
+    reading = ReadingDecoder().decode("user/7/rain_data", FIRMWARE_JSON)
+    assert reading == {
+        "temperature": 24.5,
+        "humidity": 61.0,
+        "rain_status": "DETECTED",
+        "water_status": "FULL",
+        "container_status": "Closed",
+        "seq": None,
+    }
+    assert isinstance(reading["humidity"], float)
+
+
+def test_legacy_fields_are_mapped_onto_the_schema():
+    payload = json.dumps({"temperature": 20, "water_level_raw": 2500, "servo_angle": 90}).encode()
+    reading = ReadingDecoder().decode("user/7/rain_data", payload)
+    assert reading["water_status"] == "FULL"
+    assert reading["container_status"] == "Opened"
+    assert reading["rain_status"] is None
+
+
+def test_invalid_fields_become_null_and_are_counted():
+    decoder = ReadingDecoder()
+    payload = b'{"temperature":"hot","humidity":140,"rain_status":"MAYBE","water_status":"FULL"}'
+    reading = decoder.decode("user/7/rain_data", payload)
+    assert reading["temperature"] is None and reading["humidity"] is None and reading["rain_status"] is None
+    assert reading["water_status"] == "FULL"
+    stats = decoder.stats()
+    assert stats["field_errors"]["temperature"] == 1
+    assert stats["field_errors"]["humidity"] == 1
+    assert stats["field_errors"]["rain_status"] == 1
+    assert stats["field_errors"]["water_status"] == 0
+
+
+def test_failed_dht_read_is_null_not_an_error():
+    decoder = ReadingDecoder()
+    reading = decoder.decode("user/7/rain_data", b'{"temperature":null,"humidity":NaN}')
+    assert reading["temperature"] is None and reading["humidity"] is None
+    assert sum(decoder.stats()["field_errors"].values()) == 0
+
+
+@pytest.mark.parametrize("payload", [b"not json", b"[1, 2]", b"\xff\xfe"])
+def test_undecodable_payloads_are_rejected(payload):
+    decoder = ReadingDecoder()
+    with pytest.raises(PayloadError):
+        decoder.decode("user/7/rain_data", payload)
+    assert decoder.stats()["rejected"] == 1
+
+
+def test_binary_layout_round_trips_on_negotiated_topics():
+    decoder = ReadingDecoder(binary_topics=["user/+/rain_data/bin"])
+    reading = decoder.decode("user/7/rain_data", FIRMWARE_JSON)
+    packed = encode_binary(reading)
+    assert len(packed) == 6
+    assert decoder.decode("user/7/rain_data/bin", packed) == reading
+    assert decoder.format_for("user/7/rain_data") == "json"
+
+    missing = encode_binary({"temperature": None, "humidity": float("nan")})
+    decoded = decoder.decode("user/8/rain_data/bin", missing)
+    assert decoded["temperature"] is None and decoded["humidity"] is None
+    assert decoded["container_status"] == "Closed"
+
+    with pytest.raises(PayloadError):
+        decoder.decode("user/7/rain_data/bin", b"\x02" + packed[1:])
+
+
+def test_sequence_numbers_are_validated_and_carried_by_binary_v2():
+    decoder = ReadingDecoder(binary_topics=["user/+/rain_data/bin"])
+    reading = decoder.decode("user/7/rain_data", FIRMWARE_JSON[:-1] + b',"seq":4294967295}')
+    assert reading["seq"] == 2**32 - 1
+    packed = encode_binary(reading)
+    assert len(packed) == 10 and packed[0] == 2
+    assert decoder.decode("user/7/rain_data/bin", packed) == reading
+
+    assert decoder.decode("user/7/rain_data", b'{"seq":-1}')["seq"] is None
+    assert decoder.decode("user/7/rain_data", b'{"seq":1.5}')["seq"] is None
+    assert decoder.stats()["field_errors"]["seq"] == 2
+
+
+def test_decode_columns_skips_rejected_payloads():
+    columns = ReadingDecoder().decode_columns(
+        [("user/1/rain_data", FIRMWARE_JSON), ("user/2/rain_data", b"oops"), ("user/3/rain_data", b'{"humidity":50}')]
+    )
+    assert columns["humidity"] == [61.0, 50.0]
+    assert columns["water_status"] == ["FULL", None]
+
+
+def test_topic_filters():
+    assert topic_matches("user/+/rain_data/bin", "user/7/rain_data/bin")
+    assert not topic_matches("user/+/rain_data/bin", "user/7/rain_data")
+    assert topic_matches("user/#", "user/7/rain_data")
@@ -0,0 +1,101 @@
+import pytest
+
+from recent_readings import READING_COLUMNS, RecentReadings
+from storage import MemoryStorage, SQLiteStorage
+
+
+def reading(second, device="7", **fields):
+    return {"created_at": f"2025-10-20T10:00:{second:02d}Z", "device_id": device, "temperature": 20.0 + second,
+            "humidity": 60.0, "water_status": "FULL", "firmware": "v2", **fields}
+
+
+class Recording(MemoryStorage):
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+
+    def query_range(self, *args, **kwargs):
+        rows = super().query_range(*args, **kwargs)
+        self.calls.append((kwargs, len(rows)))
+        return rows
+
+
+@pytest.fixture
+def clock():
+    return [0.0]
+
+
+def test_first_refresh_loads_the_latest_rows_then_only_new_ones(clock):
+    storage = Recording()
+    storage.insert_many([reading(s) for s in range(10)])
+    readings = RecentReadings(storage, initial_rows=5, max_age_s=0, lookback_s=2, clock=lambda: clock[0])
+    assert readings.refresh() == 5
+    assert [r["temperature"] for r in readings.rows()] == [29.0, 28.0, 27.0, 26.0, 25.0]
+
+    storage.insert_many([reading(10), reading(11)])
+    assert readings.refresh() == 2
+    kwargs, returned = storage.calls[-1]
+    assert kwargs["start"] == "2025-10-20T10:00:07.000000+00:00" and returned == 5  # 2 s lookback + 2 new
+    assert kwargs["columns"] == list(READING_COLUMNS)
+    assert "firmware" not in readings.rows()[0]
+    assert readings.refresh() == 0 and readings.version == 2
+
+
+def test_rows_sharing_the_last_timestamp_are_neither_lost_nor_repeated(clock):
+    storage = MemoryStorage()
+    storage.insert_many([reading(5, "7")])
+    readings = RecentReadings(storage, max_age_s=0)
+    readings.refresh()
+    storage.insert_many([reading(5, "8"), reading(6, "7")])  # Same second as the last row seen
+    assert readings.refresh() == 2
+    assert sorted((r["device_id"], r["created_at"][-3:]) for r in readings.rows()) == [
+        ("7", "05Z"), ("7", "06Z"), ("8", "05Z")]
+
+
+def test_rows_committed_late_with_an_older_created_at_are_picked_up(clock):
+    storage = MemoryStorage()
+    storage.insert_many([{**reading(s), "id": s} for s in range(0, 20, 2)])
+    readings = RecentReadings(storage, max_age_s=0, lookback_s=10)
+    readings.refresh()
+    # Another ingestion process (or a spool replay) commits rows stamped before the newest one seen
+    storage.insert_many([{**reading(15), "id": 100}, {**reading(20), "id": 101}, {**reading(3), "id": 102}])
+    assert readings.refresh() == 2  # 10:00:03 is older than the lookback window
+    assert readings.refresh() == 0
+    assert [r["id"] for r in readings.rows(4)] == [101, 18, 16, 100]
+    assert all(at >= "2025-10-20T10:00:10" for at in readings._seen.values())  # Bounded by the window
+
+
+def test_ring_buffer_per_device_and_pages(clock):
+    storage = MemoryStorage()
+    readings = RecentReadings(storage, per_device=3, page_rows=4, max_age_s=0)
+    readings.refresh()
+    storage.insert_many([reading(s, device) for s in range(10) for device in ("7", "8")])
+    assert readings.refresh() == 20
+    assert readings.stats()["buffer_rows"] == 6
+    assert [r["temperature"] for r in readings.rows() if r["device_id"] == "8"] == [29.0, 28.0, 27.0]
+
+
+def test_viewers_share_one_query_per_max_age(clock):
+    storage = Recording()
+    storage.insert_many([reading(1)])
+    readings = RecentReadings(storage, max_age_s=2.0, clock=lambda: clock[0])
+    for _ in range(20):  # Many viewers rerunning at once
+        readings.refresh()
+        readings.frame(100)
+    assert len(storage.calls) == 1 and readings.refreshes_skipped == 19
+    assert readings.frame(100) is readings.frame(100)  # Not rebuilt without new rows
+    readings.refresh(force=True)
+    clock[0] = 2.5
+    readings.refresh()
+    assert len(storage.calls) == 3
+
+
+def test_sqlite_backend(tmp_path):
+    storage = SQLiteStorage(str(tmp_path / "readings.db"))
+    storage.insert_many([reading(s) for s in range(3)])
+    readings = RecentReadings(storage, max_age_s=0)
+    assert readings.refresh() == 3
+    storage.insert_many([reading(3)])
+    assert readings.refresh() == 1
+    assert set(readings.rows()[0]) <= set(READING_COLUMNS) and readings.rows()[0]["id"] == 4
+    storage.close()
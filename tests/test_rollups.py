@@ -0,0 +1,104 @@
+import pytest
+
+from rollups import HOUR, MINUTE, RollupAggregator
+from storage import MemoryStorage, SQLiteStorage, to_timestamp
+
+T0 = 1_700_000_040.0  # 2023-11-14 22:14:00 UTC, a minute boundary
+
+
+def reading(ts, device="7", **fields):
+    return {"created_at": to_timestamp(ts), "device_id": device, **fields}
+
+
+def build(**kwargs):
+    sinks = {MINUTE: MemoryStorage(), HOUR: MemoryStorage()}
+    return RollupAggregator(sinks, allowed_lateness_s=2.0, **kwargs), sinks
+
+
+def test_buckets_aggregate_per_device_and_interval():
+    rollups, sinks = build()
+    rollups.add_many([
+        reading(T0 + 1, temperature=20.0, humidity=50.0, rain_status="DETECTED", water_status="NOT_FULL"),
+        reading(T0 + 30, temperature=24.0, humidity=None, rain_status="NO_RAIN", water_status="FULL"),
+        reading(T0 + 61, temperature=30.0, humidity=70.0, rain_status="NO_RAIN"),
+        reading(T0 + 5, device="8", temperature=10.0),
+    ])
+    rollups.close_buckets(now=T0 + 62)  # first minute closed, second still open
+    rollups.write_pending()
+
+    minute = {(r["device_id"], r["created_at"]): r for r in sinks[MINUTE].rows}
+    assert set(minute) == {("7", to_timestamp(T0)), ("8", to_timestamp(T0))}
+    row = minute[("7", to_timestamp(T0))]
+    assert row["readings"] == 2 and row["bucket_seconds"] == MINUTE
+    assert (row["temperature_min"], row["temperature_max"], row["temperature_mean"]) == (20.0, 24.0, 22.0)
+    assert row["humidity_count"] == 1 and row["humidity_mean"] == 50.0
+    assert row["rain_fraction"] == 0.5 and row["water_status"] == "FULL"
+    assert row["last_reading_at"] == to_timestamp(T0 + 30)
+    assert sinks[HOUR].rows == []
+
+    rollups.close()
+    hour = [r for r in sinks[HOUR].rows if r["device_id"] == "7"]
+    assert len(hour) == 1 and hour[0]["readings"] == 3 and hour[0]["temperature_max"] == 30.0
+
+
+def test_readings_after_their_bucket_was_written_become_a_mergeable_row():
+    rollups, sinks = build()
+    rollups.add_many([reading(T0 + 1, temperature=20.0)], now=T0 + 1)
+    rollups.close_buckets(now=T0 + 70)
+    rollups.add_many([reading(T0 + 2, temperature=26.0)], now=T0 + 70)  # e.g. replayed from the spill file
+    rollups.close()
+
+    rows = [r for r in sinks[MINUTE].rows if r["created_at"] == to_timestamp(T0)]
+    assert len(rows) == 2 and rollups.stats()["rollup_late_readings"] == 1  # the hour is still open
+    merged_mean = sum(r["temperature_sum"] for r in rows) / sum(r["temperature_count"] for r in rows)
+    assert merged_mean == 23.0
+
+
+def test_failed_writes_are_retried():
+    class Outage(MemoryStorage):
+        down = True
+
+        def insert_many(self, rows):
+            if self.down:
+                raise ConnectionError("unreachable")
+            return super().insert_many(rows)
+
+    sink = Outage()
+    rollups = RollupAggregator({MINUTE: sink})
+    rollups.add_many([reading(T0 + 1, temperature=20.0)])
+    rollups.close_buckets(now=T0 + 70)
+    assert rollups.write_pending() == 0
+    assert rollups.stats()["rollup_pending_rows"] == 1
+
+    sink.down = False
+    assert rollups.write_pending() == 1
+    assert rollups.stats()["rollup_write_failures"] == 1 and len(sink.rows) == 1
+
+
+def test_pending_rows_are_capped():
+    rollups = RollupAggregator({MINUTE: MemoryStorage()}, max_pending_rows=2)
+    rollups.add_many([reading(T0 + 1, device=str(d)) for d in range(5)])
+    rollups.close_buckets(now=T0 + 70)
+    assert rollups.stats()["rollup_pending_rows"] == 2 and rollups.stats()["rollup_rows_dropped"] == 3
+
+
+def test_rollup_tables_live_next_to_the_raw_table(tmp_path, monkeypatch):
+    monkeypatch.setenv("ROLLUP_TABLE_1M", "minute_rollups")
+    storage = SQLiteStorage(str(tmp_path / "readings.db"))
+    rollups = RollupAggregator.from_env(storage)
+    rollups.add_many([reading(T0 + 1, temperature=20.0)])
+    rollups.close()
+
+    minute = storage.with_table("minute_rollups")
+    rows = minute.query_range(start=T0, end=T0 + 60)
+    assert len(rows) == 1 and rows[0]["temperature_mean"] == 20.0
+    assert storage.query_range() == []
+    minute.close()
+    storage.close()
+
+
+def test_rollups_can_be_disabled(monkeypatch):
+    monkeypatch.setenv("INGEST_ROLLUPS", "0")
+    assert RollupAggregator.from_env(MemoryStorage()) is None
+    with pytest.raises(ValueError):
+        RollupAggregator({})
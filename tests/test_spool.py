@@ -0,0 +1,103 @@
+import time
+
+from spool import Spool
+from storage import MemoryStorage
+
+
+class OutageStorage(MemoryStorage):
+    """MemoryStorage that raises while `down` is True."""
+
+    def __init__(self):
+        super().__init__()
+        self.down = False
+
+    def insert_many(self, rows):
+        if self.down:
+            raise ConnectionError("Supabase unreachable")
+        return super().insert_many(rows)
+
+
+def reading(i):
+    return {"created_at": f"2025-10-20T10:00:{i % 60:02d}+00:00", "temperature": float(i)}
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_outage_backlog_is_replayed_in_bulk(tmp_path):
+    storage = OutageStorage()
+    storage.down = True
+    spool = Spool(str(tmp_path), storage, replay_rows=1000, max_backoff_s=0.05).start()
+    for start in range(0, 3000, 100):
+        spool.insert_many([reading(i) for i in range(start, start + 100)])
+    assert spool.pending_rows == 3000
+
+    storage.down = False
+    assert wait_for(lambda: storage.rows_written == 3000)
+    spool.close()
+
+    assert [r["temperature"] for r in storage.rows] == [float(i) for i in range(3000)]
+    assert storage.insert_calls <= 4  # 1000-row bulk inserts, not one call per row
+    assert spool.replay_failures > 0 and spool.pending_rows == 0
+
+
+def test_checkpoint_survives_restart_without_duplicates(tmp_path):
+    storage = MemoryStorage()
+    spool = Spool(str(tmp_path), storage, replay_rows=10)
+    spool.insert_many([reading(i) for i in range(25)])
+    spool.replay_once()
+    spool.close(drain_timeout=0)
+    assert storage.rows_written == 10
+
+    restarted = Spool(str(tmp_path), storage, replay_rows=100)
+    assert restarted.pending_rows == 15
+    restarted.replay_once()
+    assert [r["temperature"] for r in storage.rows] == [float(i) for i in range(25)]
+    restarted.close(drain_timeout=0)
+
+
+def test_segments_rotate_and_are_deleted_once_replayed(tmp_path):
+    storage = MemoryStorage()
+    spool = Spool(str(tmp_path), storage, segment_bytes=500, max_bytes=100_000, replay_rows=1000)
+    for i in range(40):
+        spool.insert_many([reading(i)])
+    assert len(list(tmp_path.glob("*.log"))) > 3
+
+    while spool.replay_once():
+        pass
+    assert storage.rows_written == 40
+    assert len(list(tmp_path.glob("*.log"))) == 1  # only the active segment is left
+    spool.close(drain_timeout=0)
+
+
+def test_size_cap_evicts_oldest_segments(tmp_path):
+    storage = MemoryStorage()
+    spool = Spool(str(tmp_path), storage, segment_bytes=500, max_bytes=1500)
+    for i in range(200):
+        spool.insert_many([reading(i)])
+
+    assert sum(p.stat().st_size for p in tmp_path.glob("*.log")) <= 1500
+    assert spool.rows_evicted > 0
+    assert spool.pending_rows == 200 - spool.rows_evicted
+
+    while spool.replay_once():
+        pass
+    assert storage.rows_written == 200 - spool.rows_evicted
+    assert storage.rows[-1]["temperature"] == 199.0  # the newest readings are kept
+    spool.close(drain_timeout=0)
+
+
+def test_torn_tail_from_a_crash_is_skipped(tmp_path):
+    (tmp_path / "000000000001.log").write_bytes(b'{"temperature":1.0}\n{"temperature":2.0}\n{"tempera')
+    storage = MemoryStorage()
+    spool = Spool(str(tmp_path), storage)
+    spool.insert_many([{"temperature": 3.0}])
+
+    while spool.replay_once():
+        pass
+    assert [r["temperature"] for r in storage.rows] == [1.0, 2.0, 3.0]
+    spool.close(drain_timeout=0)
@@ -0,0 +1,157 @@
+from types import SimpleNamespace
+
+import pytest
+
+from storage import MemoryStorage, SensorStorage, SQLiteStorage, SupabaseStorage, create_storage, to_timestamp
+
+
+def rows_for(device, count, start_minute=0):
+    return [
+        {"created_at": f"2025-10-20T10:{start_minute + i:02d}:00Z", "device_id": device,
+         "temperature": 20.0 + i, "humidity": 60.0}
+        for i in range(count)
+    ]
+
+
+def test_to_timestamp_is_fixed_width_utc():
+    assert to_timestamp("2025-10-20T10:00:00Z") == "2025-10-20T10:00:00.000000+00:00"
+    assert to_timestamp("2025-10-20T12:00:00+02:00") == "2025-10-20T10:00:00.000000+00:00"
+    assert to_timestamp(0) == "1970-01-01T00:00:00.000000+00:00"
+
+
+def test_sqlite_bulk_insert_and_time_range_query(tmp_path):
+    storage = SQLiteStorage(str(tmp_path / "readings.db"))
+    assert storage.insert_many(rows_for("7", 10) + rows_for("8", 10)) == 20
+
+    window = storage.query_range("2025-10-20T10:02:00Z", "2025-10-20T10:05:00Z", device_id="7")
+    assert [r["temperature"] for r in window] == [22.0, 23.0, 24.0]
+    assert all(r["device_id"] == "7" for r in window)
+
+    latest = storage.query_range(limit=3, descending=True, columns=["created_at", "temperature", "missing"])
+    assert [set(r) for r in latest] == [{"created_at", "temperature"}] * 3
+    assert latest[0]["created_at"] == "2025-10-20T10:09:00.000000+00:00"
+    storage.close()
+
+
+def test_sqlite_adds_new_columns_and_uses_device_index(tmp_path):
+    storage = SQLiteStorage(str(tmp_path / "readings.db"))
+    storage.insert_many(rows_for("7", 1))
+    storage.insert_many([{"created_at": "2025-10-20T11:00:00Z", "device_id": "7", "water_status": "FULL"}])
+    assert storage.query_range(device_id="7")[-1]["water_status"] == "FULL"
+
+    plan = " ".join(
+        str(tuple(r)) for r in storage._conn.execute(
+            'EXPLAIN QUERY PLAN SELECT * FROM sensor_readings WHERE device_id = ? AND created_at >= ? ORDER BY created_at',
+            ("7", "2025"),
+        )
+    )
+    assert "sensor_readings_device_created_at" in plan
+    storage.close()
+
+
+def test_sqlite_data_survives_reopen(tmp_path):
+    path = str(tmp_path / "readings.db")
+    first = SQLiteStorage(path)
+    first.insert_many(rows_for("7", 5))
+    first.close()
+
+    assert len(SQLiteStorage(path).query_range(device_id="7")) == 5
+
+
+def test_memory_storage_matches_the_interface():
+    storage = MemoryStorage()
+    storage.insert_many(rows_for("7", 5) + rows_for("8", 5))
+    window = storage.query_range("2025-10-20T10:01:00Z", "2025-10-20T10:03:00Z", device_id="8")
+    assert [r["temperature"] for r in window] == [21.0, 22.0]
+
+
+def test_backend_missing_a_method_cannot_be_created():
+    class ReadOnly(SensorStorage):
+        def query_range(self, *args, **kwargs):
+            return []
+
+    with pytest.raises(TypeError, match="insert_many"):
+        ReadOnly()
+    with pytest.raises(TypeError):
+        SensorStorage()
+
+
+def test_create_storage_sqlite_from_env(tmp_path, monkeypatch):
+    monkeypatch.setenv("SQLITE_PATH", str(tmp_path / "edge.db"))
+    storage = create_storage("sqlite")
+    assert isinstance(storage, SQLiteStorage)
+    storage.close()
+
+
+def test_with_table_keeps_the_backend_and_switches_the_table(tmp_path):
+    storage = SQLiteStorage(str(tmp_path / "readings.db"))
+    other = storage.with_table("sensor_rollups_1m")
+    other.insert_many([{"created_at": 0.0, "device_id": "7", "readings": 3}])
+    assert other.table == "sensor_rollups_1m" and len(other.query_range()) == 1
+    assert storage.query_range() == []
+    other.close()
+    storage.close()
+
+
+def test_one_supabase_client_per_credentials(monkeypatch):
+    import supabase
+
+    import storage as storage_module
+
+    created = []
+    monkeypatch.setattr(supabase, "create_client", lambda url, key: created.append((url, key)) or object())
+    monkeypatch.setattr(storage_module, "_clients", {})
+    first = create_storage("supabase", "https://a.supabase.co", "key")
+    second = create_storage("supabase", "https://a.supabase.co", "key")
+    assert first.client is second.client and len(created) == 1
+    create_storage("supabase", "https://b.supabase.co", "key")
+    assert len(created) == 2
+
+
+class PostgrestTable:
+    """The query builder calls SupabaseStorage makes, answered like PostgREST with max-rows = 1000."""
+
+    def __init__(self, rows, requests):
+        self.rows, self.requests, self.offset, self.limit = rows, requests, 0, None
+
+    def select(self, columns):
+        return self
+
+    def gte(self, column, value):
+        self.rows = [r for r in self.rows if to_timestamp(r[column]) >= value]
+        return self
+
+    def lt(self, column, value):
+        self.rows = [r for r in self.rows if to_timestamp(r[column]) < value]
+        return self
+
+    def eq(self, column, value):
+        self.rows = [r for r in self.rows if r[column] == value]
+        return self
+
+    def order(self, column, desc=False):
+        self.rows = sorted(self.rows, key=lambda r: r[column], reverse=desc)  # Stable: later calls break ties
+        return self
+
+    def range(self, start, end):
+        self.offset, self.limit = start, end - start + 1
+        return self
+
+    def execute(self):
+        self.requests.append((self.offset, self.limit))
+        ordered = sorted(self.rows, key=lambda r: (r["created_at"], r["device_id"]))
+        return SimpleNamespace(data=ordered[self.offset:self.offset + min(self.limit, 1000)])
+
+
+def test_supabase_query_range_reads_every_page():
+    rows = [r for minute in range(50) for d in range(60) for r in rows_for(str(d), 1, minute)]  # 3,000 rows
+    requests = []
+    client = SimpleNamespace(table=lambda name: PostgrestTable(rows, requests))
+    storage = SupabaseStorage(client)
+
+    everything = storage.query_range("2025-10-20T10:00:00Z", "2025-10-20T11:00:00Z")
+    assert len(everything) == 3_000 and requests == [(0, 1000), (1000, 1000), (2000, 1000), (3000, 1000)]
+    assert len({(r["created_at"], r["device_id"]) for r in everything}) == 3_000
+
+    requests.clear()
+    assert len(storage.query_range(limit=1_500)) == 1_500 and requests == [(0, 1000), (1000, 500)]